@@ -0,0 +1,28 @@
+using DicomTypeTranslation;
+using FellowOakDicom;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Microservices.IdentifierMapper;
+using System.Collections.Generic;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+internal sealed class DicomTypeTranslationBenchmarks : BenchmarkGroup
+{
+    public override string Name => "DicomTypeTranslation";
+
+    private readonly DicomDataset _dataset = TestDatasets.Create();
+    private readonly string _json;
+
+    public DicomTypeTranslationBenchmarks()
+    {
+        _json = DicomTypeTranslater.SerializeDatasetToJson(_dataset);
+    }
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return Create("SerializeDatasetToJson", () => DicomTypeTranslater.SerializeDatasetToJson(_dataset));
+        yield return Create("DeserializeJsonToDataset", () => DicomTypeTranslater.DeserializeJsonToDataset(_json));
+        yield return Create("BuildBsonDocument", () => DicomTypeTranslaterReader.BuildBsonDocument(_dataset));
+        yield return Create("RewritePatientId", () => PatientIdRewriter.Rewrite(_json, _ => "0202020202", out _));
+    }
+}
@@ -0,0 +1,44 @@
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common.Messages;
+using System.Collections.Generic;
+using System.Linq;
+using System.Text;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+internal sealed class MessageHeaderBenchmarks : BenchmarkGroup
+{
+    public override string Name => "MessageHeader";
+
+    // A few levels into the pipeline, as for an image which has been through the tag reader and identifier mapper
+    private readonly MessageHeader _header = new(new MessageHeader(new MessageHeader(new MessageHeader())));
+
+    private readonly Dictionary<string, object> _encodedHeaders;
+    private readonly Dictionary<string, object> _encodedBinaryHeaders;
+
+    public MessageHeaderBenchmarks()
+    {
+        _encodedHeaders = Encode(binaryGuids: false);
+        _encodedBinaryHeaders = Encode(binaryGuids: true);
+    }
+
+    /// <summary>
+    /// Populates the headers as they would be received from RabbitMQ, which delivers strings as bytes
+    /// </summary>
+    /// <param name="binaryGuids"></param>
+    /// <returns></returns>
+    private Dictionary<string, object> Encode(bool binaryGuids)
+    {
+        var headers = new Dictionary<string, object>();
+        _header.Populate(headers, binaryGuids);
+        return headers.ToDictionary(x => x.Key, x => x.Value is string s ? Encoding.UTF8.GetBytes(s) : x.Value);
+    }
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return Create("Populate", () => _header.Populate(new Dictionary<string, object>(5)));
+        yield return Create("PopulateBinary", () => _header.Populate(new Dictionary<string, object>(5), binaryGuids: true));
+        yield return Create("FromDict", () => MessageHeader.FromDict(_encodedHeaders, Encoding.UTF8));
+        yield return Create("FromDictBinary", () => MessageHeader.FromDict(_encodedBinaryHeaders, Encoding.UTF8));
+    }
+}
@@ -0,0 +1,39 @@
+using DicomTypeTranslation;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common.Messages;
+using System.Collections.Generic;
+using System.Text;
+using JsonConvert = SmiServices.Common.MessageSerialization.JsonConvert;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+internal sealed class MessageSerializationBenchmarks : BenchmarkGroup
+{
+    public override string Name => "MessageSerialization";
+
+    private readonly DicomFileMessage _message;
+    private readonly byte[] _body;
+
+    public MessageSerializationBenchmarks()
+    {
+        _message = new DicomFileMessage
+        {
+            DicomFilePath = "2020/01/01/ACC123456/1.dcm",
+            DicomFileSize = 123456,
+            StudyInstanceUID = "1.2.3",
+            SeriesInstanceUID = "1.2.3.4",
+            SOPInstanceUID = "1.2.3.4.5",
+            DicomDataset = DicomTypeTranslater.SerializeDatasetToJson(TestDatasets.Create()),
+        };
+        _body = JsonConvert.SerializeToUtf8Bytes(_message);
+    }
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return Create("SerializeDicomFileMessage", () => JsonConvert.SerializeToUtf8Bytes(_message));
+        yield return Create("DeserializeDicomFileMessage", () => JsonConvert.DeserializeObject<DicomFileMessage>(_body));
+        yield return Create("DeserializeLazyDicomFileMessage", () => JsonConvert.DeserializeLazy<DicomFileMessage>(_body));
+        yield return Create("LazyPassThrough", () => JsonConvert.SerializeToUtf8Bytes(JsonConvert.DeserializeLazy<DicomFileMessage>(_body)));
+        yield return Create("DecodeBody", () => Encoding.UTF8.GetString(_body));
+    }
+}
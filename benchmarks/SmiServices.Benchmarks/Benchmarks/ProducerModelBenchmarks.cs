@@ -0,0 +1,82 @@
+using RabbitMQ.Client;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Messaging;
+using System;
+using System.Collections.Generic;
+using System.Reflection;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+/// <summary>
+/// Times the client-side cost of publishing a message (serialization, headers, locking) against a channel which
+/// does nothing, so the results don't depend on a RabbitMQ server
+/// </summary>
+internal sealed class ProducerModelBenchmarks : BenchmarkGroup
+{
+    public override string Name => "ProducerModel";
+
+    private readonly ProducerModel _producer;
+    private readonly ProducerModel _binaryHeaderProducer;
+    private readonly DicomFileMessage _message;
+    private readonly MessageHeader _parentHeader = new();
+
+    public ProducerModelBenchmarks()
+    {
+        _producer = new ProducerModel("TEST.Exchange", StubProxy.Create<IModel>(), StubProxy.Create<IBasicProperties>());
+        _binaryHeaderProducer = new ProducerModel("TEST.Exchange", StubProxy.Create<IModel>(), StubProxy.Create<IBasicProperties>(), binaryHeaders: true);
+
+        _message = new DicomFileMessage
+        {
+            DicomFilePath = "2020/01/01/ACC123456/1.dcm",
+            DicomFileSize = 123456,
+            StudyInstanceUID = "1.2.3",
+            SeriesInstanceUID = "1.2.3.4",
+            SOPInstanceUID = "1.2.3.4.5",
+            DicomDataset = DicomTypeTranslation.DicomTypeTranslater.SerializeDatasetToJson(TestDatasets.Create()),
+        };
+    }
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return Create("SendMessage", () => _producer.SendMessage(_message, _parentHeader, null));
+        yield return Create("SendMessageBinaryHeaders", () => _binaryHeaderProducer.SendMessage(_message, _parentHeader, null));
+    }
+
+    /// <summary>
+    /// Implements any interface by storing property values and returning defaults from all other methods
+    /// </summary>
+    public class StubProxy : DispatchProxy
+    {
+        private readonly Dictionary<string, object?> _properties = [];
+
+        public static T Create<T>() where T : class => Create<T, StubProxy>();
+
+        protected override object? Invoke(MethodInfo? targetMethod, object?[]? args)
+        {
+            ArgumentNullException.ThrowIfNull(targetMethod);
+
+            var name = targetMethod.Name;
+
+            if (name.StartsWith("set_", StringComparison.Ordinal) && args?.Length == 1)
+            {
+                _properties[name[4..]] = args[0];
+                return null;
+            }
+
+            if (name.StartsWith("get_", StringComparison.Ordinal) && _properties.TryGetValue(name[4..], out var value))
+                return value;
+
+            // IModel.WaitForConfirms(TimeSpan, out bool timedOut)
+            if (name == nameof(IModel.WaitForConfirms))
+            {
+                if (args?.Length == 2)
+                    args[1] = false;
+                return true;
+            }
+
+            var returnType = targetMethod.ReturnType;
+            return returnType.IsValueType && returnType != typeof(void) ? Activator.CreateInstance(returnType) : null;
+        }
+    }
+}
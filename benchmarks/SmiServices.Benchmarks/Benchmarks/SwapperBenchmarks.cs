@@ -0,0 +1,85 @@
+using FAnsi.Discovery;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common;
+using SmiServices.Common.Options;
+using SmiServices.Microservices.IdentifierMapper.Swappers;
+using System;
+using System.Collections.Generic;
+using System.Data;
+using System.Linq;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+/// <summary>
+/// Times identifier lookups against a mapping table created in the database from the IdentifierMapperOptions. Only run
+/// if a yaml file with a mapping database has been given
+/// </summary>
+internal sealed class SwapperBenchmarks : BenchmarkGroup
+{
+    public override string Name => "Swapper";
+
+    private const int MappingRows = 10_000;
+    private const string SwapColumnName = "priv";
+    private const string ReplacementColumnName = "pub";
+
+    private readonly IdentifierMapperOptions? _options;
+    private readonly List<DiscoveredTable> _tables = [];
+    private readonly string[] _identifiers;
+
+    public SwapperBenchmarks(IdentifierMapperOptions? options)
+    {
+        _identifiers = Enumerable.Range(0, MappingRows).Select(i => $"{i:D10}").ToArray();
+
+        if (options?.MappingConnectionString == null)
+            return;
+
+        FansiImplementations.Load();
+
+        var server = new DiscoveredServer(options.MappingConnectionString, options.MappingDatabaseType);
+
+        var mappingDataTable = new DataTable("SmiBenchIdMap");
+        mappingDataTable.Columns.Add(SwapColumnName);
+        mappingDataTable.Columns.Add(ReplacementColumnName);
+        foreach (var identifier in _identifiers)
+            mappingDataTable.Rows.Add(identifier, $"R{identifier}");
+
+        var table = server.GetCurrentDatabase()!.CreateTable(mappingDataTable.TableName, mappingDataTable);
+        _tables.Add(table);
+
+        _options = (IdentifierMapperOptions)options.Clone();
+        _options.MappingTableSchema = table.Schema;
+        _options.MappingTableName = table.GetRuntimeName();
+        _options.SwapColumnName = SwapColumnName;
+        _options.ReplacementColumnName = ReplacementColumnName;
+    }
+
+    public override string? SkipReason => _options == null ? "No IdentifierMapperOptions.MappingConnectionString given (use --yaml-file)" : null;
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return CreateSwapper("TableLookupSwapper", new TableLookupSwapper());
+        yield return CreateSwapper("PreloadTableSwapper", new PreloadTableSwapper());
+        yield return CreateSwapper("ForGuidIdentifierSwapper", new ForGuidIdentifierSwapper());
+        yield return CreateSwapper("TableLookupWithGuidFallbackSwapper", new TableLookupWithGuidFallbackSwapper());
+    }
+
+    private Benchmark CreateSwapper(string name, SwapIdentifiers swapper)
+    {
+        swapper.Setup(_options!);
+
+        var guidTable = swapper.GetGuidTableIfAny(_options!);
+        if (guidTable != null && !_tables.Any(t => t.GetFullyQualifiedName() == guidTable.GetFullyQualifiedName()))
+            _tables.Add(guidTable);
+
+        var i = 0;
+        return Create(name, () => swapper.GetSubstitutionFor(_identifiers[i++ % _identifiers.Length], out _));
+    }
+
+    public override void Dispose()
+    {
+        foreach (var table in _tables.Where(t => t.Exists()))
+            table.Drop();
+
+        base.Dispose();
+    }
+}
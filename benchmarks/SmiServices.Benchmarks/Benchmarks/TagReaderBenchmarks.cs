@@ -0,0 +1,79 @@
+using FellowOakDicom;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common.Events;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Messaging;
+using SmiServices.Common.Options;
+using SmiServices.Microservices.DicomTagReader.Execution;
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.IO.Abstractions;
+using System.Threading.Tasks;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+internal sealed class TagReaderBenchmarks : BenchmarkGroup
+{
+    public override string Name => "TagReader";
+
+    private readonly DirectoryInfo _root;
+    private readonly FileInfo _dicomFile;
+    private readonly DicomDataset _dataset = TestDatasets.Create();
+    private readonly BenchmarkTagReader _reader;
+
+    public TagReaderBenchmarks()
+    {
+        _root = Directory.CreateTempSubdirectory("smi-bench-");
+        _dicomFile = new FileInfo(Path.Combine(_root.FullName, "1.dcm"));
+        new DicomFile(_dataset).Save(_dicomFile.FullName);
+        _dicomFile.Refresh();
+
+        var options = new DicomTagReaderOptions { FileReadOption = nameof(FileReadOption.ReadLargeOnDemand) };
+        var fileSystemOptions = new FileSystemOptions { FileSystemRoot = _root.FullName };
+        _reader = new BenchmarkTagReader(options, fileSystemOptions, new NullProducerModel(), new NullProducerModel(), new FileSystem());
+    }
+
+    public override IEnumerable<Benchmark> GetBenchmarks()
+    {
+        yield return Create("DicomFileToMessage", () => _reader.ToMessage(_dataset, _dicomFile.FullName, _dicomFile.Length));
+        yield return Create("ReadTagsFromFile", () => _reader.ReadFile(_dicomFile));
+    }
+
+    public override void Dispose()
+    {
+        _root.Delete(recursive: true);
+        base.Dispose();
+    }
+
+    /// <summary>
+    /// Exposes the per-file parts of <see cref="TagReaderBase"/> so they can be timed without a RabbitMQ server
+    /// </summary>
+    private sealed class BenchmarkTagReader(
+        DicomTagReaderOptions options,
+        FileSystemOptions fileSystemOptions,
+        IProducerModel seriesMessageProducerModel,
+        IProducerModel fileMessageProducerModel,
+        IFileSystem fs
+    ) : TagReaderBase(options, fileSystemOptions, seriesMessageProducerModel, fileMessageProducerModel, fs)
+    {
+        public DicomFileMessage ToMessage(DicomDataset ds, string path, long size) => DicomFileToMessage(ds, path, size);
+
+        public DicomFileMessage ReadFile(FileInfo file) => ReadTagsFromFile(file);
+
+        protected override List<DicomFileMessage> ReadTagsImpl(IEnumerable<FileInfo> dicomFilePaths, AccessionDirectoryMessage accMessage)
+            => throw new NotSupportedException();
+    }
+
+    private sealed class NullProducerModel : IProducerModel
+    {
+        public IMessageHeader SendMessage(IMessage message, IMessageHeader? isInResponseTo, string? routingKey) => new MessageHeader();
+
+        public Task<IMessageHeader> SendMessageAsync(IMessage message, IMessageHeader? isInResponseTo, string? routingKey)
+            => Task.FromResult<IMessageHeader>(new MessageHeader());
+
+        public void WaitForConfirms() { }
+
+        public event ProducerFatalHandler OnFatal { add { } remove { } }
+    }
+}
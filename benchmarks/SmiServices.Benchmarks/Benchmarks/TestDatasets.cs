@@ -0,0 +1,54 @@
+using FellowOakDicom;
+using System.Linq;
+
+namespace SmiServices.Benchmarks.Benchmarks;
+
+internal static class TestDatasets
+{
+    /// <summary>
+    /// Creates a dataset with the tags typically found in a CT image, without any pixel data
+    /// </summary>
+    /// <returns></returns>
+    public static DicomDataset Create()
+    {
+        var ds = new DicomDataset
+        {
+            { DicomTag.SOPClassUID, DicomUID.CTImageStorage },
+            { DicomTag.StudyInstanceUID, DicomUIDGenerator.GenerateDerivedFromUUID() },
+            { DicomTag.SeriesInstanceUID, DicomUIDGenerator.GenerateDerivedFromUUID() },
+            { DicomTag.SOPInstanceUID, DicomUIDGenerator.GenerateDerivedFromUUID() },
+            { DicomTag.PatientID, "0101010101" },
+            { DicomTag.PatientName, "Test^Patient" },
+            { DicomTag.PatientBirthDate, "19700101" },
+            { DicomTag.PatientSex, "F" },
+            { DicomTag.StudyDate, "20200101" },
+            { DicomTag.StudyTime, "120000" },
+            { DicomTag.StudyDescription, "CT HEAD" },
+            { DicomTag.SeriesDescription, "Axial 5mm" },
+            { DicomTag.Modality, "CT" },
+            { DicomTag.AccessionNumber, "ACC123456" },
+            { DicomTag.InstitutionName, "Test Hospital" },
+            { DicomTag.Manufacturer, "Test Manufacturer" },
+            { DicomTag.SliceThickness, 5m },
+            { DicomTag.KVP, 120m },
+            { DicomTag.ImagePositionPatient, new[] { -125m, -125m, 100m } },
+            { DicomTag.ImageOrientationPatient, new[] { 1m, 0m, 0m, 0m, 1m, 0m } },
+            { DicomTag.PixelSpacing, new[] { 0.5m, 0.5m } },
+            { DicomTag.Rows, (ushort)512 },
+            { DicomTag.Columns, (ushort)512 },
+            { DicomTag.BitsAllocated, (ushort)16 },
+            { DicomTag.WindowCenter, new[] { 40m, 400m } },
+            { DicomTag.WindowWidth, new[] { 80m, 2000m } },
+            { DicomTag.ImageComments, string.Concat(Enumerable.Repeat("Some free text comments. ", 40)) },
+        };
+
+        ds.Add(new DicomSequence(DicomTag.ReferencedImageSequence,
+            new DicomDataset
+            {
+                { DicomTag.ReferencedSOPClassUID, DicomUID.CTImageStorage },
+                { DicomTag.ReferencedSOPInstanceUID, DicomUIDGenerator.GenerateDerivedFromUUID() },
+            }));
+
+        return ds;
+    }
+}
@@ -0,0 +1,36 @@
+using System;
+using System.Collections.Generic;
+
+namespace SmiServices.Benchmarks.Harness;
+
+/// <summary>
+/// A single operation to be timed
+/// </summary>
+/// <param name="Name">Unique name of the benchmark, used to compare results between runs</param>
+/// <param name="Run">The operation. Should be small enough to be run many times</param>
+public sealed record Benchmark(string Name, Action Run);
+
+/// <summary>
+/// A set of benchmarks which share some setup
+/// </summary>
+public abstract class BenchmarkGroup : IDisposable
+{
+    /// <summary>
+    /// Prefix for the names of the benchmarks in this group
+    /// </summary>
+    public abstract string Name { get; }
+
+    /// <summary>
+    /// Reason the group can't be run, e.g. if it requires a database which hasn't been configured
+    /// </summary>
+    public virtual string? SkipReason => null;
+
+    public abstract IEnumerable<Benchmark> GetBenchmarks();
+
+    protected Benchmark Create(string name, Action run) => new($"{Name}.{name}", run);
+
+    public virtual void Dispose()
+    {
+        GC.SuppressFinalize(this);
+    }
+}
@@ -0,0 +1,78 @@
+using System;
+using System.Collections.Generic;
+using System.Diagnostics;
+using System.Linq;
+
+namespace SmiServices.Benchmarks.Harness;
+
+/// <summary>
+/// Result of running a <see cref="Benchmark"/>. Times are per operation
+/// </summary>
+public sealed record BenchmarkResult(
+    string Name,
+    double MedianNs,
+    double MeanNs,
+    double StdDevNs,
+    double AllocatedBytes,
+    long Operations
+);
+
+/// <summary>
+/// Times benchmarks by running each in batches which take at least <see cref="_minBatchTime"/>, after a warmup, and
+/// reporting statistics over the per-operation time of each batch
+/// </summary>
+public sealed class BenchmarkRunner
+{
+    private readonly TimeSpan _minBatchTime;
+    private readonly int _samples;
+
+    public BenchmarkRunner(TimeSpan minBatchTime, int samples)
+    {
+        if (samples < 1)
+            throw new ArgumentOutOfRangeException(nameof(samples), "Must be at least 1");
+
+        _minBatchTime = minBatchTime;
+        _samples = samples;
+    }
+
+    public BenchmarkResult Run(Benchmark benchmark)
+    {
+        // Warm up (and JIT), doubling the batch size until a batch takes long enough to time accurately
+        long batchSize = 1;
+        while (Time(benchmark.Run, batchSize) < _minBatchTime && batchSize < long.MaxValue / 2)
+            batchSize *= 2;
+
+        GC.Collect();
+        GC.WaitForPendingFinalizers();
+        GC.Collect();
+
+        var nsPerOp = new double[_samples];
+        var allocatedBefore = GC.GetAllocatedBytesForCurrentThread();
+
+        for (var i = 0; i < _samples; ++i)
+            nsPerOp[i] = Time(benchmark.Run, batchSize).TotalNanoseconds / batchSize;
+
+        var allocated = GC.GetAllocatedBytesForCurrentThread() - allocatedBefore;
+        var operations = batchSize * _samples;
+
+        var mean = nsPerOp.Average();
+        var stdDev = Math.Sqrt(nsPerOp.Sum(x => (x - mean) * (x - mean)) / nsPerOp.Length);
+
+        return new BenchmarkResult(benchmark.Name, Median(nsPerOp), mean, stdDev, (double)allocated / operations, operations);
+    }
+
+    private static TimeSpan Time(Action run, long count)
+    {
+        var start = Stopwatch.GetTimestamp();
+        for (long i = 0; i < count; ++i)
+            run();
+        return Stopwatch.GetElapsedTime(start);
+    }
+
+    private static double Median(IEnumerable<double> values)
+    {
+        var sorted = values.Order().ToArray();
+        var mid = sorted.Length / 2;
+        return sorted.Length % 2 == 1 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+    }
+}
@@ -0,0 +1,101 @@
+using CommandLine;
+using SmiServices.Benchmarks.Benchmarks;
+using SmiServices.Benchmarks.Harness;
+using SmiServices.Common.Options;
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.Linq;
+using System.Text.Json;
+
+namespace SmiServices.Benchmarks;
+
+public static class Program
+{
+    private sealed class BenchmarkCliOptions
+    {
+        [Option("filter", Required = false, HelpText = "Only run benchmarks whose name contains this string")]
+        public string? Filter { get; set; }
+
+        [Option("output", Required = false, HelpText = "Write the results to this JSON file")]
+        public string? Output { get; set; }
+
+        [Option('y', "yaml-file", Required = false, HelpText = "Yaml config file. Required for the database benchmarks")]
+        public string? YamlFile { get; set; }
+
+        [Option("samples", Default = 15, Required = false, HelpText = "Number of timed batches per benchmark")]
+        public int Samples { get; set; }
+
+        [Option("min-batch-ms", Default = 100, Required = false, HelpText = "Minimum duration of each timed batch")]
+        public int MinBatchMs { get; set; }
+    }
+
+    private static readonly JsonSerializerOptions _jsonOptions = new()
+    {
+        PropertyNamingPolicy = JsonNamingPolicy.SnakeCaseLower,
+        WriteIndented = true,
+    };
+
+    public static int Main(string[] args)
+    {
+        return Parser.Default
+            .ParseArguments<BenchmarkCliOptions>(args)
+            .MapResult(Run, _ => 1);
+    }
+
+    private static int Run(BenchmarkCliOptions options)
+    {
+        IdentifierMapperOptions? mapperOptions = null;
+        if (options.YamlFile != null)
+            mapperOptions = new GlobalOptionsFactory().Load(nameof(SmiServices.Benchmarks), options.YamlFile).IdentifierMapperOptions;
+
+        var runner = new BenchmarkRunner(TimeSpan.FromMilliseconds(options.MinBatchMs), options.Samples);
+        var results = new List<BenchmarkResult>();
+
+        Console.WriteLine($"{"Benchmark",-60} {"Median (ns)",14} {"StdDev (ns)",14} {"Alloc (B)",12}");
+
+        foreach (var createGroup in GetGroups(mapperOptions))
+        {
+            using var group = createGroup();
+
+            if (group.SkipReason != null)
+            {
+                Console.WriteLine($"{group.Name,-60} skipped: {group.SkipReason}");
+                continue;
+            }
+
+            foreach (var benchmark in group.GetBenchmarks())
+            {
+                if (options.Filter != null && !benchmark.Name.Contains(options.Filter, StringComparison.OrdinalIgnoreCase))
+                    continue;
+
+                var result = runner.Run(benchmark);
+                results.Add(result);
+
+                Console.WriteLine($"{result.Name,-60} {result.MedianNs,14:N1} {result.StdDevNs,14:N1} {result.AllocatedBytes,12:N0}");
+            }
+        }
+
+        if (options.Output != null)
+        {
+            var directory = Path.GetDirectoryName(Path.GetFullPath(options.Output));
+            if (directory != null)
+                Directory.CreateDirectory(directory);
+
+            File.WriteAllText(options.Output, JsonSerializer.Serialize(results.OrderBy(r => r.Name), _jsonOptions));
+        }
+
+        return 0;
+    }
+
+    // Groups are created lazily so only one group's setup (files, database tables) exists at a time
+    private static IEnumerable<Func<BenchmarkGroup>> GetGroups(IdentifierMapperOptions? mapperOptions)
+    {
+        yield return () => new MessageHeaderBenchmarks();
+        yield return () => new MessageSerializationBenchmarks();
+        yield return () => new ProducerModelBenchmarks();
+        yield return () => new DicomTypeTranslationBenchmarks();
+        yield return () => new TagReaderBenchmarks();
+        yield return () => new SwapperBenchmarks(mapperOptions);
+    }
+}
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Run the microbenchmarks and compare them against a stored baseline"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from collections.abc import Sequence
+
+import dotnet_common
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import common  # noqa: E402
+
+_BENCH_PROJ = f"{common.PROJ_ROOT}/benchmarks/SmiServices.Benchmarks"
+
+
+def _load(path: str) -> dict[str, float]:
+    with open(path) as f:
+        return {x["name"]: x["median_ns"] for x in json.load(f)}
+
+
+def _compare(
+    baseline: dict[str, float],
+    results: dict[str, float],
+    threshold: float,
+) -> int:
+    regressions = 0
+    for name, median in sorted(results.items()):
+        if name not in baseline:
+            print(f"{name:<60} {median:>14.1f} (new)")
+            continue
+        change = (median - baseline[name]) / baseline[name]
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions += 1
+        print(f"{name:<60} {median:>14.1f} {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(
+            f"{regressions} benchmark(s) slower than the baseline "
+            f"by more than {threshold:.0%}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+
+    parser = argparse.ArgumentParser()
+    dotnet_common.add_args(parser, "release")
+    parser.add_argument(
+        "--no-build",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--filter",
+        help="Only run benchmarks whose name contains this string",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=f"{common.PROJ_ROOT}/benchmarks/baseline.json",
+        help="Results to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Fractional increase in median time which counts as a regression",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Replace the baseline with the results of this run",
+    )
+    parser.add_argument(
+        "-y",
+        "--yaml-file",
+        help="Config file with a mapping database, for the swapper benchmarks",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.update_baseline and not os.path.isfile(args.baseline):
+        print(
+            f"Error: no baseline at {args.baseline}. "
+            "Run with --update-baseline to create one",
+            file=sys.stderr,
+        )
+        return 1
+
+    if not args.no_build:
+        cmd: tuple[str, ...] = (
+            "dotnet",
+            "build",
+            _BENCH_PROJ,
+            "-warnaserror",
+            "--use-current-runtime",
+            "--configuration",
+            args.configuration,
+            "--verbosity",
+            "quiet",
+            "--nologo",
+        )
+        common.run(cmd)
+
+    output = f"{common.DIST_DIR}/benchmarks/results.json"
+    cmd = (
+        "dotnet",
+        "run",
+        "--project",
+        _BENCH_PROJ,
+        "--no-build",
+        "-p:UseCurrentRuntimeIdentifier=True",
+        "--configuration",
+        args.configuration,
+        "--",
+        "--output",
+        output,
+        *(("--filter", args.filter) if args.filter else ()),
+        *(("--yaml-file", os.path.abspath(args.yaml_file)) if args.yaml_file else ()),
+    )
+    common.run(cmd)
+
+    if args.update_baseline:
+        shutil.copyfile(output, args.baseline)
+        print(f"Updated {args.baseline}")
+        return 0
+
+    return _compare(_load(args.baseline), _load(output), args.threshold)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
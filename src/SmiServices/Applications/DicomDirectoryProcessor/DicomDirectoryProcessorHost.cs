@@ -4,6 +4,7 @@ using SmiServices.Common.Options;
 using System;
 using System.Globalization;
 using System.IO;
+using System.IO.Abstractions;
 
 namespace SmiServices.Applications.DicomDirectoryProcessor;
 
@@ -14,6 +15,7 @@ public class DicomDirectoryProcessorHost : MicroserviceHost
 {
     private readonly DicomDirectoryProcessorCliOptions _cliOptions;
     private readonly IDicomDirectoryFinder _ddf;
+    private readonly DirectoryManifest? _manifest;
 
     /// <summary>
     /// Constructor
@@ -47,36 +49,51 @@ public class DicomDirectoryProcessorHost : MicroserviceHost
                 throw new ArgumentException("When in 'list' mode, path to accession directory file of format .csv expected (" + cliOptions.ToProcessDir.FullName + ")");
         }
 
+        DicomDirectoryFinder ddf;
+
         switch (cliOptions.DirectoryFormat.ToLower())
         {
             case "pacs":
                 Logger.Info("Creating PACS directory finder");
 
-                _ddf = new PacsDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
+                ddf = new PacsDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
                     globals.FileSystemOptions.DicomSearchPattern!, MessageBroker.SetupProducer(globals.ProcessDirectoryOptions!.AccessionDirectoryProducerOptions!, isBatch: false));
                 break;
             case "list":
                 Logger.Info("Creating accession directory lister");
 
-                _ddf = new AccessionDirectoryLister(globals.FileSystemOptions!.FileSystemRoot!,
+                ddf = new AccessionDirectoryLister(globals.FileSystemOptions!.FileSystemRoot!,
                     globals.FileSystemOptions.DicomSearchPattern!, MessageBroker.SetupProducer(globals.ProcessDirectoryOptions!.AccessionDirectoryProducerOptions!, isBatch: false));
                 break;
             case "default":
                 Logger.Info("Creating basic directory finder");
 
-                _ddf = new BasicDicomDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
+                ddf = new BasicDicomDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
                     globals.FileSystemOptions.DicomSearchPattern!, MessageBroker.SetupProducer(globals.ProcessDirectoryOptions!.AccessionDirectoryProducerOptions!, isBatch: false));
                 break;
             case "zips":
                 Logger.Info("Creating zip directory finder");
 
-                _ddf = new ZipDicomDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
+                ddf = new ZipDicomDirectoryFinder(globals.FileSystemOptions!.FileSystemRoot!,
                     globals.FileSystemOptions.DicomSearchPattern!, MessageBroker.SetupProducer(globals.ProcessDirectoryOptions!.AccessionDirectoryProducerOptions!, isBatch: false));
                 break;
             default:
                 throw new ArgumentException(
                     $"Could not match directory format {cliOptions.DirectoryFormat} to an directory scan implementation");
         }
+
+        ProcessDirectoryOptions options = globals.ProcessDirectoryOptions!;
+        ddf.MaxDegreeOfParallelism = options.MaxDegreeOfParallelism;
+
+        if (options.ManifestPath != null)
+        {
+            Logger.Info($"Using directory manifest {options.ManifestPath}");
+            _manifest = new DirectoryManifest(new FileSystem(), options.ManifestPath);
+            ddf.Manifest = _manifest;
+            ddf.CheckpointInterval = TimeSpan.FromSeconds(options.CheckpointIntervalSeconds);
+        }
+
+        _ddf = ddf;
     }
 
     /// <summary>
@@ -100,6 +117,7 @@ public class DicomDirectoryProcessorHost : MicroserviceHost
     public override void Stop(string reason)
     {
         _ddf.Stop();
+        _manifest?.Dispose();
         base.Stop(reason);
     }
 }
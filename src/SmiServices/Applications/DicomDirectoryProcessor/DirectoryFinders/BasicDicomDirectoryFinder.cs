@@ -1,6 +1,7 @@
 using SmiServices.Common.Messaging;
 using System;
 using System.Collections.Generic;
+using System.Diagnostics;
 using System.IO;
 using System.IO.Abstractions;
 using System.Linq;
@@ -28,98 +29,99 @@ public class BasicDicomDirectoryFinder : DicomDirectoryFinder
         Logger.Info("Starting directory scan of: " + topLevelDirectory);
         IsProcessing = true;
         TotalSent = 0;
+        TotalUnchanged = 0;
 
         if (!FileSystem.Directory.Exists(topLevelDirectory))
             throw new DirectoryNotFoundException("Could not find the top level directory at the start of the scan \"" + topLevelDirectory + "\"");
 
-        Times = [];
-        for (var i = 0; i < 6; ++i)
-            Times.Add([]);
+        DirectoryCrawler crawler;
 
-        var dirStack = new Stack<string>();
-        dirStack.Push(topLevelDirectory);
-
-        var largestStackSize = 1;
-
-        while (dirStack.Count > 0 && !TokenSource.IsCancellationRequested)
+        try
         {
-            Logger.Debug($"Start of loop, stack size is: {dirStack.Count}");
-
-            string dir = dirStack.Pop();
-            Logger.Debug($"Scanning {dir}");
-
-            if (!FileSystem.Directory.Exists(dir))
-            {
-                // Occurs too often on the VM for us to throw and exit from here, just have to log & continue for now
-                //throw new DirectoryNotFoundException("A previously seen directory can no longer be found: " + dir);
-
-                Logger.Warn($"Can no longer find {dir}, continuing");
-                continue;
-            }
-
-            // Lazy-evaluate the contents of the directory so we don't overwhelm the filesystem
-            // and return on the first instance of a dicom file
-
-            Stopwatch.Restart();
-            StringBuilder = new StringBuilder();
-
-            IDirectoryInfo dirInfo = FileSystem.DirectoryInfo.New(dir);
-            LogTime(TimeLabel.NewDirInfo);
-
-            IEnumerable<IFileInfo> fileEnumerator;
-            try
-            {
-                fileEnumerator = GetEnumerator(dirInfo);
-                LogTime(TimeLabel.EnumFiles);
-            }
-            catch (Exception e)
-            {
-                Logger.Error($"Couldn't enumerate files: {e.Message}");
-                continue;
-            }
-
-            bool hasDicom = fileEnumerator.FirstOrDefault() != null;
-            LogTime(TimeLabel.FirstOrDef);
-
-            // If directory contains any DICOM files report and don't go any further
-            if (hasDicom)
-            {
-                FoundNewDicomDirectory(dir);
-                LogTime(TimeLabel.FoundNewDir);
-            }
-
-            if (!hasDicom || AlwaysSearchSubdirectories)
-            {
-                Logger.Debug($"Enumerating subdirectories of {dir}");
-
-                IEnumerable<string> dirEnumerable = FileSystem.Directory.EnumerateDirectories(dir);
-                LogTime(TimeLabel.EnumDirs);
-
-                var totalSubDirs = 0;
-
-                foreach (string subDir in dirEnumerable)
-                {
-                    dirStack.Push(subDir);
-                    ++totalSubDirs;
-                }
-
-                if (dirStack.Count > largestStackSize)
-                    largestStackSize = dirStack.Count;
-
-                LogTime(TimeLabel.PushDirs);
-                Logger.Debug($"Found {totalSubDirs} subdirectories");
-            }
-
-            Logger.Debug(StringBuilder.ToString);
+            crawler = Crawl(topLevelDirectory, ScanDirectory);
+        }
+        finally
+        {
+            IsProcessing = false;
         }
-
-        IsProcessing = false;
 
         Logger.Info("Directory scan finished");
         Logger.Info($"Total messages sent: {TotalSent}");
-        Logger.Info($"Largest stack size was: {largestStackSize}");
+        if (Manifest != null)
+            Logger.Info($"Unchanged directories skipped: {TotalUnchanged}");
+        Logger.Info($"Largest backlog was: {crawler.LargestBacklog}");
 
         if (TotalSent > 0)
             Logger.Info(CalcAverages());
     }
+
+    /// <summary>
+    /// Sends a message if <paramref name="dir"/> contains any DICOM files
+    /// </summary>
+    /// <param name="dir"></param>
+    /// <returns>The subdirectories which should also be scanned</returns>
+    private IEnumerable<string> ScanDirectory(string dir)
+    {
+        Logger.Debug($"Scanning {dir}");
+
+        if (!FileSystem.Directory.Exists(dir))
+        {
+            // Occurs too often on the VM for us to throw and exit from here, just have to log & continue for now
+            //throw new DirectoryNotFoundException("A previously seen directory can no longer be found: " + dir);
+
+            Logger.Warn($"Can no longer find {dir}, continuing");
+            return [];
+        }
+
+        // Lazy-evaluate the contents of the directory so we don't overwhelm the filesystem
+        // and return on the first instance of a dicom file
+
+        var stopwatch = Stopwatch.StartNew();
+        StringBuilder? log = Logger.IsDebugEnabled ? new StringBuilder() : null;
+
+        IDirectoryInfo dirInfo = FileSystem.DirectoryInfo.New(dir);
+        LogTime(TimeLabel.NewDirInfo, stopwatch, log);
+
+        IEnumerable<IFileInfo> fileEnumerator;
+        try
+        {
+            fileEnumerator = GetEnumerator(dirInfo);
+            LogTime(TimeLabel.EnumFiles, stopwatch, log);
+        }
+        catch (Exception e)
+        {
+            Logger.Error($"Couldn't enumerate files: {e.Message}");
+            return [];
+        }
+
+        bool hasDicom = fileEnumerator.FirstOrDefault() != null;
+        LogTime(TimeLabel.FirstOrDef, stopwatch, log);
+
+        // If directory contains any DICOM files report and don't go any further
+        if (hasDicom)
+        {
+            FoundNewDicomDirectory(dir);
+            LogTime(TimeLabel.FoundNewDir, stopwatch, log);
+        }
+
+        List<string> subDirs = [];
+
+        if (!hasDicom || AlwaysSearchSubdirectories)
+        {
+            Logger.Debug($"Enumerating subdirectories of {dir}");
+
+            IEnumerable<string> dirEnumerable = FileSystem.Directory.EnumerateDirectories(dir);
+            LogTime(TimeLabel.EnumDirs, stopwatch, log);
+
+            subDirs.AddRange(dirEnumerable);
+
+            LogTime(TimeLabel.PushDirs, stopwatch, log);
+            Logger.Debug($"Found {subDirs.Count} subdirectories");
+        }
+
+        if (log != null)
+            Logger.Debug(log.ToString);
+
+        return subDirs;
+    }
 }
@@ -1,6 +1,7 @@
 using NLog;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.Metrics;
 using System;
 using System.Collections.Generic;
 using System.Diagnostics;
@@ -25,14 +26,30 @@ public abstract class DicomDirectoryFinder : IDicomDirectoryFinder
     protected readonly IFileSystem FileSystem;
 
     private readonly IProducerModel _directoriesProducerModel;
+    private readonly object _oSendLock = new();
     protected int TotalSent;
+    protected int TotalUnchanged;
 
     protected bool IsProcessing;
     protected readonly CancellationTokenSource TokenSource = new();
 
-    protected readonly Stopwatch Stopwatch = new();
-    protected StringBuilder? StringBuilder;
-    protected List<List<long>>? Times;
+    // Milliseconds taken by each step of scanning a directory, indexed by TimeLabel
+    private readonly RunningStatistics[] _times = Enum.GetValues<TimeLabel>().Select(_ => new RunningStatistics()).ToArray();
+
+    /// <summary>
+    /// Number of directories to scan at once. Raising this helps on filesystems where each directory listing is slow
+    /// </summary>
+    public int MaxDegreeOfParallelism { get; set; } = 1;
+
+    /// <summary>
+    /// If set, directories are only sent if they are new or have changed since they were last sent, and the scan is
+    /// checkpointed every <see cref="CheckpointInterval"/> so it can be resumed
+    /// </summary>
+    public DirectoryManifest? Manifest { get; set; }
+
+    public TimeSpan CheckpointInterval { get; set; } = TimeSpan.FromMinutes(1);
+
+    private long _lastCheckpointTicks;
 
     /// <summary>
     /// The filenames to look for in directories.  Defaults to *.dcm
@@ -103,21 +120,117 @@ public abstract class DicomDirectoryFinder : IDicomDirectoryFinder
 
         dirPath = dirPath.TrimStart(Path.DirectorySeparatorChar);
 
+        DateTime lastWriteTimeUtc = default;
+        var fileCount = 0;
+
+        if (Manifest != null)
+        {
+            IDirectoryInfo dirInfo = FileSystem.DirectoryInfo.New(FileSystem.Path.Combine(FileSystemRoot, dirPath));
+            lastWriteTimeUtc = dirInfo.LastWriteTimeUtc;
+            fileCount = GetEnumerator(dirInfo).Count();
+
+            if (!Manifest.HasChanged(dirPath, lastWriteTimeUtc, fileCount))
+            {
+                Logger.Debug($"DicomDirectoryFinder: {dirPath} is unchanged since it was last sent");
+                Interlocked.Increment(ref TotalUnchanged);
+                return;
+            }
+        }
+
         var message = new AccessionDirectoryMessage
         {
             DirectoryPath = dirPath,
         };
 
-        _directoriesProducerModel.SendMessage(message, isInResponseTo: null, routingKey: null);
-        ++TotalSent;
+        // Directories may be found by several threads at once, but the producer isn't safe to share
+        lock (_oSendLock)
+        {
+            _directoriesProducerModel.SendMessage(message, isInResponseTo: null, routingKey: null);
+            ++TotalSent;
+        }
+
+        Manifest?.Record(dirPath, lastWriteTimeUtc, fileCount);
     }
 
-    protected void LogTime(TimeLabel tl)
+    /// <summary>
+    /// Crawls from <paramref name="rootDir"/> (or from where the last scan of it stopped, if there is a
+    /// <see cref="Manifest"/>) using <see cref="MaxDegreeOfParallelism"/> threads
+    /// </summary>
+    /// <param name="rootDir"></param>
+    /// <param name="visit">Scans a directory and returns the subdirectories which should also be scanned</param>
+    /// <returns>The crawler, for its statistics</returns>
+    protected DirectoryCrawler Crawl(string rootDir, Func<string, IEnumerable<string>> visit)
     {
-        long elapsed = Stopwatch.ElapsedMilliseconds;
-        StringBuilder!.Append(tl + "=" + elapsed + "ms ");
-        Times![(int)tl].Add(elapsed);
-        Stopwatch.Restart();
+        var crawler = new DirectoryCrawler(MaxDegreeOfParallelism);
+
+        if (Manifest == null)
+        {
+            crawler.Crawl(rootDir, visit, TokenSource.Token);
+            return crawler;
+        }
+
+        List<string> frontier = Manifest.GetFrontier(rootDir);
+        if (frontier.Count > 0)
+            Logger.Info($"Resuming the previous scan of {rootDir} from {frontier.Count} checkpointed directories");
+        else
+            frontier.Add(rootDir);
+
+        _lastCheckpointTicks = Environment.TickCount64;
+
+        try
+        {
+            crawler.Crawl(frontier, dir =>
+            {
+                IEnumerable<string> subDirs = visit(dir);
+                CheckpointIfDue(rootDir, crawler);
+                return subDirs;
+            }, TokenSource.Token);
+        }
+        catch
+        {
+            Manifest.Checkpoint(rootDir, crawler.Snapshot());
+            throw;
+        }
+
+        List<string> remaining = crawler.Snapshot();
+        if (remaining.Count > 0)
+        {
+            Manifest.Checkpoint(rootDir, remaining);
+            Logger.Info($"Scan stopped with {remaining.Count} directories still to scan, which will be resumed next time");
+        }
+        else
+        {
+            Manifest.CompleteScan();
+        }
+
+        return crawler;
+    }
+
+    private void CheckpointIfDue(string rootDir, DirectoryCrawler crawler)
+    {
+        long last = Interlocked.Read(ref _lastCheckpointTicks);
+        long now = Environment.TickCount64;
+
+        // Only one thread should write each checkpoint
+        if (now - last < CheckpointInterval.TotalMilliseconds || Interlocked.CompareExchange(ref _lastCheckpointTicks, now, last) != last)
+            return;
+
+        Manifest!.Checkpoint(rootDir, crawler.Snapshot());
+        Logger.Debug("Checkpointed scan frontier");
+    }
+
+    /// <summary>
+    /// Records the time since <paramref name="stopwatch"/> was last restarted against <paramref name="tl"/>, then restarts it
+    /// </summary>
+    /// <param name="tl"></param>
+    /// <param name="stopwatch">Timer for the directory currently being scanned</param>
+    /// <param name="log">If not null, the time is also appended to this</param>
+    protected void LogTime(TimeLabel tl, Stopwatch stopwatch, StringBuilder? log)
+    {
+        long elapsed = stopwatch.ElapsedMilliseconds;
+        log?.Append(tl + "=" + elapsed + "ms ");
+        _times[(int)tl].Add(elapsed);
+        stopwatch.Restart();
     }
 
     protected string CalcAverages()
@@ -125,12 +238,10 @@ public abstract class DicomDirectoryFinder : IDicomDirectoryFinder
         var sb = new StringBuilder();
         sb.AppendLine("Averages:");
 
-        foreach (TimeLabel label in (TimeLabel[])Enum.GetValues(typeof(TimeLabel)))
+        foreach (TimeLabel label in Enum.GetValues<TimeLabel>())
         {
-            int count = Times![(int)label].Count;
-            long average = count == 0 ? 0 : Times[(int)label].Sum() / count;
-
-            sb.AppendLine(label + ":\t" + average + "ms");
+            RunningStatistics stats = _times[(int)label];
+            sb.AppendLine($"{label}:\t{stats.Mean:F1}ms (p50={stats.Percentile(50):F1}ms p95={stats.Percentile(95):F1}ms p99={stats.Percentile(99):F1}ms max={stats.Max}ms n={stats.Count})");
         }
 
         return sb.ToString();
@@ -0,0 +1,225 @@
+using System;
+using System.Collections.Generic;
+using System.Diagnostics.CodeAnalysis;
+using System.Linq;
+using System.Runtime.ExceptionServices;
+using System.Threading;
+
+namespace SmiServices.Applications.DicomDirectoryProcessor.DirectoryFinders;
+
+/// <summary>
+/// Walks a directory tree using several threads. Each thread works depth-first from its own deque, which keeps the
+/// number of queued directories small, and when it runs out it steals the oldest directory from another thread's deque.
+/// Those are nearest the root, so are likely to be the largest remaining subtrees. Each thread visits one directory at
+/// a time, so at most <see cref="MaxDegreeOfParallelism"/> directories are open at once
+/// </summary>
+public sealed class DirectoryCrawler
+{
+    public int MaxDegreeOfParallelism { get; }
+
+    /// <summary>
+    /// Largest number of directories waiting to be visited during the last crawl
+    /// </summary>
+    public long LargestBacklog => Interlocked.Read(ref _largestBacklog);
+
+    private readonly LinkedList<string>[] _deques;
+
+    // The directory each thread is visiting. Workers hold the read lock while moving a directory between here and the
+    // deques, so Snapshot (which takes the write lock) never sees one in neither place
+    private readonly string?[] _visiting;
+    private readonly ReaderWriterLockSlim _snapshotLock = new();
+
+    // Directories queued or being visited. The crawl is finished when this reaches 0
+    private long _pending;
+    private long _largestBacklog;
+    private Exception? _error;
+
+    public DirectoryCrawler(int maxDegreeOfParallelism)
+    {
+        if (maxDegreeOfParallelism < 1)
+            throw new ArgumentOutOfRangeException(nameof(maxDegreeOfParallelism), "Must be at least 1");
+
+        MaxDegreeOfParallelism = maxDegreeOfParallelism;
+        _deques = Enumerable.Range(0, maxDegreeOfParallelism).Select(_ => new LinkedList<string>()).ToArray();
+        _visiting = new string?[maxDegreeOfParallelism];
+    }
+
+    /// <summary>
+    /// Visits <paramref name="root"/> and every directory returned by <paramref name="visit"/>, returning once they have
+    /// all been visited. If <paramref name="visit"/> throws, the crawl is stopped and the first exception is rethrown
+    /// </summary>
+    /// <param name="root"></param>
+    /// <param name="visit">Called once for each directory, possibly from several threads at once. Returns the
+    /// subdirectories which should also be visited</param>
+    /// <param name="cancellationToken">Stops the crawl early, without throwing</param>
+    public void Crawl(string root, Func<string, IEnumerable<string>> visit, CancellationToken cancellationToken)
+        => Crawl([root], visit, cancellationToken);
+
+    /// <summary>
+    /// Visits each of <paramref name="roots"/> and every directory returned by <paramref name="visit"/>, returning once
+    /// they have all been visited. Used to resume a crawl from a <see cref="Snapshot"/>
+    /// </summary>
+    /// <param name="roots"></param>
+    /// <param name="visit"></param>
+    /// <param name="cancellationToken"></param>
+    public void Crawl(IReadOnlyList<string> roots, Func<string, IEnumerable<string>> visit, CancellationToken cancellationToken)
+    {
+        foreach (var deque in _deques)
+            deque.Clear();
+        Array.Clear(_visiting);
+
+        // Share the roots out so every thread has some work to start with
+        for (var i = 0; i < roots.Count; ++i)
+            _deques[i % _deques.Length].AddLast(roots[i]);
+
+        _pending = roots.Count;
+        _largestBacklog = roots.Count;
+        _error = null;
+
+        using var stopSource = CancellationTokenSource.CreateLinkedTokenSource(cancellationToken);
+
+        if (MaxDegreeOfParallelism == 1)
+        {
+            Work(0, visit, stopSource);
+        }
+        else
+        {
+            var threads = Enumerable
+                .Range(0, MaxDegreeOfParallelism)
+                .Select(i => new Thread(() => Work(i, visit, stopSource)) { IsBackground = true, Name = $"{nameof(DirectoryCrawler)}-{i}" })
+                .ToList();
+
+            threads.ForEach(t => t.Start());
+            threads.ForEach(t => t.Join());
+        }
+
+        if (_error != null)
+            ExceptionDispatchInfo.Throw(_error);
+    }
+
+    /// <summary>
+    /// Returns every directory which is still to be visited, or is being visited, so that an interrupted crawl can be
+    /// resumed by passing them to <see cref="Crawl(IReadOnlyList{string}, Func{string, IEnumerable{string}}, CancellationToken)"/>.
+    /// Safe to call during a crawl, including from the visit function, and after it has been stopped
+    /// </summary>
+    /// <returns></returns>
+    public List<string> Snapshot()
+    {
+        _snapshotLock.EnterWriteLock();
+        try
+        {
+            List<string> pending = [.. _visiting.OfType<string>()];
+            foreach (LinkedList<string> deque in _deques)
+                pending.AddRange(deque);
+            return pending;
+        }
+        finally
+        {
+            _snapshotLock.ExitWriteLock();
+        }
+    }
+
+    private void Work(int id, Func<string, IEnumerable<string>> visit, CancellationTokenSource stopSource)
+    {
+        var spinner = new SpinWait();
+
+        while (Interlocked.Read(ref _pending) > 0 && !stopSource.IsCancellationRequested)
+        {
+            string? dir;
+            _snapshotLock.EnterReadLock();
+            try
+            {
+                if (TryTake(id, out dir))
+                    _visiting[id] = dir;
+            }
+            finally
+            {
+                _snapshotLock.ExitReadLock();
+            }
+
+            if (dir == null)
+            {
+                // Another thread is still visiting a directory which may produce more work
+                spinner.SpinOnce();
+                continue;
+            }
+
+            spinner.Reset();
+
+            try
+            {
+                List<string> subDirs = visit(dir).ToList();
+
+                // Count them before they can be stolen, so _pending can't reach 0 early
+                UpdateLargestBacklog(Interlocked.Add(ref _pending, subDirs.Count));
+
+                _snapshotLock.EnterReadLock();
+                try
+                {
+                    lock (_deques[id])
+                        foreach (string subDir in subDirs)
+                            _deques[id].AddLast(subDir);
+
+                    // Left set if visit throws, so the directory is still in any snapshot and is retried on resume
+                    _visiting[id] = null;
+                }
+                finally
+                {
+                    _snapshotLock.ExitReadLock();
+                }
+            }
+            catch (Exception e)
+            {
+                Interlocked.CompareExchange(ref _error, e, null);
+                stopSource.Cancel();
+            }
+            finally
+            {
+                Interlocked.Decrement(ref _pending);
+            }
+        }
+    }
+
+    private bool TryTake(int id, [NotNullWhen(true)] out string? dir)
+    {
+        LinkedList<string> own = _deques[id];
+        lock (own)
+        {
+            if (own.Last != null)
+            {
+                dir = own.Last.Value;
+                own.RemoveLast();
+                return true;
+            }
+        }
+
+        for (var i = 1; i < _deques.Length; ++i)
+        {
+            LinkedList<string> victim = _deques[(id + i) % _deques.Length];
+            lock (victim)
+            {
+                if (victim.First == null)
+                    continue;
+
+                dir = victim.First.Value;
+                victim.RemoveFirst();
+                return true;
+            }
+        }
+
+        dir = null;
+        return false;
+    }
+
+    private void UpdateLargestBacklog(long pending)
+    {
+        long largest = Interlocked.Read(ref _largestBacklog);
+        while (pending > largest)
+        {
+            long previous = Interlocked.CompareExchange(ref _largestBacklog, pending, largest);
+            if (previous == largest)
+                return;
+            largest = previous;
+        }
+    }
+}
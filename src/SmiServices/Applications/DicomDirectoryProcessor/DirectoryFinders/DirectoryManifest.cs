@@ -0,0 +1,242 @@
+using SmiServices.Common.Helpers;
+using System;
+using System.Collections.Generic;
+using System.Diagnostics.CodeAnalysis;
+using System.Globalization;
+using System.IO;
+using System.IO.Abstractions;
+
+namespace SmiServices.Applications.DicomDirectoryProcessor.DirectoryFinders;
+
+/// <summary>
+/// Remembers which accession directories have already been sent, so that a rescan only sends those which are new or
+/// have changed since, and checkpoints the directories still to be scanned so an interrupted scan can be resumed.
+/// <para>
+/// Directories are recorded in an append-only file with one tab-separated line per send (path, last write time, file
+/// count, and time sent), where later lines replace earlier ones. The file is compacted each time it is opened. The
+/// scan frontier is kept alongside it in a ".frontier" file, which is replaced at each checkpoint and deleted when a
+/// scan completes
+/// </para>
+/// </summary>
+public sealed class DirectoryManifest : IDisposable
+{
+    public sealed record Entry(DateTime LastWriteTimeUtc, int FileCount, DateTime LastSentUtc);
+
+    public string Path { get; }
+
+    private readonly IFileSystem _fileSystem;
+    private readonly DateTimeProvider _dateTimeProvider;
+    private readonly string _frontierPath;
+
+    private readonly object _oLock = new();
+    private readonly Dictionary<string, Entry> _entries = [];
+    private readonly StreamWriter _writer;
+
+    /// <summary>
+    /// Opens the manifest at <paramref name="path"/>, creating it if it doesn't exist
+    /// </summary>
+    /// <param name="fileSystem"></param>
+    /// <param name="path"></param>
+    /// <param name="dateTimeProvider"></param>
+    /// <exception cref="InvalidDataException">If the file contains a line which can't be parsed, other than the last</exception>
+    public DirectoryManifest(IFileSystem fileSystem, string path, DateTimeProvider? dateTimeProvider = null)
+    {
+        _fileSystem = fileSystem;
+        _dateTimeProvider = dateTimeProvider ?? new DateTimeProvider();
+        Path = path;
+        _frontierPath = path + ".frontier";
+
+        var lines = 0;
+        var tornLastLine = false;
+        if (_fileSystem.File.Exists(path))
+        {
+            string? last = null;
+            foreach (string line in _fileSystem.File.ReadLines(path))
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                    continue;
+
+                if (last != null)
+                {
+                    (string dir, Entry entry) = Parse(last);
+                    _entries[dir] = entry;
+                    ++lines;
+                }
+
+                last = line;
+            }
+
+            // A crash while appending can leave a partial last line. It is dropped, and so removed by the rewrite below
+            if (last != null)
+            {
+                if (EndsWithNewline(path) && TryParse(last, out string? dir, out Entry? entry))
+                {
+                    _entries[dir] = entry;
+                    ++lines;
+                }
+                else
+                    tornLastLine = true;
+            }
+        }
+
+        // Drop the lines which have since been replaced
+        if (tornLastLine || lines > _entries.Count)
+            Replace(path, Format(_entries));
+
+        _writer = _fileSystem.File.AppendText(path);
+        _writer.AutoFlush = true;
+    }
+
+    public int Count
+    {
+        get
+        {
+            lock (_oLock)
+                return _entries.Count;
+        }
+    }
+
+    public Entry? Get(string dir)
+    {
+        lock (_oLock)
+            return _entries.GetValueOrDefault(dir);
+    }
+
+    /// <summary>
+    /// Returns true if <paramref name="dir"/> has not been recorded, or has a different last write time or file count
+    /// </summary>
+    /// <param name="dir"></param>
+    /// <param name="lastWriteTimeUtc"></param>
+    /// <param name="fileCount"></param>
+    /// <returns></returns>
+    public bool HasChanged(string dir, DateTime lastWriteTimeUtc, int fileCount)
+    {
+        Entry? entry = Get(dir);
+        return entry == null || entry.LastWriteTimeUtc != lastWriteTimeUtc || entry.FileCount != fileCount;
+    }
+
+    /// <summary>
+    /// Records that <paramref name="dir"/> has just been sent
+    /// </summary>
+    /// <param name="dir"></param>
+    /// <param name="lastWriteTimeUtc"></param>
+    /// <param name="fileCount"></param>
+    public void Record(string dir, DateTime lastWriteTimeUtc, int fileCount)
+    {
+        var entry = new Entry(lastWriteTimeUtc, fileCount, _dateTimeProvider.UtcNow());
+
+        lock (_oLock)
+        {
+            _entries[dir] = entry;
+            _writer.WriteLine(Format(dir, entry));
+        }
+    }
+
+    /// <summary>
+    /// Returns the directories which were still to be scanned when a scan of <paramref name="rootDir"/> last
+    /// checkpointed, or an empty list if there is no unfinished scan of it
+    /// </summary>
+    /// <param name="rootDir"></param>
+    /// <returns></returns>
+    public List<string> GetFrontier(string rootDir)
+    {
+        lock (_oLock)
+        {
+            if (!_fileSystem.File.Exists(_frontierPath))
+                return [];
+
+            using var reader = _fileSystem.File.OpenText(_frontierPath);
+            if (reader.ReadLine() != rootDir)
+                return [];
+
+            List<string> frontier = [];
+            while (reader.ReadLine() is { } line)
+                if (line.Length > 0)
+                    frontier.Add(line);
+            return frontier;
+        }
+    }
+
+    /// <summary>
+    /// Saves the directories still to be scanned in a scan of <paramref name="rootDir"/>, replacing any previous checkpoint
+    /// </summary>
+    /// <param name="rootDir"></param>
+    /// <param name="pending"></param>
+    public void Checkpoint(string rootDir, IEnumerable<string> pending)
+    {
+        lock (_oLock)
+            Replace(_frontierPath, [rootDir, .. pending]);
+    }
+
+    /// <summary>
+    /// Removes the checkpoint, once a scan has finished
+    /// </summary>
+    public void CompleteScan()
+    {
+        lock (_oLock)
+            _fileSystem.File.Delete(_frontierPath);
+    }
+
+    public void Dispose()
+    {
+        lock (_oLock)
+            _writer.Dispose();
+    }
+
+    // Writes to a temporary file first so a crash can't leave a partial file behind
+    private void Replace(string path, IEnumerable<string> lines)
+    {
+        string tmpPath = path + ".tmp";
+        _fileSystem.File.WriteAllLines(tmpPath, lines);
+        _fileSystem.File.Move(tmpPath, path, overwrite: true);
+    }
+
+    private bool EndsWithNewline(string path)
+    {
+        using var stream = _fileSystem.File.OpenRead(path);
+        if (stream.Length == 0)
+            return true;
+
+        stream.Seek(-1, SeekOrigin.End);
+        return stream.ReadByte() == '\n';
+    }
+
+    private static IEnumerable<string> Format(Dictionary<string, Entry> entries)
+    {
+        foreach ((string dir, Entry entry) in entries)
+            yield return Format(dir, entry);
+    }
+
+    private static string Format(string dir, Entry entry)
+        => string.Join('\t', dir, entry.LastWriteTimeUtc.Ticks, entry.FileCount, entry.LastSentUtc.Ticks);
+
+    private static (string, Entry) Parse(string line)
+    {
+        if (!TryParse(line, out string? dir, out Entry? entry))
+            throw new InvalidDataException($"Could not parse manifest line '{line}'");
+
+        return (dir, entry);
+    }
+
+    private static bool TryParse(string line, [NotNullWhen(true)] out string? dir, [NotNullWhen(true)] out Entry? entry)
+    {
+        dir = null;
+        entry = null;
+
+        // Parse from the end, since only the path could contain a tab
+        string[] parts = line.Split('\t');
+        if (parts.Length < 4)
+            return false;
+
+        var n = parts.Length;
+        if (!long.TryParse(parts[n - 3], NumberStyles.None, CultureInfo.InvariantCulture, out long lastWriteTicks) ||
+            !int.TryParse(parts[n - 2], NumberStyles.None, CultureInfo.InvariantCulture, out int fileCount) ||
+            !long.TryParse(parts[n - 1], NumberStyles.None, CultureInfo.InvariantCulture, out long lastSentTicks) ||
+            lastWriteTicks > DateTime.MaxValue.Ticks || lastSentTicks > DateTime.MaxValue.Ticks)
+            return false;
+
+        dir = string.Join('\t', parts[..(n - 3)]);
+        entry = new Entry(new DateTime(lastWriteTicks, DateTimeKind.Utc), fileCount, new DateTime(lastSentTicks, DateTimeKind.Utc));
+        return true;
+    }
+}
@@ -27,6 +27,7 @@ public class PacsDirectoryFinder : DicomDirectoryFinder
         Logger.Info("Starting directory scan of: " + rootDir);
         IsProcessing = true;
         TotalSent = 0;
+        TotalUnchanged = 0;
 
         if (!FileSystem.Directory.Exists(rootDir))
             throw new DirectoryNotFoundException("Could not find the root directory at the start of the scan \"" + rootDir + "\"");
@@ -39,40 +40,13 @@ public class PacsDirectoryFinder : DicomDirectoryFinder
         }
         else
         {
-            Times = [];
-            for (var i = 0; i < 6; ++i)
-                Times.Add([]);
-
-            var dirStack = new Stack<string>();
-            dirStack.Push(rootDir);
-
-            while (dirStack.Count > 0 && !TokenSource.IsCancellationRequested)
+            try
             {
-                string dir = dirStack.Pop();
-                Logger.Debug("Scanning " + dir);
-
-                IDirectoryInfo dirInfo = FileSystem.DirectoryInfo.New(dir);
-
-                if (!dirInfo.Exists)
-                {
-                    Logger.Warn("Can no longer find " + dir + ", continuing");
-                    continue;
-                }
-
-                IEnumerable<IDirectoryInfo> subDirs = dirInfo.EnumerateDirectories();
-
-                if (_dayDirectoryRegex.IsMatch(dir))
-                {
-                    Logger.Debug("At the day level, assuming all subdirs are accession directories");
-                    // At the day level, so each of the subdirectories will be accession directories
-                    foreach (IDirectoryInfo accessionDir in subDirs)
-                        FoundNewDicomDirectory(accessionDir.FullName);
-                }
-                else
-                {
-                    Logger.Debug("Not at the day level, checking subdirectories");
-                    subDirs.ToList().ForEach(x => dirStack.Push(x.FullName));
-                }
+                Crawl(rootDir, ScanDirectory);
+            }
+            finally
+            {
+                IsProcessing = false;
             }
         }
 
@@ -80,5 +54,40 @@ public class PacsDirectoryFinder : DicomDirectoryFinder
 
         Logger.Info("Directory scan finished");
         Logger.Info("Total messages sent: " + TotalSent);
+        if (Manifest != null)
+            Logger.Info("Unchanged directories skipped: " + TotalUnchanged);
+    }
+
+    /// <summary>
+    /// Sends a message for each subdirectory of <paramref name="dir"/> if it is at the day level
+    /// </summary>
+    /// <param name="dir"></param>
+    /// <returns>The subdirectories which should also be scanned</returns>
+    private IEnumerable<string> ScanDirectory(string dir)
+    {
+        Logger.Debug("Scanning " + dir);
+
+        IDirectoryInfo dirInfo = FileSystem.DirectoryInfo.New(dir);
+
+        if (!dirInfo.Exists)
+        {
+            Logger.Warn("Can no longer find " + dir + ", continuing");
+            return [];
+        }
+
+        IEnumerable<IDirectoryInfo> subDirs = dirInfo.EnumerateDirectories();
+
+        if (_dayDirectoryRegex.IsMatch(dir))
+        {
+            Logger.Debug("At the day level, assuming all subdirs are accession directories");
+            // At the day level, so each of the subdirectories will be accession directories
+            foreach (IDirectoryInfo accessionDir in subDirs)
+                FoundNewDicomDirectory(accessionDir.FullName);
+
+            return [];
+        }
+
+        Logger.Debug("Not at the day level, checking subdirectories");
+        return subDirs.Select(x => x.FullName).ToList();
     }
 }
@@ -17,8 +17,8 @@ using SmiServices.Microservices.DicomRelationalMapper;
 using System;
 using System.Collections.Generic;
 using System.IO;
-using System.Linq;
 using System.Threading;
+using System.Threading.Channels;
 using System.Threading.Tasks;
 using System.Diagnostics.CodeAnalysis;
 
@@ -91,50 +91,74 @@ public static class DicomLoader
                 throw new InvalidOperationException("DicomRelationalMapper LoadMetadataId not set"));
             var liveDatabaseName = lmd.GetDistinctLiveDatabaseServer().GetCurrentDatabase()?.GetRuntimeName() ??
                                    throw new ApplicationException("No database found");
-            var instance =
-                new MicroserviceObjectFactory().CreateInstance<INameDatabasesAndTablesDuringLoads>(databaseNamerType,
-                    liveDatabaseName, go.DicomRelationalMapperOptions.Guid) ??
-                throw new InvalidOperationException($"Failed to instantiate {nameof(INameDatabasesAndTablesDuringLoads)}");
-            host = new ParallelDLEHost(rdmpRepo, instance, true);
+            ParallelDLEHost CreateHost(Guid namerGuid)
+            {
+                var instance =
+                    new MicroserviceObjectFactory().CreateInstance<INameDatabasesAndTablesDuringLoads>(databaseNamerType,
+                        liveDatabaseName, namerGuid) ??
+                    throw new InvalidOperationException($"Failed to instantiate {nameof(INameDatabasesAndTablesDuringLoads)}");
+                return new ParallelDLEHost(rdmpRepo, instance, true);
+            }
 
-            // MatchMode: reconcile Mongo contents with SQL:
+            // MatchMode: reconcile Mongo contents with SQL, with a separate host (and staging tables) per worker:
             if (dicomLoaderOptions.MatchMode != null)
             {
-                var findOptions = new FindOptions<BsonDocument, BsonDocument>
-                {
-                    Sort = "{\"header.DicomFilePath\":1}"
-                };
-                using var cursor = mongo.GetCollection<BsonDocument>(go.MongoDbPopulatorOptions.ImageCollection).FindSync(dicomLoaderOptions.MatchMode, findOptions, cts.Token);
-                Loader.FlushRelational(host ?? throw new InvalidOperationException(),
-                    lmd ?? throw new InvalidOperationException(),
-                    cursor.ToEnumerable(cts.Token).Select(Loader.ParseBson));
+                new MatchReplayer(
+                        mongo.GetCollection<BsonDocument>(go.MongoDbPopulatorOptions.ImageCollection), lmd,
+                        () => CreateHost(Guid.NewGuid()), dicomLoaderOptions.MatchParallelism,
+                        dicomLoaderOptions.BatchSize, dicomLoaderOptions.MatchProgress)
+                    .Run(dicomLoaderOptions.MatchMode, cts.Token);
                 return 0;
             }
+
+            host = CreateHost(go.DicomRelationalMapperOptions.Guid);
         }
 
         Loader loader =
             new(
                 mongo,
                 go.MongoDbPopulatorOptions.ImageCollection, go.MongoDbPopulatorOptions.SeriesCollection, dicomLoaderOptions, host, lmd);
+        if (!dicomLoaderOptions.DeleteConflicts)
+            loader.PrefetchExistingPaths(cts.Token);
         LineReader.LineReader fileNames = new(fileList ?? Console.OpenStandardInput(), '\0');
-        ParallelOptions parallelOptions = new()
-        {
-            MaxDegreeOfParallelism = dicomLoaderOptions.Parallelism,
-            CancellationToken = cts.Token
-        };
-        Parallel.ForEachAsync(fileNames.ReadLines(), parallelOptions, loader.Load).Wait(cts.Token);
+        LoadAll(loader, fileNames.ReadLines(), dicomLoaderOptions.Parallelism, cts.Token);
         Console.CancelKeyPress -= CancelHandler;
         _cts = null;
-        loader.Flush();
+        loader.Complete();
         loader.Report();
         if (dicomLoaderOptions.ForceRecount)
-        {
-            // TODO: Implement recalculating SeriesCollection from ImageCollection
-            throw new NotImplementedException();
-        }
+            new SeriesRecounter(mongo, go.MongoDbPopulatorOptions.ImageCollection, go.MongoDbPopulatorOptions.SeriesCollection).Recount(cts.Token);
 
         return 0;
     }
+
+    /// <summary>
+    /// Pass each of <paramref name="fileNames"/> to <paramref name="loader"/>, <paramref name="parallelism"/> at a time.
+    /// The caller still has to <see cref="Loader.Complete"/> the loader afterwards
+    /// </summary>
+    /// <param name="loader"></param>
+    /// <param name="fileNames">Files or archives to load</param>
+    /// <param name="parallelism">Number of files to load at once, or -1 for no limit</param>
+    /// <param name="ct">Cancellation token</param>
+    /// <exception cref="Exception">The original error if a later stage of <paramref name="loader"/> failed and stopped loading</exception>
+    public static void LoadAll(Loader loader, IEnumerable<string> fileNames, int parallelism, CancellationToken ct)
+    {
+        ParallelOptions parallelOptions = new()
+        {
+            MaxDegreeOfParallelism = parallelism,
+            CancellationToken = ct
+        };
+        try
+        {
+            Parallel.ForEachAsync(fileNames, parallelOptions, loader.Load).Wait(ct);
+        }
+        catch (AggregateException e) when (e.InnerException is ChannelClosedException)
+        {
+            // A later stage failed and stopped loading, so throw its error instead
+            loader.Complete();
+            throw;
+        }
+    }
 }
 
 public class DicomLoaderOptions : CliOptions
@@ -159,7 +183,18 @@ public class DicomLoaderOptions : CliOptions
     [Option('m', "match", Default = null, Required = false, HelpText = "Copy matching Mongo entries to SQL and exit")]
     public string? MatchMode { get; set; }
 
-    [Option('r', "ramLimit", Default = 16, Required = false, HelpText = "RAM threshold to flush in GiB")]
+    [Option("match-parallelism", Default = 4, Required = false, HelpText = "Number of _id ranges to copy to SQL at once with --match")]
+    public int MatchParallelism { get; set; } = 4;
+
+    [Option(
+        "match-progress",
+        Default = null,
+        Required = false,
+        HelpText = "File to record --match progress in. If it exists, the copy resumes from it"
+    )]
+    public string? MatchProgress { get; set; }
+
+    [Option('r', "ramLimit", Default = 16, Required = false, HelpText = "No longer used: memory use is bounded by --batch-size and --queued-batches")]
     public long RamLimit
     {
         get;
@@ -167,16 +202,41 @@ public class DicomLoaderOptions : CliOptions
         set;
     } = 16;
 
+    [Option("bson-threads", Default = 2, Required = false, HelpText = "Number of threads converting DICOM to BSON")]
+    public int BsonThreads { get; set; } = 2;
+
+    [Option("mongo-writers", Default = 2, Required = false, HelpText = "Number of batches to insert into Mongo at once")]
+    public int MongoWriters { get; set; } = 2;
+
+    [Option("batch-size", Default = 10_000, Required = false, HelpText = "Number of images in each Mongo insert and SQL load")]
+    public int BatchSize { get; set; } = 10_000;
+
+    [Option(
+        "queued-batches",
+        Default = 4,
+        Required = false,
+        HelpText = "Number of batches which may wait between each stage. Together with --batch-size, this bounds memory use"
+    )]
+    public int QueuedBatches { get; set; } = 4;
+
     [Option('s', "sql", Default = false, Required = false, HelpText = "Load data on to the SQL stage after Mongo")]
     // ReSharper disable once UnusedAutoPropertyAccessor.Global
     public bool LoadSql { get; set; }
 
+    [Option(
+        "tags",
+        Separator = ',',
+        Required = false,
+        HelpText = "Comma-separated keywords, tags, or 4-digit hex groups to load. All other tags are dropped (UIDs are always kept)"
+    )]
+    public IEnumerable<string>? TagAllowList { get; set; }
+
     [Option(
         't',
         "totals",
         Default = false,
         Required = false,
-        HelpText = "Rebuild the Mongo SeriesCollection data and image counts based on the ImageCollection contents (TODO)"
+        HelpText = "After loading, recount the images in each series in the Mongo SeriesCollection from the ImageCollection contents"
     )]
     public bool ForceRecount { get; [UsedImplicitly] set; }
 }
@@ -0,0 +1,73 @@
+using MongoDB.Bson;
+using MongoDB.Driver;
+using System;
+using System.Collections.Generic;
+using System.Linq;
+using System.Threading;
+
+namespace SmiServices.Applications.DicomLoader;
+
+/// <summary>
+/// Splits a collection into ranges of _id, which is always indexed, so that large collections can be worked through
+/// a piece at a time
+/// </summary>
+public static class IdRangePartitioner
+{
+    // Sampled documents per boundary, to even out the partition sizes
+    private const int SamplesPerBoundary = 16;
+
+    /// <summary>
+    /// Pick _id values which split <paramref name="collection"/> into partitions of roughly
+    /// <paramref name="documentsPerPartition"/> documents, from a random sample of it
+    /// </summary>
+    /// <param name="collection"></param>
+    /// <param name="documentsPerPartition"></param>
+    /// <param name="ct"></param>
+    /// <returns>Sorted boundaries, which may be empty for a single partition. Partition i is [boundaries[i-1], boundaries[i])</returns>
+    public static List<BsonValue> Boundaries(IMongoCollection<BsonDocument> collection, long documentsPerPartition, CancellationToken ct)
+    {
+        var partitions = (int)Math.Min(int.MaxValue / SamplesPerBoundary, collection.EstimatedDocumentCount(cancellationToken: ct) / documentsPerPartition + 1);
+        if (partitions == 1)
+            return [];
+
+        var sampled = collection
+            .Aggregate(new AggregateOptions { AllowDiskUse = true }, ct)
+            .Sample(partitions * SamplesPerBoundary)
+            .Project(Builders<BsonDocument>.Projection.Include("_id"))
+            .Sort(Builders<BsonDocument>.Sort.Ascending("_id"))
+            .ToList(ct)
+            .Select(d => d["_id"])
+            .ToList();
+
+        return sampled
+            .Where((_, i) => i > 0 && i % SamplesPerBoundary == 0)
+            .Distinct()
+            .ToList();
+    }
+
+    /// <summary>
+    /// Filter for the <paramref name="partition"/>th range of <paramref name="boundaries"/>
+    /// </summary>
+    /// <param name="boundaries">From <see cref="Boundaries"/></param>
+    /// <param name="partition">From 0 to boundaries.Count inclusive</param>
+    /// <returns></returns>
+    public static BsonDocument RangeFilter(IReadOnlyList<BsonValue> boundaries, int partition)
+        => RangeFilter(partition == 0 ? null : boundaries[partition - 1], partition == boundaries.Count ? null : boundaries[partition]);
+
+    /// <summary>
+    /// Filter for _id in [<paramref name="lower"/>, <paramref name="upper"/>)
+    /// </summary>
+    /// <param name="lower">Inclusive lower bound, or null for no bound</param>
+    /// <param name="upper">Exclusive upper bound, or null for no bound</param>
+    /// <returns></returns>
+    public static BsonDocument RangeFilter(BsonValue? lower, BsonValue? upper)
+    {
+        var range = new BsonDocument();
+        if (lower is not null)
+            range.Add("$gte", lower);
+        if (upper is not null)
+            range.Add("$lt", upper);
+
+        return range.ElementCount == 0 ? new BsonDocument() : new BsonDocument("_id", range);
+    }
+}
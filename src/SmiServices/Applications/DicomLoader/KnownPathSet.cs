@@ -0,0 +1,147 @@
+using System;
+using System.Numerics;
+
+namespace SmiServices.Applications.DicomLoader;
+
+/// <summary>
+/// A compact set of file paths, used to skip files which are already loaded without querying Mongo for each. Only a
+/// 64-bit hash of each path is kept, in an open-addressed table, so it costs 11-22 bytes per path however long
+/// the paths are, and the number of paths is only limited by memory. The chance of a new path being mistaken for a
+/// known one is about Count/2^64 (under 1 in 10^10 for 100 million paths). Contains may be called from several
+/// threads at once, but not while Add is running
+/// </summary>
+public sealed class KnownPathSet
+{
+    private const int MinCapacity = 16;
+
+    // The table is split into segments of this many slots, so it isn't limited by the maximum length of an array
+    public const int DefaultSegmentLength = 1 << 24;
+
+    private readonly int _segmentLength;
+
+    // 0 marks an empty slot, so no path may hash to it
+    private ulong[][] _segments;
+    private long _mask;
+
+    public long Count { get; private set; }
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="expectedCount">Number of paths expected, to avoid regrowing the table while it is filled</param>
+    /// <param name="segmentLength">Number of slots in each segment of the table. Must be a power of 2</param>
+    public KnownPathSet(long expectedCount = 0, int segmentLength = DefaultSegmentLength)
+    {
+        if (segmentLength < 1 || !BitOperations.IsPow2(segmentLength))
+            throw new ArgumentOutOfRangeException(nameof(segmentLength), "Must be a power of 2");
+
+        _segmentLength = segmentLength;
+        _segments = Allocate(CapacityFor(expectedCount));
+        _mask = Capacity(_segments) - 1;
+    }
+
+    /// <summary>
+    /// Adds <paramref name="path"/>, returning false if it was already present
+    /// </summary>
+    /// <param name="path"></param>
+    /// <returns></returns>
+    public bool Add(string path)
+    {
+        // Keep the table at most 3/4 full so probe sequences stay short
+        if ((Count + 1) * 4 > (_mask + 1) * 3)
+            Grow();
+
+        if (!Insert(_segments, _mask, Hash(path)))
+            return false;
+
+        ++Count;
+        return true;
+    }
+
+    public bool Contains(string path)
+    {
+        ulong hash = Hash(path);
+        int shift = BitOperations.Log2((uint)_segments[0].Length);
+        int offsetMask = _segments[0].Length - 1;
+
+        for (long i = (long)hash & _mask; ; i = (i + 1) & _mask)
+        {
+            ulong slot = _segments[i >> shift][i & offsetMask];
+            if (slot == hash)
+                return true;
+            if (slot == 0)
+                return false;
+        }
+    }
+
+    private void Grow()
+    {
+        var segments = Allocate(Capacity(_segments) * 2);
+        long mask = Capacity(segments) - 1;
+
+        foreach (ulong[] segment in _segments)
+            foreach (ulong hash in segment)
+                if (hash != 0)
+                    Insert(segments, mask, hash);
+
+        _segments = segments;
+        _mask = mask;
+    }
+
+    private ulong[][] Allocate(long capacity)
+    {
+        // Small tables are a single segment of just the size needed
+        int segmentLength = (int)Math.Min(capacity, _segmentLength);
+        if (capacity / segmentLength > Array.MaxLength)
+            throw new InvalidOperationException("Too many paths to hold in memory");
+
+        var segments = new ulong[capacity / segmentLength][];
+        for (int i = 0; i < segments.Length; ++i)
+            segments[i] = new ulong[segmentLength];
+        return segments;
+    }
+
+    private static long Capacity(ulong[][] segments) => (long)segments.Length * segments[0].Length;
+
+    private static bool Insert(ulong[][] segments, long mask, ulong hash)
+    {
+        int shift = BitOperations.Log2((uint)segments[0].Length);
+        int offsetMask = segments[0].Length - 1;
+
+        for (long i = (long)hash & mask; ; i = (i + 1) & mask)
+        {
+            ref ulong slot = ref segments[i >> shift][i & offsetMask];
+            if (slot == hash)
+                return false;
+
+            if (slot != 0)
+                continue;
+
+            slot = hash;
+            return true;
+        }
+    }
+
+    private static long CapacityFor(long expectedCount)
+    {
+        long wanted = Math.Clamp(expectedCount / 3 * 4 + 4, MinCapacity, 1L << 62);
+        return (long)BitOperations.RoundUpToPowerOf2((ulong)wanted);
+    }
+
+    // FNV-1a over the UTF-16 code units, then the SplitMix64 finalizer so the low bits used for the slot index are well mixed
+    private static ulong Hash(string path)
+    {
+        ulong hash = 14695981039346656037UL;
+        foreach (char c in path)
+        {
+            hash = (hash ^ (byte)c) * 1099511628211UL;
+            hash = (hash ^ (byte)(c >> 8)) * 1099511628211UL;
+        }
+
+        hash = (hash ^ (hash >> 30)) * 0xBF58476D1CE4E5B9UL;
+        hash = (hash ^ (hash >> 27)) * 0x94D049BB133111EBUL;
+        hash ^= hash >> 31;
+
+        return hash == 0 ? 1 : hash;
+    }
+}
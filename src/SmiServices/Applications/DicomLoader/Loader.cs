@@ -7,6 +7,7 @@ using MongoDB.Bson.Serialization;
 using MongoDB.Driver;
 using Rdmp.Core.Curation.Data.DataLoad;
 using Rdmp.Core.DataLoad;
+using SmiServices.Common;
 using SmiServices.Common.Messages;
 using SmiServices.Common.MongoDB;
 using SmiServices.Microservices.DicomRelationalMapper;
@@ -16,26 +17,56 @@ using System.Collections.Generic;
 using System.Diagnostics;
 using System.IO;
 using System.Linq;
+using System.Runtime.ExceptionServices;
 using System.Text;
 using System.Threading;
+using System.Threading.Channels;
 using System.Threading.Tasks;
 
 namespace SmiServices.Applications.DicomLoader;
 
+/// <summary>
+/// Loads DICOM files into Mongo, and optionally on to the RDMP relational stage. Files are parsed by the callers of
+/// <see cref="Load"/>, then passed through stages which build the BSON documents, insert them into Mongo in batches, and
+/// load them to SQL. The stages are connected by bounded channels, so a slow stage holds up the ones before it instead
+/// of letting work pile up in memory, and each stage runs alongside the others
+/// </summary>
 public class Loader
 {
+    // Flush the series list to Mongo once it holds this many series
+    private const int SeriesFlushThreshold = 10_000;
+
     private long _dicomCount, _fileCount;
     private readonly Stopwatch _timer;
     private readonly IMongoCollection<BsonDocument> _imageStore;
     private readonly IMongoCollection<SeriesMessage> _seriesStore;
-    private List<ValueTuple<DicomFileMessage, DicomDataset>> _imageQueue;
     private static readonly RecyclableMemoryStreamManager _streamManager;
-    private volatile bool _backlogged, _flushing;
-    private readonly object _statsLock, _imageQueueLock;
 
     // Yes, we lock the series list. Read-only while accessing, write while flushing.
     private readonly ReaderWriterLockSlim _seriesListLock;
     private ConcurrentDictionary<string, SeriesMessage> _seriesList;
+    private readonly SemaphoreSlim _seriesFlushLock = new(1, 1);
+
+    private readonly Channel<(DicomFileMessage, DicomDataset, string)> _parsed;
+    private readonly Channel<ImageBatch> _built;
+    private readonly Channel<ImageBatch>? _inserted;
+    private readonly Task _stages;
+    private readonly int _batchSize;
+    private readonly PipelineStageStats _parseStats = new("parse"), _buildStats = new("build"), _insertStats = new("insert"), _sqlStats = new("sql"), _seriesStats = new("series");
+
+    /// <summary>
+    /// Images which are ready to insert into Mongo
+    /// </summary>
+    private sealed class ImageBatch(int capacity)
+    {
+        public readonly List<(DicomFileMessage, DicomDataset)> Images = new(capacity);
+        public readonly List<BsonDocument> Documents = new(capacity);
+
+        // The directory each image was loaded from
+        public readonly List<string> DirectoryNames = new(capacity);
+
+        public int Count => Images.Count;
+    }
 
     /// <summary>
     /// Make sure Mongo ignores its internal-only _id attribute when
@@ -55,54 +86,194 @@ public class Loader
         new DicomSetupBuilder().SkipValidation();
     }
 
-    private SeriesMessage LoadSm(string id, string directoryName, DicomDataset ds, string studyId)
+    /// <summary>
+    /// Count the images in <paramref name="batch"/> into the series list. Series which aren't in the list yet are
+    /// looked up in Mongo with one query for the whole batch, in case we were interrupted previously
+    /// </summary>
+    /// <param name="batch"></param>
+    private void AddSeries(ImageBatch batch)
+    {
+        var start = Stopwatch.GetTimestamp();
+
+        // Number of images in each series, and the first of them to describe the series if it's new
+        Dictionary<string, (int Count, int First)> seriesImages = [];
+        for (var i = 0; i < batch.Count; ++i)
+        {
+            var series = batch.Images[i].Item1.SeriesInstanceUID;
+            seriesImages[series] = seriesImages.TryGetValue(series, out var seen) ? (seen.Count + 1, seen.First) : (1, i);
+        }
+
+        // Held across the lookup so a series can't be flushed to Mongo between our reading it and adding to it
+        _seriesListLock.EnterReadLock();
+        try
+        {
+            var unseen = seriesImages.Keys.Where(series => !_seriesList.ContainsKey(series)).ToList();
+            Dictionary<string, SeriesMessage> stored = [];
+            if (unseen.Count > 0)
+                foreach (var sm in _seriesStore.Find(Builders<SeriesMessage>.Filter.In(s => s.SeriesInstanceUID, unseen)).ToEnumerable())
+                    stored.TryAdd(sm.SeriesInstanceUID, sm);
+
+            foreach (var (series, (count, first)) in seriesImages)
+                _seriesList.AddOrUpdate(
+                    series,
+                    _ => stored.TryGetValue(series, out var sm) ? AddImages(sm, count) : NewSm(batch, first, count),
+                    (_, sm) => AddImages(sm, count));
+        }
+        finally
+        {
+            _seriesListLock.ExitReadLock();
+        }
+
+        _seriesStats.Record(seriesImages.Count, start);
+    }
+
+    private static SeriesMessage NewSm(ImageBatch batch, int image, int count)
     {
-        // Try loading from Mongo in case we were interrupted previously
-        var b = _seriesStore.Find(new BsonDocument("SeriesInstanceUID", id)).FirstOrDefault();
-        return b ?? new SeriesMessage
+        var (message, ds) = batch.Images[image];
+        return new SeriesMessage
         {
-            DirectoryPath = directoryName,
+            DirectoryPath = batch.DirectoryNames[image],
             DicomDataset = DicomTypeTranslater.SerializeDatasetToJson(new DicomDataset(ds.Where(i => i is not DicomOtherByteFragment).ToArray())),
-            ImagesInSeries = 1,
-            SeriesInstanceUID = id,
-            StudyInstanceUID = studyId
+            ImagesInSeries = count,
+            SeriesInstanceUID = message.SeriesInstanceUID,
+            StudyInstanceUID = message.StudyInstanceUID
         };
     }
 
-    private static SeriesMessage IncSm(string _, SeriesMessage sm)
+    private static SeriesMessage AddImages(SeriesMessage sm, int count)
     {
         lock (sm)
-            sm.ImagesInSeries++;
+            sm.ImagesInSeries += count;
         return sm;
     }
 
     /// <summary>
-    /// Write the pending data out to Mongo and optionally SQL
+    /// Wait for everything passed to <see cref="Load"/> to be written out to Mongo and optionally SQL. No more files can
+    /// be loaded afterwards
     /// </summary>
-    public void Flush()
+    public void Complete()
     {
-        (DicomFileMessage, DicomDataset)[] imageBatch;
-        lock (_imageQueueLock)
+        _parsed.Writer.TryComplete();
+        try
         {
-            imageBatch = [.. _imageQueue];
-            _imageQueue = new List<(DicomFileMessage, DicomDataset)>(imageBatch.Length);
+            _stages.Wait();
         }
+        catch (AggregateException e)
+        {
+            // A failure closes the channels around it, so throw the original error rather than one of those
+            var cause = e.Flatten().InnerExceptions.FirstOrDefault(x => x is not ChannelClosedException) ?? e.GetBaseException();
+            ExceptionDispatchInfo.Capture(cause).Throw();
+        }
+
+        MongoSeriesFlush().GetAwaiter().GetResult();
+    }
+
+    private Task StartStages()
+    {
+        var build = RunStage(_loadOptions.BsonThreads, _parsed, _built, BuildBatches);
+        var insert = RunStage(_loadOptions.MongoWriters, _built, _inserted, InsertBatches);
+        var load = _inserted == null ? Task.CompletedTask : RunStage(1, _inserted, null, LoadBatches);
+        return Task.WhenAll(build, insert, load);
+    }
 
-        using var mf = MongoFlush(new ArraySegment<(DicomFileMessage, DicomDataset)>(imageBatch));
+    /// <summary>
+    /// Run <paramref name="workers"/> copies of <paramref name="work"/>, then complete <paramref name="output"/> so the
+    /// next stage finishes too. If one fails, <paramref name="input"/> is closed so the previous stage stops rather than
+    /// waiting for space in it
+    /// </summary>
+    private static async Task RunStage<T>(int workers, Channel<T> input, Channel<ImageBatch>? output, Func<Task> work)
+    {
+        Exception? error = null;
         try
         {
-            if (_parallelDleHost != null && _lmd != null) FlushRelational(_parallelDleHost, _lmd, imageBatch);
+            await Task.WhenAll(Enumerable.Range(0, Math.Max(1, workers)).Select(_ => Task.Run(async () =>
+            {
+                try
+                {
+                    await work();
+                }
+                catch (Exception e)
+                {
+                    input.Writer.TryComplete(e);
+                    throw;
+                }
+            })));
+        }
+        catch (Exception e)
+        {
+            error = e;
+            throw;
         }
         finally
         {
-            mf.Wait();
-            _backlogged = false;
+            output?.Writer.TryComplete(error);
+        }
+    }
+
+    private async Task BuildBatches()
+    {
+        var batch = new ImageBatch(_batchSize);
+        await foreach (var (message, ds, directoryName) in _parsed.Reader.ReadAllAsync())
+        {
+            var start = Stopwatch.GetTimestamp();
+            batch.Images.Add((message, ds));
+            batch.DirectoryNames.Add(directoryName);
+            batch.Documents.Add(new BsonDocument("header", MongoDocumentHeaders.ImageDocumentHeader(message, new MessageHeader()))
+                .AddRange(DicomTypeTranslaterReader.BuildBsonDocument(ds)));
+            _buildStats.Record(1, start);
+
+            if (batch.Count < _batchSize)
+                continue;
+
+            AddSeries(batch);
+            await _built.Writer.WriteAsync(batch);
+            batch = new ImageBatch(_batchSize);
+        }
+
+        if (batch.Count == 0)
+            return;
+
+        AddSeries(batch);
+        await _built.Writer.WriteAsync(batch);
+    }
+
+    private async Task InsertBatches()
+    {
+        await foreach (var batch in _built.Reader.ReadAllAsync())
+        {
+            var start = Stopwatch.GetTimestamp();
+            await MongoImageFlush(batch);
+            _insertStats.Record(batch.Count, start);
+
+            if (_seriesList.Count >= SeriesFlushThreshold)
+                await MongoSeriesFlush();
+
+            if (_inserted != null)
+                await _inserted.Writer.WriteAsync(batch);
+        }
+    }
+
+    private async Task LoadBatches()
+    {
+        await foreach (var batch in _inserted!.Reader.ReadAllAsync())
+        {
+            var start = Stopwatch.GetTimestamp();
+            FlushRelational(_parallelDleHost!, _lmd!, batch.Images);
+            _sqlStats.Record(batch.Count, start);
         }
     }
 
-    public static void FlushRelational(ParallelDLEHost host, LoadMetadata lmd, IEnumerable<(DicomFileMessage, DicomDataset)> imageBatch)
+    /// <summary>
+    /// Load a batch of images to SQL through the DLE
+    /// </summary>
+    /// <param name="host"></param>
+    /// <param name="lmd"></param>
+    /// <param name="imageBatch"></param>
+    /// <returns>The result of the DLE run. Anything other than Success or OperationNotRequired means the batch was not loaded</returns>
+    public static ExitCodeType FlushRelational(ParallelDLEHost host, LoadMetadata lmd, IEnumerable<(DicomFileMessage, DicomDataset)> imageBatch)
     {
         int count;
+        ExitCodeType result;
         var lockTimer = Stopwatch.StartNew();
         long lockWait;
         lock (host)
@@ -112,7 +283,7 @@ public class Loader
                 new QueuedImage(new MessageHeader(), 0, i.Item1, i.Item2)).ToList();
             try
             {
-                var result = host.RunDLE(lmd, new DicomFileMessageToDatasetListWorklist(workList));
+                result = host.RunDLE(lmd, new DicomFileMessageToDatasetListWorklist(workList));
                 if (result is not ExitCodeType.Success and not ExitCodeType.OperationNotRequired)
                     Console.Error.WriteLine($"DLE load failed with result {result}");
             }
@@ -127,31 +298,21 @@ public class Loader
 
         Console.WriteLine(
             $"SQL load completed on {count} items in {lockTimer.ElapsedMilliseconds}ms, {lockWait}ms lock contention");
-    }
-
-    private async Task MongoFlush(ArraySegment<(DicomFileMessage, DicomDataset)> imageBatch)
-    {
-        await MongoSeriesFlush();
-        while (imageBatch.Count > 10_000)
-        {
-            await MongoImageFlush(imageBatch[..10_000]);
-            imageBatch = imageBatch[10_000..];
-        }
-        await MongoImageFlush(imageBatch);
+        return result;
     }
 
     private static readonly InsertManyOptions _insertManyOptions = new() { IsOrdered = false };
-    private async Task MongoImageFlush(ArraySegment<(DicomFileMessage, DicomDataset)> imageBatch)
+    private async Task MongoImageFlush(ImageBatch imageBatch)
     {
-        // Delete pre-existing entries, if applicable, then insert our queue:
+        // Delete pre-existing entries, if applicable, then insert our batch:
         if (_loadOptions.DeleteConflicts)
         {
             var sw = Stopwatch.StartNew();
             var builder = Builders<BsonDocument>.Filter;
             await _imageStore.DeleteManyAsync(builder.In("header.DicomFilePath",
-                imageBatch.Select(i => i.Item1.DicomFilePath)));
+                imageBatch.Images.Select(i => i.Item1.DicomFilePath)));
             await _imageStore.DeleteManyAsync(builder.In("header.SOPInstanceUID",
-                imageBatch.Select(i => i.Item1.SOPInstanceUID)));
+                imageBatch.Images.Select(i => i.Item1.SOPInstanceUID)));
             await Console.Error.WriteLineAsync(
                 $"Deleted {imageBatch.Count} entries from Mongo in {sw.ElapsedMilliseconds}ms");
         }
@@ -159,12 +320,7 @@ public class Loader
         var mongoStopwatch = Stopwatch.StartNew();
         try
         {
-            await _imageStore.InsertManyAsync(imageBatch
-                .AsParallel()
-                .WithExecutionMode(ParallelExecutionMode.ForceParallelism)
-                .Select(static i =>
-                    new BsonDocument("header", MongoDocumentHeaders.ImageDocumentHeader(i.Item1, new MessageHeader()))
-                        .AddRange(DicomTypeTranslaterReader.BuildBsonDocument(i.Item2))), _insertManyOptions);
+            await _imageStore.InsertManyAsync(imageBatch.Documents, _insertManyOptions);
         }
         catch (Exception e)
         {
@@ -176,6 +332,21 @@ public class Loader
 
     // Now flush the SeriesMessage list to Mongo:
     private async Task MongoSeriesFlush()
+    {
+        // Only one flush at a time, and skip it if another insert worker has just flushed
+        await _seriesFlushLock.WaitAsync();
+        try
+        {
+            if (!_seriesList.IsEmpty)
+                await MongoSeriesFlushLocked();
+        }
+        finally
+        {
+            _seriesFlushLock.Release();
+        }
+    }
+
+    private async Task MongoSeriesFlushLocked()
     {
         var mongoStopwatch = Stopwatch.StartNew();
 
@@ -223,49 +394,37 @@ public class Loader
             $"Flushed {seriesCount} Series objects to Mongo in {mongoStopwatch.ElapsedMilliseconds}ms. Waited {lockTime - lockStart}ms for write lock, had {waiting} threads waiting after swap, took {deleteTime - lockTime}ms to delete and {mongoStopwatch.ElapsedMilliseconds - deleteTime}ms to write.");
     }
 
-    public void Report(CancellationToken? cancellationToken = null)
+    public void Report()
     {
-        if (_timer.ElapsedMilliseconds == 0) return;
-        cancellationToken?.ThrowIfCancellationRequested();
-        var memoryLimit = _loadOptions.RamLimit * 1024 * 1024 * 1024;
-        bool shouldFlush;
-        long used;
-        lock (_statsLock)
-        {
-            used = GC.GetTotalMemory(false);
-            _backlogged = used > memoryLimit * 3;
-            shouldFlush = !_flushing && used > memoryLimit;
-            if (shouldFlush)
-            {
-                _flushing = true;
-            }
-        }
+        var elapsed = _timer.ElapsedMilliseconds;
+        if (elapsed == 0) return;
 
-        Console.WriteLine($"Processed {_dicomCount} DICOM objects from {_fileCount} files in {_timer.ElapsedMilliseconds / 1000}s ({1000 * _dicomCount / _timer.ElapsedMilliseconds} per second) using {used / (1024 * 1024)}MiB{(shouldFlush ? " and about to flush" : "")}");
-        if (!shouldFlush) return;
-        try
-        {
-            Flush();
-        }
-        finally
-        {
-            _flushing = false;
-        }
+        var queued = $"{_parsed.Reader.Count} parsed images and {_built.Reader.Count} batches queued to insert";
+        if (_inserted != null)
+            queued += $", {_inserted.Reader.Count} to load to SQL";
+
+        List<PipelineStageStats> stages = [_parseStats, _buildStats, _seriesStats, _insertStats];
+        if (_inserted != null)
+            stages.Add(_sqlStats);
+
+        Console.WriteLine($"Processed {_dicomCount} DICOM objects from {_fileCount} files in {elapsed / 1000}s ({1000 * _dicomCount / elapsed} per second), {queued}. Stages: {string.Join(", ", stages)}");
     }
 
     private static readonly byte[] _dicomMagic = Encoding.UTF8.GetBytes("DICM"); // Can be "DICM"u8 once we reach C# 11.0!
     private readonly DicomLoaderOptions _loadOptions;
+    private readonly DicomHeaderReader _headerReader;
     private readonly ParallelDLEHost? _parallelDleHost;
     private readonly LoadMetadata? _lmd;
 
+    // Set by PrefetchExistingPaths, before loading starts
+    private KnownPathSet? _knownPaths;
+
     public Loader(IMongoDatabase database, string imageCollection, string seriesCollection,
         DicomLoaderOptions loadOptions, ParallelDLEHost? parallelDleHost, LoadMetadata? lmd)
     {
-        _imageQueueLock = new object();
         _seriesListLock = new ReaderWriterLockSlim();
         _loadOptions = loadOptions;
-        lock (_imageQueueLock)
-            _imageQueue = [];
+        _headerReader = new DicomHeaderReader(stopAtPixelData: true, loadOptions.TagAllowList?.Any() == true ? loadOptions.TagAllowList : null);
 
         try
         {
@@ -279,9 +438,17 @@ public class Loader
         _timer = Stopwatch.StartNew();
         _parallelDleHost = parallelDleHost;
         _lmd = lmd;
-        _statsLock = new object();
         _imageStore = database.GetCollection<BsonDocument>(imageCollection);
         _seriesStore = database.GetCollection<SeriesMessage>(seriesCollection);
+
+        // At most about (QueuedBatches * 2 + workers + 1) * BatchSize images are held in memory at once
+        _batchSize = Math.Max(1, loadOptions.BatchSize);
+        var queuedBatches = Math.Max(1, loadOptions.QueuedBatches);
+        _parsed = Channel.CreateBounded<(DicomFileMessage, DicomDataset, string)>(_batchSize);
+        _built = Channel.CreateBounded<ImageBatch>(queuedBatches);
+        if (_parallelDleHost != null && _lmd != null)
+            _inserted = Channel.CreateBounded<ImageBatch>(queuedBatches);
+        _stages = StartStages();
     }
 
     /// <summary>
@@ -290,23 +457,20 @@ public class Loader
     /// <param name="fi">DICOM file or archive of DICOM files to load</param>
     /// <param name="ct">Cancellation token</param>
     /// <exception cref="ApplicationException"></exception>
-    private void Process(FileInfo fi, CancellationToken ct)
+    private async Task Process(FileInfo fi, CancellationToken ct)
     {
         ct.ThrowIfCancellationRequested();
         var dName = fi.DirectoryName ?? throw new ApplicationException($"No parent directory for '{fi.FullName}'");
         var bBuffer = new byte[132];
-        var buffer = new Span<byte>(bBuffer);
+        var start = Stopwatch.GetTimestamp();
         using (var fileStream = File.OpenRead(fi.FullName))
         {
-            if (fileStream.Read(buffer) == 132 && buffer[128..].SequenceEqual(_dicomMagic))
+            if (fileStream.Read(bBuffer, 0, bBuffer.Length) == 132 && bBuffer.AsSpan(128).SequenceEqual(_dicomMagic))
             {
-                var ds = DicomFile.Open(fileStream).Dataset;
-
-                // Strip pixel data ASAP: we don't want it anyway
-                ds.Remove(DicomTag.PixelData);
-                ds = new DicomDataset(ds.Where(i => i is not DicomOtherByteFragment).ToArray());
+                // Stop at the pixel data: we don't want it anyway
+                var ds = _headerReader.Filter(_headerReader.Open(fileStream));
                 Interlocked.Increment(ref _fileCount);
-                Process(ds, fi.FullName, dName, fi.Length, ct);
+                await Process(ds, fi.FullName, dName, fi.Length, start, ct);
                 return;
             }
         }
@@ -318,6 +482,7 @@ public class Loader
             foreach (var entry in archive.Entries())
             {
                 ct.ThrowIfCancellationRequested();
+                start = Stopwatch.GetTimestamp();
                 try
                 {
                     var path = $"{fi.FullName}!{entry.Name}";
@@ -335,13 +500,11 @@ public class Loader
                         if (ms.Length <= 0)
                             continue;
                         ms.Seek(0, SeekOrigin.Begin);
-                        ds = DicomFile.Open(ms, FileReadOption.ReadAll).Dataset;
+                        ds = _headerReader.Open(ms, FileReadOption.ReadAll);
                         fileSize = ms.Length;
                     }
-                    // Strip pixel data ASAP: we don't want it anyway
-                    ds.Remove(DicomTag.PixelData);
-                    ds = new DicomDataset(ds.Where(i => i is not DicomOtherByteFragment).ToArray());
-                    Process(ds, path, dName, fileSize, ct);
+                    ds = _headerReader.Filter(ds);
+                    await Process(ds, path, dName, fileSize, start, ct);
                 }
                 catch (DicomFileException e)
                 {
@@ -362,18 +525,14 @@ public class Loader
     /// <param name="path">Filename or archive entry (/data/foo.zip!file.dcm) from which ds came</param>
     /// <param name="directoryName">The directory name from which we're loading</param>
     /// <param name="size">File or archive entry size in bytes</param>
+    /// <param name="start">Timestamp when reading the dataset started</param>
     /// <param name="ct">Cancellation token</param>
-    private void Process(DicomDataset ds, string path, string directoryName, long size, CancellationToken ct)
+    private async ValueTask Process(DicomDataset ds, string path, string directoryName, long size, long start, CancellationToken ct)
     {
-        // Throttle to avoid runaway backlog if doing SQL loads:
-        while (_backlogged && !ct.IsCancellationRequested)
-            ct.WaitHandle.WaitOne(10_000);
         ct.ThrowIfCancellationRequested();
 
-        // Update stats and consider flushing every 256 file loads
-        if ((Interlocked.Increment(ref _dicomCount) & 0xff) == 0) Report(ct);
-        if (ct.IsCancellationRequested)
-            return;
+        // Update stats every 256 file loads
+        if ((Interlocked.Increment(ref _dicomCount) & 0xff) == 0) Report();
 
         var identifiers = new string[3];
 
@@ -397,18 +556,10 @@ public class Loader
             DicomFileSize = size,
             DicomFilePath = path
         };
-        var series = identifiers[1];
-        try
-        {
-            _seriesListLock.EnterReadLock();
-            _seriesList.AddOrUpdate(series, _ => LoadSm(series, directoryName, ds, identifiers[0]), IncSm);
-        }
-        finally
-        {
-            _seriesListLock.ExitReadLock();
-        }
-        lock (_imageQueueLock)
-            _imageQueue.Add((message, ds));
+        _parseStats.Record(1, start);
+
+        // Waits here if the later stages are behind
+        await _parsed.Writer.WriteAsync((message, ds, directoryName), ct);
     }
 
     /// <summary>
@@ -418,7 +569,34 @@ public class Loader
     /// <returns>Whether there's already an entry for this file</returns>
     private bool ExistingEntry(string filename)
     {
-        return _imageStore.AsQueryable().Any(i => i["header.DicomFilePath"].CompareTo(filename) == 0);
+        return _knownPaths?.Contains(filename) ??
+               _imageStore.AsQueryable().Any(i => i["header.DicomFilePath"].CompareTo(filename) == 0);
+    }
+
+    /// <summary>
+    /// Read the path of every image already in Mongo in one pass, so duplicates can be skipped without a query each
+    /// </summary>
+    /// <param name="ct">Cancellation token</param>
+    public void PrefetchExistingPaths(CancellationToken ct)
+    {
+        var sw = Stopwatch.StartNew();
+        var knownPaths = new KnownPathSet(_imageStore.EstimatedDocumentCount(cancellationToken: ct));
+        var findOptions = new FindOptions<BsonDocument, BsonDocument>
+        {
+            Projection = Builders<BsonDocument>.Projection.Include("header.DicomFilePath").Exclude("_id"),
+            BatchSize = 10_000,
+        };
+
+        using var cursor = _imageStore.FindSync(FilterDefinition<BsonDocument>.Empty, findOptions, ct);
+        foreach (var doc in cursor.ToEnumerable(ct))
+        {
+            if (doc.TryGetValue("header", out var header) && header is BsonDocument headerDoc &&
+                headerDoc.TryGetValue("DicomFilePath", out var path) && path.IsString)
+                knownPaths.Add(path.AsString);
+        }
+
+        _knownPaths = knownPaths;
+        Console.WriteLine($"Found {knownPaths.Count} existing images in {sw.ElapsedMilliseconds}ms");
     }
 
     /// <summary>
@@ -427,28 +605,28 @@ public class Loader
     /// <param name="filename">File or archive to load</param>
     /// <param name="ct">Cancellation token for graceful cancellations</param>
     /// <returns></returns>
-    public ValueTask Load(string filename, CancellationToken ct)
+    public async ValueTask Load(string filename, CancellationToken ct)
     {
         if (!File.Exists(filename))
         {
             Console.WriteLine($@"{filename} does not exist, skipping");
-            return ValueTask.CompletedTask;
+            return;
         }
 
         if (!_loadOptions.DeleteConflicts && ExistingEntry(filename))
         {
-            return ValueTask.CompletedTask;
+            return;
         }
 
         try
         {
-            Process(new FileInfo(filename), ct);
+            await Process(new FileInfo(filename), ct);
         }
-        catch (Exception e)
+        // Closed if a later stage failed, in which case loading can't go on
+        catch (Exception e) when (e is not ChannelClosedException and not OperationCanceledException)
         {
             Console.WriteLine($"{filename}:{e}");
         }
-        return ValueTask.CompletedTask;
     }
 
     public static (DicomFileMessage, DicomDataset) ParseBson(BsonDocument arg)
@@ -0,0 +1,157 @@
+using MongoDB.Bson;
+using MongoDB.Bson.Serialization;
+using MongoDB.Driver;
+using Rdmp.Core.Curation.Data.DataLoad;
+using Rdmp.Core.DataLoad;
+using SmiServices.Microservices.DicomRelationalMapper;
+using System;
+using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.Diagnostics;
+using System.Globalization;
+using System.IO;
+using System.Linq;
+using System.Threading;
+using System.Threading.Tasks;
+
+namespace SmiServices.Applications.DicomLoader;
+
+/// <summary>
+/// Copies the Mongo images matching a filter to SQL (DicomLoader --match). The image collection is split into _id
+/// ranges which are loaded concurrently, each in batches, through separate <see cref="ParallelDLEHost"/>s so their
+/// staging tables don't collide. If a progress file is given, the ranges and which of them are complete are saved
+/// there, so a failed replay can be resumed by running it again
+/// </summary>
+public class MatchReplayer
+{
+    // Roughly how many images to put in each partition
+    private const long ImagesPerPartition = 1_000_000;
+
+    private readonly IMongoCollection<BsonDocument> _imageStore;
+    private readonly LoadMetadata _lmd;
+    private readonly Func<ParallelDLEHost> _createHost;
+    private readonly int _parallelism;
+    private readonly int _batchSize;
+    private readonly string? _progressPath;
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="imageStore"></param>
+    /// <param name="lmd"></param>
+    /// <param name="createHost">Creates a host with its own staging namer, for each concurrent load</param>
+    /// <param name="parallelism">Number of partitions to load at once</param>
+    /// <param name="batchSize">Number of images in each DLE run</param>
+    /// <param name="progressPath">File to record progress in, if any</param>
+    public MatchReplayer(IMongoCollection<BsonDocument> imageStore, LoadMetadata lmd, Func<ParallelDLEHost> createHost,
+        int parallelism, int batchSize, string? progressPath)
+    {
+        _imageStore = imageStore;
+        _lmd = lmd;
+        _createHost = createHost;
+        _parallelism = Math.Max(1, parallelism);
+        _batchSize = Math.Max(1, batchSize);
+        _progressPath = progressPath;
+    }
+
+    /// <summary>
+    /// Load the images matching <paramref name="matchFilter"/> to SQL, skipping partitions already recorded as complete
+    /// </summary>
+    /// <param name="matchFilter">Mongo filter, as JSON</param>
+    /// <param name="ct"></param>
+    /// <exception cref="AggregateException">Thrown if any partition failed to load. Only partitions where every batch loaded are recorded as complete</exception>
+    public void Run(string matchFilter, CancellationToken ct)
+    {
+        var sw = Stopwatch.StartNew();
+        var filter = BsonDocument.Parse(matchFilter);
+
+        var (boundaries, completed) = LoadProgress(filter.ToJson(), ct);
+        var pending = Enumerable.Range(0, boundaries.Count + 1).Where(p => !completed.Contains(p)).ToList();
+        Console.WriteLine($"Replaying {pending.Count} of {boundaries.Count + 1} partitions, {_parallelism} at a time");
+
+        // Each host (and so each staging namer) is only used by one partition at a time
+        ConcurrentBag<ParallelDLEHost> hosts = [];
+        using var progress = _progressPath == null ? null : File.AppendText(_progressPath);
+        var progressLock = new object();
+        long images = 0;
+
+        var parallelOptions = new ParallelOptions { MaxDegreeOfParallelism = _parallelism, CancellationToken = ct };
+        Parallel.ForEach(pending, parallelOptions, partition =>
+        {
+            if (!hosts.TryTake(out var host))
+                host = _createHost();
+
+            try
+            {
+                var partitionFilter = new BsonDocument("$and", new BsonArray { filter, IdRangePartitioner.RangeFilter(boundaries, partition) });
+                var count = ReplayPartition(host, partitionFilter, ct);
+                Interlocked.Add(ref images, count);
+            }
+            finally
+            {
+                hosts.Add(host);
+            }
+
+            lock (progressLock)
+            {
+                progress?.WriteLine(partition);
+                progress?.Flush();
+            }
+
+            Console.WriteLine($"Replayed partition {partition}, {Interlocked.Read(ref images)} images after {sw.ElapsedMilliseconds / 1000}s");
+        });
+
+        Console.WriteLine($"Replayed {images} images in {sw.ElapsedMilliseconds / 1000}s");
+    }
+
+    private long ReplayPartition(ParallelDLEHost host, BsonDocument filter, CancellationToken ct)
+    {
+        var findOptions = new FindOptions<BsonDocument, BsonDocument>
+        {
+            Sort = "{\"_id\":1}",
+            BatchSize = _batchSize,
+        };
+
+        long count = 0;
+        using var cursor = _imageStore.FindSync(filter, findOptions, ct);
+        foreach (var batch in cursor.ToEnumerable(ct).Select(Loader.ParseBson).Chunk(_batchSize))
+        {
+            // Otherwise the partition would be recorded as complete, and skipped when the replay is resumed
+            var result = Loader.FlushRelational(host, _lmd, batch);
+            if (result is not ExitCodeType.Success and not ExitCodeType.OperationNotRequired)
+                throw new ApplicationException($"DLE load failed with result {result} after {count} images of the partition");
+
+            count += batch.Length;
+        }
+
+        return count;
+    }
+
+    /// <summary>
+    /// Read the partitions and those which are complete from the progress file, or pick new partitions (saving them if
+    /// there is a progress file). The first line of the file is the match filter, the second the partition boundaries,
+    /// then one line for each completed partition
+    /// </summary>
+    /// <param name="matchFilter">The filter, as single-line JSON</param>
+    /// <param name="ct"></param>
+    private (List<BsonValue> Boundaries, HashSet<int> Completed) LoadProgress(string matchFilter, CancellationToken ct)
+    {
+        if (_progressPath != null && File.Exists(_progressPath))
+        {
+            var lines = File.ReadAllLines(_progressPath);
+            if (lines.Length < 2 || lines[0] != matchFilter)
+                throw new InvalidOperationException($"Progress file '{_progressPath}' is for a different match filter");
+
+            var boundaries = BsonSerializer.Deserialize<BsonArray>(lines[1]).ToList();
+            var completed = lines.Skip(2).Where(l => l.Length > 0).Select(l => int.Parse(l, CultureInfo.InvariantCulture)).ToHashSet();
+            Console.WriteLine($"Resuming replay from '{_progressPath}' with {completed.Count} partitions complete");
+            return (boundaries, completed);
+        }
+
+        var newBoundaries = IdRangePartitioner.Boundaries(_imageStore, ImagesPerPartition, ct);
+        if (_progressPath != null)
+            File.WriteAllLines(_progressPath, [matchFilter, new BsonArray(newBoundaries).ToJson()]);
+
+        return (newBoundaries, []);
+    }
+}
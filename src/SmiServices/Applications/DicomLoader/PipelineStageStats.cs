@@ -0,0 +1,33 @@
+using System.Diagnostics;
+using System.Threading;
+
+namespace SmiServices.Applications.DicomLoader;
+
+/// <summary>
+/// Counts the items through one stage of the <see cref="Loader"/> pipeline, and the time its threads spent working on
+/// them. The stage with the lowest rate per thread is the one to give more threads
+/// </summary>
+internal sealed class PipelineStageStats(string name)
+{
+    private long _items, _busyTicks;
+
+    public long Items => Interlocked.Read(ref _items);
+
+    /// <summary>
+    /// Record <paramref name="items"/> as done, having started on them at <paramref name="startTimestamp"/>
+    /// </summary>
+    /// <param name="items"></param>
+    /// <param name="startTimestamp">From <see cref="Stopwatch.GetTimestamp"/></param>
+    public void Record(long items, long startTimestamp)
+    {
+        Interlocked.Add(ref _busyTicks, Stopwatch.GetTimestamp() - startTimestamp);
+        Interlocked.Add(ref _items, items);
+    }
+
+    public override string ToString()
+    {
+        var items = Items;
+        var busy = Stopwatch.GetElapsedTime(0, Interlocked.Read(ref _busyTicks)).TotalSeconds;
+        return $"{name} {items} ({(busy > 0 ? items / busy : 0):F0}/s per thread)";
+    }
+}
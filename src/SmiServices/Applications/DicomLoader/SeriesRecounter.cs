@@ -0,0 +1,112 @@
+using MongoDB.Bson;
+using MongoDB.Driver;
+using System;
+using System.Diagnostics;
+using System.Threading;
+
+namespace SmiServices.Applications.DicomLoader;
+
+/// <summary>
+/// Recalculates ImagesInSeries for every series from the image collection. The counting is done by Mongo: the image
+/// collection is split into ranges of _id, and for each range an aggregation groups the images by SeriesInstanceUID
+/// and $merges the counts into the series collection, so no documents are sent to the client. Series with no entry in
+/// the series collection are left out, since the rest of their SeriesMessage can't be rebuilt from the counts
+/// </summary>
+public class SeriesRecounter
+{
+    // Roughly how many images to count in each aggregation
+    private const long ImagesPerPartition = 10_000_000;
+
+    private readonly IMongoCollection<BsonDocument> _imageStore;
+    private readonly IMongoCollection<BsonDocument> _seriesStore;
+
+    public SeriesRecounter(IMongoDatabase database, string imageCollection, string seriesCollection)
+    {
+        _imageStore = database.GetCollection<BsonDocument>(imageCollection);
+        _seriesStore = database.GetCollection<BsonDocument>(seriesCollection);
+    }
+
+    /// <summary>
+    /// Recount all series. Counts are zeroed first and built up one partition at a time, so are only correct once this
+    /// returns; if it is interrupted it should be run again
+    /// </summary>
+    /// <param name="ct">Cancellation token</param>
+    public void Recount(CancellationToken ct)
+    {
+        var sw = Stopwatch.StartNew();
+
+        // Used by the $lookup which finds each series document to merge into
+        _seriesStore.Indexes.CreateOne(
+            new CreateIndexModel<BsonDocument>(Builders<BsonDocument>.IndexKeys.Ascending("SeriesInstanceUID")),
+            cancellationToken: ct);
+
+        _seriesStore.UpdateMany(
+            FilterDefinition<BsonDocument>.Empty,
+            Builders<BsonDocument>.Update.Set("ImagesInSeries", 0),
+            cancellationToken: ct);
+
+        var boundaries = IdRangePartitioner.Boundaries(_imageStore, ImagesPerPartition, ct);
+        var aggregateOptions = new AggregateOptions { AllowDiskUse = true };
+
+        for (var i = 0; i <= boundaries.Count; ++i)
+        {
+            ct.ThrowIfCancellationRequested();
+
+            _imageStore.AggregateToCollection(
+                PipelineDefinition<BsonDocument, BsonDocument>.Create(BuildPipeline(IdRangePartitioner.RangeFilter(boundaries, i), _seriesStore.CollectionNamespace.CollectionName)),
+                aggregateOptions,
+                ct);
+
+            Console.WriteLine($"Recounted partition {i + 1} of {boundaries.Count + 1} after {sw.ElapsedMilliseconds / 1000}s");
+        }
+
+        Console.WriteLine($"Recounted all series in {sw.ElapsedMilliseconds / 1000}s");
+    }
+
+    /// <summary>
+    /// Build the aggregation which adds the number of images matching <paramref name="filter"/> to ImagesInSeries for
+    /// each series
+    /// </summary>
+    /// <param name="filter">Images to count, normally a range from <see cref="IdRangePartitioner"/></param>
+    /// <param name="seriesCollection">Name of the series collection to merge into</param>
+    /// <returns></returns>
+    public static BsonDocument[] BuildPipeline(BsonDocument filter, string seriesCollection)
+    {
+        return
+        [
+            new BsonDocument("$match", filter),
+            new BsonDocument("$group", new BsonDocument
+            {
+                { "_id", "$SeriesInstanceUID" },
+                { "ImagesInSeries", new BsonDocument("$sum", 1) },
+            }),
+            new BsonDocument("$lookup", new BsonDocument
+            {
+                { "from", seriesCollection },
+                { "localField", "_id" },
+                { "foreignField", "SeriesInstanceUID" },
+                { "as", "series" },
+            }),
+            // One output per series document, so duplicates are all updated and missing series are dropped
+            new BsonDocument("$unwind", "$series"),
+            new BsonDocument("$project", new BsonDocument
+            {
+                { "_id", "$series._id" },
+                { "ImagesInSeries", 1 },
+            }),
+            new BsonDocument("$merge", new BsonDocument
+            {
+                { "into", seriesCollection },
+                { "on", "_id" },
+                {
+                    "whenMatched", new BsonArray
+                    {
+                        new BsonDocument("$set", new BsonDocument("ImagesInSeries",
+                            new BsonDocument("$add", new BsonArray { "$ImagesInSeries", "$$new.ImagesInSeries" }))),
+                    }
+                },
+                { "whenNotMatched", "discard" },
+            }),
+        ];
+    }
+}
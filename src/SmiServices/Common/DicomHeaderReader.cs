@@ -0,0 +1,115 @@
+using FellowOakDicom;
+using FellowOakDicom.IO.Reader;
+using System;
+using System.Collections.Generic;
+using System.Globalization;
+using System.IO;
+using System.Linq;
+
+namespace SmiServices.Common;
+
+/// <summary>
+/// Reads the header of a DICOM file, stopping before any pixel data so it is never read from disk, and optionally
+/// keeps only an allowed set of tags
+/// </summary>
+public class DicomHeaderReader
+{
+    // The first group which only holds bulk pixel data (Float/DoubleFloat/PixelData and the trailing padding after them)
+    private const ushort PixelDataGroup = 0x7FE0;
+
+    // Always kept, since every message needs them
+    private static readonly DicomTag[] _requiredTags =
+    [
+        DicomTag.SOPClassUID,
+        DicomTag.StudyInstanceUID,
+        DicomTag.SeriesInstanceUID,
+        DicomTag.SOPInstanceUID,
+    ];
+
+    private readonly Func<ParseState, bool>? _stop;
+    private readonly HashSet<DicomTag>? _allowedTags;
+    private readonly HashSet<ushort> _allowedGroups = [];
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="stopAtPixelData">If true, stop parsing each file at the pixel data. Any tags after it are lost</param>
+    /// <param name="tagAllowList">If given, the only tags which are kept. Each entry is a keyword (e.g. "PatientID"),
+    /// a tag (e.g. "(0010,0020)"), or a 4-digit hex group (e.g. "0009") to keep the whole group including any private tags.
+    /// The SOP class and instance, study, and series UIDs are always kept</param>
+    /// <exception cref="ArgumentException">If an entry in <paramref name="tagAllowList"/> can't be parsed</exception>
+    public DicomHeaderReader(bool stopAtPixelData = true, IEnumerable<string>? tagAllowList = null)
+    {
+        if (stopAtPixelData)
+            _stop = IsPixelData;
+
+        if (tagAllowList == null)
+            return;
+
+        _allowedTags = [.. _requiredTags];
+        foreach (string entry in tagAllowList)
+            AddAllowed(entry.Trim());
+    }
+
+    /// <summary>
+    /// Opens the dataset in <paramref name="path"/>, without filtering it
+    /// </summary>
+    /// <param name="path"></param>
+    /// <param name="readOption"></param>
+    /// <returns></returns>
+    public DicomDataset Open(string path, FileReadOption readOption = FileReadOption.Default)
+        => DicomFile.Open(path, DicomEncoding.Default, _stop, readOption).Dataset;
+
+    /// <summary>
+    /// Opens the dataset in <paramref name="stream"/>, without filtering it. If <paramref name="readOption"/> leaves
+    /// large tags to be read on demand, the stream must stay open for as long as the dataset is used
+    /// </summary>
+    /// <param name="stream"></param>
+    /// <param name="readOption"></param>
+    /// <returns></returns>
+    public DicomDataset Open(Stream stream, FileReadOption readOption = FileReadOption.Default)
+        => DicomFile.Open(stream, DicomEncoding.Default, _stop, readOption).Dataset;
+
+    /// <summary>
+    /// Returns a copy of <paramref name="ds"/> without any encapsulated pixel data fragments, and without any tags which
+    /// aren't in the allow list (if one was given)
+    /// </summary>
+    /// <param name="ds"></param>
+    /// <returns></returns>
+    public DicomDataset Filter(DicomDataset ds) => new(ds.Where(Keep).ToArray());
+
+    private bool Keep(DicomItem item)
+    {
+        if (item is DicomOtherByteFragment)
+            return false;
+
+        return _allowedTags == null || _allowedTags.Contains(item.Tag) || _allowedGroups.Contains(item.Tag.Group);
+    }
+
+    private static bool IsPixelData(ParseState state) => state.SequenceDepth == 0 && state.Tag.Group >= PixelDataGroup;
+
+    private void AddAllowed(string entry)
+    {
+        if (entry.Length == 4 && ushort.TryParse(entry, NumberStyles.HexNumber, CultureInfo.InvariantCulture, out ushort group))
+        {
+            _allowedGroups.Add(group);
+            return;
+        }
+
+        DicomDictionaryEntry? known = DicomDictionary.Default.FirstOrDefault(e => e.Keyword == entry);
+        if (known != null)
+        {
+            _allowedTags!.Add(known.Tag);
+            return;
+        }
+
+        try
+        {
+            _allowedTags!.Add(DicomTag.Parse(entry));
+        }
+        catch (DicomDataException e)
+        {
+            throw new ArgumentException($"Could not parse '{entry}' in the tag allow list as a keyword, tag, or group", e);
+        }
+    }
+}
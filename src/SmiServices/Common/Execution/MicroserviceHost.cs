@@ -5,8 +5,10 @@ using SmiServices.Common.Events;
 using SmiServices.Common.Helpers;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.Metrics;
 using SmiServices.Common.Options;
 using System;
+using System.Net;
 
 namespace SmiServices.Common.Execution;
 
@@ -29,10 +31,15 @@ public abstract class MicroserviceHost : IMicroserviceHost
     private readonly ProducerOptions _fatalLoggingProducerOptions;
     private IProducerModel? _fatalLoggingProducer;
 
-    private readonly ControlMessageConsumer _controlMessageConsumer = null!;
+    // Control messages are only sent over RabbitMQ, so this is null for other brokers
+    private readonly ControlMessageConsumer? _controlMessageConsumer;
 
     private bool _stopCalled;
 
+    // Shared by all hosts in the process, and left running until exit
+    private static MetricsServer? _metricsServer;
+    private static readonly object _oMetricsLock = new();
+
     protected readonly MicroserviceObjectFactory ObjectFactory;
 
     /// <summary>
@@ -77,6 +84,9 @@ public abstract class MicroserviceHost : IMicroserviceHost
 
         OnFatal += (sender, args) => Fatal(args.Message, args.Exception);
 
+        if (messageBroker == null && globals.MessageBrokerType == MessageBrokerType.InMemory)
+            messageBroker = MessageBrokerFactory.Create(globals, HostProcessName + HostProcessID, OnFatal);
+
         if (messageBroker == null)
         {
             messageBroker = new RabbitMQBroker(globals.RabbitOptions, HostProcessName + HostProcessID, OnFatal);
@@ -92,11 +102,17 @@ public abstract class MicroserviceHost : IMicroserviceHost
     }
 
     /// <summary>
-    /// Add an event handler to the control message consumer
+    /// Add an event handler to the control message consumer. Does nothing if the host has no control consumer
     /// </summary>
     /// <param name="handler">Method to call when invoked. Parameters are the action to perform, and the message body</param>
     protected void AddControlHandler(IControlMessageHandler handler)
     {
+        if (_controlMessageConsumer == null)
+        {
+            Logger.Debug($"No control consumer, so {handler.GetType().Name} will not be called");
+            return;
+        }
+
         //(a, m) => action, message content
         _controlMessageConsumer.ControlEvent += handler.ControlMessageHandler;
     }
@@ -118,7 +134,38 @@ public abstract class MicroserviceHost : IMicroserviceHost
                 throw new ApplicationException("Rabbit adapter has consumers before aux. connections created");
 
             _fatalLoggingProducer = MessageBroker.SetupProducer(_fatalLoggingProducerOptions, isBatch: false);
-            MessageBroker.StartControlConsumer(_controlMessageConsumer);
+            if (_controlMessageConsumer != null)
+                MessageBroker.StartControlConsumer(_controlMessageConsumer);
+        }
+
+        StartMetricsServer();
+    }
+
+    private void StartMetricsServer()
+    {
+        var metricsOptions = Globals.MetricsOptions;
+        if (metricsOptions?.Port == null)
+            return;
+
+        lock (_oMetricsLock)
+        {
+            if (_metricsServer != null)
+                return;
+
+            var server = new MetricsServer(MetricsRegistry.Default, metricsOptions.Host, metricsOptions.Port.Value);
+            try
+            {
+                server.Start();
+            }
+            catch (HttpListenerException e)
+            {
+                // Metrics are only informational, so this shouldn't stop the host
+                Logger.Error(e, $"Could not serve metrics on port {metricsOptions.Port}");
+                server.Dispose();
+                return;
+            }
+
+            _metricsServer = server;
         }
     }
 
@@ -143,7 +190,7 @@ public abstract class MicroserviceHost : IMicroserviceHost
 
         try
         {
-            _controlMessageConsumer.Shutdown();
+            _controlMessageConsumer?.Shutdown();
         }
         catch (Exception e)
         {
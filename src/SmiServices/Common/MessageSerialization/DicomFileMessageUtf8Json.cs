@@ -0,0 +1,127 @@
+using SmiServices.Common.Messages;
+using System;
+using System.Buffers;
+using System.Collections.Generic;
+using System.Text.Encodings.Web;
+using System.Text.Json;
+using JsonSerializationException = Newtonsoft.Json.JsonSerializationException;
+
+namespace SmiServices.Common.MessageSerialization;
+
+/// <summary>
+/// Reads and writes a <see cref="DicomFileMessage"/> as UTF-8 JSON without decoding its <see cref="DicomFileMessage.DicomDataset"/>.
+/// Follows the same rules as deserializing with <see cref="JsonConvert"/>, so unknown properties and missing or null
+/// required properties are errors
+/// </summary>
+internal static class DicomFileMessageUtf8Json
+{
+    private static readonly string[] _requiredProperties =
+    [
+        nameof(DicomFileMessage.DicomFilePath),
+        nameof(DicomFileMessage.StudyInstanceUID),
+        nameof(DicomFileMessage.SeriesInstanceUID),
+        nameof(DicomFileMessage.SOPInstanceUID),
+        nameof(DicomFileMessage.DicomDataset),
+    ];
+
+    private static readonly JsonWriterOptions _writerOptions = new()
+    {
+        // Closest to the Newtonsoft defaults, which only escape control and quote characters
+        Encoder = JavaScriptEncoder.UnsafeRelaxedJsonEscaping,
+    };
+
+    public static DicomFileMessage Read(ReadOnlyMemory<byte> utf8Json)
+    {
+        var message = new DicomFileMessage();
+        var found = new HashSet<string>(StringComparer.OrdinalIgnoreCase);
+
+        try
+        {
+            var reader = new Utf8JsonReader(utf8Json.Span);
+
+            if (!reader.Read() || reader.TokenType != JsonTokenType.StartObject)
+                throw new JsonSerializationException("Deserialized message object is null, message was empty.");
+
+            while (reader.Read() && reader.TokenType == JsonTokenType.PropertyName)
+            {
+                var name = reader.GetString()!;
+                reader.Read();
+
+                if (Is(name, nameof(DicomFileMessage.DicomFilePath)))
+                    message.DicomFilePath = ReadRequiredString(ref reader, name);
+                else if (Is(name, nameof(DicomFileMessage.DicomFileSize)))
+                    message.DicomFileSize = reader.GetInt64();
+                else if (Is(name, nameof(DicomFileMessage.StudyInstanceUID)))
+                    message.StudyInstanceUID = ReadRequiredString(ref reader, name);
+                else if (Is(name, nameof(DicomFileMessage.SeriesInstanceUID)))
+                    message.SeriesInstanceUID = ReadRequiredString(ref reader, name);
+                else if (Is(name, nameof(DicomFileMessage.SOPInstanceUID)))
+                    message.SOPInstanceUID = ReadRequiredString(ref reader, name);
+                else if (Is(name, nameof(DicomFileMessage.DicomDataset)))
+                {
+                    if (reader.TokenType != JsonTokenType.String)
+                        throw RequiredNotNull(name);
+
+                    // Keep the whole token, including the quotes, so it can be decoded or written back as-is
+                    var start = (int)reader.TokenStartIndex;
+                    message.SetDicomDatasetToken(utf8Json[start..(int)reader.BytesConsumed]);
+                }
+                else
+                    throw new JsonSerializationException($"Could not find member '{name}' on object of type '{nameof(DicomFileMessage)}'");
+
+                found.Add(name);
+            }
+
+            if (reader.TokenType != JsonTokenType.EndObject)
+                throw new JsonSerializationException($"Unexpected token {reader.TokenType} when reading {nameof(DicomFileMessage)}");
+        }
+        catch (Exception e) when (e is JsonException or InvalidOperationException or FormatException)
+        {
+            throw new JsonSerializationException($"Couldn't deserialize message to {typeof(DicomFileMessage).FullName}: {e.Message}", e);
+        }
+
+        foreach (var property in _requiredProperties)
+            if (!found.Contains(property))
+                throw new JsonSerializationException($"Required property '{property}' not found in JSON.");
+
+        return message;
+    }
+
+    /// <summary>
+    /// Writes the message, copying <paramref name="datasetToken"/> into the output as the <see cref="DicomFileMessage.DicomDataset"/>
+    /// </summary>
+    /// <param name="message"></param>
+    /// <param name="datasetToken">The dataset as a UTF-8 JSON string token</param>
+    /// <returns></returns>
+    public static byte[] Write(DicomFileMessage message, ReadOnlyMemory<byte> datasetToken)
+    {
+        var buffer = new ArrayBufferWriter<byte>(datasetToken.Length + 512);
+
+        using (var writer = new Utf8JsonWriter(buffer, _writerOptions))
+        {
+            writer.WriteStartObject();
+            writer.WriteString(nameof(DicomFileMessage.DicomFilePath), message.DicomFilePath);
+            writer.WriteNumber(nameof(DicomFileMessage.DicomFileSize), message.DicomFileSize);
+            writer.WriteString(nameof(DicomFileMessage.StudyInstanceUID), message.StudyInstanceUID);
+            writer.WriteString(nameof(DicomFileMessage.SeriesInstanceUID), message.SeriesInstanceUID);
+            writer.WriteString(nameof(DicomFileMessage.SOPInstanceUID), message.SOPInstanceUID);
+            writer.WritePropertyName(nameof(DicomFileMessage.DicomDataset));
+            writer.WriteRawValue(datasetToken.Span, skipInputValidation: true);
+            writer.WriteEndObject();
+        }
+
+        return buffer.WrittenSpan.ToArray();
+    }
+
+    private static bool Is(string name, string property) => string.Equals(name, property, StringComparison.OrdinalIgnoreCase);
+
+    private static string ReadRequiredString(ref Utf8JsonReader reader, string name)
+    {
+        if (reader.TokenType != JsonTokenType.String)
+            throw RequiredNotNull(name);
+
+        return reader.GetString()!;
+    }
+
+    private static JsonSerializationException RequiredNotNull(string name) => new($"Required property '{name}' expects a non-null value.");
+}
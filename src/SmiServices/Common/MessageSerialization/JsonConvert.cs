@@ -2,6 +2,7 @@ using Newtonsoft.Json;
 using Newtonsoft.Json.Serialization;
 using RabbitMQ.Client.Events;
 using SmiServices.Common.Messages;
+using System;
 using System.Collections.Generic;
 using System.Text;
 
@@ -51,19 +52,44 @@ public static class JsonConvert
 
     /// <summary>
     /// Deserialize a message straight from the <see cref="BasicDeliverEventArgs"/>. Encoding defaults to UTF8 if not set.
+    /// Compressed bodies are decoded according to <see cref="MessageBodyEncoding"/>.
     /// </summary>
     /// <typeparam name="T">The type of <see cref="IMessage"/> to deserialize into.</typeparam>
     /// <param name="deliverArgs">The message and all associated information.</param>
     /// <returns></returns>
     public static T DeserializeObject<T>(BasicDeliverEventArgs deliverArgs) where T : IMessage
     {
-        Encoding enc = Encoding.UTF8;
+        //TODO This might crash if for some reason we have invalid Unicode points
+        return DeserializeObject<T>(MessageBodyEncoding.GetString(deliverArgs.Body, deliverArgs.BasicProperties?.ContentEncoding));
+    }
+
+    /// <summary>
+    /// Deserialize a message from UTF-8 JSON. The <see cref="DicomFileMessage.DicomDataset"/> of a <see cref="DicomFileMessage"/>
+    /// is kept as the undecoded JSON, so is only decoded if it is read, and is copied as-is by <see cref="SerializeToUtf8Bytes"/>
+    /// unless it has been set. Other message types are deserialized as normal
+    /// </summary>
+    /// <typeparam name="T">The type of <see cref="IMessage"/> to deserialize into.</typeparam>
+    /// <param name="utf8Json">The message to deserialize. Must not be modified afterwards, since the message may refer to it</param>
+    /// <returns></returns>
+    public static T DeserializeLazy<T>(ReadOnlyMemory<byte> utf8Json) where T : IMessage
+    {
+        if (typeof(T) != typeof(DicomFileMessage))
+            return DeserializeObject<T>(Encoding.UTF8.GetString(utf8Json.Span));
 
-        if (deliverArgs.BasicProperties != null && deliverArgs.BasicProperties.ContentEncoding != null)
-            enc = Encoding.GetEncoding(deliverArgs.BasicProperties.ContentEncoding);
+        return (T)(IMessage)DicomFileMessageUtf8Json.Read(utf8Json);
+    }
 
-        //TODO This might crash if for some reason we have invalid Unicode points
-        return DeserializeObject<T>(enc.GetString(deliverArgs.Body.Span));
+    /// <summary>
+    /// Serialize a message to UTF-8 JSON
+    /// </summary>
+    /// <param name="message"></param>
+    /// <returns></returns>
+    public static byte[] SerializeToUtf8Bytes(IMessage message)
+    {
+        if (message is DicomFileMessage dicomFileMessage && dicomFileMessage.TryGetDicomDatasetToken(out var datasetToken))
+            return DicomFileMessageUtf8Json.Write(dicomFileMessage, datasetToken);
+
+        return Encoding.UTF8.GetBytes(Newtonsoft.Json.JsonConvert.SerializeObject(message));
     }
 
     public static T DeserializeObject<T>(byte[] body) where T : IMessage
@@ -0,0 +1,56 @@
+using System;
+using System.Text.Json;
+
+namespace SmiServices.Common.MessageSerialization;
+
+/// <summary>
+/// A string which may be held as its encoded JSON token, and is only decoded when first read. Lets large values such as
+/// a serialized DicomDataset be passed through without being decoded and re-encoded
+/// </summary>
+internal sealed class LazyJsonString : IEquatable<LazyJsonString>
+{
+    private string? _value;
+    private readonly ReadOnlyMemory<byte> _utf8Token;
+
+    public LazyJsonString(string value)
+    {
+        _value = value;
+    }
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="utf8Token">The JSON string token as UTF-8, including the quotes and any escape sequences. Must not be modified afterwards</param>
+    public LazyJsonString(ReadOnlyMemory<byte> utf8Token)
+    {
+        _utf8Token = utf8Token;
+    }
+
+    public string Value => _value ??= Decode();
+
+    /// <summary>
+    /// Returns the original JSON token, if this was created from one
+    /// </summary>
+    /// <param name="utf8Token"></param>
+    /// <returns></returns>
+    public bool TryGetUtf8Token(out ReadOnlyMemory<byte> utf8Token)
+    {
+        utf8Token = _utf8Token;
+        return !utf8Token.IsEmpty;
+    }
+
+    private string Decode()
+    {
+        var reader = new Utf8JsonReader(_utf8Token.Span);
+        reader.Read();
+        return reader.GetString()!;
+    }
+
+    public bool Equals(LazyJsonString? other) => other != null && Value == other.Value;
+
+    public override bool Equals(object? obj) => Equals(obj as LazyJsonString);
+
+    public override int GetHashCode() => Value.GetHashCode();
+
+    public override string ToString() => Value;
+}
@@ -0,0 +1,22 @@
+namespace SmiServices.Common.MessageSerialization;
+
+/// <summary>
+/// Compression applied to serialized message bodies before they are published
+/// </summary>
+public enum MessageBodyCompression
+{
+    /// <summary>
+    /// Bodies are sent as plain UTF-8 JSON
+    /// </summary>
+    None = 0,
+
+    /// <summary>
+    /// Bodies over the size threshold are gzip compressed and sent with content-encoding "gzip"
+    /// </summary>
+    GZip,
+
+    /// <summary>
+    /// Bodies over the size threshold are Brotli compressed and sent with content-encoding "br"
+    /// </summary>
+    Brotli,
+}
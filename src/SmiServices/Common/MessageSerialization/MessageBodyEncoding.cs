@@ -0,0 +1,128 @@
+using System;
+using System.IO;
+using System.IO.Compression;
+using System.Runtime.InteropServices;
+using System.Text;
+
+namespace SmiServices.Common.MessageSerialization;
+
+/// <summary>
+/// Helper class to encode and decode message bodies according to the AMQP content-encoding property. Historically the
+/// content-encoding has been used to specify the character set of the JSON body, so any value which isn't a known
+/// compression token is still treated as a character set.
+/// </summary>
+public static class MessageBodyEncoding
+{
+    public const string DefaultContentEncoding = "UTF-8";
+    public const string GZipContentEncoding = "gzip";
+    public const string BrotliContentEncoding = "br";
+
+    /// <summary>
+    /// Encode a serialized message as UTF-8, compressing it if it is larger than <paramref name="thresholdBytes"/>
+    /// </summary>
+    /// <param name="json">The serialized message</param>
+    /// <param name="compression">The compression to apply</param>
+    /// <param name="thresholdBytes">Bodies smaller than this are left uncompressed</param>
+    /// <param name="contentEncoding">The content-encoding which should be sent with the body</param>
+    /// <returns></returns>
+    public static byte[] Encode(string json, MessageBodyCompression compression, int thresholdBytes, out string contentEncoding)
+        => Encode(Encoding.UTF8.GetBytes(json), compression, thresholdBytes, out contentEncoding);
+
+    /// <summary>
+    /// Compress a UTF-8 serialized message if it is larger than <paramref name="thresholdBytes"/>
+    /// </summary>
+    /// <param name="body">The serialized message as UTF-8</param>
+    /// <param name="compression">The compression to apply</param>
+    /// <param name="thresholdBytes">Bodies smaller than this are left uncompressed</param>
+    /// <param name="contentEncoding">The content-encoding which should be sent with the body</param>
+    /// <returns></returns>
+    public static byte[] Encode(byte[] body, MessageBodyCompression compression, int thresholdBytes, out string contentEncoding)
+    {
+        contentEncoding = DefaultContentEncoding;
+
+        if (compression == MessageBodyCompression.None || body.Length < thresholdBytes)
+            return body;
+
+        using var compressed = new MemoryStream(body.Length / 4);
+        using (Stream compressor = compression switch
+        {
+            MessageBodyCompression.GZip => new GZipStream(compressed, CompressionLevel.Fastest, leaveOpen: true),
+            MessageBodyCompression.Brotli => new BrotliStream(compressed, CompressionLevel.Fastest, leaveOpen: true),
+            _ => throw new ArgumentOutOfRangeException(nameof(compression), compression, null),
+        })
+        {
+            compressor.Write(body);
+        }
+
+        contentEncoding = compression == MessageBodyCompression.GZip ? GZipContentEncoding : BrotliContentEncoding;
+        return compressed.ToArray();
+    }
+
+    /// <summary>
+    /// Decode a message body to its JSON string, decompressing it if required
+    /// </summary>
+    /// <param name="body">The raw message body</param>
+    /// <param name="contentEncoding">The content-encoding the message was sent with. Defaults to UTF-8 if not set</param>
+    /// <returns></returns>
+    public static string GetString(ReadOnlyMemory<byte> body, string? contentEncoding)
+    {
+        if (!IsCompressed(contentEncoding))
+            return GetCharacterEncoding(contentEncoding).GetString(body.Span);
+
+        using var reader = new StreamReader(Decompress(body, contentEncoding), Encoding.UTF8);
+
+        return reader.ReadToEnd();
+    }
+
+    /// <summary>
+    /// Decode a message body to its JSON as UTF-8, decompressing it if required. The result does not share memory with
+    /// <paramref name="body"/>, so can be kept after the delivery has been handled
+    /// </summary>
+    /// <param name="body">The raw message body</param>
+    /// <param name="contentEncoding">The content-encoding the message was sent with. Defaults to UTF-8 if not set</param>
+    /// <returns></returns>
+    public static ReadOnlyMemory<byte> GetUtf8Bytes(ReadOnlyMemory<byte> body, string? contentEncoding)
+    {
+        if (!IsCompressed(contentEncoding))
+        {
+            var encoding = GetCharacterEncoding(contentEncoding);
+            return encoding.CodePage == Encoding.UTF8.CodePage
+                ? body.ToArray()
+                : Encoding.Convert(encoding, Encoding.UTF8, body.ToArray());
+        }
+
+        using var decompressor = Decompress(body, contentEncoding);
+        using var decompressed = new MemoryStream(body.Length * 4);
+        decompressor.CopyTo(decompressed);
+
+        return decompressed.GetBuffer().AsMemory(0, (int)decompressed.Length);
+    }
+
+    /// <summary>
+    /// Returns the character set used for text in messages with the given content-encoding, such as the header values
+    /// </summary>
+    /// <param name="contentEncoding"></param>
+    /// <returns></returns>
+    public static Encoding GetCharacterEncoding(string? contentEncoding)
+    {
+        if (contentEncoding == null || IsCompressed(contentEncoding))
+            return Encoding.UTF8;
+
+        return Encoding.GetEncoding(contentEncoding);
+    }
+
+    private static Stream Decompress(ReadOnlyMemory<byte> body, string? contentEncoding)
+    {
+        if (!MemoryMarshal.TryGetArray(body, out ArraySegment<byte> segment))
+            segment = new ArraySegment<byte>(body.ToArray());
+
+        var compressed = new MemoryStream(segment.Array!, segment.Offset, segment.Count, writable: false);
+        return string.Equals(contentEncoding, GZipContentEncoding, StringComparison.OrdinalIgnoreCase)
+            ? new GZipStream(compressed, CompressionMode.Decompress)
+            : new BrotliStream(compressed, CompressionMode.Decompress);
+    }
+
+    private static bool IsCompressed(string? contentEncoding) =>
+        string.Equals(contentEncoding, GZipContentEncoding, StringComparison.OrdinalIgnoreCase) ||
+        string.Equals(contentEncoding, BrotliContentEncoding, StringComparison.OrdinalIgnoreCase);
+}
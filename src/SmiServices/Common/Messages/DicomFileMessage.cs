@@ -1,6 +1,7 @@
 
 using Equ;
 using Newtonsoft.Json;
+using SmiServices.Common.MessageSerialization;
 using System;
 using System.IO;
 using System.Text;
@@ -44,7 +45,14 @@ public sealed class DicomFileMessage : MemberwiseEquatable<DicomFileMessage>, IF
     /// Key-value pairs of Dicom tags and their values.
     /// </summary>
     [JsonProperty(Required = Required.Always)]
-    public string DicomDataset { get; set; } = null!;
+    public string DicomDataset
+    {
+        get => _dicomDataset?.Value!;
+        set => _dicomDataset = value == null ? null : new LazyJsonString(value);
+    }
+
+    // May hold the undecoded JSON if the message was read with MessageSerialization.JsonConvert.DeserializeLazy
+    private LazyJsonString? _dicomDataset;
 
 
     public DicomFileMessage() { }
@@ -60,6 +68,23 @@ public sealed class DicomFileMessage : MemberwiseEquatable<DicomFileMessage>, IF
         DicomFilePath = file[root.Length..].TrimStart(Path.DirectorySeparatorChar);
     }
 
+    /// <summary>
+    /// Sets the <see cref="DicomDataset"/> from its JSON string token, which is only decoded if the property is read
+    /// </summary>
+    /// <param name="utf8Token"></param>
+    internal void SetDicomDatasetToken(ReadOnlyMemory<byte> utf8Token) => _dicomDataset = new LazyJsonString(utf8Token);
+
+    /// <summary>
+    /// Returns the JSON string token of the <see cref="DicomDataset"/>, if it was read lazily and has not been set since
+    /// </summary>
+    /// <param name="utf8Token"></param>
+    /// <returns></returns>
+    internal bool TryGetDicomDatasetToken(out ReadOnlyMemory<byte> utf8Token)
+    {
+        utf8Token = default;
+        return _dicomDataset != null && _dicomDataset.TryGetUtf8Token(out utf8Token);
+    }
+
     public string GetAbsolutePath(string rootPath)
     {
         return Path.Combine(rootPath, DicomFilePath);
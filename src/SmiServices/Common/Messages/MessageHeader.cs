@@ -5,6 +5,7 @@ using NLog;
 using System;
 using System.Collections.Generic;
 using System.Linq;
+using System.Security.Cryptography;
 using System.Text;
 
 namespace SmiServices.Common.Messages;
@@ -22,6 +23,16 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
     public Guid[] Parents { get; init; }
     public const string Splitter = "->";
 
+    /// <summary>
+    /// Length of a capped parent chain: the root message, a hash of the elided messages, and the immediate parent
+    /// </summary>
+    public const int CappedParentsLength = 3;
+
+    // Header keys used instead of MessageGuid and Parents when GUIDs are sent as raw bytes
+    private const string MessageGuidBytesKey = "MessageGuidBytes";
+    private const string ParentsBytesKey = "ParentsBytes";
+    private const int GuidLength = 16;
+
     private static readonly int _producerProcessID;
 
     private static string? _currentProgramName;
@@ -51,6 +62,15 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
     /// </summary>
     /// <param name="parent">The triggering message that caused you to want to send this message</param>
     public MessageHeader(IMessageHeader? parent = null)
+        : this(parent, capParents: false) { }
+
+    /// <summary>
+    /// Declares that your process is about to send a message.  Optionally as a result of processing another message (<paramref name="parent"/>).
+    /// </summary>
+    /// <param name="parent">The triggering message that caused you to want to send this message</param>
+    /// <param name="capParents">If set, <see cref="Parents"/> is limited to <see cref="CappedParentsLength"/> entries. Messages
+    /// replaced by the hash will no longer be found by <see cref="IsDescendantOf"/></param>
+    public MessageHeader(IMessageHeader? parent, bool capParents)
     {
         ProducerProcessID = _producerProcessID;
         ProducerExecutableName = CurrentProgramName;
@@ -61,6 +81,11 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
             Parents = [];
             OriginalPublishTimestamp = UnixTimeNow();
         }
+        else if (capParents && parent.Parents.Length >= CappedParentsLength)
+        {
+            Parents = [parent.Parents[0], HashParents(parent.Parents.AsSpan(1)), parent.MessageGuid];
+            OriginalPublishTimestamp = parent.OriginalPublishTimestamp;
+        }
         else
         {
             var p = new List<Guid>(parent.Parents) { parent.MessageGuid };
@@ -69,32 +94,84 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
         }
     }
 
+    /// <summary>
+    /// Combines a section of a parent chain into a single identifier. Once a chain is capped this is only ever given the
+    /// previous hash and parent, so the cost doesn't grow with the length of the chain
+    /// </summary>
+    /// <param name="parents"></param>
+    /// <returns></returns>
+    private static Guid HashParents(ReadOnlySpan<Guid> parents)
+    {
+        // Only ever more than the capped length the first time a chain is capped
+        Span<byte> bytes = parents.Length <= CappedParentsLength ? stackalloc byte[CappedParentsLength * GuidLength] : new byte[parents.Length * GuidLength];
+        bytes = bytes[..WriteGuids(parents, bytes)];
+
+        Span<byte> hash = stackalloc byte[SHA256.HashSizeInBytes];
+        SHA256.HashData(bytes, hash);
+        return new Guid(hash[..GuidLength]);
+    }
+
     /// <summary>
     /// Creates a <see cref="MessageHeader"/> out of a (byte-encoded) header field set from RabbitMQ
     /// </summary>
     /// <param name="encodedHeaders"></param>
     /// <param name="enc"></param>
     public static MessageHeader FromDict(IDictionary<string, object> encodedHeaders, Encoding enc)
-        => new()
+    {
+        Guid messageGuid;
+        Guid[] parents;
+
+        if (encodedHeaders.TryGetValue(MessageGuidBytesKey, out var guidBytes))
+        {
+            messageGuid = new Guid((byte[])guidBytes);
+            parents = GetGuidArray((byte[])encodedHeaders[ParentsBytesKey]);
+        }
+        else
         {
-            MessageGuid = GetGuidArrayFromEncodedHeader(encodedHeaders["MessageGuid"], enc).Single(),
+            messageGuid = GetGuidArrayFromEncodedHeader(encodedHeaders["MessageGuid"], enc).Single();
+            parents = GetGuidArrayFromEncodedHeader(encodedHeaders["Parents"], enc);
+        }
+
+        return new MessageHeader
+        {
+            MessageGuid = messageGuid,
             ProducerProcessID = (int)encodedHeaders["ProducerProcessID"],
             ProducerExecutableName = enc.GetString((byte[])encodedHeaders["ProducerExecutableName"]),
-            Parents = GetGuidArrayFromEncodedHeader(encodedHeaders["Parents"], enc),
+            Parents = parents,
             OriginalPublishTimestamp = Convert.ToInt64(encodedHeaders["OriginalPublishTimestamp"]),
         };
+    }
+
+    /// <summary>
+    /// Populates RabbitMQ header properties with the current MessageHeader
+    /// </summary>
+    /// <param name="headers"></param>
+    public void Populate(IDictionary<string, object> headers) => Populate(headers, binaryGuids: false);
 
     /// <summary>
     /// Populates RabbitMQ header properties with the current MessageHeader
     /// </summary>
     /// <param name="headers"></param>
-    public void Populate(IDictionary<string, object> headers)
+    /// <param name="binaryGuids">If set, the GUIDs are written as raw bytes rather than strings. Only readable by
+    /// <see cref="FromDict"/>, so must not be used if any consumers are in other languages</param>
+    public void Populate(IDictionary<string, object> headers, bool binaryGuids)
     {
-        headers.Add("MessageGuid", MessageGuid.ToString());
+        if (binaryGuids)
+        {
+            headers.Add(MessageGuidBytesKey, MessageGuid.ToByteArray());
+            var parents = new byte[Parents.Length * GuidLength];
+            WriteGuids(Parents, parents);
+            headers.Add(ParentsBytesKey, parents);
+        }
+        else
+        {
+            headers.Add("MessageGuid", MessageGuid.ToString());
+            headers.Add("Parents", string.Join(Splitter, Parents));
+        }
+
         headers.Add("ProducerProcessID", ProducerProcessID);
         headers.Add("ProducerExecutableName", ProducerExecutableName);
         headers.Add("OriginalPublishTimestamp", OriginalPublishTimestamp);
-        headers.Add("Parents", string.Join(Splitter, Parents));
     }
 
     public bool IsDescendantOf(IMessageHeader other)
@@ -104,6 +181,9 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
 
     public void Log(ILogger logger, LogLevel level, string message, Exception? ex = null)
     {
+        if (!logger.IsEnabled(level))
+            return;
+
         //TODO This is massively over-logging - ProducerProcessID, ProducerExecutableName, OriginalPublishTimestamp are found in the logs anyway
         var theEvent = new LogEventInfo(level, logger.Name, message);
         theEvent.Properties["MessageGuid"] = MessageGuid.ToString();
@@ -138,6 +218,24 @@ public class MessageHeader : MemberwiseEquatable<MessageHeader>, IMessageHeader
         return strings.Select(Guid.Parse).ToArray();
     }
 
+    private static int WriteGuids(ReadOnlySpan<Guid> guids, Span<byte> destination)
+    {
+        for (var i = 0; i < guids.Length; ++i)
+            guids[i].TryWriteBytes(destination.Slice(i * GuidLength, GuidLength));
+        return guids.Length * GuidLength;
+    }
+
+    private static Guid[] GetGuidArray(byte[] bytes)
+    {
+        if (bytes.Length % GuidLength != 0)
+            throw new ArgumentException($"Expected a multiple of {GuidLength} bytes, got {bytes.Length}", nameof(bytes));
+
+        var guids = new Guid[bytes.Length / GuidLength];
+        for (var i = 0; i < guids.Length; ++i)
+            guids[i] = new Guid(bytes.AsSpan(i * GuidLength, GuidLength));
+        return guids;
+    }
+
     private static Guid[] GetGuidArrayFromEncodedHeader(object o, Encoding enc)
     {
         return GetGuidArray(enc.GetString((byte[])o));
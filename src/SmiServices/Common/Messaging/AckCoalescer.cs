@@ -0,0 +1,179 @@
+using NLog;
+using System;
+using System.Collections.Generic;
+using System.Linq;
+using System.Threading;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// Holds back acks so they can be sent as a single multiple ack for the highest contiguous completed delivery tag.
+/// Pending acks are sent once enough are waiting or on a timer, and nacks are always sent immediately. Requires deliveries to be reported via <see cref="Delivered"/> in delivery tag order
+/// </summary>
+public sealed class AckCoalescer : IDisposable
+{
+    private readonly ILogger _logger = LogManager.GetCurrentClassLogger();
+
+    private readonly int _maxBatchSize;
+    private readonly TimeSpan _maxDelay;
+    private readonly Action<ulong, bool> _sendAck;
+    private readonly Timer _timer;
+
+    // Sends are made while holding this lock, so that a nack is always sent before any multiple ack which covers it
+    private readonly object _oLock = new();
+    private readonly SortedSet<ulong> _inFlight = [];
+    private readonly SortedSet<ulong> _completed = [];
+    private bool _disposed;
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="maxBatchSize">Number of pending acks at which they are sent</param>
+    /// <param name="maxDelay">Longest time an ack is held back for</param>
+    /// <param name="sendAck">Sends an ack to the broker, given the delivery tag and whether it is a multiple ack</param>
+    public AckCoalescer(int maxBatchSize, TimeSpan maxDelay, Action<ulong, bool> sendAck)
+    {
+        if (maxBatchSize < 1)
+            throw new ArgumentOutOfRangeException(nameof(maxBatchSize), "Must be at least 1");
+        if (maxDelay <= TimeSpan.Zero)
+            throw new ArgumentOutOfRangeException(nameof(maxDelay), "Must be greater than 0");
+
+        _maxBatchSize = maxBatchSize;
+        _maxDelay = maxDelay;
+        _sendAck = sendAck;
+        _timer = new Timer(_ => FlushOnTimer(), null, maxDelay, maxDelay);
+    }
+
+    /// <summary>
+    /// The number of acks which have not yet been sent
+    /// </summary>
+    public int PendingCount
+    {
+        get
+        {
+            lock (_oLock)
+                return _completed.Count;
+        }
+    }
+
+    /// <summary>
+    /// Record that a message has been passed to the consumer
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    public void Delivered(ulong deliveryTag)
+    {
+        lock (_oLock)
+            if (!_disposed)
+                _inFlight.Add(deliveryTag);
+    }
+
+    /// <summary>
+    /// Acks the message, either now or as part of a later multiple ack
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    public void Ack(ulong deliveryTag)
+    {
+        lock (_oLock)
+        {
+            if (_disposed)
+            {
+                _sendAck(deliveryTag, false);
+                return;
+            }
+
+            _inFlight.Remove(deliveryTag);
+            _completed.Add(deliveryTag);
+
+            if (_completed.Count >= _maxBatchSize)
+                FlushImpl();
+        }
+    }
+
+    /// <summary>
+    /// Immediately acks all messages up to and including <paramref name="deliveryTag"/>
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    public void AckMultiple(ulong deliveryTag)
+    {
+        lock (_oLock)
+        {
+            _inFlight.RemoveWhere(x => x <= deliveryTag);
+            _completed.RemoveWhere(x => x <= deliveryTag);
+            _sendAck(deliveryTag, true);
+        }
+    }
+
+    /// <summary>
+    /// Immediately sends a nack for the message
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    /// <param name="sendNack"></param>
+    public void Nack(ulong deliveryTag, Action sendNack)
+    {
+        lock (_oLock)
+        {
+            _inFlight.Remove(deliveryTag);
+            sendNack();
+        }
+    }
+
+    /// <summary>
+    /// Sends all pending acks
+    /// </summary>
+    public void Flush()
+    {
+        lock (_oLock)
+            FlushImpl();
+    }
+
+    private void FlushImpl()
+    {
+        if (_completed.Count == 0)
+            return;
+
+        // Every delivery below the lowest in-flight message has been acked or nacked, so can be covered by a multiple ack
+        var lowestInFlight = _inFlight.Count > 0 ? _inFlight.Min : ulong.MaxValue;
+        var completed = _completed.ToList();
+        var contiguousCount = completed.TakeWhile(x => x < lowestInFlight).Count();
+
+        // Cleared before sending, since there is no point retrying if the channel has failed
+        _completed.Clear();
+
+        if (contiguousCount > 0)
+            _sendAck(completed[contiguousCount - 1], contiguousCount > 1);
+
+        // Messages completed after one which is still in flight (e.g. a held message) have to be acked individually
+        foreach (var tag in completed.Skip(contiguousCount))
+            _sendAck(tag, false);
+    }
+
+    private void FlushOnTimer()
+    {
+        try
+        {
+            Flush();
+        }
+        catch (Exception e)
+        {
+            _logger.Warn(e, $"Could not send acks after {_maxDelay}");
+        }
+    }
+
+    /// <summary>
+    /// Stops the timer and sends all pending acks. Any later acks are sent immediately
+    /// </summary>
+    public void Dispose()
+    {
+        _timer.Dispose();
+
+        lock (_oLock)
+        {
+            if (_disposed)
+                return;
+
+            _disposed = true;
+            FlushImpl();
+            _inFlight.Clear();
+        }
+    }
+}
@@ -1,5 +1,6 @@
 using RabbitMQ.Client;
 using SmiServices.Common.Messages;
+using SmiServices.Common.MessageSerialization;
 using System;
 
 namespace SmiServices.Common.Messaging;
@@ -19,9 +20,16 @@ public class BatchProducerModel : ProducerModel
         IBackoffProvider? backoffProvider = null,
         string? probeQueueName = null,
         int probeQueueLimit = 0,
-        TimeSpan? probeTimeout = null
+        TimeSpan? probeInterval = null,
+        int maxOutstandingConfirms = 0,
+        MessageBodyCompression bodyCompression = MessageBodyCompression.None,
+        int bodyCompressionThreshold = 0,
+        bool binaryHeaders = false,
+        bool capParentChain = false,
+        double minPublishRate = 1,
+        double maxPublishRate = 10_000
     )
-        : base(exchangeName, model, properties, maxPublishAttempts, backoffProvider, probeQueueName, probeQueueLimit, probeTimeout)
+        : base(exchangeName, model, properties, maxPublishAttempts, backoffProvider, probeQueueName, probeQueueLimit, probeInterval, maxOutstandingConfirms, bodyCompression, bodyCompressionThreshold, binaryHeaders, capParentChain, minPublishRate, maxPublishRate)
     { }
 
 
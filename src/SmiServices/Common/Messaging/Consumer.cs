@@ -3,9 +3,12 @@ using NLog;
 using RabbitMQ.Client.Events;
 using SmiServices.Common.Events;
 using SmiServices.Common.Messages;
+using SmiServices.Common.Metrics;
 using System;
 using System.Collections.Generic;
+using System.Diagnostics;
 using System.Linq;
+using System.Threading;
 using System.Threading.Tasks;
 
 namespace SmiServices.Common.Messaging;
@@ -15,12 +18,14 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
     /// <summary>
     /// Count of the messages Acknowledged by this Consumer, use <see cref="Ack(IMessageHeader, ulong)"/> to increment this
     /// </summary>
-    public int AckCount { get; private set; }
+    public int AckCount => _ackCount;
+    private int _ackCount;
 
     /// <summary>
     /// Count of the messages Rejected by this Consumer, use <see cref="ErrorAndNack"/> to increment this
     /// </summary>
-    public int NackCount { get; private set; }
+    public int NackCount => _nackCount;
+    private int _nackCount;
 
     /// <inheritdoc/>
     public bool HoldUnprocessableMessages { get; set; } = false;
@@ -30,6 +35,10 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
     /// <inheritdoc/>
     public int QoSPrefetchCount { get; set; }
 
+    /// <inheritdoc/>
+    /// <remarks>Override to return true if <see cref="ProcessMessageImpl"/> can safely be run concurrently. Thread-safe consumers should only ack single messages</remarks>
+    public virtual bool IsThreadSafe => false;
+
     /// <summary>
     /// Event raised when Fatal method called
     /// </summary>
@@ -39,9 +48,16 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
 
     protected readonly ILogger Logger;
 
+    private readonly MetricCounter.Child _ackedMetric;
+    private readonly MetricCounter.Child _nackedMetric;
+    private readonly MetricHistogram.Child _processingMetric;
+
     private readonly object _oConsumeLock = new();
     private bool _exiting;
 
+    // Only set if acks are being coalesced
+    private AckCoalescer? _ackCoalescer;
+
     public virtual void Shutdown()
     {
 
@@ -64,19 +80,38 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
         }
 
         Logger = LogManager.GetLogger(loggerName);
+
+        _ackedMetric = SmiMetrics.MessagesAcked.WithLabels(loggerName);
+        _nackedMetric = SmiMetrics.MessagesNacked.WithLabels(loggerName);
+        _processingMetric = SmiMetrics.ProcessingSeconds.WithLabels(loggerName);
+    }
+
+    /// <inheritdoc/>
+    public IDisposable CoalesceAcks(int maxBatchSize, TimeSpan maxDelay)
+    {
+        var coalescer = new AckCoalescer(maxBatchSize, maxDelay,
+            (tag, multiple) => OnAck?.Invoke(this, new BasicAckEventArgs { DeliveryTag = tag, Multiple = multiple }));
+        _ackCoalescer = coalescer;
+        return coalescer;
     }
 
     public void ProcessMessage(IMessageHeader header, T message, ulong tag)
     {
+        // Recorded even if exiting, so the message is never covered by a multiple ack
+        _ackCoalescer?.Delivered(tag);
+
         lock (_oConsumeLock)
         {
             if (_exiting)
                 return;
         }
 
+        var start = Stopwatch.GetTimestamp();
+
         try
         {
             ProcessMessageImpl(header, message, tag);
+            _processingMetric.ObserveElapsed(start);
         }
         catch (Exception e)
         {
@@ -84,9 +119,9 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
 
             if (HoldUnprocessableMessages)
             {
-                ++_heldMessages;
-                string msg = $"Holding an unprocessable message ({_heldMessages} total message(s) currently held";
-                if (_heldMessages >= QoSPrefetchCount)
+                var heldMessages = Interlocked.Increment(ref _heldMessages);
+                string msg = $"Holding an unprocessable message ({heldMessages} total message(s) currently held";
+                if (heldMessages >= QoSPrefetchCount)
                     msg += $". Have now exceeded the configured BasicQos value of {QoSPrefetchCount}. No further messages will be delivered to this consumer!";
                 Logger.Warn(msg);
             }
@@ -105,8 +140,13 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
     /// <param name="tag"></param>
     private void DiscardSingleMessage(ulong tag)
     {
-        OnNack?.Invoke(this, new BasicNackEventArgs { DeliveryTag = tag, Multiple = false, Requeue = false });
-        NackCount++;
+        var nackArgs = new BasicNackEventArgs { DeliveryTag = tag, Multiple = false, Requeue = false };
+        if (_ackCoalescer != null)
+            _ackCoalescer.Nack(tag, () => OnNack?.Invoke(this, nackArgs));
+        else
+            OnNack?.Invoke(this, nackArgs);
+        Interlocked.Increment(ref _nackCount);
+        _nackedMetric.Inc();
     }
 
     protected virtual void ErrorAndNack(IMessageHeader header, ulong tag, string message, Exception exception)
@@ -117,9 +157,40 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
 
     protected void Ack(IMessageHeader header, ulong deliveryTag)
     {
-        OnAck?.Invoke(this, new BasicAckEventArgs { DeliveryTag = deliveryTag, Multiple = false });
-        header.Log(Logger, LogLevel.Trace, $"Acknowledged {header.MessageGuid}");
-        AckCount++;
+        if (_ackCoalescer != null)
+            _ackCoalescer.Ack(deliveryTag);
+        else
+            OnAck?.Invoke(this, new BasicAckEventArgs { DeliveryTag = deliveryTag, Multiple = false });
+        if (Logger.IsTraceEnabled)
+            header.Log(Logger, LogLevel.Trace, $"Acknowledged {header.MessageGuid}");
+        Interlocked.Increment(ref _ackCount);
+        _ackedMetric.Inc();
+    }
+
+    /// <summary>
+    /// Acknowledges a message once the publish of its response has been confirmed, without blocking the calling thread.
+    /// Use with <see cref="IProducerModel.SendMessageAsync"/>. If the publish fails then <see cref="Fatal"/> is called
+    /// and the message is left unacknowledged
+    /// </summary>
+    /// <param name="header"></param>
+    /// <param name="deliveryTag"></param>
+    /// <param name="publishConfirmed"></param>
+    protected void AckWhenConfirmed(IMessageHeader header, ulong deliveryTag, Task publishConfirmed)
+    {
+        // E.g. if the producer doesn't track confirms, and so has already waited for this one
+        if (publishConfirmed.IsCompletedSuccessfully)
+        {
+            Ack(header, deliveryTag);
+            return;
+        }
+
+        publishConfirmed.ContinueWith(t =>
+        {
+            if (t.IsCompletedSuccessfully)
+                Ack(header, deliveryTag);
+            else
+                Fatal($"Could not confirm the response to {header.MessageGuid} was published", t.Exception?.GetBaseException() ?? new TaskCanceledException(t));
+        }, TaskScheduler.Default);
     }
 
     /// <summary>
@@ -130,12 +201,17 @@ public abstract class Consumer<T> : IConsumer<T> where T : IMessage
     /// <param name="latestDeliveryTag"></param>
     protected void Ack(IList<IMessageHeader> batchHeaders, ulong latestDeliveryTag)
     {
-        foreach (IMessageHeader header in batchHeaders)
-            header.Log(Logger, LogLevel.Trace, "Acknowledged");
+        if (Logger.IsTraceEnabled)
+            foreach (IMessageHeader header in batchHeaders)
+                header.Log(Logger, LogLevel.Trace, "Acknowledged");
 
-        AckCount += batchHeaders.Count;
+        Interlocked.Add(ref _ackCount, batchHeaders.Count);
+        _ackedMetric.Inc(batchHeaders.Count);
 
-        OnAck?.Invoke(this, new BasicAckEventArgs { DeliveryTag = latestDeliveryTag, Multiple = true });
+        if (_ackCoalescer != null)
+            _ackCoalescer.AckMultiple(latestDeliveryTag);
+        else
+            OnAck?.Invoke(this, new BasicAckEventArgs { DeliveryTag = latestDeliveryTag, Multiple = true });
     }
 
     /// <summary>
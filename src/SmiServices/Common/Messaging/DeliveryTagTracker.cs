@@ -0,0 +1,60 @@
+using System;
+using System.Collections.Generic;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// Tracks the delivery tags on a channel which have not yet been acknowledged or rejected. Used when messages are
+/// processed concurrently, so that acks and nacks which arrive out of order are only sent once for each delivery.
+/// Sends are made while holding the tracker lock, since channels are not thread-safe.
+/// </summary>
+public sealed class DeliveryTagTracker
+{
+    private readonly SortedSet<ulong> _unsettled = [];
+
+    /// <summary>
+    /// The number of deliveries which have not yet been acknowledged or rejected
+    /// </summary>
+    public int UnsettledCount
+    {
+        get
+        {
+            lock (_unsettled)
+                return _unsettled.Count;
+        }
+    }
+
+    /// <summary>
+    /// Record that a message has been delivered to the consumer
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    public void Delivered(ulong deliveryTag)
+    {
+        lock (_unsettled)
+            _unsettled.Add(deliveryTag);
+    }
+
+    /// <summary>
+    /// Marks the delivery (or all deliveries up to and including it, if <paramref name="multiple"/> is set) as settled,
+    /// and calls <paramref name="send"/> unless they were all already settled
+    /// </summary>
+    /// <param name="deliveryTag"></param>
+    /// <param name="multiple"></param>
+    /// <param name="send">Sends the ack or nack to the broker</param>
+    /// <returns>True if <paramref name="send"/> was called</returns>
+    public bool Settle(ulong deliveryTag, bool multiple, Action send)
+    {
+        lock (_unsettled)
+        {
+            var removed = multiple
+                ? _unsettled.RemoveWhere(x => x <= deliveryTag) > 0
+                : _unsettled.Remove(deliveryTag);
+
+            if (!removed)
+                return false;
+
+            send();
+            return true;
+        }
+    }
+}
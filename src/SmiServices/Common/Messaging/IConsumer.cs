@@ -2,6 +2,7 @@ using RabbitMQ.Client;
 using SmiServices.Common.Events;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Options;
+using System;
 
 namespace SmiServices.Common.Messaging;
 
@@ -44,4 +45,18 @@ public interface IConsumer<T> where T : IMessage
     /// The BasicQos value configured on the <see cref="IModel"/>
     /// </summary>
     int QoSPrefetchCount { get; set; }
+
+    /// <summary>
+    /// If set, <see cref="ProcessMessage"/> may be called concurrently when <see cref="ConsumerOptions.MaxConcurrency"/> is greater than 1
+    /// </summary>
+    bool IsThreadSafe { get; }
+
+    /// <summary>
+    /// Hold back acks and send them as multiple acks where possible. Only valid if <see cref="ProcessMessage"/> is
+    /// called in delivery tag order
+    /// </summary>
+    /// <param name="maxBatchSize">Number of pending acks at which they are sent</param>
+    /// <param name="maxDelay">Longest time an ack is held back for</param>
+    /// <returns>Dispose to send any pending acks and stop coalescing</returns>
+    IDisposable CoalesceAcks(int maxBatchSize, TimeSpan maxDelay);
 }
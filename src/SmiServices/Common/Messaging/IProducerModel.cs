@@ -1,5 +1,6 @@
 using SmiServices.Common.Events;
 using SmiServices.Common.Messages;
+using System.Threading.Tasks;
 
 namespace SmiServices.Common.Messaging;
 
@@ -17,6 +18,15 @@ public interface IProducerModel
     /// <param name="routingKey">Routing key for the exchange to direct the message.</param>
     IMessageHeader SendMessage(IMessage message, IMessageHeader? isInResponseTo, string? routingKey);
 
+    /// <summary>
+    /// Sends a <see cref="IMessage"/> to a RabbitMQ exchange without blocking until the publish is confirmed.
+    /// </summary>
+    /// <param name="message">Message object to serialise and send.</param>
+    /// <param name="isInResponseTo">If you are responding to a message, pass that messages header in here (otherwise pass null)</param>
+    /// <param name="routingKey">Routing key for the exchange to direct the message.</param>
+    /// <returns>Task which completes once RabbitMQ has confirmed the message, or faults if it was rejected</returns>
+    Task<IMessageHeader> SendMessageAsync(IMessage message, IMessageHeader? isInResponseTo, string? routingKey);
+
     /// <summary>
     /// Waits until all sent messages are confirmed by RabbitMQ
     /// </summary>
@@ -0,0 +1,404 @@
+using NLog;
+using RabbitMQ.Client;
+using SmiServices.Common.Events;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Metrics;
+using SmiServices.Common.Options;
+using System;
+using System.Collections.Generic;
+using System.Linq;
+using System.Threading;
+using System.Threading.Tasks;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// Message broker which passes message objects between producers and consumers in the same process, via the queues of an <see cref="InMemoryMessageBus"/>.
+/// Messages are not serialized or persisted, and a message routed to more than one queue is shared by all of their consumers.
+/// </summary>
+public class InMemoryBroker : IMessageBroker
+{
+    /// <summary>
+    /// Used to ensure we can't create any new consumers or producers after we have called Shutdown()
+    /// </summary>
+    public bool ShutdownCalled { get; private set; }
+
+    public bool HasConsumers
+    {
+        get
+        {
+            lock (_oResourceLock)
+            {
+                return _consumers.Count > 0;
+            }
+        }
+    }
+
+    private readonly ILogger _logger = LogManager.GetCurrentClassLogger();
+
+    private readonly InMemoryMessageBus _bus;
+    private readonly HostFatalHandler? _hostFatalHandler;
+
+    private readonly Dictionary<Guid, ConsumerResources> _consumers = [];
+    private readonly object _oResourceLock = new();
+    private readonly object _exitLock = new();
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="bus">The exchanges and queues to use. Shared with any other brokers in the process which should exchange messages</param>
+    /// <param name="hostId">Identifier for this host instance</param>
+    /// <param name="hostFatalHandler"></param>
+    public InMemoryBroker(InMemoryMessageBus bus, string hostId, HostFatalHandler? hostFatalHandler = null)
+    {
+        if (string.IsNullOrWhiteSpace(hostId))
+            throw new ArgumentException("Host ID required", nameof(hostId));
+
+        _bus = bus;
+
+        if (hostFatalHandler == null)
+            _logger.Warn("No handler given for fatal events");
+
+        _hostFatalHandler = hostFatalHandler;
+    }
+
+    /// <summary>
+    /// Start a task which sends messages from a queue to the <see cref="IConsumer{T}"/>.
+    /// </summary>
+    /// <param name="consumerOptions">The queue options.</param>
+    /// <param name="consumer">Consumer that will be sent any received messages.</param>
+    /// <param name="isSolo">If specified, will ensure that it is the only consumer on the provided queue</param>
+    /// <returns>Identifier for the consumer task, can be used to stop the consumer without shutting down the whole broker</returns>
+    public Guid StartConsumer<T>(ConsumerOptions consumerOptions, IConsumer<T> consumer, bool isSolo = false) where T : IMessage
+    {
+        if (ShutdownCalled)
+            throw new ApplicationException("Broker has been shut down");
+
+        if (!consumerOptions.VerifyPopulated())
+            throw new ArgumentException($"The given {nameof(consumerOptions)} has invalid values");
+
+        var queue = _bus.GetQueue(consumerOptions.QueueName!)
+            ?? throw new ApplicationException($"Expected queue \"{consumerOptions.QueueName}\" to exist");
+
+        if (queue.AddConsumer() > 1 && isSolo)
+        {
+            queue.RemoveConsumer();
+            throw new ApplicationException($"Already a consumer on queue {consumerOptions.QueueName} and solo consumer was specified");
+        }
+
+        consumer.QoSPrefetchCount = consumerOptions.QoSPrefetchCount;
+
+        var maxConcurrency = 1;
+        if (consumerOptions.MaxConcurrency > 1)
+        {
+            if (consumer.IsThreadSafe)
+                maxConcurrency = Math.Min(consumerOptions.MaxConcurrency, consumerOptions.QoSPrefetchCount);
+            else
+                _logger.Warn($"Ignoring MaxConcurrency of {consumerOptions.MaxConcurrency} for {consumerOptions.QueueName} since {consumer.GetType().Name} is not thread-safe");
+        }
+
+        if (consumerOptions.HoldUnprocessableMessages && !consumerOptions.AutoAck)
+            consumer.HoldUnprocessableMessages = true;
+
+        var resources = new ConsumerResources(queue, consumerOptions.AutoAck ? null : consumerOptions.QoSPrefetchCount)
+        {
+            QueueMetric = SmiMetrics.QueueMessages.Observe(() => queue.Channel.Reader.Count, queue.Name),
+        };
+        Guid taskId = Guid.NewGuid();
+
+        consumer.OnFatal += (s, e) =>
+        {
+            resources.Dispose(RabbitMQBroker.DefaultOperationTimeout);
+            _hostFatalHandler?.Invoke(s, e);
+        };
+
+        consumer.OnAck += (_, a) => resources.Settle(a.DeliveryTag, a.Multiple, requeue: false);
+        consumer.OnNack += (_, a) => resources.Settle(a.DeliveryTag, a.Multiple, a.Requeue);
+
+        lock (_oResourceLock)
+        {
+            _consumers.Add(taskId, resources);
+        }
+
+        resources.Start(() => Consume(resources, consumer, maxConcurrency));
+
+        _logger.Debug($"Consumer task started [QueueName={consumerOptions.QueueName}]");
+        return taskId;
+    }
+
+    private void Consume<T>(ConsumerResources resources, IConsumer<T> consumer, int maxConcurrency) where T : IMessage
+    {
+        var workerSlots = maxConcurrency > 1 ? new SemaphoreSlim(maxConcurrency, maxConcurrency) : null;
+
+        while (resources.TryReceive(out var tag, out var delivery))
+        {
+            if (delivery.Message is not T message)
+            {
+                delivery.Header.Log(_logger, LogLevel.Error, $"Could not deliver {delivery.Message.GetType().Name} to a consumer of {typeof(T).Name}");
+                resources.Settle(tag, multiple: false, requeue: false);
+                continue;
+            }
+
+            delivery.Header.Log(_logger, LogLevel.Trace, "Received");
+
+            if (workerSlots == null)
+            {
+                consumer.ProcessMessage(delivery.Header, message, tag);
+                continue;
+            }
+
+            workerSlots.Wait();
+            Task.Run(() =>
+            {
+                try
+                {
+                    consumer.ProcessMessage(delivery.Header, message, tag);
+                }
+                finally
+                {
+                    workerSlots.Release();
+                }
+            });
+        }
+
+        _logger.Debug($"Consumer for {resources.Queue.Name} exiting");
+    }
+
+    /// <summary>
+    /// Control messages are only sent over RabbitMQ, so this just logs that the consumer will not receive any
+    /// </summary>
+    /// <param name="controlMessageConsumer"></param>
+    public void StartControlConsumer(IControlMessageConsumer controlMessageConsumer)
+    {
+        if (ShutdownCalled)
+            throw new ApplicationException("Broker has been shut down");
+
+        _logger.Info("Control messages are not supported by the in-memory broker");
+    }
+
+    /// <summary>
+    /// Stops the consumer, returning any unacknowledged messages to its queue
+    /// </summary>
+    /// <param name="taskId"></param>
+    /// <param name="timeout">Max time to wait for the message being processed to complete</param>
+    public void StopConsumer(Guid taskId, TimeSpan timeout)
+    {
+        if (ShutdownCalled)
+            return;
+
+        ConsumerResources? resources;
+        lock (_oResourceLock)
+        {
+            if (!_consumers.Remove(taskId, out resources))
+                throw new ApplicationException("Guid was not found in the task register");
+        }
+
+        resources.Dispose(timeout);
+    }
+
+    /// <summary>
+    /// Setup a <see cref="IProducerModel"/> to send messages with.
+    /// </summary>
+    /// <param name="producerOptions">The producer options class to setup which must include the exchange name.</param>
+    /// <param name="isBatch">Ignored, since there are no confirms to wait for</param>
+    /// <returns>Object which can send messages to an exchange on the bus.</returns>
+    public IProducerModel SetupProducer(ProducerOptions producerOptions, bool isBatch = false)
+    {
+        if (ShutdownCalled)
+            throw new ApplicationException("Broker has been shut down");
+
+        if (!producerOptions.VerifyPopulated())
+            throw new ArgumentException("The given producer options have invalid values");
+
+        if (!_bus.ExchangeExists(producerOptions.ExchangeName!))
+            throw new ApplicationException($"Expected exchange \"{producerOptions.ExchangeName}\" to exist");
+
+        return new InMemoryProducerModel(producerOptions.ExchangeName!, _bus, producerOptions.CapParentChain);
+    }
+
+    /// <summary>
+    /// Not supported, since there is no RabbitMQ connection
+    /// </summary>
+    /// <param name="connectionName"></param>
+    /// <returns></returns>
+    public IModel GetModel(string connectionName)
+    {
+        throw new NotSupportedException($"{nameof(InMemoryBroker)} does not have a RabbitMQ connection");
+    }
+
+    /// <summary>
+    /// Stop all consumers, returning any unacknowledged messages to their queues
+    /// </summary>
+    /// <param name="timeout">Max time given for each consumer to exit</param>
+    public void Shutdown(TimeSpan timeout)
+    {
+        if (ShutdownCalled)
+            return;
+        if (timeout.Equals(TimeSpan.Zero))
+            throw new ApplicationException($"Invalid {nameof(timeout)} value");
+
+        ShutdownCalled = true;
+
+        List<ConsumerResources> consumers;
+        lock (_oResourceLock)
+        {
+            consumers = [.. _consumers.Values];
+            _consumers.Clear();
+        }
+
+        foreach (var resources in consumers)
+            resources.Dispose(timeout);
+
+        lock (_exitLock)
+            Monitor.PulseAll(_exitLock);
+    }
+
+    public void Wait()
+    {
+        lock (_exitLock)
+        {
+            while (!ShutdownCalled)
+            {
+                Monitor.Wait(_exitLock);
+            }
+        }
+    }
+
+    /// <summary>
+    /// A consumer's subscription to a queue, which tracks the messages it has not yet acknowledged
+    /// </summary>
+    private sealed class ConsumerResources
+    {
+        public InMemoryQueue Queue { get; }
+
+        public IDisposable? QueueMetric { get; init; }
+
+        private readonly ILogger _logger = LogManager.GetLogger(nameof(ConsumerResources));
+
+        private readonly CancellationTokenSource _cancellation = new();
+        private readonly SemaphoreSlim? _prefetch;
+        private readonly SortedDictionary<ulong, InMemoryDelivery> _unacked = [];
+        private ulong _lastTag;
+        private Task? _task;
+        private int _disposed;
+
+        /// <summary>
+        ///
+        /// </summary>
+        /// <param name="queue"></param>
+        /// <param name="prefetchCount">Max number of unacknowledged messages, or null if messages are acknowledged on delivery</param>
+        public ConsumerResources(InMemoryQueue queue, int? prefetchCount)
+        {
+            Queue = queue;
+            if (prefetchCount != null)
+                _prefetch = new SemaphoreSlim(prefetchCount.Value, prefetchCount.Value);
+        }
+
+        public void Start(Action consume)
+        {
+            _task = Task.Factory.StartNew(consume, TaskCreationOptions.LongRunning);
+        }
+
+        /// <summary>
+        /// Waits for the next message, and records it as unacknowledged
+        /// </summary>
+        /// <param name="tag"></param>
+        /// <param name="delivery"></param>
+        /// <returns>False if the consumer has been stopped</returns>
+        public bool TryReceive(out ulong tag, out InMemoryDelivery delivery)
+        {
+            var token = _cancellation.Token;
+            var reader = Queue.Channel.Reader;
+
+            try
+            {
+                _prefetch?.Wait(token);
+
+                while (!reader.TryRead(out delivery))
+                    reader.WaitToReadAsync(token).AsTask().GetAwaiter().GetResult();
+            }
+            catch (OperationCanceledException)
+            {
+                tag = 0;
+                delivery = default;
+                return false;
+            }
+
+            lock (_unacked)
+            {
+                tag = ++_lastTag;
+
+                // Don't lose the message if we were stopped while reading it
+                if (_cancellation.IsCancellationRequested)
+                {
+                    Queue.Requeue(delivery);
+                    return false;
+                }
+
+                if (_prefetch != null)
+                    _unacked.Add(tag, delivery);
+            }
+
+            return true;
+        }
+
+        public void Settle(ulong tag, bool multiple, bool requeue)
+        {
+            if (_prefetch == null)
+                return;
+
+            List<InMemoryDelivery> settled = [];
+
+            lock (_unacked)
+            {
+                if (multiple)
+                {
+                    foreach (var unackedTag in _unacked.Keys.TakeWhile(t => t <= tag).ToList())
+                    {
+                        settled.Add(_unacked[unackedTag]);
+                        _unacked.Remove(unackedTag);
+                    }
+                }
+                else if (_unacked.Remove(tag, out var delivery))
+                {
+                    settled.Add(delivery);
+                }
+            }
+
+            if (settled.Count == 0)
+            {
+                _logger.Warn($"Ignoring ack or nack for unknown delivery tag {tag} on {Queue.Name}");
+                return;
+            }
+
+            if (requeue)
+                foreach (var delivery in settled)
+                    Queue.Requeue(delivery);
+
+            if (_disposed == 0)
+                _prefetch.Release(settled.Count);
+        }
+
+        public void Dispose(TimeSpan timeout)
+        {
+            if (Interlocked.Exchange(ref _disposed, 1) == 1)
+                return;
+
+            _cancellation.Cancel();
+            QueueMetric?.Dispose();
+
+            if (_task != null && !_task.Wait(timeout))
+                _logger.Warn($"Consumer for {Queue.Name} did not exit within {timeout}");
+
+            // Return anything still unacknowledged, as RabbitMQ does when a channel is closed
+            lock (_unacked)
+            {
+                foreach (var delivery in _unacked.Values)
+                    Queue.Requeue(delivery);
+                _unacked.Clear();
+            }
+
+            Queue.RemoveConsumer();
+        }
+    }
+}
@@ -0,0 +1,225 @@
+using SmiServices.Common.Messages;
+using SmiServices.Common.Options;
+using System;
+using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.Threading;
+using System.Threading.Channels;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// The exchanges, queues, and bindings shared by each <see cref="InMemoryBroker"/> in a process. Exchanges route using
+/// RabbitMQ topic semantics, and each queue is a bounded channel of message object references
+/// </summary>
+public sealed class InMemoryMessageBus
+{
+    /// <summary>
+    /// The bus used by brokers created from <see cref="MessageBrokerFactory"/>
+    /// </summary>
+    public static InMemoryMessageBus Default { get; } = new();
+
+    private readonly object _oTopologyLock = new();
+
+    // Binding arrays are replaced rather than modified, so publishers can route without taking the lock
+    private readonly ConcurrentDictionary<string, Binding[]> _exchanges = new();
+    private readonly ConcurrentDictionary<string, InMemoryQueue> _queues = new();
+
+    public void DeclareExchange(string exchangeName)
+    {
+        ArgumentException.ThrowIfNullOrWhiteSpace(exchangeName);
+
+        _exchanges.TryAdd(exchangeName, []);
+    }
+
+    public void DeclareQueue(string queueName, int capacity)
+    {
+        ArgumentException.ThrowIfNullOrWhiteSpace(queueName);
+        ArgumentOutOfRangeException.ThrowIfNegativeOrZero(capacity);
+
+        _queues.TryAdd(queueName, new InMemoryQueue(queueName, capacity));
+    }
+
+    /// <summary>
+    /// Routes messages published to <paramref name="exchangeName"/> with a routing key matching <paramref name="routingKey"/>
+    /// to the queue. Both are created if they do not exist
+    /// </summary>
+    /// <param name="exchangeName"></param>
+    /// <param name="queueName"></param>
+    /// <param name="routingKey">Topic pattern, where '*' matches a single word and '#' matches zero or more words</param>
+    /// <param name="capacity">Capacity of the queue, if it needs to be created</param>
+    public void BindQueue(string exchangeName, string queueName, string routingKey, int capacity)
+    {
+        ArgumentNullException.ThrowIfNull(routingKey);
+
+        DeclareExchange(exchangeName);
+        DeclareQueue(queueName, capacity);
+
+        lock (_oTopologyLock)
+        {
+            var bindings = _exchanges[exchangeName];
+            foreach (var binding in bindings)
+                if (binding.Queue.Name == queueName && binding.RoutingKey == routingKey)
+                    return;
+
+            _exchanges[exchangeName] = [.. bindings, new Binding(_queues[queueName], routingKey)];
+        }
+    }
+
+    /// <summary>
+    /// Creates all the queues and bindings in <paramref name="options"/>. Can be called more than once
+    /// </summary>
+    /// <param name="options"></param>
+    public void Declare(InMemoryBrokerOptions options)
+    {
+        foreach (var binding in options.Bindings ?? [])
+        {
+            if (string.IsNullOrWhiteSpace(binding.ExchangeName) || string.IsNullOrWhiteSpace(binding.QueueName))
+                throw new ArgumentException($"Each of the {nameof(options.Bindings)} must have an {nameof(binding.ExchangeName)} and a {nameof(binding.QueueName)}");
+
+            BindQueue(binding.ExchangeName, binding.QueueName, binding.RoutingKey, options.QueueCapacity);
+        }
+    }
+
+    public bool ExchangeExists(string exchangeName) => _exchanges.ContainsKey(exchangeName);
+
+    /// <summary>
+    /// Returns the number of messages waiting to be delivered from the queue
+    /// </summary>
+    /// <param name="queueName"></param>
+    public int MessageCount(string queueName)
+    {
+        if (!_queues.TryGetValue(queueName, out var queue))
+            throw new ArgumentException($"Queue \"{queueName}\" does not exist", nameof(queueName));
+
+        return queue.Channel.Reader.Count;
+    }
+
+    internal InMemoryQueue? GetQueue(string queueName) => _queues.GetValueOrDefault(queueName);
+
+    /// <summary>
+    /// Delivers the message to every queue bound to the exchange with a matching routing key. Blocks while any of those queues are full
+    /// </summary>
+    /// <param name="exchangeName"></param>
+    /// <param name="routingKey"></param>
+    /// <param name="header"></param>
+    /// <param name="message"></param>
+    /// <returns>The number of queues the message was delivered to</returns>
+    internal int Publish(string exchangeName, string routingKey, IMessageHeader header, IMessage message)
+    {
+        if (!_exchanges.TryGetValue(exchangeName, out var bindings))
+            throw new ApplicationException($"Exchange \"{exchangeName}\" does not exist");
+
+        var delivery = new InMemoryDelivery(header, message);
+        var routed = 0;
+
+        foreach (var binding in bindings)
+        {
+            // A queue only gets one copy, even if more than one of its bindings match
+            if (!TopicMatches(binding.RoutingKey, routingKey) || HasEarlierMatch(bindings, binding, routingKey))
+                continue;
+
+            binding.Queue.Enqueue(delivery);
+            ++routed;
+        }
+
+        return routed;
+    }
+
+    private static bool HasEarlierMatch(Binding[] bindings, Binding binding, string routingKey)
+    {
+        foreach (var other in bindings)
+        {
+            if (ReferenceEquals(other, binding))
+                return false;
+            if (other.Queue == binding.Queue && TopicMatches(other.RoutingKey, routingKey))
+                return true;
+        }
+
+        return false;
+    }
+
+    /// <summary>
+    /// Checks if a routing key matches a RabbitMQ topic pattern
+    /// </summary>
+    /// <param name="pattern"></param>
+    /// <param name="routingKey"></param>
+    /// <returns></returns>
+    public static bool TopicMatches(string pattern, string routingKey)
+    {
+        if (pattern == RabbitMQBroker.RabbitMqRoutingKey_MatchAnything || pattern == routingKey)
+            return true;
+
+        return TopicMatches(pattern.Split('.'), 0, routingKey.Length == 0 ? [] : routingKey.Split('.'), 0);
+    }
+
+    private static bool TopicMatches(string[] pattern, int p, string[] words, int w)
+    {
+        while (p < pattern.Length)
+        {
+            if (pattern[p] == RabbitMQBroker.RabbitMqRoutingKey_MatchAnything)
+            {
+                // Try consuming each possible number of words
+                for (var skip = w; skip <= words.Length; ++skip)
+                    if (TopicMatches(pattern, p + 1, words, skip))
+                        return true;
+
+                return false;
+            }
+
+            if (w == words.Length)
+                return false;
+
+            if (pattern[p] != RabbitMQBroker.RabbitMqRoutingKey_MatchOneWord && pattern[p] != words[w])
+                return false;
+
+            ++p;
+            ++w;
+        }
+
+        return w == words.Length;
+    }
+
+    private sealed record Binding(InMemoryQueue Queue, string RoutingKey);
+}
+
+internal readonly record struct InMemoryDelivery(IMessageHeader Header, IMessage Message);
+
+internal sealed class InMemoryQueue
+{
+    public string Name { get; }
+
+    public Channel<InMemoryDelivery> Channel { get; }
+
+    public int ConsumerCount => _consumerCount;
+    private int _consumerCount;
+
+    public InMemoryQueue(string name, int capacity)
+    {
+        Name = name;
+        Channel = System.Threading.Channels.Channel.CreateBounded<InMemoryDelivery>(new BoundedChannelOptions(capacity)
+        {
+            FullMode = BoundedChannelFullMode.Wait,
+        });
+    }
+
+    public void Enqueue(InMemoryDelivery delivery)
+    {
+        if (!Channel.Writer.TryWrite(delivery))
+            Channel.Writer.WriteAsync(delivery).AsTask().GetAwaiter().GetResult();
+    }
+
+    /// <summary>
+    /// Returns a message to the queue without blocking, since this may be called from the thread which would otherwise make room for it
+    /// </summary>
+    /// <param name="delivery"></param>
+    public void Requeue(InMemoryDelivery delivery)
+    {
+        if (!Channel.Writer.TryWrite(delivery))
+            _ = Channel.Writer.WriteAsync(delivery).AsTask();
+    }
+
+    public int AddConsumer() => Interlocked.Increment(ref _consumerCount);
+
+    public void RemoveConsumer() => Interlocked.Decrement(ref _consumerCount);
+}
@@ -0,0 +1,57 @@
+using NLog;
+using SmiServices.Common.Events;
+using SmiServices.Common.Messages;
+using System.Threading.Tasks;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// Sends messages to an exchange on an <see cref="InMemoryMessageBus"/>. Messages are delivered by reference, so must not be modified after sending
+/// </summary>
+public class InMemoryProducerModel : IProducerModel
+{
+    private readonly ILogger _logger = LogManager.GetCurrentClassLogger();
+
+    private readonly string _exchangeName;
+    private readonly InMemoryMessageBus _bus;
+    private readonly bool _capParentChain;
+
+    /// <summary>
+    /// Never raised, since there is no connection which can fail
+    /// </summary>
+    public event ProducerFatalHandler OnFatal { add { } remove { } }
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="exchangeName"></param>
+    /// <param name="bus"></param>
+    /// <param name="capParentChain">Limit the parent chain in the header to <see cref="MessageHeader.CappedParentsLength"/> entries</param>
+    public InMemoryProducerModel(string exchangeName, InMemoryMessageBus bus, bool capParentChain = false)
+    {
+        _exchangeName = exchangeName;
+        _bus = bus;
+        _capParentChain = capParentChain;
+    }
+
+    public IMessageHeader SendMessage(IMessage message, IMessageHeader? inResponseTo, string? routingKey)
+    {
+        IMessageHeader header = new MessageHeader(inResponseTo, _capParentChain);
+
+        if (_bus.Publish(_exchangeName, routingKey ?? "", header, message) == 0)
+            header.Log(_logger, LogLevel.Debug, $"No queues bound to {_exchangeName} for routing key \"{routingKey}\", message dropped");
+
+        return header;
+    }
+
+    /// <summary>
+    /// Sends the message. The returned task is always complete, since the message is in the destination queues once this returns
+    /// </summary>
+    public Task<IMessageHeader> SendMessageAsync(IMessage message, IMessageHeader? isInResponseTo, string? routingKey)
+        => Task.FromResult(SendMessage(message, isInResponseTo, routingKey));
+
+    /// <summary>
+    /// No-op, since messages are in the destination queues as soon as they are sent
+    /// </summary>
+    public void WaitForConfirms() { }
+}
@@ -1,3 +1,4 @@
+using SmiServices.Common.Events;
 using SmiServices.Common.Options;
 using System;
 using System.Diagnostics.CodeAnalysis;
@@ -7,7 +8,7 @@ namespace SmiServices.Common.Messaging;
 public static class MessageBrokerFactory
 {
     [ExcludeFromCodeCoverage] // NOTE(rkm 2024-02-08) This can be removed after we use the class
-    public static IMessageBroker Create(GlobalOptions globals, string connectionIdentifier)
+    public static IMessageBroker Create(GlobalOptions globals, string connectionIdentifier, HostFatalHandler? hostFatalHandler = null)
     {
         switch (globals.MessageBrokerType)
         {
@@ -16,7 +17,19 @@ public static class MessageBrokerFactory
                     if (globals.RabbitOptions == null)
                         throw new ArgumentNullException(nameof(globals), $"{nameof(globals.RabbitOptions)} must not be null");
 
-                    return new RabbitMQBroker(globals.RabbitOptions, connectionIdentifier);
+                    return new RabbitMQBroker(globals.RabbitOptions, connectionIdentifier, hostFatalHandler);
+                }
+            case MessageBrokerType.InMemory:
+                {
+                    if (globals.InMemoryBrokerOptions == null)
+                        throw new ArgumentNullException(nameof(globals), $"{nameof(globals.InMemoryBrokerOptions)} must not be null");
+
+                    InMemoryMessageBus.Default.Declare(globals.InMemoryBrokerOptions);
+
+                    // Every host sends its fatal errors here, whether or not anything is bound to receive them
+                    if (!string.IsNullOrWhiteSpace(globals.RabbitOptions?.FatalLoggingExchange))
+                        InMemoryMessageBus.Default.DeclareExchange(globals.RabbitOptions.FatalLoggingExchange);
+                    return new InMemoryBroker(InMemoryMessageBus.Default, connectionIdentifier, hostFatalHandler);
                 }
             case MessageBrokerType.None:
                 throw new ArgumentOutOfRangeException(nameof(globals), $"A valid {nameof(MessageBrokerType)} must be chosen");
@@ -8,4 +8,9 @@ public enum MessageBrokerType
     None = 0,
 
     RabbitMQ,
+
+    /// <summary>
+    /// Passes message objects between hosts in the same process, without serialization or a RabbitMQ server
+    /// </summary>
+    InMemory,
 }
@@ -1,13 +1,16 @@
-using Newtonsoft.Json;
 using NLog;
 using RabbitMQ.Client;
 using RabbitMQ.Client.Events;
 using SmiServices.Common.Events;
 using SmiServices.Common.Messages;
+using SmiServices.Common.MessageSerialization;
+using SmiServices.Common.Metrics;
 using System;
 using System.Collections.Generic;
-using System.Text;
+using System.Diagnostics;
+using System.Linq;
 using System.Threading;
+using System.Threading.Tasks;
 
 namespace SmiServices.Common.Messaging;
 
@@ -33,15 +36,34 @@ public class ProducerModel : IProducerModel
 
     private readonly IBackoffProvider? _backoffProvider;
 
-    // TODO(rkm 2024-10-02) Make this configurable
-    private const int _probeCounterLimit = 1_000;
+    private readonly TimeSpan _probeInterval = TimeSpan.FromSeconds(1);
 
-    private readonly TimeSpan _probeTimeout = TimeSpan.FromMinutes(1);
-
-    // Start at the limit so an initial check is performed
-    private int _probeMessageCounter = _probeCounterLimit;
+    // Only set if a probe queue is given. Publishes are throttled to keep the probe queue near its limit
     private readonly string? _probeQueueName;
-    private readonly int _probeQueueLimit;
+    private readonly PublishRateLimiter? _rateLimiter;
+
+    // Reports the rate of _rateLimiter until the channel is shut down
+    private readonly IDisposable? _publishRateMetric;
+
+    private long _nextProbeTimestamp;
+
+    // Guards _rateLimiter and _nextProbeTimestamp. Senders wait for the rate limiter without holding _oSendLock
+    private readonly object _oThrottleLock = new();
+
+    // Only set if publisher confirms are tracked asynchronously. Bounds the number of publishes awaiting a confirm
+    private readonly SemaphoreSlim? _outstandingConfirms;
+
+    // Keyed by publish sequence number. Locked separately from _oSendLock so confirms aren't held up by throttling
+    private readonly SortedDictionary<ulong, PendingConfirm> _pendingConfirms = [];
+
+    private readonly MessageBodyCompression _bodyCompression;
+    private readonly int _bodyCompressionThreshold;
+
+    private readonly MetricHistogram.Child _publishMetric;
+    private readonly MetricHistogram.Child _confirmMetric;
+
+    private readonly bool _binaryHeaders;
+    private readonly bool _capParentChain;
 
     /// <summary>
     /// 
@@ -51,9 +73,16 @@ public class ProducerModel : IProducerModel
     /// <param name="properties"></param>
     /// <param name="maxRetryAttempts">Max number of times to retry message confirmations</param>
     /// <param name="backoffProvider"></param>
-    /// <param name="probeQueueName"></param>
-    /// <param name="probeQueueLimit"></param>
-    /// <param name="probeTimeout"></param>
+    /// <param name="probeQueueName">Downstream queue whose depth controls the publish rate</param>
+    /// <param name="probeQueueLimit">Target depth of the probe queue</param>
+    /// <param name="probeInterval">Interval between samples of the probe queue depth</param>
+    /// <param name="maxOutstandingConfirms">If greater than 0, publisher confirms are tracked per-message and <see cref="SendMessageAsync"/> will block once this many are pending</param>
+    /// <param name="bodyCompression">Compression to apply to message bodies</param>
+    /// <param name="bodyCompressionThreshold">Message bodies smaller than this number of bytes are not compressed</param>
+    /// <param name="binaryHeaders">Send the header GUIDs as bytes rather than strings</param>
+    /// <param name="capParentChain">Limit the parent chain in the header to <see cref="MessageHeader.CappedParentsLength"/> entries</param>
+    /// <param name="minPublishRate">Lowest publish rate, in messages per second, when throttled by the probe queue</param>
+    /// <param name="maxPublishRate">Highest publish rate, in messages per second, when throttled by the probe queue</param>
     public ProducerModel(
         string exchangeName, IModel model,
         IBasicProperties properties,
@@ -61,7 +90,14 @@ public class ProducerModel : IProducerModel
         IBackoffProvider? backoffProvider = null,
         string? probeQueueName = null,
         int probeQueueLimit = 0,
-        TimeSpan? probeTimeout = null
+        TimeSpan? probeInterval = null,
+        int maxOutstandingConfirms = 0,
+        MessageBodyCompression bodyCompression = MessageBodyCompression.None,
+        int bodyCompressionThreshold = 0,
+        bool binaryHeaders = false,
+        bool capParentChain = false,
+        double minPublishRate = 1,
+        double maxPublishRate = 10_000
     )
     {
         if (string.IsNullOrWhiteSpace(exchangeName))
@@ -74,6 +110,9 @@ public class ProducerModel : IProducerModel
 
         _maxRetryAttempts = maxRetryAttempts;
 
+        if (maxOutstandingConfirms < 0)
+            throw new ArgumentException("maxOutstandingConfirms must not be negative. Given: " + maxOutstandingConfirms);
+
         _logger = LogManager.GetLogger(GetType().Name);
 
         _model = model;
@@ -90,15 +129,41 @@ public class ProducerModel : IProducerModel
 
         _backoffProvider = backoffProvider;
 
+        _bodyCompression = bodyCompression;
+        _bodyCompressionThreshold = bodyCompressionThreshold;
+
+        _binaryHeaders = binaryHeaders;
+        _capParentChain = capParentChain;
+
+        _publishMetric = SmiMetrics.PublishSeconds.WithLabels(exchangeName);
+        _confirmMetric = SmiMetrics.ConfirmSeconds.WithLabels(exchangeName);
+
         _probeQueueName = probeQueueName;
-        _probeQueueLimit = probeQueueLimit;
-        if (probeTimeout != null)
-            _probeTimeout = probeTimeout.Value;
+        if (probeInterval != null)
+            _probeInterval = probeInterval.Value;
 
         if (_probeQueueName != null)
         {
+            if (probeQueueLimit <= 0)
+                throw new ArgumentException("probeQueueLimit must be greater than 0 if a probe queue is given. Given: " + probeQueueLimit);
+
             var messageCount = model.MessageCount(_probeQueueName);
             _logger.Debug($"Probe queue has {messageCount} message(s)");
+
+            _rateLimiter = new PublishRateLimiter(probeQueueLimit, minPublishRate, maxPublishRate);
+            _rateLimiter.Update(messageCount);
+            _nextProbeTimestamp = Stopwatch.GetTimestamp() + (long)(_probeInterval.TotalSeconds * Stopwatch.Frequency);
+
+            _publishRateMetric = SmiMetrics.PublishRate.Observe(() => _rateLimiter.Rate, exchangeName);
+            _model.ModelShutdown += (s, a) => _publishRateMetric?.Dispose();
+        }
+
+        if (maxOutstandingConfirms > 0)
+        {
+            _outstandingConfirms = new SemaphoreSlim(maxOutstandingConfirms, maxOutstandingConfirms);
+            _model.BasicAcks += (s, a) => CompleteConfirms(a.DeliveryTag, a.Multiple, null);
+            _model.BasicNacks += (s, a) => CompleteConfirms(a.DeliveryTag, a.Multiple, new ApplicationException("RabbitMQ got a Nack"));
+            _model.ModelShutdown += (s, a) => FailAllConfirms(new ApplicationException($"Channel was shut down before the publish was confirmed ({a.ReplyText})"));
         }
     }
 
@@ -112,13 +177,52 @@ public class ProducerModel : IProducerModel
     /// <returns></returns>
     public virtual IMessageHeader SendMessage(IMessage message, IMessageHeader? inResponseTo = null, string? routingKey = null)
     {
+        var start = Stopwatch.GetTimestamp();
         IMessageHeader header = SendMessageImpl(message, inResponseTo, routingKey);
         WaitForConfirms();
-        header.Log(_logger, LogLevel.Trace, "Sent " + header.MessageGuid + " to " + _exchangeName);
+        _publishMetric.ObserveElapsed(start);
+
+        if (_logger.IsTraceEnabled)
+            header.Log(_logger, LogLevel.Trace, "Sent " + header.MessageGuid + " to " + _exchangeName);
 
         return header;
     }
 
+    /// <summary>
+    /// Sends a message without waiting for the broker to confirm it. If confirm tracking is not enabled, this behaves
+    /// the same as <see cref="SendMessage"/> and returns a completed task
+    /// </summary>
+    /// <param name="message"></param>
+    /// <param name="inResponseTo"></param>
+    /// <param name="routingKey"></param>
+    /// <returns>Task which completes when the publish is confirmed, or faults if it is nacked or the channel closes</returns>
+    public Task<IMessageHeader> SendMessageAsync(IMessage message, IMessageHeader? inResponseTo = null, string? routingKey = null)
+    {
+        if (_outstandingConfirms == null)
+        {
+            var start = Stopwatch.GetTimestamp();
+            IMessageHeader confirmedHeader = SendMessageImpl(message, inResponseTo, routingKey);
+            WaitForConfirms();
+            _publishMetric.ObserveElapsed(start);
+
+            if (_logger.IsTraceEnabled)
+                confirmedHeader.Log(_logger, LogLevel.Trace, "Sent " + confirmedHeader.MessageGuid + " to " + _exchangeName);
+            return Task.FromResult(confirmedHeader);
+        }
+
+        // Only blocks if we are at the limit of unconfirmed messages
+        _outstandingConfirms.Wait();
+
+        var completion = new TaskCompletionSource<IMessageHeader>(TaskCreationOptions.RunContinuationsAsynchronously);
+
+        // Frees the slot again if this fails
+        IMessageHeader header = SendMessageImpl(message, inResponseTo, routingKey, completion);
+        if (_logger.IsTraceEnabled)
+            header.Log(_logger, LogLevel.Trace, "Sent " + header.MessageGuid + " to " + _exchangeName + " (unconfirmed)");
+
+        return completion.Task;
+    }
+
     public void WaitForConfirms()
     {
         // Attempt to get a publish confirmation from RabbitMQ, with some retry/timeout
@@ -163,34 +267,155 @@ public class ProducerModel : IProducerModel
     /// <param name="routingKey"></param>
     /// <returns></returns>
     protected IMessageHeader SendMessageImpl(IMessage message, IMessageHeader? inResponseTo = null, string? routingKey = null)
+        => SendMessageImpl(message, inResponseTo, routingKey, null);
+
+    /// <summary>
+    /// Publishes the message. If <paramref name="completion"/> is given, it is completed by the publish confirm, and
+    /// the slot taken in <see cref="_outstandingConfirms"/> is freed then, or here if the publish fails
+    /// </summary>
+    private IMessageHeader SendMessageImpl(IMessage message, IMessageHeader? inResponseTo, string? routingKey, TaskCompletionSource<IMessageHeader>? completion)
+    {
+        ulong? seqNo = null;
+
+        try
+        {
+            return SendMessageImpl(message, inResponseTo, routingKey, completion, ref seqNo);
+        }
+        catch (Exception) when (completion != null)
+        {
+            // A confirm or channel shutdown may already have completed the publish and freed its slot. Otherwise the
+            // entry is removed, so that it isn't completed (and its slot freed) a second time later
+            bool pending;
+            lock (_pendingConfirms)
+                pending = seqNo == null || _pendingConfirms.Remove(seqNo.Value);
+
+            if (pending)
+                _outstandingConfirms!.Release();
+            throw;
+        }
+    }
+
+    private IMessageHeader SendMessageImpl(IMessage message, IMessageHeader? inResponseTo, string? routingKey, TaskCompletionSource<IMessageHeader>? completion, ref ulong? seqNo)
     {
+        if (_rateLimiter != null)
+            Throttle(_rateLimiter);
+
         lock (_oSendLock)
         {
-            byte[] body = Encoding.UTF8.GetBytes(JsonConvert.SerializeObject(message));
+            byte[] body = MessageBodyEncoding.Encode(JsonConvert.SerializeToUtf8Bytes(message), _bodyCompression, _bodyCompressionThreshold, out var contentEncoding);
+
+            // Only overwrite the content-encoding if it can vary per-message
+            if (_bodyCompression != MessageBodyCompression.None)
+                _messageBasicProperties.ContentEncoding = contentEncoding;
 
             _messageBasicProperties.Timestamp = new AmqpTimestamp(MessageHeader.UnixTimeNow());
-            _messageBasicProperties.Headers = new Dictionary<string, object>();
+            _messageBasicProperties.Headers = new Dictionary<string, object>(5);
 
-            IMessageHeader header = inResponseTo != null ? new MessageHeader(inResponseTo) : new MessageHeader();
-            header.Populate(_messageBasicProperties.Headers);
+            var header = new MessageHeader(inResponseTo, _capParentChain);
+            header.Populate(_messageBasicProperties.Headers, _binaryHeaders);
 
-            if (_probeQueueName != null && _probeMessageCounter >= _probeCounterLimit)
-            {
-                while (_model.MessageCount(_probeQueueName) >= _probeQueueLimit)
+            // Sequence number must be recorded before publishing, since the confirm can arrive before BasicPublish returns
+            if (completion != null)
+                lock (_pendingConfirms)
                 {
-                    _logger.Warn($"Probe queue ({_probeQueueName}) over message limit ({_probeCounterLimit}). Sleeping for {_probeTimeout}");
-                    Thread.Sleep(_probeTimeout);
+                    seqNo = _model.NextPublishSeqNo;
+                    _pendingConfirms.Add(seqNo.Value, new PendingConfirm(completion, header, Stopwatch.GetTimestamp()));
                 }
-                _probeMessageCounter = 0;
-            }
 
             _model.BasicPublish(_exchangeName, routingKey ?? "", true, _messageBasicProperties, body);
-            ++_probeMessageCounter;
 
             return header;
         }
     }
 
+    /// <summary>
+    /// Waits until the next publish is allowed by the rate limiter, sampling the probe queue if it is due. Must not be
+    /// called under <see cref="_oSendLock"/>, so that other senders can publish while this one waits
+    /// </summary>
+    /// <param name="rateLimiter"></param>
+    private void Throttle(PublishRateLimiter rateLimiter)
+    {
+        TimeSpan wait;
+
+        lock (_oThrottleLock)
+        {
+            var now = Stopwatch.GetTimestamp();
+            if (now >= _nextProbeTimestamp)
+            {
+                // The model can not be used while another thread is publishing on it
+                uint messageCount;
+                lock (_oSendLock)
+                    messageCount = _model.MessageCount(_probeQueueName!);
+
+                rateLimiter.Update(messageCount);
+                _nextProbeTimestamp = now + (long)(_probeInterval.TotalSeconds * Stopwatch.Frequency);
+
+                if (_logger.IsDebugEnabled)
+                    _logger.Debug($"Probe queue ({_probeQueueName}) has {messageCount} message(s). Publish rate is now {rateLimiter.Rate:0.#}/s");
+            }
+
+            // Tokens are taken in turn, so concurrent senders each wait for their own share of the rate
+            wait = rateLimiter.Acquire();
+        }
+
+        if (wait > TimeSpan.Zero)
+            Thread.Sleep(wait);
+    }
+
+    private void CompleteConfirms(ulong deliveryTag, bool multiple, Exception? error)
+    {
+        List<PendingConfirm> completed = [];
+
+        lock (_pendingConfirms)
+        {
+            if (multiple)
+            {
+                foreach (var seqNo in _pendingConfirms.Keys.TakeWhile(x => x <= deliveryTag).ToList())
+                {
+                    completed.Add(_pendingConfirms[seqNo]);
+                    _pendingConfirms.Remove(seqNo);
+                }
+            }
+            else if (_pendingConfirms.TryGetValue(deliveryTag, out var pending))
+            {
+                completed.Add(pending);
+                _pendingConfirms.Remove(deliveryTag);
+            }
+        }
+
+        foreach (var pending in completed)
+        {
+            if (error == null)
+            {
+                _backoffProvider?.Reset();
+                _confirmMetric.ObserveElapsed(pending.PublishTimestamp);
+                pending.Completion.TrySetResult(pending.Header);
+            }
+            else
+            {
+                pending.Completion.TrySetException(error);
+            }
+
+            _outstandingConfirms!.Release();
+        }
+    }
+
+    private void FailAllConfirms(Exception error)
+    {
+        ulong lastSeqNo;
+
+        lock (_pendingConfirms)
+        {
+            if (_pendingConfirms.Count == 0)
+                return;
+
+            lastSeqNo = _pendingConfirms.Keys.Max();
+        }
+
+        _logger.Warn($"Failing all unconfirmed messages: {error.Message}");
+        CompleteConfirms(lastSeqNo, multiple: true, error);
+    }
+
     private void Fatal(BasicReturnEventArgs a)
     {
         lock (_oSendLock)
@@ -201,4 +426,6 @@ public class ProducerModel : IProducerModel
                 throw new ApplicationException("No subscribers for fatal error event");
         }
     }
+
+    private readonly record struct PendingConfirm(TaskCompletionSource<IMessageHeader> Completion, IMessageHeader Header, long PublishTimestamp);
 }
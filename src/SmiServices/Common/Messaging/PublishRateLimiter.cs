@@ -0,0 +1,97 @@
+using System;
+
+namespace SmiServices.Common.Messaging;
+
+/// <summary>
+/// Token bucket which limits the rate of publishing, where the rate is adjusted towards keeping a downstream queue at a
+/// target depth. Not thread-safe, callers must synchronise access
+/// </summary>
+public sealed class PublishRateLimiter
+{
+    /// <summary>
+    /// Largest factor by which the rate is changed on each update
+    /// </summary>
+    private const double Gain = 0.5;
+
+    /// <summary>
+    /// Number of seconds worth of publishes which can be sent in a burst
+    /// </summary>
+    private const double BurstSeconds = 0.1;
+
+    private readonly double _targetDepth;
+    private readonly double _minRate;
+    private readonly double _maxRate;
+    private readonly TimeProvider _timeProvider;
+
+    private double _tokens;
+    private long _lastRefill;
+
+    /// <summary>
+    /// The current publish rate in messages per second
+    /// </summary>
+    public double Rate { get; private set; }
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="targetDepth">Number of messages to aim for in the downstream queue</param>
+    /// <param name="minRate">Lowest publish rate in messages per second</param>
+    /// <param name="maxRate">Highest publish rate in messages per second. This is also the initial rate</param>
+    /// <param name="timeProvider"></param>
+    public PublishRateLimiter(double targetDepth, double minRate, double maxRate, TimeProvider? timeProvider = null)
+    {
+        if (targetDepth <= 0)
+            throw new ArgumentOutOfRangeException(nameof(targetDepth), "Must be greater than 0");
+        if (minRate <= 0)
+            throw new ArgumentOutOfRangeException(nameof(minRate), "Must be greater than 0");
+        if (maxRate < minRate)
+            throw new ArgumentOutOfRangeException(nameof(maxRate), "Must not be less than minRate");
+
+        _targetDepth = targetDepth;
+        _minRate = minRate;
+        _maxRate = maxRate;
+        _timeProvider = timeProvider ?? TimeProvider.System;
+
+        Rate = maxRate;
+        _tokens = Capacity;
+        _lastRefill = _timeProvider.GetTimestamp();
+    }
+
+    private double Capacity => Math.Max(1, Rate * BurstSeconds);
+
+    /// <summary>
+    /// Adjusts the rate given the current depth of the downstream queue. The rate is increased by up to
+    /// <see cref="Gain"/> when the queue is empty, unchanged at the target depth, and decreased by up to
+    /// <see cref="Gain"/> when the queue is at twice the target depth or more
+    /// </summary>
+    /// <param name="depth"></param>
+    public void Update(double depth)
+    {
+        Refill();
+
+        var error = Math.Clamp((_targetDepth - depth) / _targetDepth, -1, 1);
+        Rate = Math.Clamp(Rate * (1 + Gain * error), _minRate, _maxRate);
+        _tokens = Math.Min(_tokens, Capacity);
+    }
+
+    /// <summary>
+    /// Takes a token for a single publish
+    /// </summary>
+    /// <returns>How long the caller must wait before publishing</returns>
+    public TimeSpan Acquire()
+    {
+        Refill();
+
+        _tokens -= 1;
+        return _tokens >= 0 ? TimeSpan.Zero : TimeSpan.FromSeconds(-_tokens / Rate);
+    }
+
+    private void Refill()
+    {
+        var now = _timeProvider.GetTimestamp();
+        var elapsed = _timeProvider.GetElapsedTime(_lastRefill, now);
+        _lastRefill = now;
+
+        _tokens = Math.Min(_tokens + elapsed.TotalSeconds * Rate, Capacity);
+    }
+}
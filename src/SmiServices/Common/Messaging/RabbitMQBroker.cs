@@ -5,12 +5,15 @@ using RabbitMQ.Client.Exceptions;
 using SmiServices.Common.Events;
 using SmiServices.Common.Messages;
 using SmiServices.Common.MessageSerialization;
+using SmiServices.Common.Metrics;
 using SmiServices.Common.Options;
 using System;
 using System.Collections.Generic;
+using System.IO;
 using System.Linq;
 using System.Text;
 using System.Threading;
+using System.Threading.Tasks;
 
 namespace SmiServices.Common.Messaging;
 
@@ -49,6 +52,10 @@ public class RabbitMQBroker : IMessageBroker
     private readonly object _oResourceLock = new();
     private readonly object _exitLock = new();
 
+    // Only used to read queue depths for metrics, since models can't be shared between threads
+    private IModel? _metricsModel;
+    private readonly object _oMetricsLock = new();
+
     private const int MinRabbitServerVersionMajor = 3;
     private const int MinRabbitServerVersionMinor = 7;
     private const int MinRabbitServerVersionPatch = 0;
@@ -114,8 +121,53 @@ public class RabbitMQBroker : IMessageBroker
             throw new ApplicationException($"Already a consumer on queue {consumerOptions.QueueName} and solo consumer was specified");
         }
 
+        var maxConcurrency = 1;
+        if (consumerOptions.MaxConcurrency > 1)
+        {
+            if (consumer.IsThreadSafe)
+                maxConcurrency = Math.Min(consumerOptions.MaxConcurrency, consumerOptions.QoSPrefetchCount);
+            else
+                _logger.Warn($"Ignoring MaxConcurrency of {consumerOptions.MaxConcurrency} for {consumerOptions.QueueName} since {consumer.GetType().Name} is not thread-safe");
+        }
+
+        // Only needed if acks can arrive out of order
+        DeliveryTagTracker? tracker = maxConcurrency > 1 && !consumerOptions.AutoAck ? new DeliveryTagTracker() : null;
+
         EventingBasicConsumer ebc = new(model);
-        ebc.Received += (o, a) => HandleMessage(o, a, consumer);
+
+        if (maxConcurrency > 1)
+        {
+            _logger.Debug($"Processing up to {maxConcurrency} messages concurrently from {consumerOptions.QueueName}");
+
+            var workerSlots = new SemaphoreSlim(maxConcurrency, maxConcurrency);
+
+            void processConcurrently(IMessageHeader header, T message, ulong tag)
+            {
+                // Blocks the channel's dispatch thread until a worker is free
+                workerSlots.Wait();
+                Task.Run(() =>
+                {
+                    try
+                    {
+                        consumer.ProcessMessage(header, message, tag);
+                    }
+                    finally
+                    {
+                        workerSlots.Release();
+                    }
+                });
+            }
+
+            ebc.Received += (o, a) =>
+            {
+                tracker?.Delivered(a.DeliveryTag);
+                HandleMessage<T>(o, a, processConcurrently, tracker, consumerOptions.LazyDeserialization);
+            };
+        }
+        else
+        {
+            ebc.Received += (o, a) => HandleMessage<T>(o, a, consumer.ProcessMessage, tracker, consumerOptions.LazyDeserialization);
+        }
 
         void shutdown(object? o, ShutdownEventArgs a)
         {
@@ -129,7 +181,22 @@ public class RabbitMQBroker : IMessageBroker
         model.ModelShutdown += shutdown;
         ebc.Shutdown += shutdown;
 
-        var resources = new ConsumerResources(ebc, consumerOptions.QueueName!, model);
+        // Coalescing relies on messages being processed in delivery order
+        IDisposable? ackCoalescing = null;
+        var ackBatchSize = Math.Min(consumerOptions.AckBatchSize, consumerOptions.QoSPrefetchCount);
+        if (ackBatchSize > 1 && !consumerOptions.AutoAck)
+        {
+            if (maxConcurrency > 1)
+                _logger.Warn($"Ignoring AckBatchSize of {consumerOptions.AckBatchSize} for {consumerOptions.QueueName} since messages are processed concurrently");
+            else
+                ackCoalescing = consumer.CoalesceAcks(ackBatchSize, consumerOptions.AckBatchTimeout ?? TimeSpan.FromMilliseconds(100));
+        }
+
+        var resources = new ConsumerResources(ebc, consumerOptions.QueueName!, model)
+        {
+            QueueMetric = SmiMetrics.QueueMessages.Observe(() => GetMessageCount(consumerOptions.QueueName!), consumerOptions.QueueName!),
+            AckCoalescing = ackCoalescing,
+        };
         Guid taskId = Guid.NewGuid();
 
         lock (_oResourceLock)
@@ -146,25 +213,40 @@ public class RabbitMQBroker : IMessageBroker
         if (consumerOptions.HoldUnprocessableMessages && !consumerOptions.AutoAck)
             consumer.HoldUnprocessableMessages = true;
 
-        consumer.OnAck += (_, a) => { ebc.Model.BasicAck(a.DeliveryTag, a.Multiple); };
-        consumer.OnNack += (_, a) => { ebc.Model.BasicNack(a.DeliveryTag, a.Multiple, a.Requeue); };
+        if (tracker != null)
+        {
+            consumer.OnAck += (_, a) => tracker.Settle(a.DeliveryTag, a.Multiple, () => ebc.Model.BasicAck(a.DeliveryTag, a.Multiple));
+            consumer.OnNack += (_, a) => tracker.Settle(a.DeliveryTag, a.Multiple, () => ebc.Model.BasicNack(a.DeliveryTag, a.Multiple, a.Requeue));
+        }
+        else
+        {
+            consumer.OnAck += (_, a) => { ebc.Model.BasicAck(a.DeliveryTag, a.Multiple); };
+            consumer.OnNack += (_, a) => { ebc.Model.BasicNack(a.DeliveryTag, a.Multiple, a.Requeue); };
+        }
 
         model.BasicConsume(ebc, consumerOptions.QueueName, consumerOptions.AutoAck);
         _logger.Debug($"Consumer task started [QueueName={consumerOptions?.QueueName}]");
         return taskId;
     }
 
-    private void HandleMessage<T>(object? sender, BasicDeliverEventArgs deliverArgs, IConsumer<T> consumer) where T : IMessage
+    private void HandleMessage<T>(object? sender, BasicDeliverEventArgs deliverArgs, Action<IMessageHeader, T, ulong> processMessage, DeliveryTagTracker? tracker, bool lazyDeserialization) where T : IMessage
     {
         var model = ((EventingBasicConsumer)sender!).Model;
 
+        void discard()
+        {
+            if (tracker != null)
+                tracker.Settle(deliverArgs.DeliveryTag, multiple: false, () => model.BasicNack(deliverArgs.DeliveryTag, multiple: false, requeue: false));
+            else
+                model.BasicNack(deliverArgs.DeliveryTag, multiple: false, requeue: false);
+        }
+
         Encoding enc = Encoding.UTF8;
         MessageHeader header;
 
         try
         {
-            if (deliverArgs.BasicProperties?.ContentEncoding != null)
-                enc = Encoding.GetEncoding(deliverArgs.BasicProperties.ContentEncoding);
+            enc = MessageBodyEncoding.GetCharacterEncoding(deliverArgs.BasicProperties?.ContentEncoding);
 
             var headers = deliverArgs.BasicProperties?.Headers
                 ?? throw new ArgumentNullException(nameof(deliverArgs), "A part of deliverArgs.BasicProperties.Headers was null");
@@ -175,7 +257,7 @@ public class RabbitMQBroker : IMessageBroker
         catch (Exception e)
         {
             _logger.Error("Message header content was null, or could not be parsed into a MessageHeader object: " + e);
-            model.BasicNack(deliverArgs.DeliveryTag, multiple: false, requeue: false);
+            discard();
             return;
         }
 
@@ -183,7 +265,10 @@ public class RabbitMQBroker : IMessageBroker
 
         try
         {
-            message = JsonConvert.DeserializeObject<T>(deliverArgs);
+            // The delivery body is only valid during this handler, so must be copied if it is kept by the message
+            message = lazyDeserialization
+                ? JsonConvert.DeserializeLazy<T>(MessageBodyEncoding.GetUtf8Bytes(deliverArgs.Body, deliverArgs.BasicProperties?.ContentEncoding))
+                : JsonConvert.DeserializeObject<T>(deliverArgs);
         }
         catch (Newtonsoft.Json.JsonSerializationException e)
         {
@@ -192,11 +277,20 @@ public class RabbitMQBroker : IMessageBroker
             _logger.Debug($"JsonSerializationException, doing ErrorAndNack for message (DeliveryTag {deliverArgs.DeliveryTag})");
             var errorMessage = $"Could not deserialize message to {typeof(T).Name} object. Likely an issue with the message content";
             header.Log(_logger, LogLevel.Error, errorMessage, e);
-            model.BasicNack(deliverArgs.DeliveryTag, multiple: false, requeue: false);
+            discard();
+            return;
+        }
+        catch (Exception e) when (e is InvalidDataException or ArgumentException)
+        {
+            // Corrupt compressed body, or bytes which aren't valid in its character set - Can never process this message
+
+            var errorMessage = $"Could not decode message body with content-encoding '{deliverArgs.BasicProperties?.ContentEncoding}'";
+            header.Log(_logger, LogLevel.Error, errorMessage, e);
+            discard();
             return;
         }
 
-        consumer.ProcessMessage(header, message, deliverArgs.DeliveryTag);
+        processMessage(header, message, deliverArgs.DeliveryTag);
     }
 
     public void StartControlConsumer(IControlMessageConsumer controlMessageConsumer)
@@ -309,7 +403,7 @@ public class RabbitMQBroker : IMessageBroker
         }
 
         var props = model.CreateBasicProperties();
-        props.ContentEncoding = "UTF-8";
+        props.ContentEncoding = MessageBodyEncoding.DefaultContentEncoding;
         props.ContentType = "application/json";
         props.Persistent = true;
 
@@ -327,12 +421,17 @@ public class RabbitMQBroker : IMessageBroker
             }
         }
 
+#pragma warning disable CS0618 // Obsolete
+        if (producerOptions.ProbeTimeout != null)
+            _logger.Warn($"{nameof(ProducerOptions.ProbeTimeout)} is set for {producerOptions.ExchangeName} but is no longer used. Set {nameof(ProducerOptions.ProbeInterval)} to change how often the probe queue is sampled");
+#pragma warning restore CS0618
+
         IProducerModel producerModel;
         try
         {
             producerModel = isBatch ?
-                new BatchProducerModel(producerOptions.ExchangeName!, model, props, producerOptions.MaxConfirmAttempts, backoffProvider, producerOptions.ProbeQueueName, producerOptions.ProbeQueueLimit, producerOptions.ProbeTimeout) :
-                new ProducerModel(producerOptions.ExchangeName!, model, props, producerOptions.MaxConfirmAttempts, backoffProvider, producerOptions.ProbeQueueName, producerOptions.ProbeQueueLimit, producerOptions.ProbeTimeout);
+                new BatchProducerModel(producerOptions.ExchangeName!, model, props, producerOptions.MaxConfirmAttempts, backoffProvider, producerOptions.ProbeQueueName, producerOptions.ProbeQueueLimit, producerOptions.ProbeInterval, producerOptions.MaxOutstandingConfirms, producerOptions.BodyCompression, producerOptions.BodyCompressionThreshold, producerOptions.BinaryHeaders, producerOptions.CapParentChain, producerOptions.MinPublishRate, producerOptions.MaxPublishRate) :
+                new ProducerModel(producerOptions.ExchangeName!, model, props, producerOptions.MaxConfirmAttempts, backoffProvider, producerOptions.ProbeQueueName, producerOptions.ProbeQueueLimit, producerOptions.ProbeInterval, producerOptions.MaxOutstandingConfirms, producerOptions.BodyCompression, producerOptions.BodyCompressionThreshold, producerOptions.BinaryHeaders, producerOptions.CapParentChain, producerOptions.MinPublishRate, producerOptions.MaxPublishRate);
         }
         catch (Exception)
         {
@@ -377,6 +476,28 @@ public class RabbitMQBroker : IMessageBroker
         return model;
     }
 
+    private double GetMessageCount(string queueName)
+    {
+        lock (_oMetricsLock)
+        {
+            if (ShutdownCalled)
+                return double.NaN;
+
+            try
+            {
+                if (_metricsModel == null || _metricsModel.IsClosed)
+                    _metricsModel = _connection.CreateModel();
+
+                return _metricsModel.MessageCount(queueName);
+            }
+            catch (Exception e)
+            {
+                _logger.Debug(e, $"Could not get the message count for {queueName}");
+                return double.NaN;
+            }
+        }
+    }
+
     /// <summary>
     /// Close all open connections and stop any consumers
     /// </summary>
@@ -398,6 +519,11 @@ public class RabbitMQBroker : IMessageBroker
             }
             _rabbitResources.Clear();
         }
+        lock (_oMetricsLock)
+        {
+            if (_metricsModel?.IsOpen == true)
+                _metricsModel.Close();
+        }
         lock (_exitLock)
             Monitor.PulseAll(_exitLock);
     }
@@ -465,8 +591,21 @@ public class RabbitMQBroker : IMessageBroker
         internal readonly EventingBasicConsumer ebc;
         internal readonly string QueueName;
 
+        internal IDisposable? QueueMetric { get; init; }
+
+        internal IDisposable? AckCoalescing { get; init; }
+
         public override void Dispose()
         {
+            QueueMetric?.Dispose();
+
+            // Send any pending acks before the channel is closed. Those messages will be redelivered if it already has been
+            try
+            {
+                AckCoalescing?.Dispose();
+            }
+            catch (AlreadyClosedException) { }
+
             foreach (var tag in ebc.ConsumerTags)
             {
                 Model.BasicCancel(tag);
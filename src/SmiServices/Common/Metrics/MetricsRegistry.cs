@@ -0,0 +1,320 @@
+using System;
+using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.Globalization;
+using System.IO;
+using System.Linq;
+using System.Threading;
+
+namespace SmiServices.Common.Metrics;
+
+/// <summary>
+/// Set of metrics which can be written in the Prometheus text exposition format. Metrics are registered once, then each
+/// labelled child should be looked up once and cached, so that recording a value is only an interlocked update
+/// </summary>
+public sealed class MetricsRegistry
+{
+    /// <summary>
+    /// The registry used by <see cref="SmiMetrics"/> and exposed by <see cref="MetricsServer"/>
+    /// </summary>
+    public static MetricsRegistry Default { get; } = new();
+
+    private readonly object _oRegisterLock = new();
+    private readonly List<MetricFamily> _families = [];
+
+    public MetricCounter Counter(string name, string help, params string[] labelNames)
+        => Register(name, () => new MetricCounter(name, help, labelNames));
+
+    /// <summary>
+    /// Registers a histogram
+    /// </summary>
+    /// <param name="name"></param>
+    /// <param name="help"></param>
+    /// <param name="buckets">Upper bounds of the buckets in ascending order, or null for <see cref="MetricHistogram.DefaultBuckets"/></param>
+    /// <param name="labelNames"></param>
+    /// <returns></returns>
+    public MetricHistogram Histogram(string name, string help, double[]? buckets, params string[] labelNames)
+        => Register(name, () => new MetricHistogram(name, help, buckets ?? MetricHistogram.DefaultBuckets, labelNames));
+
+    /// <summary>
+    /// Registers a metric whose values are read from callbacks when the metrics are written. Use this to expose
+    /// existing counts without changing the code which updates them
+    /// </summary>
+    /// <param name="name"></param>
+    /// <param name="help"></param>
+    /// <param name="type"></param>
+    /// <param name="labelNames"></param>
+    /// <returns></returns>
+    public ObservedMetric Observed(string name, string help, MetricType type, params string[] labelNames)
+        => Register(name, () => new ObservedMetric(name, help, type, labelNames));
+
+    private T Register<T>(string name, Func<T> create) where T : MetricFamily
+    {
+        lock (_oRegisterLock)
+        {
+            var existing = _families.FirstOrDefault(f => f.Name == name);
+            if (existing != null)
+                return existing as T ?? throw new ArgumentException($"Metric {name} is already registered as a {existing.GetType().Name}");
+
+            var family = create();
+            _families.Add(family);
+            return family;
+        }
+    }
+
+    /// <summary>
+    /// Writes all the metrics in the Prometheus text exposition format
+    /// </summary>
+    /// <param name="writer"></param>
+    public void WriteTo(TextWriter writer)
+    {
+        MetricFamily[] families;
+        lock (_oRegisterLock)
+            families = [.. _families];
+
+        foreach (var family in families)
+        {
+            writer.Write($"# HELP {family.Name} {family.Help}\n");
+            writer.Write($"# TYPE {family.Name} {family.Type.ToString().ToLowerInvariant()}\n");
+            family.WriteSamples(writer);
+        }
+    }
+}
+
+public enum MetricType
+{
+    Counter,
+    Gauge,
+    Histogram,
+}
+
+public abstract class MetricFamily
+{
+    public string Name { get; }
+    public string Help { get; }
+    public abstract MetricType Type { get; }
+
+    protected readonly string[] LabelNames;
+
+    protected MetricFamily(string name, string help, string[] labelNames)
+    {
+        Name = name;
+        Help = help;
+        LabelNames = labelNames;
+    }
+
+    internal abstract void WriteSamples(TextWriter writer);
+
+    protected string FormatLabels(string[] labelValues)
+    {
+        if (labelValues.Length != LabelNames.Length)
+            throw new ArgumentException($"Metric {Name} expects {LabelNames.Length} label value(s), got {labelValues.Length}");
+
+        if (labelValues.Length == 0)
+            return "";
+
+        var labels = LabelNames.Zip(labelValues, (n, v) => $"{n}=\"{Escape(v)}\"");
+        return string.Join(",", labels);
+    }
+
+    protected static void WriteSample(TextWriter writer, string name, string labels, double value)
+    {
+        writer.Write(name);
+        if (labels.Length > 0)
+            writer.Write($"{{{labels}}}");
+        writer.Write(' ');
+        writer.Write(FormatValue(value));
+        writer.Write('\n');
+    }
+
+    protected static string FormatValue(double value)
+    {
+        if (double.IsPositiveInfinity(value))
+            return "+Inf";
+        if (double.IsNegativeInfinity(value))
+            return "-Inf";
+        return value.ToString(CultureInfo.InvariantCulture);
+    }
+
+    private static string Escape(string value) => value.Replace("\\", "\\\\").Replace("\"", "\\\"").Replace("\n", "\\n");
+
+    protected static void AddDouble(ref long location, double value)
+    {
+        long initial, updated;
+        do
+        {
+            initial = Interlocked.Read(ref location);
+            updated = BitConverter.DoubleToInt64Bits(BitConverter.Int64BitsToDouble(initial) + value);
+        }
+        while (Interlocked.CompareExchange(ref location, updated, initial) != initial);
+    }
+
+    protected static double ReadDouble(ref long location) => BitConverter.Int64BitsToDouble(Interlocked.Read(ref location));
+}
+
+public sealed class MetricCounter : MetricFamily
+{
+    public override MetricType Type => MetricType.Counter;
+
+    private readonly ConcurrentDictionary<string, Child> _children = new();
+
+    internal MetricCounter(string name, string help, string[] labelNames)
+        : base(name, help, labelNames) { }
+
+    public Child WithLabels(params string[] labelValues)
+    {
+        var labels = FormatLabels(labelValues);
+        return _children.GetOrAdd(labels, static _ => new Child());
+    }
+
+    internal override void WriteSamples(TextWriter writer)
+    {
+        foreach (var (labels, child) in _children)
+            WriteSample(writer, Name, labels, child.Value);
+    }
+
+    public sealed class Child
+    {
+        private long _value;
+
+        public double Value => ReadDouble(ref _value);
+
+        public void Inc(double by = 1)
+        {
+            if (by < 0)
+                throw new ArgumentOutOfRangeException(nameof(by), "Counters can only increase");
+
+            AddDouble(ref _value, by);
+        }
+    }
+}
+
+public sealed class MetricHistogram : MetricFamily
+{
+    /// <summary>
+    /// Bucket bounds in seconds, suitable for most latencies
+    /// </summary>
+    public static readonly double[] DefaultBuckets = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+
+    public override MetricType Type => MetricType.Histogram;
+
+    private readonly double[] _buckets;
+    private readonly ConcurrentDictionary<string, Child> _children = new();
+
+    internal MetricHistogram(string name, string help, double[] buckets, string[] labelNames)
+        : base(name, help, labelNames)
+    {
+        _buckets = buckets;
+    }
+
+    public Child WithLabels(params string[] labelValues)
+    {
+        var labels = FormatLabels(labelValues);
+        return _children.GetOrAdd(labels, _ => new Child(_buckets));
+    }
+
+    internal override void WriteSamples(TextWriter writer)
+    {
+        foreach (var (labels, child) in _children)
+        {
+            var prefix = labels.Length > 0 ? labels + "," : "";
+
+            // Bucket counts are cumulative
+            long cumulative = 0;
+            for (var i = 0; i < _buckets.Length; ++i)
+            {
+                cumulative += Interlocked.Read(ref child.Counts[i]);
+                WriteSample(writer, Name + "_bucket", $"{prefix}le=\"{FormatValue(_buckets[i])}\"", cumulative);
+            }
+
+            var count = child.Count;
+            WriteSample(writer, Name + "_bucket", $"{prefix}le=\"+Inf\"", count);
+            WriteSample(writer, Name + "_sum", labels, child.Sum);
+            WriteSample(writer, Name + "_count", labels, count);
+        }
+    }
+
+    public sealed class Child
+    {
+        private readonly double[] _buckets;
+        internal readonly long[] Counts;
+        private long _count;
+        private long _sum;
+
+        internal Child(double[] buckets)
+        {
+            _buckets = buckets;
+            Counts = new long[buckets.Length];
+        }
+
+        public long Count => Interlocked.Read(ref _count);
+
+        public double Sum => ReadDouble(ref _sum);
+
+        public void Observe(double value)
+        {
+            for (var i = 0; i < _buckets.Length; ++i)
+            {
+                if (value <= _buckets[i])
+                {
+                    Interlocked.Increment(ref Counts[i]);
+                    break;
+                }
+            }
+
+            AddDouble(ref _sum, value);
+            Interlocked.Increment(ref _count);
+        }
+
+        /// <summary>
+        /// Observes the time since <paramref name="startTimestamp"/>, which should be from <see cref="System.Diagnostics.Stopwatch.GetTimestamp"/>
+        /// </summary>
+        /// <param name="startTimestamp"></param>
+        public void ObserveElapsed(long startTimestamp)
+            => Observe(System.Diagnostics.Stopwatch.GetElapsedTime(startTimestamp).TotalSeconds);
+    }
+}
+
+public sealed class ObservedMetric : MetricFamily
+{
+    public override MetricType Type { get; }
+
+    private readonly ConcurrentDictionary<string, Registration> _registrations = new();
+
+    internal ObservedMetric(string name, string help, MetricType type, string[] labelNames)
+        : base(name, help, labelNames)
+    {
+        if (type == MetricType.Histogram)
+            throw new ArgumentException("Histograms can not be observed", nameof(type));
+
+        Type = type;
+    }
+
+    /// <summary>
+    /// Adds a source for the metric, replacing any existing source with the same label values
+    /// </summary>
+    /// <param name="read">Called each time the metrics are written. Must be thread-safe</param>
+    /// <param name="labelValues"></param>
+    /// <returns>Dispose to remove the source</returns>
+    public IDisposable Observe(Func<double> read, params string[] labelValues)
+    {
+        var labels = FormatLabels(labelValues);
+        var registration = new Registration(this, labels, read);
+        _registrations[labels] = registration;
+        return registration;
+    }
+
+    internal override void WriteSamples(TextWriter writer)
+    {
+        foreach (var (labels, registration) in _registrations)
+            WriteSample(writer, Name, labels, registration.Read());
+    }
+
+    private sealed class Registration(ObservedMetric metric, string labels, Func<double> read) : IDisposable
+    {
+        public Func<double> Read { get; } = read;
+
+        // Only remove ourselves, not a later source with the same labels
+        public void Dispose() => metric._registrations.TryRemove(new KeyValuePair<string, Registration>(labels, this));
+    }
+}
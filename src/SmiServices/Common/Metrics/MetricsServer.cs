@@ -0,0 +1,90 @@
+using NLog;
+using System;
+using System.IO;
+using System.Net;
+using System.Text;
+using System.Threading.Tasks;
+
+namespace SmiServices.Common.Metrics;
+
+/// <summary>
+/// Serves the metrics in a <see cref="MetricsRegistry"/> over HTTP at /metrics, for scraping by Prometheus
+/// </summary>
+public sealed class MetricsServer : IDisposable
+{
+    private const string ContentType = "text/plain; version=0.0.4; charset=utf-8";
+
+    private readonly ILogger _logger = LogManager.GetCurrentClassLogger();
+
+    private readonly MetricsRegistry _registry;
+    private readonly HttpListener _listener = new();
+    private Task? _listenTask;
+
+    /// <summary>
+    ///
+    /// </summary>
+    /// <param name="registry"></param>
+    /// <param name="host">Host name to listen on, or "+" for all</param>
+    /// <param name="port"></param>
+    public MetricsServer(MetricsRegistry registry, string host, int port)
+    {
+        _registry = registry;
+        _listener.Prefixes.Add($"http://{host}:{port}/metrics/");
+    }
+
+    public void Start()
+    {
+        _listener.Start();
+        _listenTask = Task.Run(ListenAsync);
+        _logger.Info($"Serving metrics on {string.Join(", ", _listener.Prefixes)}");
+    }
+
+    private async Task ListenAsync()
+    {
+        while (_listener.IsListening)
+        {
+            HttpListenerContext context;
+            try
+            {
+                context = await _listener.GetContextAsync();
+            }
+            catch (Exception e) when (e is HttpListenerException or ObjectDisposedException)
+            {
+                // Listener was stopped
+                return;
+            }
+
+            try
+            {
+                Respond(context.Response);
+            }
+            catch (Exception e)
+            {
+                _logger.Warn(e, "Could not write metrics response");
+                context.Response.Abort();
+            }
+        }
+    }
+
+    private void Respond(HttpListenerResponse response)
+    {
+        using var buffer = new MemoryStream();
+        using (var writer = new StreamWriter(buffer, new UTF8Encoding(false), leaveOpen: true))
+            _registry.WriteTo(writer);
+
+        response.StatusCode = (int)HttpStatusCode.OK;
+        response.ContentType = ContentType;
+        response.ContentLength64 = buffer.Length;
+        buffer.Position = 0;
+        buffer.CopyTo(response.OutputStream);
+        response.Close();
+    }
+
+    public void Dispose()
+    {
+        if (_listener.IsListening)
+            _listener.Stop();
+        _listener.Close();
+        _listenTask?.Wait(TimeSpan.FromSeconds(5));
+    }
+}
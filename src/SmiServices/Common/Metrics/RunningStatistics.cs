@@ -0,0 +1,95 @@
+using System;
+
+namespace SmiServices.Common.Metrics;
+
+/// <summary>
+/// Count, mean, max and approximate percentiles of a stream of non-negative values, in constant memory. Percentiles are
+/// estimated from logarithmic buckets, so are within about 9% of the true value
+/// </summary>
+public sealed class RunningStatistics
+{
+    // Each doubling of the value is split into this many buckets
+    private const int BucketsPerOctave = 8;
+    private const int BucketCount = 64 * BucketsPerOctave;
+
+    private readonly object _oLock = new();
+    private readonly long[] _buckets = new long[BucketCount];
+
+    private long _count;
+    private double _mean;
+    private double _max;
+
+    public long Count
+    {
+        get
+        {
+            lock (_oLock)
+                return _count;
+        }
+    }
+
+    public double Mean
+    {
+        get
+        {
+            lock (_oLock)
+                return _mean;
+        }
+    }
+
+    public double Max
+    {
+        get
+        {
+            lock (_oLock)
+                return _max;
+        }
+    }
+
+    public void Add(double value)
+    {
+        if (value < 0 || double.IsNaN(value))
+            throw new ArgumentOutOfRangeException(nameof(value), "Must be a non-negative number");
+
+        lock (_oLock)
+        {
+            ++_count;
+            _mean += (value - _mean) / _count;
+            _max = Math.Max(_max, value);
+            ++_buckets[BucketOf(value)];
+        }
+    }
+
+    /// <summary>
+    /// Returns an estimate of the given percentile, or 0 if no values have been added
+    /// </summary>
+    /// <param name="percentile">Between 0 and 100</param>
+    /// <returns></returns>
+    public double Percentile(double percentile)
+    {
+        if (percentile is < 0 or > 100)
+            throw new ArgumentOutOfRangeException(nameof(percentile), "Must be between 0 and 100");
+
+        lock (_oLock)
+        {
+            if (_count == 0)
+                return 0;
+
+            var rank = (long)Math.Ceiling(percentile / 100 * _count);
+            long seen = 0;
+
+            for (var i = 0; i < BucketCount; ++i)
+            {
+                seen += _buckets[i];
+                if (seen >= Math.Max(rank, 1))
+                    return Math.Min(UpperBound(i), _max);
+            }
+
+            return _max;
+        }
+    }
+
+    private static int BucketOf(double value) => Math.Min((int)(Math.Log2(value + 1) * BucketsPerOctave), BucketCount - 1);
+
+    private static double UpperBound(int bucket) => Math.Pow(2, (bucket + 1.0) / BucketsPerOctave) - 1;
+}
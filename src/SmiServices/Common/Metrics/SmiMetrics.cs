@@ -0,0 +1,67 @@
+namespace SmiServices.Common.Metrics;
+
+/// <summary>
+/// The metrics shared by all services. Values are only recorded in memory, and are exposed if
+/// <see cref="Options.MetricsOptions.Port"/> is set
+/// </summary>
+public static class SmiMetrics
+{
+    public static MetricsRegistry Registry => MetricsRegistry.Default;
+
+    #region Messaging
+
+    public static readonly MetricCounter MessagesAcked = Registry.Counter(
+        "smi_consumer_messages_acked_total", "Messages acknowledged by the consumer", "consumer");
+
+    public static readonly MetricCounter MessagesNacked = Registry.Counter(
+        "smi_consumer_messages_nacked_total", "Messages rejected by the consumer", "consumer");
+
+    public static readonly MetricHistogram ProcessingSeconds = Registry.Histogram(
+        "smi_consumer_processing_seconds", "Time taken by the consumer to process each message", null, "consumer");
+
+    public static readonly MetricHistogram PublishSeconds = Registry.Histogram(
+        "smi_producer_publish_seconds", "Time taken to send a message and wait for its publish confirm", null, "exchange");
+
+    public static readonly MetricHistogram ConfirmSeconds = Registry.Histogram(
+        "smi_producer_confirm_seconds", "Time between publishing a message and receiving its asynchronous publish confirm", null, "exchange");
+
+    public static readonly ObservedMetric PublishRate = Registry.Observed(
+        "smi_producer_publish_rate", "Messages per second the producer is limited to by its probe queue", MetricType.Gauge, "exchange");
+
+    public static readonly ObservedMetric QueueMessages = Registry.Observed(
+        "smi_queue_messages", "Messages waiting in the queue", MetricType.Gauge, "queue");
+
+    #endregion
+
+    #region Services
+
+    public static readonly ObservedMetric SwapperCacheHits = Registry.Observed(
+        "smi_swapper_cache_hits_total", "Identifier swaps answered from the cache", MetricType.Counter, "swapper");
+
+    public static readonly ObservedMetric SwapperCacheMisses = Registry.Observed(
+        "smi_swapper_cache_misses_total", "Identifier swaps not answered from the cache", MetricType.Counter, "swapper");
+
+    public static readonly ObservedMetric SwapperDatabaseSeconds = Registry.Observed(
+        "smi_swapper_database_seconds_total", "Time spent querying the mapping database", MetricType.Counter, "swapper");
+
+    public static readonly MetricHistogram TagReaderAccessionSeconds = Registry.Histogram(
+        "smi_tagreader_accession_seconds", "Time taken to read and send the files in each accession directory", null);
+
+    public static readonly MetricCounter TagReaderFilesRead = Registry.Counter(
+        "smi_tagreader_files_read_total", "DICOM files read");
+
+    public static readonly MetricHistogram DleBatchSeconds = Registry.Histogram(
+        "smi_dle_batch_seconds", "Time taken to run the data load engine on each batch of images, including retries",
+        [1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600], "exit_code");
+
+    public static readonly ObservedMetric UpdateQueries = Registry.Observed(
+        "smi_update_queries_total", "UPDATE queries sent to the table", MetricType.Counter, "table");
+
+    public static readonly ObservedMetric UpdateAffectedRows = Registry.Observed(
+        "smi_update_affected_rows_total", "Rows affected by UPDATE queries", MetricType.Counter, "table");
+
+    public static readonly ObservedMetric UpdateSeconds = Registry.Observed(
+        "smi_update_seconds_total", "Time during which UPDATE queries were running on the table", MetricType.Counter, "table");
+
+    #endregion
+}
@@ -1,3 +1,4 @@
+using System;
 using System.Text;
 
 namespace SmiServices.Common.Options;
@@ -27,6 +28,29 @@ public class ConsumerOptions : IOptions
     /// </summary>
     public bool HoldUnprocessableMessages { get; set; }
 
+    /// <summary>
+    /// Max number of messages to process at the same time. Values greater than 1 only apply to consumers which declare
+    /// themselves thread-safe, and are limited to the <see cref="QoSPrefetchCount"/>
+    /// </summary>
+    public int MaxConcurrency { get; set; } = 1;
+
+    /// <summary>
+    /// If greater than 1, acks are held back and sent as a single multiple ack once this many are pending (limited to
+    /// the <see cref="QoSPrefetchCount"/>), or after <see cref="AckBatchTimeout"/>. Not used if <see cref="MaxConcurrency"/>
+    /// is greater than 1
+    /// </summary>
+    public int AckBatchSize { get; set; } = 1;
+
+    /// <summary>
+    /// Longest time an ack is held back for when <see cref="AckBatchSize"/> is set. Defaults to 100ms
+    /// </summary>
+    public TimeSpan? AckBatchTimeout { get; set; }
+
+    /// <summary>
+    /// Keep the DicomDataset of each received DicomFileMessage as the undecoded message body until it is read. Saves
+    /// decoding the dataset in consumers which don't need it, and re-encoding it when the message is sent on unchanged
+    /// </summary>
+    public bool LazyDeserialization { get; set; }
 
     /// <summary>
     /// Verifies that the individual options have been populated
@@ -34,7 +58,7 @@ public class ConsumerOptions : IOptions
     /// <returns></returns>
     public bool VerifyPopulated()
     {
-        return !string.IsNullOrWhiteSpace(QueueName) && (QoSPrefetchCount != 0);
+        return !string.IsNullOrWhiteSpace(QueueName) && (QoSPrefetchCount != 0) && (MaxConcurrency > 0);
     }
 
     public override string ToString()
@@ -44,6 +68,9 @@ public class ConsumerOptions : IOptions
         sb.Append(", AutoAck: " + AutoAck);
         sb.Append(", QoSPrefetchCount: " + QoSPrefetchCount);
         sb.Append(", HoldUnprocessableMessages: " + HoldUnprocessableMessages);
+        sb.Append(", MaxConcurrency: " + MaxConcurrency);
+        sb.Append(", AckBatchSize: " + AckBatchSize);
+        sb.Append(", LazyDeserialization: " + LazyDeserialization);
         return sb.ToString();
     }
 }
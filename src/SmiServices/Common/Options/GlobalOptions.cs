@@ -50,7 +50,9 @@ public class GlobalOptions : IOptions
     public MessageBrokerType? MessageBrokerType { get; set; } = Messaging.MessageBrokerType.RabbitMQ;
 
     public LoggingOptions? LoggingOptions { get; set; } = new LoggingOptions();
+    public MetricsOptions? MetricsOptions { get; set; } = new MetricsOptions();
     public RabbitOptions? RabbitOptions { get; set; } = new RabbitOptions();
+    public InMemoryBrokerOptions? InMemoryBrokerOptions { get; set; } = new InMemoryBrokerOptions();
     public FileSystemOptions? FileSystemOptions { get; set; } = new FileSystemOptions();
     public RDMPOptions? RDMPOptions { get; set; } = new RDMPOptions();
     public MongoDatabases? MongoDatabases { get; set; } = new MongoDatabases();
@@ -107,6 +109,21 @@ public class LoggingOptions
     public override string ToString() => GlobalOptions.GenerateToString(this);
 }
 
+public class MetricsOptions : IOptions
+{
+    /// <summary>
+    /// If set, metrics are served on this port at /metrics in the Prometheus text format
+    /// </summary>
+    public int? Port { get; set; }
+
+    /// <summary>
+    /// The host name to serve metrics on. The default of "+" accepts requests for any host name
+    /// </summary>
+    public string Host { get; set; } = "+";
+
+    public override string ToString() => GlobalOptions.GenerateToString(this);
+}
+
 public class IsIdentifiableServiceOptions : ConsumerOptions
 {
     /// <summary>
@@ -123,6 +140,22 @@ public class ProcessDirectoryOptions : IOptions
 {
     public ProducerOptions? AccessionDirectoryProducerOptions { get; set; }
 
+    /// <summary>
+    /// Number of directories to scan at once. Ignored when reading a list of accession directories
+    /// </summary>
+    public int MaxDegreeOfParallelism { get; set; } = 1;
+
+    /// <summary>
+    /// If set, the path of a file recording every accession directory sent. Rescans then only send directories which
+    /// are new or have changed, and an interrupted scan resumes where it stopped
+    /// </summary>
+    public string? ManifestPath { get; set; }
+
+    /// <summary>
+    /// Seconds between saving the scan's progress to the manifest
+    /// </summary>
+    public int CheckpointIntervalSeconds { get; set; } = 60;
+
     public override string ToString()
     {
         return GlobalOptions.GenerateToString(this);
@@ -160,12 +193,40 @@ public class IdentifierMapperOptions : ConsumerOptions, IMappingTableOptions
     public string? ReplacementColumnName { get; set; }
     public string? SwapperType { get; set; }
 
+    /// <inheritdoc/>
+    public int LookupCacheSize { get; set; } = 100_000;
+
+    /// <inheritdoc/>
+    public TimeSpan? LookupCacheTimeout { get; set; }
+
+    /// <inheritdoc/>
+    public bool CacheLookupMisses { get; set; }
+
+    /// <inheritdoc/>
+    public bool PreloadDeltaRefresh { get; set; }
+
+    /// <inheritdoc/>
+    public TimeSpan? PreloadRefreshInterval { get; set; }
+
     /// <summary>
-    /// True - Changes behaviour of swapper host to pick up the PatientID tag using regex from the JSON string directly
-    /// rather than deserializing it to <see cref="DicomDataset"/> first.
+    /// No longer used: the PatientID is always read and replaced in the JSON string directly, rather than deserializing
+    /// it to <see cref="DicomDataset"/> first.
     /// </summary>
+    [Obsolete("The PatientID is always read and replaced in the JSON directly, so this has no effect")]
     public bool AllowRegexMatching { get; set; }
 
+    /// <summary>
+    /// If greater than 1, messages are held back until this many have arrived (limited to the <see cref="ConsumerOptions.QoSPrefetchCount"/>)
+    /// or after <see cref="SwapBatchTimeout"/>, and their identifiers are swapped together, so database backed swappers
+    /// make one lookup per batch rather than one per message
+    /// </summary>
+    public int SwapBatchSize { get; set; } = 1;
+
+    /// <summary>
+    /// Longest time a message is held back for when <see cref="SwapBatchSize"/> is set. Defaults to 100ms
+    /// </summary>
+    public TimeSpan? SwapBatchTimeout { get; set; }
+
     /// <summary>
     /// Optional, if set then your <see cref="SwapperType"/> will be wrapped and it's answers cached in this Redis database.
     /// The Redis database will always be consulted for a known answer first and <see cref="SwapperType"/> used
@@ -209,6 +270,33 @@ public interface IMappingTableOptions : IOptions
     DatabaseType MappingDatabaseType { get; }
     int TimeoutInSeconds { get; }
 
+    /// <summary>
+    /// Number of lookups to cache, for swappers which cache them. 0 disables the cache
+    /// </summary>
+    int LookupCacheSize { get; }
+
+    /// <summary>
+    /// How long a cached lookup is kept for, or null to keep it until it is evicted or the cache is cleared
+    /// </summary>
+    TimeSpan? LookupCacheTimeout { get; }
+
+    /// <summary>
+    /// Also cache lookups which found no match. New mappings for those values are then only seen once the entry expires
+    /// or the cache is cleared (e.g. by a refresh control message)
+    /// </summary>
+    bool CacheLookupMisses { get; }
+
+    /// <summary>
+    /// When a preloaded mapping table is refreshed, only fetch the rows whose ValidFrom has changed since the last load,
+    /// rather than the whole table. Rows deleted from the table are only dropped by a full reload (e.g. on restart)
+    /// </summary>
+    bool PreloadDeltaRefresh { get; }
+
+    /// <summary>
+    /// How often to refresh a preloaded mapping table in the background, or null to only refresh it on a control message
+    /// </summary>
+    TimeSpan? PreloadRefreshInterval { get; }
+
     DiscoveredTable Discover();
     IMappingTableOptions Clone();
 }
@@ -230,6 +318,28 @@ public class DicomTagReaderOptions : ConsumerOptions
     public TagProcessorMode TagProcessorMode { get; set; }
     public int MaxIoThreads { get; set; } = 1;
 
+    /// <summary>
+    /// If greater than 0, each <see cref="DicomFileMessage"/> is sent as soon as its file has been read, and at most
+    /// this many are held in memory, rather than reading the whole directory before sending anything. The
+    /// <see cref="SeriesMessage"/>(s) are still only sent, and the <see cref="AccessionDirectoryMessage"/> acknowledged,
+    /// once every file in the directory has been read and sent. If a file fails part way through, the file messages
+    /// already sent are not withdrawn, so downstream services may see them again when the directory is reprocessed
+    /// </summary>
+    public int StreamingQueueSize { get; set; }
+
+    /// <summary>
+    /// If true, stop reading each file at its pixel data, so the bulk data is never read from disk. Any tags after the
+    /// pixel data are not included in the messages
+    /// </summary>
+    public bool StopAtPixelData { get; set; }
+
+    /// <summary>
+    /// If set, the only tags included in the messages. Each entry is a keyword (e.g. "PatientID"), a tag
+    /// (e.g. "(0010,0020)"), or a 4-digit hex group (e.g. "0009") to keep a whole group of private tags. The UIDs are
+    /// always included
+    /// </summary>
+    public List<string>? TagAllowList { get; set; }
+
     public FileReadOption GetReadOption()
     {
         try
@@ -654,3 +764,32 @@ public class RabbitOptions : IOptions
         return GlobalOptions.GenerateToString(this);
     }
 }
+
+public class InMemoryBrokerOptions : IOptions
+{
+    /// <summary>
+    /// Maximum number of messages held in each queue. Publishers block while a queue they route to is full
+    /// </summary>
+    public int QueueCapacity { get; set; } = 10000;
+
+    /// <summary>
+    /// The queues to create, and the exchanges they receive messages from
+    /// </summary>
+    public InMemoryBindingOptions[]? Bindings { get; set; }
+
+    public override string ToString()
+    {
+        return GlobalOptions.GenerateToString(this);
+    }
+}
+
+public class InMemoryBindingOptions
+{
+    public string? ExchangeName { get; set; }
+    public string? QueueName { get; set; }
+
+    /// <summary>
+    /// Topic pattern for the binding. Defaults to matching any routing key
+    /// </summary>
+    public string RoutingKey { get; set; } = "#";
+}
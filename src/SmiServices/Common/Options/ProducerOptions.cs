@@ -1,5 +1,6 @@
 using Equ;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.MessageSerialization;
 using System;
 
 namespace SmiServices.Common.Options;
@@ -25,20 +26,68 @@ public class ProducerOptions : MemberwiseEquatable<ProducerOptions>, IOptions
     public string? BackoffProviderType { get; set; }
 
     /// <summary>
-    /// Downstream queue to monitor
+    /// Downstream queue to monitor. If set, the publish rate is continuously adjusted to keep this queue near
+    /// <see cref="ProbeQueueLimit"/> messages
     /// </summary>
     public string? ProbeQueueName { get; set; }
 
     /// <summary>
-    /// Message limit of the downstream queue
+    /// Target number of messages in the downstream queue
     /// </summary>
     public int ProbeQueueLimit { get; set; } = 0;
 
     /// <summary>
-    /// Sleep time between each check of the probe queue when it is over the message limit
+    /// Interval between samples of the probe queue depth. Defaults to 1 second
     /// </summary>
+    public TimeSpan? ProbeInterval { get; set; }
+
+    /// <summary>
+    /// No longer used. This was the time to sleep when the probe queue was over its limit, but the publish rate is now
+    /// adjusted continuously instead
+    /// </summary>
+    [Obsolete("The publish rate is now adjusted continuously. Use ProbeInterval to set how often the probe queue is sampled")]
     public TimeSpan? ProbeTimeout { get; set; }
 
+    /// <summary>
+    /// Lowest publish rate, in messages per second, when throttled by the probe queue
+    /// </summary>
+    public double MinPublishRate { get; set; } = 1;
+
+    /// <summary>
+    /// Highest publish rate, in messages per second, when throttled by the probe queue. This is also the initial rate
+    /// </summary>
+    public double MaxPublishRate { get; set; } = 10_000;
+
+    /// <summary>
+    /// If greater than 0, publisher confirms are tracked per-message rather than waited for after each send. Sends made
+    /// with <see cref="IProducerModel.SendMessageAsync"/> will block once this many messages are awaiting confirmation
+    /// </summary>
+    public int MaxOutstandingConfirms { get; set; } = 0;
+
+    /// <summary>
+    /// Compression to apply to message bodies. Consumers decode according to the content-encoding of each message, so
+    /// all consumers of the exchange must be updated before this is enabled
+    /// </summary>
+    public MessageBodyCompression BodyCompression { get; set; } = MessageBodyCompression.None;
+
+    /// <summary>
+    /// Message bodies smaller than this number of bytes are not compressed
+    /// </summary>
+    public int BodyCompressionThreshold { get; set; } = 4096;
+
+    /// <summary>
+    /// Send the message header GUIDs as bytes rather than strings. Only supported by the C# services, so must not be
+    /// enabled for exchanges which are consumed by any of the Java services
+    /// </summary>
+    public bool BinaryHeaders { get; set; } = false;
+
+    /// <summary>
+    /// Limit the parent chain in each message header to the root message, a hash of the intermediate messages, and the
+    /// immediate parent. Keeps the header size constant regardless of the depth of the pipeline, at the cost of losing
+    /// the intermediate message GUIDs
+    /// </summary>
+    public bool CapParentChain { get; set; } = false;
+
     /// <summary>
     /// Verifies that the individual options have been populated
     /// </summary>
@@ -48,5 +97,5 @@ public class ProducerOptions : MemberwiseEquatable<ProducerOptions>, IOptions
         return !string.IsNullOrWhiteSpace(ExchangeName);
     }
 
-    public override string ToString() => $"ExchangeName={ExchangeName}, MaxConfirmAttempts={MaxConfirmAttempts}, BackoffProviderType={BackoffProviderType}";
+    public override string ToString() => $"ExchangeName={ExchangeName}, MaxConfirmAttempts={MaxConfirmAttempts}, BackoffProviderType={BackoffProviderType}, ProbeQueueName={ProbeQueueName}, ProbeQueueLimit={ProbeQueueLimit}, ProbeInterval={ProbeInterval}, MinPublishRate={MinPublishRate}, MaxPublishRate={MaxPublishRate}, MaxOutstandingConfirms={MaxOutstandingConfirms}, BodyCompression={BodyCompression}, BinaryHeaders={BinaryHeaders}, CapParentChain={CapParentChain}";
 }
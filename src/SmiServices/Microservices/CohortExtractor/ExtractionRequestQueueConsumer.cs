@@ -5,7 +5,9 @@ using SmiServices.Common.Options;
 using SmiServices.Microservices.CohortExtractor.ProjectPathResolvers;
 using SmiServices.Microservices.CohortExtractor.RequestFulfillers;
 using System;
+using System.Collections.Generic;
 using System.ComponentModel;
+using System.Threading.Tasks;
 
 namespace SmiServices.Microservices.CohortExtractor;
 
@@ -45,6 +47,9 @@ public class ExtractionRequestQueueConsumer : Consumer<ExtractionRequestMessage>
         string extractionDirectory = request.ExtractionDirectory.TrimEnd('/', '\\');
         string? extractFileRoutingKey = request.IsIdentifiableExtraction ? _options.ExtractIdentRoutingKey : _options.ExtractAnonRoutingKey;
 
+        // The request is acked once all of these are confirmed, rather than waiting for each in turn
+        List<Task> infoConfirms = [];
+
         foreach (ExtractImageCollection matchedFiles in _fulfiller.GetAllMatchingFiles(request))
         {
             Logger.Info($"Accepted {matchedFiles.Accepted.Count} and rejected {matchedFiles.Rejected.Count} files for KeyValue {matchedFiles.KeyValue}");
@@ -87,16 +92,13 @@ public class ExtractionRequestQueueConsumer : Consumer<ExtractionRequestMessage>
             }
 
             infoMessage.KeyValue = matchedFiles.KeyValue;
-            _fileMessageInfoProducer.SendMessage(infoMessage, header, routingKey: null);
-
-            if (_fileMessageInfoProducer.GetType() == typeof(BatchProducerModel))
-                _fileMessageInfoProducer.WaitForConfirms();
+            infoConfirms.Add(_fileMessageInfoProducer.SendMessageAsync(infoMessage, header, routingKey: null));
 
             Logger.Info($"All ExtractFileCollectionInfoMessage(s) sent for {matchedFiles.KeyValue}");
         }
 
         Logger.Info($"Finished processing message {header.MessageGuid}");
 
-        Ack(header, tag);
+        AckWhenConfirmed(header, tag, Task.WhenAll(infoConfirms));
     }
 }
@@ -56,9 +56,7 @@ public class DicomAnonymiserConsumer : Consumer<ExtractFileMessage>
             statusMessage.Status = ExtractedFileStatus.FileMissing;
             statusMessage.StatusMessage = $"Could not find file to anonymise: '{sourceFileAbs}'";
             statusMessage.OutputFilePath = null;
-            _statusMessageProducer.SendMessage(statusMessage, header, _options.RoutingKeyFailure);
-
-            Ack(header, tag);
+            AckWhenConfirmed(header, tag, _statusMessageProducer.SendMessageAsync(statusMessage, header, _options.RoutingKeyFailure));
             return;
         }
 
@@ -67,9 +65,7 @@ public class DicomAnonymiserConsumer : Consumer<ExtractFileMessage>
             statusMessage.Status = ExtractedFileStatus.ErrorWontRetry;
             statusMessage.StatusMessage = $"Source file was writeable and FailIfSourceWriteable is set: '{sourceFileAbs}'";
             statusMessage.OutputFilePath = null;
-            _statusMessageProducer.SendMessage(statusMessage, header, _options.RoutingKeyFailure);
-
-            Ack(header, tag);
+            AckWhenConfirmed(header, tag, _statusMessageProducer.SendMessageAsync(statusMessage, header, _options.RoutingKeyFailure));
             return;
         }
 
@@ -108,8 +104,8 @@ public class DicomAnonymiserConsumer : Consumer<ExtractFileMessage>
             routingKey = _options.RoutingKeyFailure ?? "noverify";
         }
 
-        _statusMessageProducer.SendMessage(statusMessage, header, routingKey);
+        var statusConfirmed = _statusMessageProducer.SendMessageAsync(statusMessage, header, routingKey);
 
-        Ack(header, tag);
+        AckWhenConfirmed(header, tag, statusConfirmed);
     }
 }
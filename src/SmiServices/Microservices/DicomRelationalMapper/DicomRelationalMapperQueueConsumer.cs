@@ -10,11 +10,13 @@ using Rdmp.Core.Repositories;
 using Rdmp.Core.ReusableLibraryCode.Checks;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.Metrics;
 using SmiServices.Common.Options;
 using SmiServices.Microservices.DicomRelationalMapper.Namers;
 using System;
 using System.Collections.Generic;
 using System.Collections.ObjectModel;
+using System.Diagnostics;
 using System.Linq;
 using System.Threading;
 using System.Threading.Tasks;
@@ -210,6 +212,7 @@ public class DicomRelationalMapperQueueConsumer : Consumer<DicomFileMessage>, ID
         ExitCodeType exitCode;
 
         var datasetProvider = new DicomFileMessageToDatasetListWorklist(toProcess);
+        var dleStart = Stopwatch.GetTimestamp();
 
         do
         {
@@ -255,6 +258,7 @@ public class DicomRelationalMapperQueueConsumer : Consumer<DicomFileMessage>, ID
         while (remainingRetries-- > 0 && (exitCode == ExitCodeType.Error || exitCode == ExitCodeType.Abort));
 
         Logger.Info("DLE exited with code " + exitCode);
+        SmiMetrics.DleBatchSeconds.WithLabels(exitCode.ToString()).ObserveElapsed(dleStart);
 
         switch (exitCode)
         {
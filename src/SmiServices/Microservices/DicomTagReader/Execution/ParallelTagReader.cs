@@ -28,6 +28,8 @@ public class ParallelTagReader : TagReaderBase
         Logger.Info($"Using MaxDegreeOfParallelism={_parallelOptions.MaxDegreeOfParallelism} for parallel IO operations");
     }
 
+    protected override int MaxReadThreads => _parallelOptions.MaxDegreeOfParallelism;
+
     protected override List<DicomFileMessage> ReadTagsImpl(IEnumerable<FileInfo> dicomFilePaths,
         AccessionDirectoryMessage accMessage)
     {
@@ -1,19 +1,25 @@
 
 using DicomTypeTranslation;
 using FellowOakDicom;
+using Microsoft.IO;
 using NLog;
 using SmiServices.Common;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.Metrics;
 using SmiServices.Common.Options;
 using System;
+using System.Collections.Concurrent;
 using System.Collections.Generic;
 using System.Diagnostics;
 using System.IO;
 using System.IO.Abstractions;
 using System.IO.Compression;
 using System.Linq;
+using System.Runtime.ExceptionServices;
 using System.Text;
+using System.Threading;
+using System.Threading.Tasks;
 
 namespace SmiServices.Microservices.DicomTagReader.Execution;
 
@@ -30,14 +36,23 @@ public abstract class TagReaderBase
 
     private readonly string _searchPattern;
 
+    private readonly int _streamingQueueSize;
+
+    private readonly DicomHeaderReader _headerReader;
+
     private static FileReadOption _fileReadOption;
 
+    private static readonly RecyclableMemoryStreamManager _streamManager = new();
+
     private readonly Stopwatch _stopwatch = new();
     private int _nAccMessagesProcessed;
     protected int NFilesProcessed;
     private int _nMessagesSent;
     private readonly long[] _swTotals = new long[4]; // Enumerate, Read, Send, Total
 
+    private readonly MetricHistogram.Child _accessionMetric = SmiMetrics.TagReaderAccessionSeconds.WithLabels();
+    private readonly MetricCounter.Child _filesReadMetric = SmiMetrics.TagReaderFilesRead.WithLabels();
+
     public bool IsExiting;
     public readonly object TagReaderProcessLock = new();
 
@@ -63,6 +78,8 @@ public abstract class TagReaderBase
         _searchPattern = fileSystemOptions.DicomSearchPattern ?? throw new ArgumentNullException(nameof(fileSystemOptions));
 
         _fileReadOption = options.GetReadOption();
+        _streamingQueueSize = options.StreamingQueueSize;
+        _headerReader = new DicomHeaderReader(options.StopAtPixelData, options.TagAllowList);
 
         Logger.Debug($"FileReadOption is: {_fileReadOption}");
 
@@ -107,80 +124,245 @@ public abstract class TagReaderBase
         // We have files to process, let's do it!
 
         long beginRead = _stopwatch.ElapsedTicks;
-
-        List<DicomFileMessage> fileMessages = ReadTagsImpl(dicomFilePaths.Select(p => new FileInfo(p)), message);
-        fileMessages.AddRange(ReadZipFilesImpl(zipFilePaths.Select(p => new FileInfo(p)), message));
-
-        _swTotals[1] += (_stopwatch.ElapsedTicks - beginRead) / toProcess;
-
         var seriesMessages = new Dictionary<string, SeriesMessage>();
+        int fileMessageCount;
 
-        foreach (DicomFileMessage fileMessage in fileMessages)
-        {
-            string seriesUID = fileMessage.SeriesInstanceUID;
-
-            // If we've already seen this seriesUID, just update the image count
-            if (seriesMessages.TryGetValue(seriesUID, out SeriesMessage? value))
-            {
-                value.ImagesInSeries++;
-                continue;
-            }
+        IEnumerable<FileInfo> dicomFiles = dicomFilePaths.Select(p => new FileInfo(p));
+        IEnumerable<FileInfo> zipFiles = zipFilePaths.Select(p => new FileInfo(p));
 
-            // Else create a new SeriesMessage
-            var seriesMessage = new SeriesMessage
-            {
-                DirectoryPath = message.DirectoryPath,
+        if (_streamingQueueSize > 0)
+        {
+            // Reading and sending overlap, so the read time includes sending the file messages
+            fileMessageCount = ReadAndSendStreaming(header, message, dicomFiles, zipFiles, seriesMessages);
+            _swTotals[1] += (_stopwatch.ElapsedTicks - beginRead) / toProcess;
 
-                StudyInstanceUID = fileMessage.StudyInstanceUID,
-                SeriesInstanceUID = seriesUID,
+            if (fileMessageCount == 0)
+                throw new ApplicationException("No DicomFileMessage(s) to send after processing the directory");
+        }
+        else
+        {
+            List<DicomFileMessage> fileMessages = ReadTagsImpl(dicomFiles, message);
+            fileMessages.AddRange(ReadZipFilesImpl(zipFiles, message));
 
-                ImagesInSeries = 1,
+            _swTotals[1] += (_stopwatch.ElapsedTicks - beginRead) / toProcess;
 
-                DicomDataset = fileMessage.DicomDataset
-            };
+            foreach (DicomFileMessage fileMessage in fileMessages)
+                AddToSeries(seriesMessages, fileMessage, message);
 
-            seriesMessages.Add(seriesUID, seriesMessage);
-        }
+            Logger.Debug("TagReader: Finished processing directory, sending messages");
 
-        Logger.Debug("TagReader: Finished processing directory, sending messages");
+            // Only send if have processed all files in the directory ok
 
-        // Only send if have processed all files in the directory ok
+            if (fileMessages.Count == 0)
+                throw new ApplicationException("No DicomFileMessage(s) to send after processing the directory");
 
-        if (fileMessages.Count == 0)
-            throw new ApplicationException("No DicomFileMessage(s) to send after processing the directory");
+            if (seriesMessages.Count == 0)
+                throw new ApplicationException("No SeriesMessage(s) to send but we have file messages");
 
-        if (seriesMessages.Count == 0)
-            throw new ApplicationException("No SeriesMessage(s) to send but we have file messages");
+            Logger.Info($"Sending {fileMessages.Count} DicomFileMessage(s)");
 
-        Logger.Info($"Sending {fileMessages.Count} DicomFileMessage(s)");
+            long beginSend = _stopwatch.ElapsedTicks;
+            var fileHeaders = new List<IMessageHeader>();
+            foreach (DicomFileMessage fileMessage in fileMessages)
+                fileHeaders.Add(_fileMessageProducerModel.SendMessage(fileMessage, header, routingKey: null));
 
-        long beginSend = _stopwatch.ElapsedTicks;
-        var headers = new List<IMessageHeader>();
-        foreach (DicomFileMessage fileMessage in fileMessages)
-            headers.Add(_fileMessageProducerModel.SendMessage(fileMessage, header, routingKey: null));
+            _fileMessageProducerModel.WaitForConfirms();
 
-        _fileMessageProducerModel.WaitForConfirms();
+            if (Logger.IsTraceEnabled)
+                fileHeaders.ForEach(x => x.Log(Logger, LogLevel.Trace, $"Sent {header?.MessageGuid}"));
 
-        headers.ForEach(x => x.Log(Logger, LogLevel.Trace, $"Sent {header?.MessageGuid}"));
+            _swTotals[2] += _stopwatch.ElapsedTicks - beginSend;
+            fileMessageCount = fileMessages.Count;
+        }
 
         Logger.Info($"Sending {seriesMessages.Count} SeriesMessage(s)");
 
-        headers.Clear();
+        long beginSeriesSend = _stopwatch.ElapsedTicks;
+        var headers = new List<IMessageHeader>();
         foreach (KeyValuePair<string, SeriesMessage> kvp in seriesMessages)
             headers.Add(_seriesMessageProducerModel.SendMessage(kvp.Value, header, routingKey: null));
 
         _seriesMessageProducerModel.WaitForConfirms();
-        headers.ForEach(x => x.Log(Logger, LogLevel.Trace, $"Sent {x.MessageGuid}"));
+        if (Logger.IsTraceEnabled)
+            headers.ForEach(x => x.Log(Logger, LogLevel.Trace, $"Sent {x.MessageGuid}"));
 
-        _swTotals[2] += _stopwatch.ElapsedTicks - beginSend;
+        _swTotals[2] += _stopwatch.ElapsedTicks - beginSeriesSend;
         _swTotals[3] += _stopwatch.ElapsedTicks;
-        _nMessagesSent += fileMessages.Count + seriesMessages.Count;
+        _nMessagesSent += fileMessageCount + seriesMessages.Count;
+
+        _accessionMetric.Observe(_stopwatch.Elapsed.TotalSeconds);
+        _filesReadMetric.Inc(fileMessageCount);
 
         if (++_nAccMessagesProcessed % 10 == 0)
             LogRates();
     }
 
 
+    private static void AddToSeries(Dictionary<string, SeriesMessage> seriesMessages, DicomFileMessage fileMessage, AccessionDirectoryMessage accMessage)
+    {
+        string seriesUID = fileMessage.SeriesInstanceUID;
+
+        // If we've already seen this seriesUID, just update the image count
+        if (seriesMessages.TryGetValue(seriesUID, out SeriesMessage? value))
+        {
+            value.ImagesInSeries++;
+            return;
+        }
+
+        // Else create a new SeriesMessage
+        var seriesMessage = new SeriesMessage
+        {
+            DirectoryPath = accMessage.DirectoryPath,
+
+            StudyInstanceUID = fileMessage.StudyInstanceUID,
+            SeriesInstanceUID = seriesUID,
+
+            ImagesInSeries = 1,
+
+            DicomDataset = fileMessage.DicomDataset
+        };
+
+        seriesMessages.Add(seriesUID, seriesMessage);
+    }
+
+    /// <summary>
+    /// Reads the files on a background task and sends each <see cref="DicomFileMessage"/> as soon as it is read, so at
+    /// most <see cref="DicomTagReaderOptions.StreamingQueueSize"/> of them are held in memory at once. The series
+    /// messages are only collected here, and are sent by the caller once every file message has been confirmed.
+    /// </summary>
+    /// <param name="header"></param>
+    /// <param name="accMessage"></param>
+    /// <param name="dicomFiles"></param>
+    /// <param name="zipFiles"></param>
+    /// <param name="seriesMessages">Populated with a <see cref="SeriesMessage"/> for each series seen</param>
+    /// <returns>The number of file messages sent</returns>
+    private int ReadAndSendStreaming(
+        IMessageHeader? header,
+        AccessionDirectoryMessage accMessage,
+        IEnumerable<FileInfo> dicomFiles,
+        IEnumerable<FileInfo> zipFiles,
+        Dictionary<string, SeriesMessage> seriesMessages
+    )
+    {
+        using var queue = new BlockingCollection<DicomFileMessage>(_streamingQueueSize);
+        using var cts = new CancellationTokenSource();
+
+        Task reader = Task.Run(() =>
+        {
+            try
+            {
+                var parallelOptions = new ParallelOptions
+                {
+                    MaxDegreeOfParallelism = MaxReadThreads,
+                    CancellationToken = cts.Token,
+                };
+
+                Parallel.ForEach(dicomFiles, parallelOptions, dicomFilePath =>
+                {
+                    DicomFileMessage? fileMessage = TryReadTagsFromFile(dicomFilePath);
+                    if (fileMessage == null)
+                        return;
+
+                    queue.Add(fileMessage, cts.Token);
+                    Interlocked.Increment(ref NFilesProcessed);
+                });
+
+                ReadZipEntries(zipFiles, cts.Token, fileMessage => queue.Add(fileMessage, cts.Token));
+            }
+            finally
+            {
+                queue.CompleteAdding();
+            }
+        });
+
+        var sent = 0;
+        var headers = new List<IMessageHeader>();
+
+        try
+        {
+            foreach (DicomFileMessage fileMessage in queue.GetConsumingEnumerable())
+            {
+                // Stop sending as soon as any file fails, rather than draining what was already queued
+                if (reader.IsFaulted)
+                    break;
+
+                AddToSeries(seriesMessages, fileMessage, accMessage);
+
+                IMessageHeader sentHeader = _fileMessageProducerModel.SendMessage(fileMessage, header, routingKey: null);
+                if (Logger.IsTraceEnabled)
+                    headers.Add(sentHeader);
+                ++sent;
+            }
+        }
+        catch (Exception)
+        {
+            cts.Cancel();
+
+            try
+            {
+                reader.Wait();
+            }
+            catch (AggregateException)
+            {
+                // Already failing, so any error from the reader is not interesting
+            }
+
+            throw;
+        }
+
+        try
+        {
+            reader.Wait();
+        }
+        catch (AggregateException ae)
+        {
+            // Surface the original error, e.g. the ApplicationException if a file couldn't be read and NackIfAnyFileErrors is set
+            ExceptionDispatchInfo.Throw(ae.Flatten().InnerExceptions[0]);
+        }
+
+        Logger.Debug($"TagReader: Finished processing directory, sent {sent} DicomFileMessage(s)");
+
+        _fileMessageProducerModel.WaitForConfirms();
+
+        if (Logger.IsTraceEnabled)
+            headers.ForEach(x => x.Log(Logger, LogLevel.Trace, $"Sent {header?.MessageGuid}"));
+
+        return sent;
+    }
+
+    /// <summary>
+    /// Reads a single file, handling any error according to <see cref="NackIfAnyFileErrors"/>
+    /// </summary>
+    /// <param name="dicomFilePath"></param>
+    /// <returns>The message, or null if the file couldn't be read and should be skipped</returns>
+    private DicomFileMessage? TryReadTagsFromFile(FileInfo dicomFilePath)
+    {
+        Logger.Trace("TagReader: Processing " + dicomFilePath);
+
+        try
+        {
+            return ReadTagsFromFile(dicomFilePath);
+        }
+        catch (Exception e)
+        {
+            if (NackIfAnyFileErrors)
+                throw new ApplicationException(
+                    "Exception processing file and NackIfAnyFileErrors option set. File was: " + dicomFilePath,
+                    e);
+
+            Logger.Error(e,
+                "Error processing file " + dicomFilePath +
+                ". Ignoring and moving on since NackIfAnyFileErrors is false");
+
+            return null;
+        }
+    }
+
+    /// <summary>
+    /// Maximum number of zip entries to read at once, and of files when <see cref="DicomTagReaderOptions.StreamingQueueSize"/> is set
+    /// </summary>
+    protected virtual int MaxReadThreads => 1;
+
     public bool Include(string filePath)
     {
         return IncludeFile?.Invoke(filePath) ?? true;
@@ -194,24 +376,86 @@ public abstract class TagReaderBase
     /// <returns></returns>
     protected virtual IEnumerable<DicomFileMessage> ReadZipFilesImpl(IEnumerable<FileInfo> zipFilePaths, AccessionDirectoryMessage accMessage)
     {
-        foreach (FileInfo zipFilePath in zipFilePaths)
+        var fileMessages = new List<DicomFileMessage>();
+
+        ReadZipEntries(zipFilePaths, CancellationToken.None, fileMessage =>
         {
-            using var archive = ZipFile.Open(zipFilePath.FullName, ZipArchiveMode.Read);
-            foreach (var entry in archive.Entries)
-            {
-                if (!entry.FullName.EndsWith(".dcm", StringComparison.CurrentCultureIgnoreCase)) continue;
-                byte[]? buffer = null;
+            lock (fileMessages)
+                fileMessages.Add(fileMessage);
+        });
+
+        return fileMessages;
+    }
 
-                buffer = ReadFully(entry.Open());
+    /// <summary>
+    /// Reads every dcm entry in <paramref name="zipFilePaths"/>, sharing the entries of all the archives between up to
+    /// <see cref="MaxReadThreads"/> threads
+    /// </summary>
+    /// <param name="zipFilePaths"></param>
+    /// <param name="cancellationToken"></param>
+    /// <param name="onMessage">Called with each message, possibly from several threads at once</param>
+    private void ReadZipEntries(IEnumerable<FileInfo> zipFilePaths, CancellationToken cancellationToken, Action<DicomFileMessage> onMessage)
+    {
+        // Only the central directory is read here. Entries which aren't dcm files are never decompressed
+        var entries = new List<(string ZipPath, int Index)>();
+        foreach (FileInfo zipFilePath in zipFilePaths)
+        {
+            using var archive = ZipFile.OpenRead(zipFilePath.FullName);
+            for (var i = 0; i < archive.Entries.Count; ++i)
+                if (archive.Entries[i].FullName.EndsWith(".dcm", StringComparison.CurrentCultureIgnoreCase))
+                    entries.Add((zipFilePath.FullName, i));
+        }
 
-                using var memoryStream = new MemoryStream(buffer);
-                var dicom = DicomFile.Open(memoryStream);
+        var parallelOptions = new ParallelOptions
+        {
+            MaxDegreeOfParallelism = MaxReadThreads,
+            CancellationToken = cancellationToken,
+        };
 
-                yield return DicomFileToMessage(dicom.Dataset, $"{zipFilePath.FullName}!{entry.FullName}", null);
-            }
+        try
+        {
+            // ZipArchive isn't thread-safe, so each thread opens its own handle on each archive it reads from
+            Parallel.ForEach(
+                entries,
+                parallelOptions,
+                () => new Dictionary<string, ZipArchive>(),
+                (entry, _, archives) =>
+                {
+                    if (!archives.TryGetValue(entry.ZipPath, out ZipArchive? archive))
+                    {
+                        archive = ZipFile.OpenRead(entry.ZipPath);
+                        archives.Add(entry.ZipPath, archive);
+                    }
+
+                    onMessage(ReadZipEntry(archive.Entries[entry.Index], entry.ZipPath));
+                    return archives;
+                },
+                archives =>
+                {
+                    foreach (ZipArchive archive in archives.Values)
+                        archive.Dispose();
+                });
+        }
+        catch (AggregateException ae)
+        {
+            ExceptionDispatchInfo.Throw(ae.Flatten().InnerExceptions[0]);
         }
     }
 
+    private DicomFileMessage ReadZipEntry(ZipArchiveEntry entry, string zipFilePath)
+    {
+        using var stream = _streamManager.GetStream(nameof(ReadZipEntry), entry.Length);
+
+        using (Stream entryStream = entry.Open())
+            entryStream.CopyTo(stream);
+
+        stream.Position = 0;
+        DicomDataset ds = _headerReader.Open(stream);
+
+        // Large tags may be read from the stream on demand, so the message has to be built before the stream goes back to the pool
+        return DicomFileToMessage(ds, $"{zipFilePath}!{entry.FullName}", null);
+    }
+
     /// <summary>
     /// Creates a new <see cref="DicomFileMessage"/> by reading <paramref name="ds"/> tags
     /// </summary>
@@ -243,7 +487,7 @@ public abstract class TagReaderBase
 
         try
         {
-            DicomDataset filtered = new(ds.Where(i => i is not DicomOtherByteFragment).ToArray());
+            DicomDataset filtered = _headerReader.Filter(ds);
             serializedDataset = DicomTypeTranslater.SerializeDatasetToJson(filtered);
         }
         catch (Exception e)
@@ -264,27 +508,6 @@ public abstract class TagReaderBase
 
     }
 
-    private static byte[] ReadFully(Stream stream)
-    {
-        var buffer = new byte[32768];
-        int len;
-        try
-        {
-            len = (int)stream.Length;
-        }
-        catch
-        {
-            len = 32768;
-        }
-        using var ms = new MemoryStream(len);
-        while (true)
-        {
-            var read = stream.Read(buffer, 0, buffer.Length);
-            if (read <= 0)
-                return ms.ToArray();
-            ms.Write(buffer, 0, read);
-        }
-    }
     protected abstract List<DicomFileMessage> ReadTagsImpl(IEnumerable<FileInfo> dicomFilePaths,
         AccessionDirectoryMessage accMessage);
 
@@ -297,7 +520,7 @@ public abstract class TagReaderBase
     {
         try
         {
-            return DicomFileToMessage(DicomFile.Open(dicomFilePath.FullName, _fileReadOption).Dataset, dicomFilePath.FullName, dicomFilePath.Length);
+            return DicomFileToMessage(_headerReader.Open(dicomFilePath.FullName, _fileReadOption), dicomFilePath.FullName, dicomFilePath.Length);
         }
         catch (DicomFileException dfe)
         {
@@ -5,6 +5,7 @@ using SmiServices.Common.Messaging;
 using SmiServices.Common.Options;
 using System;
 using System.IO.Abstractions;
+using System.Threading.Tasks;
 
 
 namespace SmiServices.Microservices.FileCopier;
@@ -44,7 +45,7 @@ public class ExtractionFileCopier : IFileCopier
         _logger.Info($"fileSystemRoot={_fileSystemRoot}, extractionRoot={_extractionRoot}");
     }
 
-    public void ProcessMessage(
+    public Task ProcessMessage(
         ExtractFileMessage message,
         IMessageHeader header)
     {
@@ -60,8 +61,7 @@ public class ExtractionFileCopier : IFileCopier
                 Status = ExtractedFileStatus.FileMissing,
                 StatusMessage = $"Could not find '{fullSrc}'"
             };
-            _ = _copyStatusProducerModel.SendMessage(statusMessage, header, _options.NoVerifyRoutingKey);
-            return;
+            return _copyStatusProducerModel.SendMessageAsync(statusMessage, header, _options.NoVerifyRoutingKey);
         }
 
         string fullDest = _fileSystem.Path.Combine(_extractionRoot, message.ExtractionDirectory, message.OutputPath);
@@ -87,6 +87,6 @@ public class ExtractionFileCopier : IFileCopier
             Status = ExtractedFileStatus.Copied,
             OutputFilePath = message.OutputPath,
         };
-        _ = _copyStatusProducerModel.SendMessage(statusMessage, header, _options.NoVerifyRoutingKey);
+        return _copyStatusProducerModel.SendMessageAsync(statusMessage, header, _options.NoVerifyRoutingKey);
     }
 }
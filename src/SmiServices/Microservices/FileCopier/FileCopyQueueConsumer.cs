@@ -2,6 +2,7 @@ using SmiServices.Common.Messages;
 using SmiServices.Common.Messages.Extraction;
 using SmiServices.Common.Messaging;
 using System;
+using System.Threading.Tasks;
 
 namespace SmiServices.Microservices.FileCopier;
 
@@ -15,6 +16,9 @@ public class FileCopyQueueConsumer : Consumer<ExtractFileMessage>
         _fileCopier = fileCopier;
     }
 
+    /// <inheritdoc/>
+    public override bool IsThreadSafe => true;
+
     protected override void ProcessMessageImpl(
         IMessageHeader header,
         ExtractFileMessage message,
@@ -23,9 +27,11 @@ public class FileCopyQueueConsumer : Consumer<ExtractFileMessage>
         if (!message.IsIdentifiableExtraction)
             throw new ArgumentException("Received a message with IsIdentifiableExtraction not set");
 
+        Task statusConfirmed;
+
         try
         {
-            _fileCopier.ProcessMessage(message, header);
+            statusConfirmed = _fileCopier.ProcessMessage(message, header);
         }
         catch (ApplicationException e)
         {
@@ -34,6 +40,6 @@ public class FileCopyQueueConsumer : Consumer<ExtractFileMessage>
             return;
         }
 
-        Ack(header, tag);
+        AckWhenConfirmed(header, tag, statusConfirmed);
     }
 }
@@ -1,10 +1,17 @@
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messages.Extraction;
+using System.Threading.Tasks;
 
 
 namespace SmiServices.Microservices.FileCopier;
 
 public interface IFileCopier
 {
-    void ProcessMessage(ExtractFileMessage message, IMessageHeader header);
+    /// <summary>
+    /// Copies the file and sends its status message
+    /// </summary>
+    /// <param name="message"></param>
+    /// <param name="header"></param>
+    /// <returns>Task which completes once the status message has been confirmed</returns>
+    Task ProcessMessage(ExtractFileMessage message, IMessageHeader header);
 }
@@ -59,13 +59,18 @@ public class IdentifierMapperHost : MicroserviceHost
         _swapper.Setup(_consumerOptions);
         Logger.Info($"Swapper of type {_swapper.GetType()} created");
 
+        if (_swapper is SwapIdentifiers swapIdentifiers)
+            swapIdentifiers.ObserveMetrics();
+
         // Batching now handled implicitly as backlog demands
         _producerModel = MessageBroker.SetupProducer(options.IdentifierMapperOptions.AnonImagesProducerOptions!, isBatch: true);
 
-        Consumer = new IdentifierMapperQueueConsumer(_producerModel, _swapper)
-        {
-            AllowRegexMatching = options.IdentifierMapperOptions.AllowRegexMatching
-        };
+        Consumer = new IdentifierMapperQueueConsumer(_producerModel, _swapper);
+
+        if (_consumerOptions.SwapBatchSize > 1)
+            Consumer.BatchSwaps(
+                Math.Min(_consumerOptions.SwapBatchSize, Math.Max(1, (int)_consumerOptions.QoSPrefetchCount)),
+                _consumerOptions.SwapBatchTimeout ?? TimeSpan.FromMilliseconds(100));
 
         // Add our event handler for control messages
         AddControlHandler(new IdentifierMapperControlMessageHandler(_swapper));
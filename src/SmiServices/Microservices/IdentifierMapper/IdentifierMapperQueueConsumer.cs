@@ -1,5 +1,3 @@
-using DicomTypeTranslation;
-using FellowOakDicom;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
 using SmiServices.Microservices.IdentifierMapper.Swappers;
@@ -8,27 +6,36 @@ using System.Collections.Concurrent;
 using System.Collections.Generic;
 using System.Diagnostics.CodeAnalysis;
 using System.Linq;
-using System.Text.RegularExpressions;
 using System.Threading;
 
 namespace SmiServices.Microservices.IdentifierMapper;
 
 public class IdentifierMapperQueueConsumer : Consumer<DicomFileMessage>
 {
+    /// <summary>
+    /// No longer used: the PatientID is always rewritten in the JSON directly, by <see cref="PatientIdRewriter"/>
+    /// </summary>
+    [Obsolete("The PatientID is always rewritten in the JSON directly, so this has no effect")]
     public bool AllowRegexMatching { get; set; }
 
     private readonly IProducerModel _producer;
     private readonly ISwapIdentifiers _swapper;
-
-    private readonly Regex _patientIdRegex = new("\"00100020\":{\"vr\":\"LO\",\"Value\":\\[\"(\\d*)\"]", RegexOptions.IgnoreCase);
+    private readonly Func<string, string?> _substitute;
 
     private readonly BlockingCollection<Tuple<DicomFileMessage, IMessageHeader, ulong>> msgq = [];
     private readonly Thread acker;
 
+    // Only set if swaps are being batched
+    private Timer? _batchTimer;
+    private int _maxBatchSize;
+    private readonly List<(IMessageHeader Header, DicomFileMessage Message, ulong Tag)> _batch = [];
+    private readonly object _oBatchLock = new();
+
     public IdentifierMapperQueueConsumer(IProducerModel producer, ISwapIdentifiers swapper)
     {
         _producer = producer;
         _swapper = swapper;
+        _substitute = patientId => _swapper.GetSubstitutionFor(patientId, out _);
         acker = new Thread(() =>
           {
               try
@@ -69,36 +76,61 @@ public class IdentifierMapperQueueConsumer : Consumer<DicomFileMessage>
     }
 
     /// <summary>
-    /// Cleanly shut this process down, draining the Ack queue and ending that thread
+    /// Hold back messages until <paramref name="maxBatchSize"/> have arrived or <paramref name="maxDelay"/> has passed,
+    /// then swap all their identifiers with one call to <see cref="ISwapIdentifiers.GetSubstitutionsFor"/>
+    /// </summary>
+    /// <param name="maxBatchSize">Should be no more than the QoSPrefetchCount, or batches will only be sent on the timer</param>
+    /// <param name="maxDelay">Longest time a message is held back for</param>
+    public void BatchSwaps(int maxBatchSize, TimeSpan maxDelay)
+    {
+        if (maxBatchSize < 1)
+            throw new ArgumentOutOfRangeException(nameof(maxBatchSize), "Must be at least 1");
+        if (maxDelay <= TimeSpan.Zero)
+            throw new ArgumentOutOfRangeException(nameof(maxDelay), "Must be greater than 0");
+
+        _maxBatchSize = maxBatchSize;
+        _batchTimer = new Timer(_ => SwapBatchOnTimer(), null, maxDelay, maxDelay);
+    }
+
+    /// <summary>
+    /// Cleanly shut this process down, swapping any batched messages, draining the Ack queue and ending that thread
     /// </summary>
     public override void Shutdown()
     {
+        if (_batchTimer != null)
+        {
+            using var timerDisposed = new ManualResetEvent(false);
+            if (_batchTimer.Dispose(timerDisposed))
+                timerDisposed.WaitOne();
+            SwapBatch();
+        }
+
         msgq.CompleteAdding();
         acker.Join();
     }
 
     protected override void ProcessMessageImpl(IMessageHeader header, DicomFileMessage msg, ulong tag)
     {
-        string? errorReason = null;
-        var success = false;
-
-        try
+        if (_batchTimer != null)
         {
-            if (AllowRegexMatching)
+            bool full;
+            lock (_oBatchLock)
             {
-                Match match = _patientIdRegex.Match(msg.DicomDataset);
-
-                //Try to do swap using regex looking for a chi (10 digits in length)
-                if (match.Success)
-                {
-                    string patId = match.Groups[1].Value;
-                    if (!string.IsNullOrEmpty(patId) && patId.Trim().Length == 10)
-                        success = SwapIdentifier(msg, patId.Trim(), out errorReason);
-                }
+                _batch.Add((header, msg, tag));
+                full = _batch.Count >= _maxBatchSize;
             }
 
-            if (!success)
-                success = SwapIdentifier(msg, out errorReason);
+            if (full)
+                SwapBatch();
+            return;
+        }
+
+        bool success;
+        string? errorReason;
+
+        try
+        {
+            success = SwapIdentifier(msg, out errorReason);
         }
         catch (BadPatientIDException e)
         {
@@ -114,10 +146,7 @@ public class IdentifierMapperQueueConsumer : Consumer<DicomFileMessage>
         }
 
         if (!success)
-        {
-            Logger.Info($"Could not swap identifiers for message {header.MessageGuid}. Reason was: {errorReason}");
-            ErrorAndNack(header, tag, errorReason!, new Exception());
-        }
+            NotSwapped(header, tag, errorReason!);
         else
         {
             // Enqueue the outgoing message. Request will be acked by the queue handling thread above.
@@ -125,113 +154,133 @@ public class IdentifierMapperQueueConsumer : Consumer<DicomFileMessage>
         }
     }
 
-    private bool SwapIdentifier(DicomFileMessage msg, string patientId, out string? errorReason)
+    private void NotSwapped(IMessageHeader header, ulong tag, string reason)
     {
-        string? to = _swapper.GetSubstitutionFor(patientId, out errorReason);
-
-        if (to == null)
-        {
-            errorReason = $"Swapper {_swapper} returned null";
-            return false;
-        }
-
-        msg.DicomDataset = msg.DicomDataset.Replace($":[\"{patientId}\"]", $":[\"{to}\"]");
-
-        return true;
+        Logger.Info($"Could not swap identifiers for message {header.MessageGuid}. Reason was: {reason}");
+        ErrorAndNack(header, tag, reason, new Exception());
     }
 
-    /// <summary>
-    /// Swaps the patient ID in the <paramref name="msg"/> for its anonymous mapping.  Returns true if a mapping
-    /// was found or false if it was not possible to get a mapping for some reason (e.g. tag is missing or no mapping
-    /// was found).
-    /// </summary>
-    /// <param name="msg"></param>
-    /// <param name="reason"></param>
-    /// <returns></returns>
-    /// <exception cref="BadPatientIDException">Thrown if PatientID tag is corrupt</exception>
-    public bool SwapIdentifier(DicomFileMessage msg, [NotNullWhen(false)] out string? reason)
+    private void SwapBatchOnTimer()
     {
-        DicomDataset ds;
         try
         {
-            ds = DicomTypeTranslater.DeserializeJsonToDataset(msg.DicomDataset);
+            SwapBatch();
         }
         catch (Exception e)
         {
-            throw new ApplicationException("Failed to deserialize dataset", e);
-        }
-
-        if (!ds.Contains(DicomTag.PatientID))
-        {
-            reason = "Dataset did not contain PatientID";
-            return false;
+            // Not on a consumer thread, so nothing else would catch this
+            Fatal("Failed to swap a batch of identifiers", e);
         }
+    }
 
-        var from = GetPatientID(ds);
-
-        if (string.IsNullOrWhiteSpace(from))
+    /// <summary>
+    /// Swaps the identifiers of the batched messages together, then queues them to be sent and acked. Messages whose
+    /// PatientID can't be swapped are nacked individually. If the swap fails entirely, the remaining messages are
+    /// nacked and the exception rethrown
+    /// </summary>
+    private void SwapBatch()
+    {
+        // Held throughout so that batches are sent in the order they were received
+        lock (_oBatchLock)
         {
-            reason = "PatientID was blank";
-            return false;
-        }
-
-        string? to = _swapper.GetSubstitutionFor(from, out reason);
+            if (_batch.Count == 0)
+                return;
 
-        if (to == null)
-        {
-            reason = $"Swapper {_swapper} returned null";
-            return false;
-        }
+            List<(IMessageHeader Header, DicomFileMessage Message, ulong Tag, PatientIdRewriter.Location Location)> located = [];
 
-        // Update the JSON deserialized dicom dataset
-        ds.AddOrUpdate(DicomTag.PatientID, to);
+            // Tags of the messages which have been nacked or queued to be sent
+            HashSet<ulong> settled = [];
+            try
+            {
+                foreach (var (header, msg, tag) in _batch)
+                {
+                    PatientIdRewriter.Outcome outcome;
+                    PatientIdRewriter.Location? location;
+                    try
+                    {
+                        outcome = PatientIdRewriter.Locate(msg.DicomDataset, out location);
+                    }
+                    catch (Exception e) when (e is BadPatientIDException or ApplicationException)
+                    {
+                        ErrorAndNack(header, tag, "Error while processing DicomFileMessage", e);
+                        settled.Add(tag);
+                        continue;
+                    }
+
+                    if (location == null)
+                    {
+                        NotSwapped(header, tag, FailureReason(outcome));
+                        settled.Add(tag);
+                    }
+                    else
+                        located.Add((header, msg, tag, location));
+                }
 
-        string updatedJson;
+                var substitutions = located.Count == 0
+                    ? new Dictionary<string, string?>()
+                    : _swapper.GetSubstitutionsFor(located.Select(l => l.Location.PatientId).Distinct().ToList());
 
-        try
-        {
-            updatedJson = DicomTypeTranslater.SerializeDatasetToJson(ds);
-        }
-        catch (Exception e)
-        {
-            throw new ApplicationException("Failed to serialize dataset", e);
+                foreach (var (header, msg, tag, location) in located)
+                {
+                    var to = substitutions.GetValueOrDefault(location.PatientId);
+                    if (to == null)
+                    {
+                        NotSwapped(header, tag, FailureReason(PatientIdRewriter.Outcome.NoSubstitution));
+                        settled.Add(tag);
+                        continue;
+                    }
+
+                    msg.DicomDataset = location.Replace(to);
+                    msgq.Add(new Tuple<DicomFileMessage, IMessageHeader, ulong>(msg, header, tag));
+                    settled.Add(tag);
+                }
+            }
+            catch (Exception e)
+            {
+                // Otherwise they would be cleared from the batch without ever being acked or nacked
+                foreach (var (header, _, tag) in _batch)
+                    if (!settled.Contains(tag))
+                        ErrorAndNack(header, tag, "Error while swapping a batch of DicomFileMessages", e);
+                throw;
+            }
+            finally
+            {
+                _batch.Clear();
+                foreach (var l in located)
+                    l.Location.Dispose();
+            }
         }
+    }
 
+    private string FailureReason(PatientIdRewriter.Outcome outcome) => outcome switch
+    {
+        PatientIdRewriter.Outcome.Missing => "Dataset did not contain PatientID",
+        PatientIdRewriter.Outcome.Blank => "PatientID was blank",
+        _ => $"Swapper {_swapper} returned null",
+    };
 
-        // Unlikely, but should still check
-        if (updatedJson == null)
+    /// <summary>
+    /// Swaps the patient ID in the <paramref name="msg"/> for its anonymous mapping.  Returns true if a mapping
+    /// was found or false if it was not possible to get a mapping for some reason (e.g. tag is missing or no mapping
+    /// was found).
+    /// </summary>
+    /// <param name="msg"></param>
+    /// <param name="reason"></param>
+    /// <returns></returns>
+    /// <exception cref="BadPatientIDException">Thrown if PatientID tag is corrupt</exception>
+    public bool SwapIdentifier(DicomFileMessage msg, [NotNullWhen(false)] out string? reason)
+    {
+        var outcome = PatientIdRewriter.Rewrite(msg.DicomDataset, _substitute, out var rewritten);
+        if (outcome != PatientIdRewriter.Outcome.Rewritten)
         {
-            reason = "Updated json string was null";
+            reason = FailureReason(outcome);
             return false;
         }
 
-        // Override the message DicomDataset with the new serialized dataset
-        msg.DicomDataset = updatedJson;
+        // Override the message DicomDataset with the rewritten one
+        msg.DicomDataset = rewritten!;
 
+        reason = null;
         return true;
     }
-
-    private static string? GetPatientID(DicomDataset ds)
-    {
-        var val = DicomTypeTranslaterReader.GetCSharpValue(ds, DicomTag.PatientID);
-
-        switch (val)
-        {
-            case null:
-                return null;
-            case string s:
-                return s;
-            case string[] arr:
-                {
-                    var unique = arr.Where(a => !string.IsNullOrWhiteSpace(a)).Distinct().ToArray();
-                    if (unique.Length == 0)
-                        return null;
-                    if (unique.Length == 1)
-                        return unique[0];
-                    throw new BadPatientIDException($"DicomDataset had multiple values for PatientID:{string.Join("\\", arr)}");
-                }
-            default:
-                throw new BadPatientIDException($"DicomDataset had bad Type for PatientID:{val.GetType()}");
-        }
-    }
 }
@@ -0,0 +1,343 @@
+using System;
+using System.Buffers;
+using System.Collections.Generic;
+using System.Linq;
+using System.Text;
+using System.Text.Encodings.Web;
+using System.Text.Json;
+
+namespace SmiServices.Microservices.IdentifierMapper;
+
+/// <summary>
+/// Swaps the PatientID in a DICOM JSON dataset without deserializing it to a DicomDataset. The top-level 00100020
+/// element is found in a single forward pass, and only its value is rewritten: the rest of the JSON is copied as-is, so
+/// matching values elsewhere (e.g. in OtherPatientIDsSequence) are left alone
+/// </summary>
+public static class PatientIdRewriter
+{
+    public enum Outcome
+    {
+        Rewritten,
+        Located,
+        Missing,
+        Blank,
+        NoSubstitution,
+    }
+
+    private static ReadOnlySpan<byte> PatientIdTag => "00100020"u8;
+
+    // VRs which are read back as strings. Others (e.g. DA, IS, UL) would have given GetPatientID a different Type
+    private static readonly HashSet<string> _stringVRs = ["AE", "AS", "CS", "LO", "LT", "PN", "SH", "ST", "UC", "UI", "UR", "UT"];
+
+    // Sequences nest three levels per item, so allow for deeper datasets than the default of 64
+    private static readonly JsonReaderOptions _readerOptions = new() { MaxDepth = 256 };
+
+    private static readonly JsonWriterOptions _writerOptions = new()
+    {
+        // Closest to the Newtonsoft defaults, which only escape control and quote characters
+        Encoder = JavaScriptEncoder.UnsafeRelaxedJsonEscaping,
+    };
+
+    /// <summary>
+    /// Replaces the PatientID in <paramref name="json"/> with the result of <paramref name="substitute"/>
+    /// </summary>
+    /// <param name="json">The dataset, as in <see cref="Common.Messages.DicomFileMessage.DicomDataset"/></param>
+    /// <param name="substitute">Returns the replacement for a PatientID, or null if there is none</param>
+    /// <param name="rewritten">The updated JSON, if the outcome is <see cref="Outcome.Rewritten"/></param>
+    /// <returns></returns>
+    /// <exception cref="BadPatientIDException">Thrown if the PatientID has several different values or a non-string VR</exception>
+    /// <exception cref="ApplicationException">Thrown if <paramref name="json"/> is not a valid dataset</exception>
+    public static Outcome Rewrite(string json, Func<string, string?> substitute, out string? rewritten)
+    {
+        rewritten = null;
+
+        var outcome = Locate(json, out var location);
+        if (location == null)
+            return outcome;
+
+        using (location)
+        {
+            var to = substitute(location.PatientId);
+            if (to == null)
+                return Outcome.NoSubstitution;
+
+            rewritten = location.Replace(to);
+            return Outcome.Rewritten;
+        }
+    }
+
+    /// <summary>
+    /// Finds the PatientID in <paramref name="json"/>, so it can be replaced later. Lets the PatientIDs of several
+    /// datasets be swapped together without reading each dataset twice
+    /// </summary>
+    /// <param name="json">The dataset, as in <see cref="Common.Messages.DicomFileMessage.DicomDataset"/></param>
+    /// <param name="location">If the outcome is <see cref="Outcome.Located"/>, the PatientID and where it is. Must be disposed</param>
+    /// <returns></returns>
+    /// <exception cref="BadPatientIDException">Thrown if the PatientID has several different values or a non-string VR</exception>
+    /// <exception cref="ApplicationException">Thrown if <paramref name="json"/> is not a valid dataset</exception>
+    public static Outcome Locate(string json, out Location? location)
+    {
+        location = null;
+        var buffer = ArrayPool<byte>.Shared.Rent(Encoding.UTF8.GetMaxByteCount(json.Length));
+
+        try
+        {
+            var length = Encoding.UTF8.GetBytes(json, buffer);
+
+            int start, end;
+            string vr;
+            List<string> values;
+            bool personNames;
+            try
+            {
+                if (!TryFind(buffer.AsSpan(0, length), out start, out end, out vr, out values, out personNames))
+                    return Outcome.Missing;
+            }
+            catch (Exception e) when (e is JsonException or InvalidOperationException)
+            {
+                throw new ApplicationException("Failed to parse dataset", e);
+            }
+
+            var from = GetPatientID(values);
+            if (string.IsNullOrWhiteSpace(from))
+                return Outcome.Blank;
+
+            location = new Location(buffer, length, start, end, vr, personNames, from);
+            return Outcome.Located;
+        }
+        finally
+        {
+            // Otherwise the Location returns it
+            if (location == null)
+                ArrayPool<byte>.Shared.Return(buffer);
+        }
+    }
+
+    /// <summary>
+    /// The PatientID found in a dataset by <see cref="Locate"/>. Holds a pooled copy of the dataset until disposed
+    /// </summary>
+    public sealed class Location : IDisposable
+    {
+        public string PatientId { get; }
+
+        private byte[]? _utf8;
+        private readonly int _length;
+        private readonly int _start;
+        private readonly int _end;
+        private readonly string _vr;
+        private readonly bool _personNames;
+
+        internal Location(byte[] utf8, int length, int start, int end, string vr, bool personNames, string patientId)
+        {
+            _utf8 = utf8;
+            _length = length;
+            _start = start;
+            _end = end;
+            _vr = vr;
+            _personNames = personNames;
+            PatientId = patientId;
+        }
+
+        /// <summary>
+        /// Returns the dataset with <see cref="PatientId"/> replaced by <paramref name="to"/>
+        /// </summary>
+        /// <param name="to"></param>
+        /// <returns></returns>
+        public string Replace(string to)
+        {
+            ObjectDisposedException.ThrowIf(_utf8 == null, this);
+            return Splice(_utf8.AsSpan(0, _length), _start, _end, _vr, _personNames, to);
+        }
+
+        public void Dispose()
+        {
+            if (_utf8 == null)
+                return;
+
+            ArrayPool<byte>.Shared.Return(_utf8);
+            _utf8 = null;
+        }
+    }
+
+    /// <summary>
+    /// Find the byte range of the top-level PatientID element's value, and read its VR and values
+    /// </summary>
+    private static bool TryFind(ReadOnlySpan<byte> utf8, out int start, out int end, out string vr, out List<string> values, out bool personNames)
+    {
+        start = end = -1;
+        vr = "";
+        values = [];
+        personNames = false;
+
+        var reader = new Utf8JsonReader(utf8, _readerOptions);
+        if (!reader.Read() || reader.TokenType != JsonTokenType.StartObject)
+            throw new JsonException("Dataset was not a JSON object");
+
+        while (reader.Read() && reader.TokenType == JsonTokenType.PropertyName)
+        {
+            if (!reader.ValueTextEquals(PatientIdTag))
+            {
+                reader.Skip();
+                continue;
+            }
+
+            // A second copy would otherwise be left unswapped
+            if (start >= 0)
+                throw new JsonException("Dataset had more than one PatientID element");
+
+            reader.Read();
+            if (reader.TokenType != JsonTokenType.StartObject)
+                throw new JsonException($"Unexpected token {reader.TokenType} for PatientID");
+
+            start = (int)reader.TokenStartIndex;
+            vr = ReadElement(ref reader, values, out personNames);
+            end = (int)reader.BytesConsumed;
+        }
+
+        // Only now is the rest of the dataset known to be well formed
+        if (reader.TokenType != JsonTokenType.EndObject)
+            throw new JsonException($"Unexpected token {reader.TokenType} in dataset");
+
+        return start >= 0;
+    }
+
+    /// <summary>
+    /// Reads the PatientID element object, leaving <paramref name="reader"/> on its end
+    /// </summary>
+    /// <param name="reader"></param>
+    /// <param name="values"></param>
+    /// <param name="personNames">True if the values were PN objects rather than strings</param>
+    /// <returns>The VR</returns>
+    private static string ReadElement(ref Utf8JsonReader reader, List<string> values, out bool personNames)
+    {
+        string? vr = null;
+        personNames = false;
+
+        while (reader.Read() && reader.TokenType == JsonTokenType.PropertyName)
+        {
+            if (reader.ValueTextEquals("vr"u8))
+            {
+                reader.Read();
+                vr = reader.GetString();
+            }
+            else if (reader.ValueTextEquals("Value"u8))
+            {
+                reader.Read();
+                if (reader.TokenType != JsonTokenType.StartArray)
+                    throw new JsonException($"Unexpected token {reader.TokenType} for PatientID Value");
+
+                while (reader.Read() && reader.TokenType != JsonTokenType.EndArray)
+                {
+                    switch (reader.TokenType)
+                    {
+                        case JsonTokenType.String:
+                            // A value containing the DICOM separator is several values
+                            values.AddRange(reader.GetString()!.Split('\\'));
+                            break;
+                        case JsonTokenType.Null:
+                            values.Add("");
+                            break;
+                        case JsonTokenType.StartObject:
+                            values.Add(ReadPersonName(ref reader));
+                            personNames = true;
+                            break;
+                        default:
+                            throw new BadPatientIDException($"DicomDataset had bad Type for PatientID:{reader.TokenType}");
+                    }
+                }
+            }
+            else
+                reader.Skip();
+        }
+
+        if (vr == null)
+            throw new JsonException("PatientID had no VR");
+        if (!_stringVRs.Contains(vr))
+            throw new BadPatientIDException($"DicomDataset had bad VR for PatientID:{vr}");
+        if (personNames && vr != "PN")
+            throw new BadPatientIDException($"DicomDataset had bad Type for PatientID:{JsonTokenType.StartObject}");
+
+        return vr;
+    }
+
+    /// <summary>
+    /// Reads a PN value object, e.g. {"Alphabetic":"..."}, leaving <paramref name="reader"/> on its end. The component
+    /// groups are joined with '=' as when the dataset is deserialized
+    /// </summary>
+    private static string ReadPersonName(ref Utf8JsonReader reader)
+    {
+        string? alphabetic = null, ideographic = null, phonetic = null;
+
+        while (reader.Read() && reader.TokenType == JsonTokenType.PropertyName)
+        {
+            if (reader.ValueTextEquals("Alphabetic"u8))
+            {
+                reader.Read();
+                alphabetic = reader.GetString();
+            }
+            else if (reader.ValueTextEquals("Ideographic"u8))
+            {
+                reader.Read();
+                ideographic = reader.GetString();
+            }
+            else if (reader.ValueTextEquals("Phonetic"u8))
+            {
+                reader.Read();
+                phonetic = reader.GetString();
+            }
+            else
+                reader.Skip();
+        }
+
+        return string.Join('=', alphabetic, ideographic, phonetic).TrimEnd('=');
+    }
+
+    // Same rules as for the values of a deserialized dataset: blanks are ignored, but different values are an error
+    private static string? GetPatientID(List<string> values)
+    {
+        if (values.Count == 1)
+            return values[0];
+
+        var unique = values.Where(v => !string.IsNullOrWhiteSpace(v)).Distinct().ToArray();
+        if (unique.Length > 1)
+            throw new BadPatientIDException($"DicomDataset had multiple values for PatientID:{string.Join("\\", values)}");
+
+        return unique.FirstOrDefault();
+    }
+
+    private static string Splice(ReadOnlySpan<byte> utf8, int start, int end, string vr, bool personNames, string to)
+    {
+        var element = new ArrayBufferWriter<byte>(48 + to.Length * 3);
+        using (var writer = new Utf8JsonWriter(element, _writerOptions))
+        {
+            writer.WriteStartObject();
+            writer.WriteString("vr"u8, vr);
+            writer.WriteStartArray("Value"u8);
+            if (personNames)
+            {
+                // Kept in the same form as the original value
+                writer.WriteStartObject();
+                writer.WriteString("Alphabetic"u8, to);
+                writer.WriteEndObject();
+            }
+            else
+                writer.WriteStringValue(to);
+            writer.WriteEndArray();
+            writer.WriteEndObject();
+        }
+
+        var length = start + element.WrittenCount + utf8.Length - end;
+        var output = ArrayPool<byte>.Shared.Rent(length);
+        try
+        {
+            utf8[..start].CopyTo(output);
+            element.WrittenSpan.CopyTo(output.AsSpan(start));
+            utf8[end..].CopyTo(output.AsSpan(start + element.WrittenCount));
+            return Encoding.UTF8.GetString(output, 0, length);
+        }
+        finally
+        {
+            ArrayPool<byte>.Shared.Return(output);
+        }
+    }
+}
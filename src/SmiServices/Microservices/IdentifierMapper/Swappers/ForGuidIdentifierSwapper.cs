@@ -5,6 +5,7 @@ using SmiServices.Common.Options;
 using System;
 using System.Collections.Generic;
 using System.Data.Common;
+using System.Linq;
 using System.Text;
 using TypeGuesser;
 
@@ -114,6 +115,110 @@ public class ForGuidIdentifierSwapper : SwapIdentifiers
         }
     }
 
+    /// <summary>
+    /// Allocates guids for all the uncached values together: one insert of new rows and one select of the stored answers
+    /// for each chunk of values, in a single transaction
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns></returns>
+    public override IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap)
+    {
+        var answers = new Dictionary<string, string?>(toSwap.Count);
+        List<string> uncached = [];
+
+        lock (_oCacheLock)
+        {
+            foreach (var value in toSwap)
+            {
+                if (!answers.TryAdd(value, null))
+                    continue;
+
+                if (_swapColumnLength > 0 && value.Length > _swapColumnLength)
+                    Invalid++;
+                else if (_cachedAnswers.TryGetValue(value, out var cached))
+                {
+                    answers[value] = cached;
+                    CacheHit++;
+                    Success++;
+                }
+                else
+                    uncached.Add(value);
+            }
+
+            if (uncached.Count == 0)
+                return answers;
+
+            var syntax = _table!.GetQuerySyntaxHelper();
+            var table = _table.GetFullyQualifiedName();
+            var swapColumn = syntax.EnsureWrapped(_options!.SwapColumnName);
+            var replacementColumn = syntax.EnsureWrapped(_options.ReplacementColumnName);
+            var server = _table.Database.Server;
+
+            using (new TimeTracker(DatabaseStopwatch))
+            using (var con = server.BeginNewTransactedConnection())
+            {
+                // Two parameters per row for the insert
+                foreach (var chunk in uncached.Chunk(MaxQueryParameters / 2))
+                {
+                    var rows = string.Join(",", chunk.Select((_, i) => $"(@swap{i},@guid{i})"));
+                    var insertSql = _options.MappingDatabaseType switch
+                    {
+                        FAnsi.DatabaseType.MicrosoftSQLServer =>
+                            $"INSERT INTO {table}({swapColumn},{replacementColumn}) SELECT v.s, v.r FROM (VALUES {rows}) AS v(s, r) WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {swapColumn} = v.s)",
+                        FAnsi.DatabaseType.MySql =>
+                            $"INSERT IGNORE INTO {table}({swapColumn},{replacementColumn}) VALUES {rows}",
+                        FAnsi.DatabaseType.PostgreSql =>
+                            $"INSERT INTO {table}({swapColumn},{replacementColumn}) VALUES {rows} ON CONFLICT DO NOTHING",
+                        _ => throw new ArgumentOutOfRangeException(_options.MappingConnectionString)
+                    };
+
+                    DbCommand insert = server.GetCommand(insertSql, con);
+                    for (var i = 0; i < chunk.Length; ++i)
+                    {
+                        server.AddParameterWithValueToCommand($"@swap{i}", insert, chunk[i]);
+                        server.AddParameterWithValueToCommand($"@guid{i}", insert, Guid.NewGuid().ToString());
+                    }
+
+                    try
+                    {
+                        insert.ExecuteNonQuery();
+                    }
+                    catch (Exception e)
+                    {
+                        Invalid += chunk.Length;
+                        throw new Exception("Failed to perform lookup of toSwap with SQL:" + insertSql, e);
+                    }
+
+                    // Some of the values may have been allocated guids by someone else in the meantime, so read back what was stored
+                    var parameters = chunk.Select((_, i) => $"@swap{i}").ToArray();
+                    DbCommand select = server.GetCommand(
+                        $"SELECT {swapColumn}, {replacementColumn} FROM {table} WHERE {swapColumn} IN ({string.Join(",", parameters)})", con);
+                    for (var i = 0; i < chunk.Length; ++i)
+                        server.AddParameterWithValueToCommand(parameters[i], select, chunk[i]);
+
+                    Dictionary<string, string> stored = new(StringComparer.OrdinalIgnoreCase);
+                    using (var reader = select.ExecuteReader())
+                        while (reader.Read())
+                            stored.TryAdd(reader.GetString(0), reader.GetString(1));
+
+                    foreach (var value in chunk)
+                    {
+                        var syncAnswer = stored.GetValueOrDefault(value) ?? throw new Exception("Replacement value was null");
+                        _cachedAnswers.TryAdd(value, syncAnswer);
+                        answers[value] = syncAnswer;
+                    }
+                }
+
+                con.ManagedTransaction?.CommitAndCloseConnection();
+            }
+
+            Success += uncached.Count;
+            CacheMiss += uncached.Count;
+        }
+
+        return answers;
+    }
+
     /// <summary>
     /// Clears the in-memory cache of swap pairs
     /// </summary>
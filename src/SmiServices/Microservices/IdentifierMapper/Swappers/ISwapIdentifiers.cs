@@ -1,6 +1,7 @@
 using FAnsi.Discovery;
 using NLog;
 using SmiServices.Common.Options;
+using System.Collections.Generic;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
 
@@ -20,6 +21,14 @@ public interface ISwapIdentifiers
     /// <returns></returns>
     string? GetSubstitutionFor(string toSwap, out string? reason);
 
+    /// <summary>
+    /// Returns the substitution identifiers for several values at once, which swappers backed by a database can look
+    /// up together rather than one query per value
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns>An entry for each distinct value in <paramref name="toSwap"/>, which is null if no substitution is possible</returns>
+    IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap);
+
     /// <summary>
     /// Clear the mapping cache (if exists) and reload
     /// </summary>
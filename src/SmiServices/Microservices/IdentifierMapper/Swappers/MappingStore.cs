@@ -0,0 +1,218 @@
+using System;
+using System.Collections.Frozen;
+using System.Collections.Generic;
+using System.Diagnostics.CodeAnalysis;
+using System.Linq;
+using System.Text;
+
+namespace SmiServices.Microservices.IdentifierMapper.Swappers;
+
+/// <summary>
+/// An immutable map of identifiers to their replacements, packed to hold a whole mapping table in memory. Numeric keys
+/// (such as CHIs) are stored as longs in a sorted array, and all the values are stored as UTF-8 in one shared buffer,
+/// so a 10-digit key and value cost about 26 bytes rather than the 150 or so of a Dictionary of strings. Safe to read
+/// from several threads at once. Changes are made by <see cref="With"/>, which returns a new store
+/// </summary>
+public sealed class MappingStore
+{
+    // Keys of up to this many digits are packed into a long, with their length above the digits so leading zeros are kept
+    private const int MaxPackedDigits = 17;
+    private const int LengthShift = 57;
+
+    // Changes are held as strings until there are more than this, or 1/64th of the packed mappings, then packed too
+    private const int MinOverridesToPack = 4096;
+
+    private readonly long[] _packedKeys;
+    private readonly int[] _packedValues;
+    private readonly FrozenDictionary<string, int> _otherKeys;
+
+    // Value i is the UTF-8 bytes from _valueOffsets[i] to _valueOffsets[i + 1]
+    private readonly int[] _valueOffsets;
+    private readonly byte[] _valuePool;
+
+    // Added or changed by With, and take precedence over the packed mappings
+    private readonly FrozenDictionary<string, string> _overrides;
+
+    public int Count { get; }
+
+    private MappingStore(long[] packedKeys, int[] packedValues, FrozenDictionary<string, int> otherKeys, int[] valueOffsets, byte[] valuePool, FrozenDictionary<string, string> overrides)
+    {
+        _packedKeys = packedKeys;
+        _packedValues = packedValues;
+        _otherKeys = otherKeys;
+        _valueOffsets = valueOffsets;
+        _valuePool = valuePool;
+        _overrides = overrides;
+
+        Count = _packedKeys.Length + _otherKeys.Count + _overrides.Keys.Count(key => !TryGetIndex(key, out _));
+    }
+
+    public bool TryGetValue(string key, [NotNullWhen(true)] out string? value)
+    {
+        if (_overrides.TryGetValue(key, out value))
+            return true;
+
+        if (!TryGetIndex(key, out var index))
+        {
+            value = null;
+            return false;
+        }
+
+        value = GetValue(index);
+        return true;
+    }
+
+    /// <summary>
+    /// Returns a store with the mappings of this one, plus <paramref name="changes"/> which are added or replace the
+    /// existing values. This store is unchanged, and shares its packed mappings with the new one where it can
+    /// </summary>
+    /// <param name="changes"></param>
+    /// <returns></returns>
+    public MappingStore With(IEnumerable<KeyValuePair<string, string>> changes)
+    {
+        var overrides = new Dictionary<string, string>(_overrides);
+        foreach (var (key, value) in changes)
+            if (!TryGetValue(key, out var current) || current != value)
+                overrides[key] = value;
+
+        if (overrides.Count <= Math.Max(MinOverridesToPack, _packedKeys.Length / 64))
+            return new MappingStore(_packedKeys, _packedValues, _otherKeys, _valueOffsets, _valuePool, overrides.ToFrozenDictionary());
+
+        var builder = new Builder();
+        for (var i = 0; i < _packedKeys.Length; ++i)
+        {
+            var key = Unpack(_packedKeys[i]);
+            if (!overrides.ContainsKey(key))
+                builder.Add(key, GetValue(_packedValues[i]));
+        }
+
+        foreach (var (key, index) in _otherKeys)
+            if (!overrides.ContainsKey(key))
+                builder.Add(key, GetValue(index));
+
+        foreach (var (key, value) in overrides)
+            builder.Add(key, value);
+
+        return builder.Build();
+    }
+
+    private bool TryGetIndex(string key, out int index)
+    {
+        if (!TryPack(key, out var packed))
+            return _otherKeys.TryGetValue(key, out index);
+
+        var i = Array.BinarySearch(_packedKeys, packed);
+        index = i < 0 ? -1 : _packedValues[i];
+        return i >= 0;
+    }
+
+    private string GetValue(int index) =>
+        Encoding.UTF8.GetString(_valuePool, _valueOffsets[index], _valueOffsets[index + 1] - _valueOffsets[index]);
+
+    private static bool TryPack(string key, out long packed)
+    {
+        packed = 0;
+        if (key.Length == 0 || key.Length > MaxPackedDigits)
+            return false;
+
+        long digits = 0;
+        foreach (char c in key)
+        {
+            if (c is < '0' or > '9')
+                return false;
+            digits = digits * 10 + (c - '0');
+        }
+
+        packed = ((long)key.Length << LengthShift) | digits;
+        return true;
+    }
+
+    private static string Unpack(long packed)
+    {
+        var length = (int)(packed >> LengthShift);
+        return (packed & ((1L << LengthShift) - 1)).ToString().PadLeft(length, '0');
+    }
+
+    private static ArgumentException Duplicate(string key) => new($"Mapping table had more than one entry for '{key}'");
+
+    /// <summary>
+    /// Collects the mappings for a <see cref="MappingStore"/>
+    /// </summary>
+    public sealed class Builder
+    {
+        private long[] _packedKeys = new long[1024];
+        private int[] _packedValues = new int[1024];
+        private int _packedCount;
+        private readonly Dictionary<string, int> _otherKeys = [];
+
+        private int[] _valueOffsets = new int[1025];
+        private int _valueCount;
+        private byte[] _valuePool = new byte[16 * 1024];
+
+        /// <summary>
+        /// Adds the mapping of <paramref name="key"/> to <paramref name="value"/>
+        /// </summary>
+        /// <param name="key"></param>
+        /// <param name="value"></param>
+        /// <exception cref="ArgumentException">Thrown if a non-numeric <paramref name="key"/> has already been added. Duplicate numeric keys are found by <see cref="Build"/></exception>
+        public void Add(string key, string value)
+        {
+            var index = AddValue(value);
+
+            if (!TryPack(key, out var packed))
+            {
+                if (!_otherKeys.TryAdd(key, index))
+                    throw Duplicate(key);
+                return;
+            }
+
+            if (_packedCount == _packedKeys.Length)
+            {
+                Array.Resize(ref _packedKeys, _packedKeys.Length * 2);
+                Array.Resize(ref _packedValues, _packedValues.Length * 2);
+            }
+
+            _packedKeys[_packedCount] = packed;
+            _packedValues[_packedCount] = index;
+            ++_packedCount;
+        }
+
+        private int AddValue(string value)
+        {
+            var start = _valueOffsets[_valueCount];
+            var length = Encoding.UTF8.GetByteCount(value);
+
+            if ((long)start + length > Array.MaxLength)
+                throw new InvalidOperationException("Mapping table values were too large to hold in memory");
+            if (start + length > _valuePool.Length)
+                Array.Resize(ref _valuePool, (int)Math.Min(Array.MaxLength, Math.Max(2L * _valuePool.Length, start + length)));
+            if (_valueCount + 1 == _valueOffsets.Length)
+                Array.Resize(ref _valueOffsets, _valueOffsets.Length * 2);
+
+            Encoding.UTF8.GetBytes(value, _valuePool.AsSpan(start));
+            _valueOffsets[++_valueCount] = start + length;
+            return _valueCount - 1;
+        }
+
+        /// <summary>
+        /// Creates the store. The builder should not be used afterwards
+        /// </summary>
+        /// <returns></returns>
+        /// <exception cref="ArgumentException">Thrown if a numeric key was added more than once</exception>
+        public MappingStore Build()
+        {
+            Array.Resize(ref _packedKeys, _packedCount);
+            Array.Resize(ref _packedValues, _packedCount);
+            Array.Sort(_packedKeys, _packedValues);
+
+            for (var i = 1; i < _packedKeys.Length; ++i)
+                if (_packedKeys[i] == _packedKeys[i - 1])
+                    throw Duplicate(Unpack(_packedKeys[i]));
+
+            Array.Resize(ref _valueOffsets, _valueCount + 1);
+            Array.Resize(ref _valuePool, _valueOffsets[_valueCount]);
+
+            return new MappingStore(_packedKeys, _packedValues, _otherKeys.ToFrozenDictionary(), _valueOffsets, _valuePool, FrozenDictionary<string, string>.Empty);
+        }
+    }
+}
@@ -1,5 +1,6 @@
 using FAnsi.Discovery;
 using NLog;
+using Rdmp.Core.DataLoad.Triggers;
 using SmiServices.Common;
 using SmiServices.Common.Options;
 using System;
@@ -7,20 +8,32 @@ using System.Collections.Generic;
 using System.Data.Common;
 using System.Diagnostics;
 using System.Diagnostics.CodeAnalysis;
+using System.Linq;
+using System.Threading;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
 
 /// <summary>
-/// Connects to a database containing values to swap identifiers with, and loads it entirely into memory
+/// Connects to a database containing values to swap identifiers with, and loads it entirely into memory as a
+/// <see cref="MappingStore"/>. Reloads build a new store and publish it in one step, so lookups never take a lock.
+/// With <see cref="IMappingTableOptions.PreloadDeltaRefresh"/>, reloads only fetch the rows changed since the last one
 /// </summary>
-public class PreloadTableSwapper : SwapIdentifiers
+public class PreloadTableSwapper : SwapIdentifiers, IDisposable
 {
     private readonly ILogger _logger;
 
     private IMappingTableOptions? _options;
 
-    private Dictionary<string, string>? _mapping;
-    private readonly object _oDictionaryLock = new();
+    private volatile MappingStore? _mapping;
+
+    // Stops two reloads from running at once. Lookups carry on with the current store meanwhile
+    private readonly object _oLoadLock = new();
+
+    // The latest ValidFrom in the table when it was last read, if reloads are deltas
+    private bool _deltaRefresh;
+    private DateTime? _highWaterMark;
+
+    private Timer? _refreshTimer;
 
 
     public PreloadTableSwapper()
@@ -29,80 +42,197 @@ public class PreloadTableSwapper : SwapIdentifiers
     }
 
     /// <summary>
-    /// Preloads the swap table into memory
+    /// Preloads the swap table into memory, and starts refreshing it every <see cref="IMappingTableOptions.PreloadRefreshInterval"/> if set
     /// </summary>
     /// <param name="options"></param>
     [MemberNotNull(nameof(_mapping))]
     public override void Setup(IMappingTableOptions options)
     {
-        _logger.Info("Setting up mapping dictionary");
+        _logger.Info("Setting up mapping store");
+
+        lock (_oLoadLock)
+        {
+            _options = options;
+            _deltaRefresh = options.PreloadDeltaRefresh && HasValidFrom(options.Discover());
+            Load();
+        }
+
+        _refreshTimer?.Dispose();
+        _refreshTimer = null;
+
+        if (options.PreloadRefreshInterval is { } interval)
+        {
+            // Rearmed after each refresh, so a slow one isn't followed straight away by the next
+            _refreshTimer = new Timer(_ => RefreshOnTimer(interval));
+            _refreshTimer.Change(interval, Timeout.InfiniteTimeSpan);
+        }
+    }
+
+    private bool HasValidFrom(DiscoveredTable tbl)
+    {
+        if (tbl.DiscoverColumns().Any(c => c.GetRuntimeName().Equals(SpecialFieldNames.ValidFrom, StringComparison.OrdinalIgnoreCase)))
+            return true;
+
+        _logger.Warn($"Mapping table {tbl.GetFullyQualifiedName()} has no {SpecialFieldNames.ValidFrom} column, so will be reloaded in full on refresh");
+        return false;
+    }
+
+    /// <summary>
+    /// Reads the whole table into a new store
+    /// </summary>
+    [MemberNotNull(nameof(_mapping))]
+    private void Load()
+    {
+        using (new TimeTracker(DatabaseStopwatch))
+        {
+            DiscoveredTable tbl = _options!.Discover();
+
+            using DbConnection con = tbl.Database.Server.GetConnection();
+            con.Open();
+
+            // Read first, so rows which change during the load are fetched again by the next refresh
+            var highWaterMark = _deltaRefresh ? GetHighWaterMark(tbl, con) : null;
+
+            _logger.Debug("Populating store from mapping table...");
+            Stopwatch sw = Stopwatch.StartNew();
+
+            var builder = new MappingStore.Builder();
+            ReadMappings(tbl, con, null, builder.Add);
 
+            _mapping = builder.Build();
+            _highWaterMark = highWaterMark;
+
+            _logger.Debug("Mapping store populated with " + _mapping.Count + " entries in " + sw.Elapsed.ToString("g"));
+        }
+    }
+
+    /// <summary>
+    /// Reads the rows changed since the last load, and publishes them with the rest of the mappings as a new store
+    /// </summary>
+    private void LoadChanges()
+    {
         using (new TimeTracker(DatabaseStopwatch))
-            lock (_oDictionaryLock)
-            {
-                _options = options;
+        {
+            DiscoveredTable tbl = _options!.Discover();
 
-                DiscoveredTable tbl = options.Discover();
+            using DbConnection con = tbl.Database.Server.GetConnection();
+            con.Open();
 
-                using DbConnection con = tbl.Database.Server.GetConnection();
-                con.Open();
+            var highWaterMark = GetHighWaterMark(tbl, con);
 
-                string sql =
-                    $"SELECT {options.SwapColumnName}, {options.ReplacementColumnName} FROM {tbl.GetFullyQualifiedName()}";
-                _logger.Debug($"SQL: {sql}");
+            Stopwatch sw = Stopwatch.StartNew();
 
-                DbCommand cmd = tbl.Database.Server.GetCommand(sql, con);
-                cmd.CommandTimeout = _options.TimeoutInSeconds;
+            List<KeyValuePair<string, string>> changes = [];
+            ReadMappings(tbl, con, _highWaterMark, (key, value) => changes.Add(new KeyValuePair<string, string>(key, value)));
 
-                DbDataReader dataReader = cmd.ExecuteReader();
+            _mapping = _mapping!.With(changes);
 
-                _mapping = [];
+            _logger.Debug($"Applied {changes.Count} rows changed since {_highWaterMark:s} to mapping store in {sw.Elapsed:g}");
+            _highWaterMark = highWaterMark;
+        }
+    }
+
+    private DateTime? GetHighWaterMark(DiscoveredTable tbl, DbConnection con)
+    {
+        var syntax = tbl.GetQuerySyntaxHelper();
+        using DbCommand cmd = tbl.Database.Server.GetCommand(
+            $"SELECT MAX({syntax.EnsureWrapped(SpecialFieldNames.ValidFrom)}) FROM {tbl.GetFullyQualifiedName()}",
+            con);
+        cmd.CommandTimeout = _options!.TimeoutInSeconds;
+
+        return cmd.ExecuteScalar() is DateTime mark ? mark : null;
+    }
+
+    private void ReadMappings(DiscoveredTable tbl, DbConnection con, DateTime? changedSince, Action<string, string> add)
+    {
+        string sql =
+            $"SELECT {_options!.SwapColumnName}, {_options.ReplacementColumnName} FROM {tbl.GetFullyQualifiedName()}";
+        if (changedSince != null)
+            sql += $" WHERE {tbl.GetQuerySyntaxHelper().EnsureWrapped(SpecialFieldNames.ValidFrom)} >= @changedSince";
+        _logger.Debug($"SQL: {sql}");
+
+        using DbCommand cmd = tbl.Database.Server.GetCommand(sql, con);
+        cmd.CommandTimeout = _options.TimeoutInSeconds;
+        if (changedSince != null)
+            tbl.Database.Server.AddParameterWithValueToCommand("@changedSince", cmd, changedSince.Value);
+
+        using DbDataReader dataReader = cmd.ExecuteReader();
+
+        var swapColumn = dataReader.GetOrdinal(_options.SwapColumnName!);
+        var replacementColumn = dataReader.GetOrdinal(_options.ReplacementColumnName!);
+
+        while (dataReader.Read())
+            add(dataReader.GetValue(swapColumn).ToString()!, dataReader.GetValue(replacementColumn).ToString()!);
+    }
+
+    private void Refresh()
+    {
+        if (_options == null)
+            throw new ApplicationException("ClearCache called before mapping options set");
 
-                _logger.Debug("Populating dictionary from mapping table...");
-                Stopwatch sw = Stopwatch.StartNew();
+        lock (_oLoadLock)
+            if (_deltaRefresh && _mapping != null)
+                LoadChanges();
+            else
+                Load();
+    }
 
-                while (dataReader.Read())
-                    _mapping.Add(dataReader[_options.SwapColumnName!].ToString()!, dataReader[_options.ReplacementColumnName!].ToString()!);
+    private void RefreshOnTimer(TimeSpan interval)
+    {
+        try
+        {
+            _logger.Debug("Refreshing mapping store");
+            Refresh();
+        }
+        catch (Exception e)
+        {
+            _logger.Error(e, "Failed to refresh mapping store, carrying on with the current mappings");
+        }
 
-                _logger.Debug("Mapping dictionary populated with " + _mapping.Count + " entries in " + sw.Elapsed.ToString("g"));
-            }
+        try
+        {
+            _refreshTimer?.Change(interval, Timeout.InfiniteTimeSpan);
+        }
+        catch (ObjectDisposedException)
+        {
+            // Stopped by Setup or Dispose
+        }
     }
 
     public override string? GetSubstitutionFor(string toSwap, out string? reason)
     {
-        lock (_oDictionaryLock)
+        if (!_mapping!.TryGetValue(toSwap, out var result))
         {
-            if (!_mapping!.ContainsKey(toSwap))
-            {
-                reason = "PatientID was not in mapping table";
-                Fail++;
-                CacheMiss++;
-                return null;
-            }
-
-            reason = null;
+            reason = "PatientID was not in mapping table";
+            Interlocked.Increment(ref Fail);
+            Interlocked.Increment(ref CacheMiss);
+            return null;
         }
 
-        Success++;
-        CacheHit++;
-        return _mapping[toSwap];
+        reason = null;
+        Interlocked.Increment(ref Success);
+        Interlocked.Increment(ref CacheHit);
+        return result;
     }
 
     /// <summary>
-    /// Clears the cached table and reloads it from the database
+    /// Reloads the table from the database, or only the rows changed since it was last read if
+    /// <see cref="IMappingTableOptions.PreloadDeltaRefresh"/> is set. Lookups use the current mappings until it is done
     /// </summary>
     public override void ClearCache()
     {
         _logger.Debug("Clearing cache and reloading");
-
-        if (_options == null)
-            throw new ApplicationException("ClearCache called before mapping options set");
-
-        Setup(_options);
+        Refresh();
     }
 
     public override DiscoveredTable? GetGuidTableIfAny(IMappingTableOptions options)
     {
         return null;
     }
+
+    public void Dispose()
+    {
+        GC.SuppressFinalize(this);
+        _refreshTimer?.Dispose();
+    }
 }
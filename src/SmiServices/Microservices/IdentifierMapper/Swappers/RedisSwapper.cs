@@ -5,6 +5,8 @@ using SmiServices.Common.Options;
 using StackExchange.Redis;
 using System;
 using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.Linq;
 using System.Threading;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
@@ -112,6 +114,84 @@ public class RedisSwapper : SwapIdentifiers, IDisposable
         return result;
     }
 
+    /// <summary>
+    /// Looks up the values missing from memory with one Redis read, and those missing from Redis with one call to the
+    /// hosted swapper
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns></returns>
+    public override IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap)
+    {
+        var answers = new Dictionary<string, string?>(toSwap.Count);
+        List<string> uncached = [];
+
+        foreach (var value in toSwap)
+        {
+            if (!answers.TryAdd(value, null))
+                continue;
+
+            if (_cache.TryGetValue(value, out string? result))
+            {
+                answers[value] = result;
+                Interlocked.Increment(ref CacheHit);
+            }
+            else
+                uncached.Add(value);
+        }
+
+        if (uncached.Count > 0)
+        {
+            IDatabase db = _redis.GetDatabase();
+            var stored = db.StringGet(uncached.Select(v => (RedisKey)v).ToArray());
+
+            List<string> misses = [];
+            for (var i = 0; i < uncached.Count; ++i)
+                if (stored[i].HasValue)
+                {
+                    answers[uncached[i]] = stored[i].ToString();
+                    Interlocked.Increment(ref CacheHit);
+                }
+                else
+                {
+                    misses.Add(uncached[i]);
+                    Interlocked.Increment(ref CacheMiss);
+                }
+
+            if (misses.Count > 0)
+            {
+                IReadOnlyDictionary<string, string?> found;
+                lock (_hostedSwapper)
+                {
+                    found = _hostedSwapper.GetSubstitutionsFor(misses);
+                }
+
+                //cache the results (even if they are null - no lookup match found)
+                var results = misses.Select(v => new KeyValuePair<RedisKey, RedisValue>(v, found.GetValueOrDefault(v) ?? NullString)).ToArray();
+                db.StringSet(results);
+                for (var i = 0; i < misses.Count; ++i)
+                    answers[misses[i]] = results[i].Value.ToString();
+            }
+
+            foreach (var value in uncached)
+                _cache.Set(value, answers[value] ?? NullString, new MemoryCacheEntryOptions
+                {
+                    Size = 1
+                });
+        }
+
+        foreach (var value in answers.Keys.ToArray())
+        {
+            if (string.Equals(NullString, answers[value]))
+                answers[value] = null;
+
+            if (answers[value] == null)
+                Interlocked.Increment(ref Fail);
+            else if (Interlocked.Increment(ref Success) % 1000 == 0)
+                LogProgress(_logger, LogLevel.Info);
+        }
+
+        return answers;
+    }
 
     public override void ClearCache()
     {
@@ -1,6 +1,8 @@
 using FAnsi.Discovery;
 using NLog;
+using SmiServices.Common.Metrics;
 using SmiServices.Common.Options;
+using System.Collections.Generic;
 using System.Diagnostics;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
@@ -18,8 +20,27 @@ public abstract class SwapIdentifiers : ISwapIdentifiers
 
     public abstract void Setup(IMappingTableOptions mappingTableOptions);
 
+    // Kept under the 2100 parameter limit of SQL Server
+    protected const int MaxQueryParameters = 2000;
+
     public abstract string? GetSubstitutionFor(string toSwap, out string? reason);
 
+    /// <summary>
+    /// Looks up each distinct value with <see cref="GetSubstitutionFor"/>. Override to look them up together
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns></returns>
+    public virtual IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap)
+    {
+        var answers = new Dictionary<string, string?>(toSwap.Count);
+
+        foreach (var value in toSwap)
+            if (!answers.ContainsKey(value))
+                answers.Add(value, GetSubstitutionFor(value, out _));
+
+        return answers;
+    }
+
     public abstract void ClearCache();
 
     public virtual void LogProgress(ILogger logger, LogLevel level)
@@ -28,4 +49,15 @@ public abstract class SwapIdentifiers : ISwapIdentifiers
     }
 
     public abstract DiscoveredTable? GetGuidTableIfAny(IMappingTableOptions options);
+
+    /// <summary>
+    /// Exposes the cache and database counts through <see cref="SmiMetrics"/>
+    /// </summary>
+    public void ObserveMetrics()
+    {
+        var name = GetType().Name;
+        SmiMetrics.SwapperCacheHits.Observe(() => CacheHit, name);
+        SmiMetrics.SwapperCacheMisses.Observe(() => CacheMiss, name);
+        SmiMetrics.SwapperDatabaseSeconds.Observe(() => DatabaseStopwatch.Elapsed.TotalSeconds, name);
+    }
 }
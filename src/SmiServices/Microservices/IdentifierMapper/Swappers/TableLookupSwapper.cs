@@ -1,16 +1,21 @@
 using FAnsi.Discovery;
+using Microsoft.Extensions.Caching.Memory;
 using NLog;
 using SmiServices.Common;
 using SmiServices.Common.Options;
 using System;
+using System.Collections.Generic;
 using System.Data.Common;
+using System.Linq;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
 
 /// <summary>
-/// Connects to a database containing values to swap identifiers with. Keeps a single cache of the last seen value
+/// Connects to a database containing values to swap identifiers with. Keeps a cache of recently swapped values (and
+/// optionally of values with no match), bounded by <see cref="IMappingTableOptions.LookupCacheSize"/>, and looks up
+/// the rest with a prepared query on a long-lived connection
 /// </summary>
-public class TableLookupSwapper : SwapIdentifiers
+public class TableLookupSwapper : SwapIdentifiers, IDisposable
 {
 
     private readonly ILogger _logger = LogManager.GetCurrentClassLogger();
@@ -18,10 +23,21 @@ public class TableLookupSwapper : SwapIdentifiers
     private DiscoveredServer? _server;
     private IMappingTableOptions? _options;
     private DiscoveredTable? _swapTable;
+    private string? _lookupSql;
+    private int _swapColumnLength;
 
-    // Simple cache of the last swap pair
-    private string? _lastKey;
-    private string? _lastVal;
+    // Evicts the least recently used entries once full
+    private MemoryCache? _cache;
+    private MemoryCacheEntryOptions? _cacheEntryOptions;
+    private bool _cacheMisses;
+
+    // Cached for values with no match
+    private static readonly object _noMatch = new();
+
+    // Reopened if a query on it fails
+    private readonly object _oConnectionLock = new();
+    private DbConnection? _connection;
+    private DbCommand? _lookup;
 
 
     public override void Setup(IMappingTableOptions options)
@@ -32,63 +48,224 @@ public class TableLookupSwapper : SwapIdentifiers
 
         if (!_swapTable.Exists())
             throw new ArgumentException($"Swap table '{_swapTable.GetFullyQualifiedName()}' did not exist on server '{_server}'");
+
+        var syntax = _server.GetQuerySyntaxHelper();
+        _lookupSql = $"SELECT {syntax.EnsureWrapped(options.ReplacementColumnName)} FROM {_swapTable.GetFullyQualifiedName()} WHERE {syntax.EnsureWrapped(options.SwapColumnName)}=@val";
+        _swapColumnLength = _swapTable.DiscoverColumn(options.SwapColumnName ?? throw new ArgumentException("SwapColumnName must be set"))
+            .DataType?.GetLengthIfString() ?? -1;
+
+        _cache?.Dispose();
+        _cache = options.LookupCacheSize > 0 ? new MemoryCache(new MemoryCacheOptions { SizeLimit = options.LookupCacheSize }) : null;
+        _cacheEntryOptions = new MemoryCacheEntryOptions
+        {
+            Size = 1,
+            AbsoluteExpirationRelativeToNow = options.LookupCacheTimeout,
+        };
+        _cacheMisses = options.CacheLookupMisses;
+
+        CloseConnection();
     }
 
     public override string? GetSubstitutionFor(string toSwap, out string? reason)
     {
         reason = null;
 
-        // If the cached key matches, return the last value
-        if (string.Equals(toSwap, _lastKey) && _lastVal != null)
+        if (_cache != null && _cache.TryGetValue(toSwap, out object? cached))
         {
             _logger.Debug("Using cached swap value");
 
             CacheHit++;
-            Success++;
-
-            return _lastVal;
+            return Answer(toSwap, cached as string, out reason);
         }
 
         CacheMiss++;
 
-        // Else fall through to the database lookup
-        using (new TimeTracker(DatabaseStopwatch))
-        using (DbConnection con = _server!.GetConnection())
+        var result = WithConnection(Lookup, toSwap);
+        Cache(toSwap, result);
+
+        return Answer(toSwap, result, out reason);
+    }
+
+    /// <summary>
+    /// Looks up the uncached values with one query per <see cref="SwapIdentifiers.MaxQueryParameters"/> values, rather than one each
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns></returns>
+    public override IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap)
+    {
+        var answers = new Dictionary<string, string?>(toSwap.Count);
+        List<string> uncached = [];
+
+        foreach (var value in toSwap)
         {
-            con.Open();
+            if (!answers.TryAdd(value, null))
+                continue;
+
+            if (_cache != null && _cache.TryGetValue(value, out object? cached))
+            {
+                CacheHit++;
+                answers[value] = cached as string;
+            }
+            else
+            {
+                CacheMiss++;
+                uncached.Add(value);
+            }
+        }
+
+        foreach (var chunk in uncached.Chunk(MaxQueryParameters))
+            foreach (var (value, answer) in WithConnection(LookupMany, chunk))
+            {
+                answers[value] = answer;
+                Cache(value, answer);
+            }
 
-            string sql =
-                $"SELECT {_server.GetQuerySyntaxHelper().EnsureWrapped(_options!.ReplacementColumnName)} FROM {_swapTable!.GetFullyQualifiedName()} WHERE {_server.GetQuerySyntaxHelper().EnsureWrapped(_options.SwapColumnName)}=@val";
+        foreach (var answer in answers.Values)
+            if (answer == null)
+                ++Fail;
+            else
+                ++Success;
 
-            DbCommand cmd = _server.GetCommand(sql, con);
-            _server.AddParameterWithValueToCommand("@val", cmd, toSwap);
+        return answers;
+    }
 
-            object? result = cmd.ExecuteScalar();
+    private string? Answer(string toSwap, string? result, out string? reason)
+    {
+        if (result == null)
+        {
+            reason = $"No match found for '{toSwap}'";
+            Fail++;
+            return null;
+        }
+
+        reason = null;
+        ++Success;
+        return result;
+    }
+
+    private void Cache(string toSwap, string? result)
+    {
+        if (_cache != null && (result != null || _cacheMisses))
+            _cache.Set(toSwap, result ?? _noMatch, _cacheEntryOptions);
+    }
 
-            if (result == DBNull.Value || result == null)
+    /// <summary>
+    /// Runs <paramref name="query"/> on the long-lived connection, opening it if needed. If the query fails, the
+    /// connection may have been dropped since it was last used, so it is tried once more on a new connection
+    /// </summary>
+    private TResult WithConnection<TArg, TResult>(Func<DbConnection, TArg, TResult> query, TArg arg)
+    {
+        lock (_oConnectionLock)
+            using (new TimeTracker(DatabaseStopwatch))
             {
-                reason = $"No match found for '{toSwap}'";
-                Fail++;
-                return null;
+                try
+                {
+                    return query(OpenConnection(), arg);
+                }
+                catch (Exception e) when (e is DbException or InvalidOperationException)
+                {
+                    _logger.Warn(e, "Lookup failed, retrying on a new connection");
+                    CloseConnection();
+                    return query(OpenConnection(), arg);
+                }
             }
+    }
 
-            _lastKey = toSwap;
-            _lastVal = result.ToString();
+    private DbConnection OpenConnection()
+    {
+        if (_connection != null)
+            return _connection;
 
-            ++Success;
+        _connection = _server!.GetConnection();
+        _connection.Open();
+        return _connection;
+    }
 
-            return _lastVal;
+    private void CloseConnection()
+    {
+        lock (_oConnectionLock)
+        {
+            _lookup?.Dispose();
+            _lookup = null;
+            _connection?.Dispose();
+            _connection = null;
+        }
+    }
+
+    private string? Lookup(DbConnection con, string toSwap)
+    {
+        // Longer values can't be in the column, and would be truncated to fit the prepared parameter
+        if (_swapColumnLength > 0 && toSwap.Length > _swapColumnLength)
+            return null;
+
+        if (_lookup == null)
+        {
+            _lookup = _server!.GetCommand(_lookupSql!, con);
+            _server.AddParameterWithValueToCommand("@val", _lookup, "");
+
+            // SQL Server can only prepare commands whose string parameters have a size
+            if (_swapColumnLength > 0)
+            {
+                _lookup.Parameters[0].Size = _swapColumnLength;
+                _lookup.Prepare();
+            }
         }
+
+        _lookup.Parameters[0].Value = toSwap;
+        object? result = _lookup.ExecuteScalar();
+
+        return result == DBNull.Value || result == null ? null : result.ToString();
+    }
+
+    private Dictionary<string, string?> LookupMany(DbConnection con, string[] toSwap)
+    {
+        var syntax = _server!.GetQuerySyntaxHelper();
+        var swapColumn = syntax.EnsureWrapped(_options!.SwapColumnName);
+        var replacementColumn = syntax.EnsureWrapped(_options.ReplacementColumnName);
+
+        var parameters = toSwap.Select((_, i) => $"@val{i}").ToArray();
+        using DbCommand cmd = _server.GetCommand(
+            $"SELECT {swapColumn}, {replacementColumn} FROM {_swapTable!.GetFullyQualifiedName()} WHERE {swapColumn} IN ({string.Join(",", parameters)})",
+            con);
+        for (var i = 0; i < toSwap.Length; ++i)
+            _server.AddParameterWithValueToCommand(parameters[i], cmd, toSwap[i]);
+
+        // Rows are matched back to the values by the database's comparison (which may ignore case), so look
+        // for an exact match first
+        Dictionary<string, string> exact = [];
+        Dictionary<string, string> ignoringCase = new(StringComparer.OrdinalIgnoreCase);
+        using (var reader = cmd.ExecuteReader())
+            while (reader.Read())
+            {
+                if (reader.IsDBNull(0) || reader.IsDBNull(1))
+                    continue;
+
+                var key = reader.GetValue(0).ToString()!;
+                var value = reader.GetValue(1).ToString()!;
+                exact.TryAdd(key, value);
+                ignoringCase.TryAdd(key, value);
+            }
+
+        return toSwap.ToDictionary(
+            value => value,
+            value => exact.TryGetValue(value, out var answer) || ignoringCase.TryGetValue(value, out answer) ? answer : null);
     }
 
     public override void ClearCache()
     {
-        _lastVal = null;
-        _logger.Debug("ClearCache called, single value cache cleared");
+        _cache?.Clear();
+        _logger.Debug("ClearCache called, lookup cache cleared");
     }
 
     public override DiscoveredTable? GetGuidTableIfAny(IMappingTableOptions options)
     {
         return null;
     }
+
+    public void Dispose()
+    {
+        GC.SuppressFinalize(this);
+        CloseConnection();
+        _cache?.Dispose();
+    }
 }
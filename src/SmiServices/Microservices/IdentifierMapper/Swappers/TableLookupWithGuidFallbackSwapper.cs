@@ -1,6 +1,9 @@
 using FAnsi.Discovery;
 using NLog;
 using SmiServices.Common.Options;
+using System;
+using System.Collections.Generic;
+using System.Linq;
 
 namespace SmiServices.Microservices.IdentifierMapper.Swappers;
 
@@ -10,7 +13,7 @@ namespace SmiServices.Microservices.IdentifierMapper.Swappers;
 ///
 /// <para>The Guid mapping table will be the mapping table name with the suffix <see cref="GuidTableSuffix"/> (i.e. <see cref="IMappingTableOptions.MappingTableName"/> + suffix)</para>
 /// </summary>
-public class TableLookupWithGuidFallbackSwapper : SwapIdentifiers
+public class TableLookupWithGuidFallbackSwapper : SwapIdentifiers, IDisposable
 {
     /// <summary>
     /// Determines the name to give/expect for the substitution table when the lookup misses.  The name will be
@@ -83,6 +86,26 @@ public class TableLookupWithGuidFallbackSwapper : SwapIdentifiers
         return !string.IsNullOrWhiteSpace(answer) ? answer : _guidSwapper.GetSubstitutionFor(toSwap, out reason);
     }
 
+    /// <summary>
+    /// Looks up all the values in the wrapped <see cref="TableLookupSwapper"/>, then allocates guids for the misses
+    /// with the wrapped <see cref="ForGuidIdentifierSwapper"/>, so each swapper makes one set of queries
+    /// </summary>
+    /// <param name="toSwap"></param>
+    /// <returns></returns>
+    public override IReadOnlyDictionary<string, string?> GetSubstitutionsFor(IReadOnlyCollection<string> toSwap)
+    {
+        var answers = new Dictionary<string, string?>(_tableSwapper.GetSubstitutionsFor(toSwap));
+
+        var misses = answers.Where(kvp => string.IsNullOrWhiteSpace(kvp.Value)).Select(kvp => kvp.Key).ToList();
+        if (misses.Count == 0)
+            return answers;
+
+        foreach (var (value, guid) in _guidSwapper.GetSubstitutionsFor(misses))
+            answers[value] = guid;
+
+        return answers;
+    }
+
     /// <summary>
     /// Calls <see cref="ISwapIdentifiers.ClearCache"/> on both wrapped swappers (guid and lookup)
     /// </summary>
@@ -97,4 +120,10 @@ public class TableLookupWithGuidFallbackSwapper : SwapIdentifiers
         _tableSwapper.LogProgress(logger, level);
         _guidSwapper.LogProgress(logger, level);
     }
+
+    public void Dispose()
+    {
+        GC.SuppressFinalize(this);
+        _tableSwapper.Dispose();
+    }
 }
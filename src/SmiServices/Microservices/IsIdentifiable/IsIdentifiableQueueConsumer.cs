@@ -92,9 +92,9 @@ public class IsIdentifiableQueueConsumer : Consumer<ExtractedFileStatusMessage>,
             Status = status,
             Report = report,
         };
-        _producer.SendMessage(response, header, routingKey: null);
+        var responseConfirmed = _producer.SendMessageAsync(response, header, routingKey: null);
 
-        Ack(header, tag);
+        AckWhenConfirmed(header, tag, responseConfirmed);
     }
 
     public void Dispose()
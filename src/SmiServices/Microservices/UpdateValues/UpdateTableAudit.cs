@@ -1,4 +1,5 @@
 using FAnsi.Discovery;
+using SmiServices.Common.Metrics;
 using System.Diagnostics;
 using System.Threading;
 
@@ -41,6 +42,14 @@ public class UpdateTableAudit
     public UpdateTableAudit(DiscoveredTable? t)
     {
         Table = t;
+
+        if (t != null)
+        {
+            var name = t.GetFullyQualifiedName();
+            SmiMetrics.UpdateQueries.Observe(() => Queries, name);
+            SmiMetrics.UpdateAffectedRows.Observe(() => AffectedRows, name);
+            SmiMetrics.UpdateSeconds.Observe(() => Stopwatch.Elapsed.TotalSeconds, name);
+        }
     }
 
 
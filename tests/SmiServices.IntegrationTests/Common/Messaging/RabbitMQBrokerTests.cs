@@ -2,6 +2,7 @@ using Moq;
 using NUnit.Framework;
 using NUnit.Framework.Internal;
 using SmiServices.Common.Messages;
+using SmiServices.Common.MessageSerialization;
 using SmiServices.Common.Messaging;
 using SmiServices.Common.Options;
 using SmiServices.UnitTests.Common;
@@ -274,6 +275,51 @@ public class RabbitMQBrokerTests
         Assert.That(fatalCalled, Is.False);
     }
 
+    [Test]
+    public void HandleMessage_CorruptCompressedBody_IsDiscarded()
+    {
+        // Arrange
+
+        var globalOptions = GlobalOptionsForTest();
+        var consumerOptions = TestConsumerOptions();
+        using var tester = new MicroserviceTester(globalOptions.RabbitOptions!, consumerOptions);
+        using var model = tester.Broker.GetModel(TestContext.CurrentContext.Test.Name);
+        model.ConfirmSelect();
+
+        var corruptProperties = model.CreateBasicProperties();
+        corruptProperties.ContentEncoding = MessageBodyEncoding.GZipContentEncoding;
+        corruptProperties.Headers = new Dictionary<string, object>();
+        new MessageHeader().Populate(corruptProperties.Headers);
+
+        var validProperties = model.CreateBasicProperties();
+        validProperties.Headers = new Dictionary<string, object>();
+        new MessageHeader().Populate(validProperties.Headers);
+
+        // With a prefetch of 1, the valid message is only delivered once the corrupt one has been settled
+        var mockConsumer = new Mock<IConsumer<AccessionDirectoryMessage>>(MockBehavior.Strict);
+        mockConsumer.SetupProperty(x => x.QoSPrefetchCount);
+        var processed = false;
+        mockConsumer
+            .Setup(x => x.ProcessMessage(It.IsAny<IMessageHeader>(), It.IsAny<AccessionDirectoryMessage>(), It.IsAny<ulong>()))
+            .Callback(() => processed = true);
+        var fatalCalled = false;
+        mockConsumer.Object.OnFatal += (sender, args) => fatalCalled = true;
+
+        var broker = new RabbitMQBroker(globalOptions.RabbitOptions!, "RabbitMQBrokerTests");
+        broker.StartConsumer(consumerOptions, mockConsumer.Object);
+
+        // Act
+
+        model.BasicPublish("TEST.TestExchange", "", mandatory: true, corruptProperties, Encoding.UTF8.GetBytes("not gzip"));
+        model.BasicPublish("TEST.TestExchange", "", mandatory: true, validProperties, JsonConvert.SerializeToUtf8Bytes(new AccessionDirectoryMessage { DirectoryPath = "foo" }));
+        model.WaitForConfirms();
+
+        // Assert
+
+        TestTimelineAwaiter.Await(() => processed);
+        Assert.That(fatalCalled, Is.False);
+    }
+
     [Test]
     public void HandleControlMessage_HappyPath_IsOk()
     {
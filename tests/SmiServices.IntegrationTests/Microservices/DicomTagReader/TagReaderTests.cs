@@ -48,10 +48,13 @@ public class TagReaderTests
     /// Test that the TagReader behaves properly depending on the NackIfAnyFileErrors option
     /// </summary>
     /// <param name="nackIfAnyFileErrors"></param>
+    /// <param name="streamingQueueSize"></param>
     [Test]
-    [TestCase(true)]
-    [TestCase(false)]
-    public void TestNackIfAnyFileErrorsOption(bool nackIfAnyFileErrors)
+    [TestCase(true, 0)]
+    [TestCase(false, 0)]
+    [TestCase(true, 1)]
+    [TestCase(false, 1)]
+    public void TestNackIfAnyFileErrorsOption(bool nackIfAnyFileErrors, int streamingQueueSize)
     {
         var messagesSent = 0;
 
@@ -61,6 +64,7 @@ public class TagReaderTests
         Assert.That(_helper.TestDir.EnumerateFiles("*.dcm").Count(), Is.EqualTo(2));
 
         _helper.Options.DicomTagReaderOptions!.NackIfAnyFileErrors = nackIfAnyFileErrors;
+        _helper.Options.DicomTagReaderOptions.StreamingQueueSize = streamingQueueSize;
         _helper.Options.FileSystemOptions!.FileSystemRoot = _helper.TestDir.FullName;
         _helper.TestAccessionDirectoryMessage.DirectoryPath = _helper.TestDir.FullName;
 
@@ -143,7 +147,10 @@ public class TagReaderTests
             .Callback<IMessage, IMessageHeader, string>((m, h, s) => message = m)
             .Returns(new MessageHeader());
 
-        var tagReader = new SerialTagReader(_helper.Options.DicomTagReaderOptions!, _helper.Options.FileSystemOptions, _helper.TestSeriesModel.Object, _helper.TestImageModel.Object, new FileSystem());
+        _helper.Options.DicomTagReaderOptions!.MaxIoThreads = 4;
+        TagReaderBase tagReader = parallel
+            ? new ParallelTagReader(_helper.Options.DicomTagReaderOptions, _helper.Options.FileSystemOptions, _helper.TestSeriesModel.Object, _helper.TestImageModel.Object, new FileSystem())
+            : new SerialTagReader(_helper.Options.DicomTagReaderOptions, _helper.Options.FileSystemOptions, _helper.TestSeriesModel.Object, _helper.TestImageModel.Object, new FileSystem());
         tagReader.ReadTags(new MessageHeader(), _helper.TestAccessionDirectoryMessage);
 
         Assert.That(message, Is.Not.EqualTo(null));
@@ -156,8 +163,10 @@ public class TagReaderTests
     /// <summary>
     /// Tests that we can read a mixture of zip files and dcm files using <see cref="TagReaderBase"/>
     /// </summary>
-    [Test]
-    public void TestSeriesMessageImagesInSeriesCorrect_WhenUsingZips()
+    /// <param name="parallel">Whether to read the entries with a <see cref="ParallelTagReader"/></param>
+    [TestCase(false)]
+    [TestCase(true)]
+    public void TestSeriesMessageImagesInSeriesCorrect_WhenUsingZips(bool parallel)
     {
         _helper.Options.FileSystemOptions!.FileSystemRoot = _helper.TestDir.FullName;
         _helper.TestAccessionDirectoryMessage.DirectoryPath = _helper.TestDir.FullName;
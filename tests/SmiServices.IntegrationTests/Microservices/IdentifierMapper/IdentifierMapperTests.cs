@@ -72,6 +72,65 @@ public class IdentifierMapperTests : DatabaseTests
         AssertDicomFileMessageHasPatientID(msg, "020202");
     }
 
+    [TestCase(DatabaseType.MicrosoftSQLServer)]
+    [TestCase(DatabaseType.MySql)]
+    [TestCase(DatabaseType.PostgreSql)]
+    public void TestPreloadDeltaRefresh(DatabaseType type)
+    {
+        var mappingDataTable = new DataTable("IdMap");
+        mappingDataTable.Columns.Add("priv");
+        mappingDataTable.Columns.Add("pub");
+        mappingDataTable.Columns.Add("hic_validFrom", typeof(DateTime));
+        mappingDataTable.Rows.Add("010101", "020202", new DateTime(2020, 1, 1));
+        mappingDataTable.Rows.Add("030303", "040404", new DateTime(2020, 1, 1));
+
+        PostgresFixes.GetCleanedServerPostgresFix(TestDatabaseSettings, type);
+        var db = GetCleanedServer(type);
+        var table = db.CreateTable("IdMap", mappingDataTable);
+
+        var options = new IdentifierMapperOptions
+        {
+            MappingConnectionString = db.Server.Builder.ConnectionString,
+            MappingTableSchema = table.Schema,
+            MappingTableName = table.GetRuntimeName(),
+            SwapColumnName = "priv",
+            ReplacementColumnName = "pub",
+            MappingDatabaseType = type,
+            TimeoutInSeconds = 500,
+            PreloadDeltaRefresh = true,
+        };
+
+        var swapper = new PreloadTableSwapper();
+        swapper.Setup(options);
+
+        table.Insert(new Dictionary<string, object>
+        {
+            { "priv", "050505" },
+            { "pub", "060606" },
+            { "hic_validFrom", new DateTime(2021, 1, 1) },
+        });
+
+        using (var con = db.Server.GetConnection())
+        {
+            con.Open();
+            var syntax = db.Server.GetQuerySyntaxHelper();
+            using var cmd = db.Server.GetCommand(
+                $"UPDATE {table.GetFullyQualifiedName()} SET {syntax.EnsureWrapped("pub")}='070707', {syntax.EnsureWrapped("hic_validFrom")}=@validFrom WHERE {syntax.EnsureWrapped("priv")}='010101'",
+                con);
+            db.Server.AddParameterWithValueToCommand("@validFrom", cmd, new DateTime(2021, 1, 1));
+            cmd.ExecuteNonQuery();
+        }
+
+        swapper.ClearCache();
+
+        Assert.Multiple(() =>
+        {
+            Assert.That(swapper.GetSubstitutionFor("010101", out _), Is.EqualTo("070707"));
+            Assert.That(swapper.GetSubstitutionFor("030303", out _), Is.EqualTo("040404"));
+            Assert.That(swapper.GetSubstitutionFor("050505", out _), Is.EqualTo("060606"));
+        });
+    }
+
     [TestCase(DatabaseType.MicrosoftSQLServer, Test.Normal)]
     [TestCase(DatabaseType.MicrosoftSQLServer, Test.ProperlyFormatedChi)]
     [TestCase(DatabaseType.MySql, Test.Normal)]
@@ -106,8 +165,10 @@ public class IdentifierMapperTests : DatabaseTests
 
         var consumer = new IdentifierMapperQueueConsumer(Mock.Of<IProducerModel>(), swapper)
         {
+#pragma warning disable CS0618 // Obsolete
             AllowRegexMatching = true
         };
+#pragma warning restore CS0618
 
         var msg = GetTestDicomFileMessage(test);
         consumer.SwapIdentifier(msg, out _);
@@ -194,7 +255,9 @@ public class IdentifierMapperTests : DatabaseTests
 
         Task.WaitAll([.. tasks]);
 
+#pragma warning disable CS0618 // Obsolete
         options.IdentifierMapperOptions.AllowRegexMatching = true;
+#pragma warning restore CS0618
 
         using (var tester = new MicroserviceTester(options.RabbitOptions!, options.IdentifierMapperOptions))
         {
@@ -217,7 +280,9 @@ public class IdentifierMapperTests : DatabaseTests
             host.Stop("Test finished");
         }
 
+#pragma warning disable CS0618 // Obsolete
         options.IdentifierMapperOptions.AllowRegexMatching = false;
+#pragma warning restore CS0618
 
         using (var tester = new MicroserviceTester(options.RabbitOptions!, options.IdentifierMapperOptions))
         {
@@ -673,7 +738,7 @@ public class IdentifierMapperTests : DatabaseTests
             Assert.That(swapper.CacheHit, Is.EqualTo(2));
         });
 
-        // Just to make sure...
+        // Still cached, as the cache holds more than the last value
 
         swapped = swapper.GetSubstitutionFor("CHI-1", out _);
         Assert.Multiple(() =>
@@ -681,7 +746,59 @@ public class IdentifierMapperTests : DatabaseTests
             Assert.That(swapped, Is.EqualTo("REP-1"));
 
             Assert.That(swapper.Success, Is.EqualTo(5));
-            Assert.That(swapper.CacheHit, Is.EqualTo(2));
+            Assert.That(swapper.CacheHit, Is.EqualTo(3));
+        });
+
+        // Until the cache is cleared
+
+        swapper.ClearCache();
+        swapped = swapper.GetSubstitutionFor("CHI-1", out _);
+        Assert.Multiple(() =>
+        {
+            Assert.That(swapped, Is.EqualTo("REP-1"));
+
+            Assert.That(swapper.Success, Is.EqualTo(6));
+            Assert.That(swapper.CacheHit, Is.EqualTo(3));
+        });
+    }
+
+    [Test]
+    public void TestSwapCache_Misses()
+    {
+        var mappingDataTable = new DataTable("IdMap");
+        mappingDataTable.Columns.Add("priv");
+        mappingDataTable.Columns.Add("pub");
+
+        mappingDataTable.Rows.Add("CHI-1", "REP-1");
+
+        DiscoveredDatabase db = GetCleanedServer(DatabaseType.MicrosoftSQLServer);
+        var table = db.CreateTable("IdMap", mappingDataTable);
+
+        var options = new IdentifierMapperOptions
+        {
+            MappingConnectionString = db.Server.Builder.ConnectionString,
+            MappingTableSchema = table.Schema,
+            MappingTableName = table.GetRuntimeName(),
+            SwapColumnName = "priv",
+            ReplacementColumnName = "pub",
+            MappingDatabaseType = DatabaseType.MicrosoftSQLServer,
+            TimeoutInSeconds = 500,
+            CacheLookupMisses = true,
+        };
+
+        using var swapper = new TableLookupSwapper();
+        swapper.Setup(options);
+
+        var first = swapper.GetSubstitutionFor("CHI-2", out _);
+        var second = swapper.GetSubstitutionFor("CHI-2", out var reason);
+        Assert.Multiple(() =>
+        {
+            Assert.That(first, Is.Null);
+            Assert.That(second, Is.Null);
+            Assert.That(reason, Is.EqualTo("No match found for 'CHI-2'"));
+
+            Assert.That(swapper.Fail, Is.EqualTo(2));
+            Assert.That(swapper.CacheHit, Is.EqualTo(1));
         });
     }
 }
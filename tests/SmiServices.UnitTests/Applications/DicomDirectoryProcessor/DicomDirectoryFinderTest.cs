@@ -20,8 +20,9 @@ public class DicomDirectoryFinderTest
     {
     }
 
-    [Test]
-    public void FindingAccessionDirectory()
+    [TestCase(1)]
+    [TestCase(4)]
+    public void FindingAccessionDirectory(int maxDegreeOfParallelism)
     {
         var fileSystem = new MockFileSystem(new Dictionary<string, MockFileData>
         {
@@ -42,7 +43,10 @@ public class DicomDirectoryFinderTest
 
         string rootDir = Path.GetFullPath("/PACS");
         var mockProducerModel = new Mock<IProducerModel>();
-        var ddf = new BasicDicomDirectoryFinder(rootDir, fileSystem, "*.dcm", mockProducerModel.Object);
+        var ddf = new BasicDicomDirectoryFinder(rootDir, fileSystem, "*.dcm", mockProducerModel.Object)
+        {
+            MaxDegreeOfParallelism = maxDegreeOfParallelism,
+        };
         ddf.SearchForDicomDirectories(rootDir);
 
         mockProducerModel.Verify(pm => pm.SendMessage(m1, null, It.IsAny<string>()));
@@ -0,0 +1,221 @@
+using NUnit.Framework;
+using SmiServices.Applications.DicomDirectoryProcessor.DirectoryFinders;
+using System;
+using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.Linq;
+using System.Threading;
+using System.Threading.Tasks;
+
+namespace SmiServices.UnitTests.Applications.DicomDirectoryProcessor;
+
+internal class DirectoryCrawlerTests
+{
+    private static readonly TimeSpan _timeout = TimeSpan.FromSeconds(30);
+
+    /// <summary>
+    /// A tree of directory names, where the children of each directory are given by <see cref="Children"/>
+    /// </summary>
+    private sealed class Tree
+    {
+        public readonly Dictionary<string, List<string>> Children = [];
+
+        public void Add(string parent, string child)
+        {
+            if (!Children.TryGetValue(parent, out var children))
+                Children[parent] = children = [];
+            children.Add(child);
+            Children.TryAdd(child, []);
+        }
+
+        public IEnumerable<string> All => Children.Keys;
+
+        // A chain of the given depth, with a wide branch of leaves every 100 levels
+        public static Tree DeepAndUnbalanced(int depth)
+        {
+            var tree = new Tree();
+            tree.Children["d0"] = [];
+            for (var i = 0; i < depth; ++i)
+            {
+                tree.Add($"d{i}", $"d{i + 1}");
+                if (i % 100 == 0)
+                    for (var j = 0; j < 50; ++j)
+                        tree.Add($"d{i}", $"w{i}-{j}");
+            }
+            return tree;
+        }
+
+        public static Tree Wide(int children, int grandchildren)
+        {
+            var tree = new Tree();
+            tree.Children["root"] = [];
+            for (var i = 0; i < children; ++i)
+                for (var j = 0; j < grandchildren; ++j)
+                    tree.Add($"root/{i}", $"root/{i}/{j}");
+            for (var i = 0; i < children; ++i)
+                tree.Add("root", $"root/{i}");
+            return tree;
+        }
+    }
+
+    private static void CrawlWithTimeout(DirectoryCrawler crawler, IReadOnlyList<string> roots, Func<string, IEnumerable<string>> visit, CancellationToken cancellationToken = default)
+    {
+        var crawl = Task.Run(() => crawler.Crawl(roots, visit, cancellationToken));
+        Assert.That(crawl.Wait(_timeout), Is.True, "Crawl did not finish");
+    }
+
+    [TestCase(1)]
+    [TestCase(4)]
+    public void Crawl_DeepUnbalancedTree_VisitsEachOnceAndFinishes(int parallelism)
+    {
+        // Arrange
+        var tree = Tree.DeepAndUnbalanced(2000);
+        var crawler = new DirectoryCrawler(parallelism);
+        var visits = new ConcurrentDictionary<string, int>();
+
+        // Act
+        CrawlWithTimeout(crawler, ["d0"], dir =>
+        {
+            visits.AddOrUpdate(dir, 1, (_, n) => n + 1);
+            return tree.Children[dir];
+        });
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(visits.Keys, Is.EquivalentTo(tree.All));
+            Assert.That(visits.Values, Is.All.EqualTo(1));
+            Assert.That(crawler.Snapshot(), Is.Empty);
+        });
+    }
+
+    [Test]
+    public void Crawl_WithStealing_VisitsEachOnceOnSeveralThreads()
+    {
+        // Arrange
+        var tree = Tree.Wide(64, 8);
+        var crawler = new DirectoryCrawler(4);
+        var visits = new ConcurrentDictionary<string, int>();
+        var threads = new ConcurrentDictionary<int, byte>();
+
+        // Act
+        CrawlWithTimeout(crawler, ["root"], dir =>
+        {
+            visits.AddOrUpdate(dir, 1, (_, n) => n + 1);
+            threads.TryAdd(Environment.CurrentManagedThreadId, 0);
+
+            // Slow enough that the other threads have to steal from the one which visited the root
+            Thread.Sleep(1);
+            return tree.Children[dir];
+        });
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(visits.Keys, Is.EquivalentTo(tree.All));
+            Assert.That(visits.Values, Is.All.EqualTo(1));
+            Assert.That(threads, Has.Count.GreaterThan(1));
+            Assert.That(crawler.LargestBacklog, Is.GreaterThanOrEqualTo(64));
+        });
+    }
+
+    [Test]
+    public void Crawl_VisitThrows_RethrowsAndStopsOtherWorkers()
+    {
+        // Arrange
+        var tree = Tree.Wide(1000, 0);
+        var crawler = new DirectoryCrawler(4);
+        var visitCount = 0;
+        string? failedDir = null;
+        var error = new InvalidOperationException("Could not list directory");
+
+        // Act
+        var crawl = Task.Run(() => crawler.Crawl("root", dir =>
+        {
+            if (Interlocked.Increment(ref visitCount) == 10)
+            {
+                failedDir = dir;
+                throw error;
+            }
+
+            Thread.Sleep(1);
+            return tree.Children[dir];
+        }, CancellationToken.None));
+
+        // Assert
+        var exc = Assert.Throws<AggregateException>(() => crawl.Wait(_timeout));
+        Assert.Multiple(() =>
+        {
+            Assert.That(exc!.InnerException, Is.SameAs(error));
+            Assert.That(visitCount, Is.LessThan(tree.Children.Count));
+
+            // The failed directory is kept, so it is retried if the crawl is resumed
+            Assert.That(crawler.Snapshot(), Does.Contain(failedDir));
+        });
+    }
+
+    [TestCase(1)]
+    [TestCase(4)]
+    public void Crawl_Cancelled_StopsAndSnapshotResumesTheRest(int parallelism)
+    {
+        // Arrange
+        var tree = Tree.DeepAndUnbalanced(500);
+        var crawler = new DirectoryCrawler(parallelism);
+        var firstVisits = new ConcurrentDictionary<string, int>();
+        using var cts = new CancellationTokenSource();
+
+        CrawlWithTimeout(crawler, ["d0"], dir =>
+        {
+            if (firstVisits.Count >= 100)
+                cts.Cancel();
+
+            firstVisits.AddOrUpdate(dir, 1, (_, n) => n + 1);
+            return tree.Children[dir];
+        }, cts.Token);
+
+        // Act
+        var frontier = crawler.Snapshot();
+        var secondVisits = new ConcurrentDictionary<string, int>();
+        CrawlWithTimeout(new DirectoryCrawler(parallelism), frontier, dir =>
+        {
+            secondVisits.AddOrUpdate(dir, 1, (_, n) => n + 1);
+            return tree.Children[dir];
+        });
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(firstVisits.Count, Is.LessThan(tree.Children.Count));
+            Assert.That(frontier, Is.Not.Empty);
+            Assert.That(firstVisits.Keys.Intersect(secondVisits.Keys), Is.Empty);
+            Assert.That(firstVisits.Keys.Concat(secondVisits.Keys), Is.EquivalentTo(tree.All));
+        });
+    }
+
+    [Test]
+    public void Snapshot_DuringVisit_IncludesVisitingAndQueuedDirectories()
+    {
+        // Arrange
+        var tree = Tree.Wide(3, 0);
+        var crawler = new DirectoryCrawler(1);
+        List<string>? snapshot = null;
+
+        // Act
+        CrawlWithTimeout(crawler, ["root"], dir =>
+        {
+            // The children are visited last first, so root/1 is visited while root/0 is still queued
+            if (dir == "root/1")
+                snapshot = crawler.Snapshot();
+            return tree.Children[dir];
+        });
+
+        // Assert
+        Assert.That(snapshot, Is.EquivalentTo(new[] { "root/1", "root/0" }));
+    }
+
+    [Test]
+    public void Constructor_NoParallelism_Throws()
+    {
+        Assert.Throws<ArgumentOutOfRangeException>(() => _ = new DirectoryCrawler(0));
+    }
+}
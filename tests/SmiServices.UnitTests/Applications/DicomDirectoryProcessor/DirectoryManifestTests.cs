@@ -0,0 +1,161 @@
+using Moq;
+using NUnit.Framework;
+using SmiServices.Applications.DicomDirectoryProcessor.DirectoryFinders;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Messaging;
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.IO.Abstractions.TestingHelpers;
+
+namespace SmiServices.UnitTests.Applications.DicomDirectoryProcessor;
+
+internal class DirectoryManifestTests
+{
+    private static readonly string _manifestPath = Path.GetFullPath("/manifest.tsv");
+
+    private static MockFileSystem CreateFileSystem() => new(new Dictionary<string, MockFileData>
+    {
+        { Path.GetFullPath("/PACS/a/1/x.dcm"), new MockFileData([0x12, 0x34, 0x56, 0xd2]) },
+        { Path.GetFullPath("/PACS/b/2/y.dcm"), new MockFileData([0x12, 0x34, 0x56, 0xd2]) },
+    });
+
+    [Test]
+    public void Record_IsReloaded()
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        var lastWrite = new DateTime(2020, 1, 1, 0, 0, 0, DateTimeKind.Utc);
+
+        using (var manifest = new DirectoryManifest(fileSystem, _manifestPath))
+        {
+            manifest.Record("a\tb", lastWrite, 3);
+            manifest.Record("a\tb", lastWrite, 4);
+        }
+
+        // Act
+        using var reloaded = new DirectoryManifest(fileSystem, _manifestPath);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(reloaded.Count, Is.EqualTo(1));
+            Assert.That(reloaded.HasChanged("a\tb", lastWrite, 4), Is.False);
+            Assert.That(reloaded.HasChanged("a\tb", lastWrite, 3), Is.True);
+            Assert.That(reloaded.HasChanged("a\tb", lastWrite.AddSeconds(1), 4), Is.True);
+            Assert.That(reloaded.HasChanged("other", lastWrite, 4), Is.True);
+            Assert.That(fileSystem.File.ReadAllLines(_manifestPath), Has.Length.EqualTo(1));
+        });
+    }
+
+    [TestCase("c\t63")]
+    [TestCase("c\t637134336000000000\t2\t63713433")]
+    public void Constructor_TornLastLine_IsDropped(string tornLine)
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        var lastWrite = new DateTime(2020, 1, 1, 0, 0, 0, DateTimeKind.Utc);
+        fileSystem.AddFile(_manifestPath, new MockFileData(
+            $"a\t{lastWrite.Ticks}\t1\t{lastWrite.Ticks}\nb\t{lastWrite.Ticks}\t2\t{lastWrite.Ticks}\n{tornLine}"));
+
+        // Act
+        using (var manifest = new DirectoryManifest(fileSystem, _manifestPath))
+            manifest.Record("c", lastWrite, 3);
+        using var reloaded = new DirectoryManifest(fileSystem, _manifestPath);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(reloaded.Count, Is.EqualTo(3));
+            Assert.That(reloaded.HasChanged("a", lastWrite, 1), Is.False);
+            Assert.That(reloaded.HasChanged("b", lastWrite, 2), Is.False);
+            Assert.That(reloaded.HasChanged("c", lastWrite, 3), Is.False);
+            Assert.That(fileSystem.File.ReadAllLines(_manifestPath), Has.Length.EqualTo(3));
+        });
+    }
+
+    [Test]
+    public void Constructor_CorruptMiddleLine_Throws()
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        var ticks = new DateTime(2020, 1, 1, 0, 0, 0, DateTimeKind.Utc).Ticks;
+        fileSystem.AddFile(_manifestPath, new MockFileData($"a\t{ticks}\t1\t{ticks}\nb\tgarbage\nc\t{ticks}\t3\t{ticks}\n"));
+
+        // Act
+        // Assert
+        Assert.Throws<InvalidDataException>(() => _ = new DirectoryManifest(fileSystem, _manifestPath));
+    }
+
+    [Test]
+    public void Checkpoint_IsOnlyReturnedForSameRoot()
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        using var manifest = new DirectoryManifest(fileSystem, _manifestPath);
+
+        // Act
+        manifest.Checkpoint("/PACS", ["/PACS/a", "/PACS/b"]);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(manifest.GetFrontier("/PACS"), Is.EqualTo(new[] { "/PACS/a", "/PACS/b" }));
+            Assert.That(manifest.GetFrontier("/OTHER"), Is.Empty);
+        });
+
+        manifest.CompleteScan();
+        Assert.That(manifest.GetFrontier("/PACS"), Is.Empty);
+    }
+
+    [Test]
+    public void SearchForDicomDirectories_WithManifest_OnlySendsChangedDirectories()
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        string rootDir = Path.GetFullPath("/PACS");
+        using var manifest = new DirectoryManifest(fileSystem, _manifestPath);
+        var mockProducerModel = new Mock<IProducerModel>();
+        var ddf = new BasicDicomDirectoryFinder(rootDir, fileSystem, "*.dcm", mockProducerModel.Object)
+        {
+            Manifest = manifest,
+        };
+        ddf.SearchForDicomDirectories(rootDir);
+
+        fileSystem.AddFile(Path.GetFullPath("/PACS/b/2/z.dcm"), new MockFileData([0x12, 0x34, 0x56, 0xd2]));
+        mockProducerModel.Invocations.Clear();
+
+        // Act
+        ddf.SearchForDicomDirectories(rootDir);
+
+        // Assert
+        var changed = new AccessionDirectoryMessage { DirectoryPath = "b/2".Replace('/', Path.DirectorySeparatorChar) };
+        mockProducerModel.Verify(pm => pm.SendMessage(It.IsAny<IMessage>(), null, It.IsAny<string>()), Times.Once);
+        mockProducerModel.Verify(pm => pm.SendMessage(changed, null, It.IsAny<string>()));
+    }
+
+    [Test]
+    public void SearchForDicomDirectories_WithCheckpoint_ResumesFromIt()
+    {
+        // Arrange
+        var fileSystem = CreateFileSystem();
+        string rootDir = Path.GetFullPath("/PACS");
+        using var manifest = new DirectoryManifest(fileSystem, _manifestPath);
+        manifest.Checkpoint(rootDir, [Path.GetFullPath("/PACS/b")]);
+
+        var mockProducerModel = new Mock<IProducerModel>();
+        var ddf = new BasicDicomDirectoryFinder(rootDir, fileSystem, "*.dcm", mockProducerModel.Object)
+        {
+            Manifest = manifest,
+        };
+
+        // Act
+        ddf.SearchForDicomDirectories(rootDir);
+
+        // Assert
+        var resumed = new AccessionDirectoryMessage { DirectoryPath = "b/2".Replace('/', Path.DirectorySeparatorChar) };
+        mockProducerModel.Verify(pm => pm.SendMessage(It.IsAny<IMessage>(), null, It.IsAny<string>()), Times.Once);
+        mockProducerModel.Verify(pm => pm.SendMessage(resumed, null, It.IsAny<string>()));
+        Assert.That(manifest.GetFrontier(rootDir), Is.Empty);
+    }
+}
@@ -0,0 +1,35 @@
+using MongoDB.Bson;
+using NUnit.Framework;
+using SmiServices.Applications.DicomLoader;
+
+namespace SmiServices.UnitTests.Applications.DicomLoader;
+
+internal class IdRangePartitionerTests
+{
+    [Test]
+    public void RangeFilter_Bounded_MatchesIdRange()
+    {
+        Assert.That(IdRangePartitioner.RangeFilter(new BsonInt32(10), new BsonInt32(20)), Is.EqualTo(BsonDocument.Parse("{ _id: { $gte: 10, $lt: 20 } }")));
+    }
+
+    [Test]
+    public void RangeFilter_Unbounded_MatchesEverything()
+    {
+        Assert.That(IdRangePartitioner.RangeFilter(null, null), Is.EqualTo(new BsonDocument()));
+    }
+
+    [Test]
+    public void RangeFilter_Partitions_CoverAllRanges()
+    {
+        // Arrange
+        BsonValue[] boundaries = [new BsonInt32(10), new BsonInt32(20)];
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(IdRangePartitioner.RangeFilter(boundaries, 0), Is.EqualTo(BsonDocument.Parse("{ _id: { $lt: 10 } }")));
+            Assert.That(IdRangePartitioner.RangeFilter(boundaries, 1), Is.EqualTo(BsonDocument.Parse("{ _id: { $gte: 10, $lt: 20 } }")));
+            Assert.That(IdRangePartitioner.RangeFilter(boundaries, 2), Is.EqualTo(BsonDocument.Parse("{ _id: { $gte: 20 } }")));
+        });
+    }
+}
@@ -0,0 +1,79 @@
+using NUnit.Framework;
+using SmiServices.Applications.DicomLoader;
+using System;
+using System.Linq;
+
+namespace SmiServices.UnitTests.Applications.DicomLoader;
+
+internal class KnownPathSetTests
+{
+    [Test]
+    public void Add_ThenContains()
+    {
+        // Arrange
+        var set = new KnownPathSet();
+
+        // Act
+        var added = set.Add("/data/a.dcm");
+        var addedAgain = set.Add("/data/a.dcm");
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(added, Is.True);
+            Assert.That(addedAgain, Is.False);
+            Assert.That(set.Count, Is.EqualTo(1));
+            Assert.That(set.Contains("/data/a.dcm"), Is.True);
+            Assert.That(set.Contains("/data/b.dcm"), Is.False);
+            Assert.That(set.Contains("/data/a.zip!a.dcm"), Is.False);
+        });
+    }
+
+    [Test]
+    public void Add_BeyondExpectedCount_Grows()
+    {
+        // Arrange
+        var set = new KnownPathSet(expectedCount: 10);
+        var paths = Enumerable.Range(0, 10_000).Select(i => $"/data/{i}/image.dcm").ToList();
+
+        // Act
+        foreach (var path in paths)
+            set.Add(path);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(set.Count, Is.EqualTo(paths.Count));
+            Assert.That(paths.All(set.Contains), Is.True);
+            Assert.That(Enumerable.Range(10_000, 1_000).Any(i => set.Contains($"/data/{i}/image.dcm")), Is.False);
+        });
+    }
+
+    [Test]
+    public void Add_AcrossManySegments()
+    {
+        // Arrange
+        var set = new KnownPathSet(expectedCount: 100, segmentLength: 64);
+        var paths = Enumerable.Range(0, 10_000).Select(i => $"/data/{i}/image.dcm").ToList();
+
+        // Act
+        foreach (var path in paths)
+            set.Add(path);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(set.Count, Is.EqualTo(paths.Count));
+            Assert.That(paths.All(set.Contains), Is.True);
+            Assert.That(paths.Any(set.Add), Is.False);
+            Assert.That(Enumerable.Range(10_000, 1_000).Any(i => set.Contains($"/data/{i}/image.dcm")), Is.False);
+        });
+    }
+
+    [TestCase(0)]
+    [TestCase(3)]
+    public void Constructor_SegmentLengthNotPowerOf2_Throws(int segmentLength)
+    {
+        Assert.Throws<ArgumentOutOfRangeException>(() => _ = new KnownPathSet(segmentLength: segmentLength));
+    }
+}
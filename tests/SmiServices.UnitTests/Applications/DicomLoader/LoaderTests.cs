@@ -0,0 +1,329 @@
+using FellowOakDicom;
+using MongoDB.Bson;
+using MongoDB.Bson.Serialization;
+using MongoDB.Driver;
+using Moq;
+using NUnit.Framework;
+using SmiServices.Applications.DicomLoader;
+using SmiServices.Common.Messages;
+using SmiServices.UnitTests.Common.MongoDB;
+using SmiServices.UnitTests.TestCommon;
+using System;
+using System.Collections.Concurrent;
+using System.Collections.Generic;
+using System.IO;
+using System.Linq;
+using System.Threading;
+using System.Threading.Channels;
+using System.Threading.Tasks;
+
+namespace SmiServices.UnitTests.Applications.DicomLoader;
+
+internal class LoaderTests
+{
+    private const string ImageCollection = "image";
+    private const string SeriesCollection = "series";
+
+    private DisposableTempDir _tempDir = null!;
+
+    [SetUp]
+    public void SetUp()
+    {
+        _tempDir = new DisposableTempDir();
+    }
+
+    [TearDown]
+    public void TearDown()
+    {
+        _tempDir.Dispose();
+    }
+
+    /// <summary>
+    /// Image collection which records each batch inserted, and can be made to fail when deleting conflicts
+    /// </summary>
+    private sealed class FakeImageCollection : StubMongoCollection<int, BsonDocument>
+    {
+        public readonly ConcurrentQueue<List<BsonDocument>> Batches = new();
+
+        public Exception? DeleteError { get; set; }
+
+        public override Task<DeleteResult> DeleteManyAsync(FilterDefinition<BsonDocument> filter, CancellationToken cancellationToken = new CancellationToken())
+        {
+            return DeleteError != null
+                ? Task.FromException<DeleteResult>(DeleteError)
+                : Task.FromResult<DeleteResult>(new DeleteResult.Acknowledged(0));
+        }
+
+        public override Task InsertManyAsync(IEnumerable<BsonDocument> documents, InsertManyOptions? options = null, CancellationToken cancellationToken = new CancellationToken())
+        {
+            Batches.Enqueue(documents.ToList());
+            return Task.CompletedTask;
+        }
+    }
+
+    /// <summary>
+    /// Series collection which records the series looked up and inserted. Lookups find the series in <see cref="Stored"/>
+    /// </summary>
+    private sealed class FakeSeriesCollection : StubMongoCollection<int, SeriesMessage>
+    {
+        public readonly List<SeriesMessage> Stored = [];
+        public readonly ConcurrentQueue<List<string>> Lookups = new();
+        public readonly ConcurrentQueue<SeriesMessage> Inserted = new();
+
+        public override Task<DeleteResult> DeleteManyAsync(FilterDefinition<SeriesMessage> filter, CancellationToken cancellationToken = new CancellationToken())
+        {
+            return Task.FromResult<DeleteResult>(new DeleteResult.Acknowledged(0));
+        }
+
+        public override Task InsertManyAsync(IEnumerable<SeriesMessage> documents, InsertManyOptions? options = null, CancellationToken cancellationToken = new CancellationToken())
+        {
+            foreach (var sm in documents)
+                Inserted.Enqueue(sm);
+            return Task.CompletedTask;
+        }
+
+        public override IAsyncCursor<TProjection> FindSync<TProjection>(FilterDefinition<SeriesMessage> filter, FindOptions<SeriesMessage, TProjection>? options = null, CancellationToken cancellationToken = new CancellationToken())
+        {
+            var rendered = filter.Render(new RenderArgs<SeriesMessage>(BsonSerializer.SerializerRegistry.GetSerializer<SeriesMessage>(), BsonSerializer.SerializerRegistry));
+            var seriesInstanceUids = rendered["SeriesInstanceUID"]["$in"].AsBsonArray.Select(v => v.AsString).ToList();
+            Lookups.Enqueue(seriesInstanceUids);
+
+            var mockCursor = new Mock<IAsyncCursor<TProjection>>();
+            mockCursor
+                .SetupSequence(_ => _.MoveNext(It.IsAny<CancellationToken>()))
+                .Returns(true)
+                .Returns(false);
+            mockCursor
+                .Setup(x => x.Current)
+                .Returns((IEnumerable<TProjection>)Stored.Where(sm => seriesInstanceUids.Contains(sm.SeriesInstanceUID)).ToList());
+            return mockCursor.Object;
+        }
+    }
+
+    private sealed class FakeDatabase : StubMongoDatabase
+    {
+        public readonly FakeImageCollection Images = new();
+        public readonly FakeSeriesCollection Series = new();
+
+        public override IMongoCollection<TDocument> GetCollection<TDocument>(string name, MongoCollectionSettings? settings = null)
+        {
+            object collection = name switch
+            {
+                ImageCollection => Images,
+                SeriesCollection => Series,
+                _ => throw new ArgumentException($"No collection named {name}"),
+            };
+            return (IMongoCollection<TDocument>)collection;
+        }
+    }
+
+    private static Loader CreateLoader(FakeDatabase database, int batchSize)
+    {
+        var options = new DicomLoaderOptions
+        {
+            // Skip the lookup of existing images, which the fake collection doesn't support
+            DeleteConflicts = true,
+            BatchSize = batchSize,
+            QueuedBatches = 1,
+            BsonThreads = 1,
+            MongoWriters = 1,
+        };
+        return new Loader(database, ImageCollection, SeriesCollection, options, null, null);
+    }
+
+    private string WriteImage(string sopInstanceUid, string seriesInstanceUid = "1.2.3.4", string directory = "")
+    {
+        var ds = new DicomDataset
+        {
+            { DicomTag.SOPClassUID, DicomUID.SecondaryCaptureImageStorage },
+            { DicomTag.StudyInstanceUID, "1.2.3" },
+            { DicomTag.SeriesInstanceUID, seriesInstanceUid },
+            { DicomTag.SOPInstanceUID, sopInstanceUid },
+            { DicomTag.Modality, "OT" },
+        };
+
+        var dir = Directory.CreateDirectory(Path.Combine(_tempDir, directory));
+        var path = Path.Combine(dir.FullName, $"{sopInstanceUid}.dcm");
+        new DicomFile(ds).Save(path);
+        return path;
+    }
+
+    /// <summary>
+    /// Keep loading <paramref name="path"/> until the loader stops accepting files
+    /// </summary>
+    private static async Task<ChannelClosedException?> LoadUntilClosed(Loader loader, string path)
+    {
+        // Each channel only holds a batch, so this soon has to wait on the failed stage
+        for (var i = 0; i < 100; ++i)
+        {
+            try
+            {
+                await loader.Load(path, CancellationToken.None);
+            }
+            catch (ChannelClosedException e)
+            {
+                return e;
+            }
+        }
+
+        return null;
+    }
+
+    [Test]
+    public async Task Complete_PartialLastBatch_IsInserted()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var loader = CreateLoader(database, batchSize: 3);
+        var sopInstanceUids = Enumerable.Range(1, 5).Select(i => $"1.2.3.4.{i}").ToList();
+
+        // Act
+        foreach (var sopInstanceUid in sopInstanceUids)
+            await loader.Load(WriteImage(sopInstanceUid), CancellationToken.None);
+        loader.Complete();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(database.Images.Batches.Select(b => b.Count), Is.EqualTo(new[] { 3, 2 }));
+            Assert.That(database.Images.Batches.SelectMany(b => b).Select(d => d["SOPInstanceUID"].AsString), Is.EquivalentTo(sopInstanceUids));
+        });
+    }
+
+    [Test]
+    public async Task Load_LaterStageFails_StopsLoading()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var error = new InvalidOperationException("Could not delete conflicts");
+        database.Images.DeleteError = error;
+        var loader = CreateLoader(database, batchSize: 1);
+        var path = WriteImage("1.2.3.4.5");
+
+        // Act
+        var closed = await LoadUntilClosed(loader, path);
+
+        // Assert
+        // The insert stage closed the channel to the build stage, which then closed the one it reads from
+        Assert.That(closed, Is.Not.Null);
+        Assert.Multiple(() =>
+        {
+            Assert.That(closed!.GetBaseException(), Is.SameAs(error));
+            Assert.That(database.Images.Batches, Is.Empty);
+        });
+    }
+
+    [Test]
+    public async Task Complete_LaterStageFailed_ThrowsOriginalError()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var error = new InvalidOperationException("Could not delete conflicts");
+        database.Images.DeleteError = error;
+        var loader = CreateLoader(database, batchSize: 1);
+        Assert.That(await LoadUntilClosed(loader, WriteImage("1.2.3.4.5")), Is.Not.Null);
+
+        // Act
+        // Assert
+        var exc = Assert.Throws<InvalidOperationException>(loader.Complete);
+        Assert.That(exc, Is.SameAs(error));
+    }
+
+    [Test]
+    public void LoadAll_LaterStageFails_ThrowsOriginalError()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var error = new InvalidOperationException("Could not delete conflicts");
+        database.Images.DeleteError = error;
+        var loader = CreateLoader(database, batchSize: 1);
+        var fileNames = Enumerable.Repeat(WriteImage("1.2.3.4.5"), 100);
+
+        // Act
+        // Assert
+        var exc = Assert.Throws<InvalidOperationException>(() => SmiServices.Applications.DicomLoader.DicomLoader.LoadAll(loader, fileNames, 1, CancellationToken.None));
+        Assert.That(exc, Is.SameAs(error));
+    }
+
+    [Test]
+    public async Task Complete_SeriesAlreadyInMongo_AddsToStoredCount()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        database.Series.Stored.Add(new SeriesMessage
+        {
+            DirectoryPath = "earlier",
+            DicomDataset = "{}",
+            ImagesInSeries = 5,
+            SeriesInstanceUID = "1.2.3.4",
+            StudyInstanceUID = "1.2.3",
+        });
+        var loader = CreateLoader(database, batchSize: 2);
+
+        // Act
+        await loader.Load(WriteImage("1.2.3.4.1"), CancellationToken.None);
+        await loader.Load(WriteImage("1.2.3.4.2"), CancellationToken.None);
+        loader.Complete();
+
+        // Assert
+        Assert.That(database.Series.Inserted, Has.Count.EqualTo(1));
+        var sm = database.Series.Inserted.Single();
+        Assert.Multiple(() =>
+        {
+            Assert.That(sm.ImagesInSeries, Is.EqualTo(7));
+            Assert.That(sm.DirectoryPath, Is.EqualTo("earlier"));
+        });
+    }
+
+    [Test]
+    public async Task Complete_NewSeries_IsDescribedByItsFirstImage()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var loader = CreateLoader(database, batchSize: 2);
+        var first = WriteImage("1.2.3.4.1", directory: "first");
+
+        // Act
+        await loader.Load(first, CancellationToken.None);
+        await loader.Load(WriteImage("1.2.3.4.2", directory: "second"), CancellationToken.None);
+        loader.Complete();
+
+        // Assert
+        Assert.That(database.Series.Inserted, Has.Count.EqualTo(1));
+        var sm = database.Series.Inserted.Single();
+        Assert.Multiple(() =>
+        {
+            Assert.That(sm.SeriesInstanceUID, Is.EqualTo("1.2.3.4"));
+            Assert.That(sm.StudyInstanceUID, Is.EqualTo("1.2.3"));
+            Assert.That(sm.ImagesInSeries, Is.EqualTo(2));
+            Assert.That(sm.DirectoryPath, Is.EqualTo(Path.GetDirectoryName(first)));
+            Assert.That(sm.DicomDataset, Does.Contain("1.2.3.4.1"));
+            Assert.That(sm.DicomDataset, Does.Not.Contain("1.2.3.4.2"));
+        });
+    }
+
+    [Test]
+    public async Task Complete_SeriesRepeatedInBatch_LookedUpOnce()
+    {
+        // Arrange
+        var database = new FakeDatabase();
+        var loader = CreateLoader(database, batchSize: 2);
+
+        // Act
+        // Batches of [A, A] and [A, B]
+        await loader.Load(WriteImage("1.1.1", seriesInstanceUid: "1.1"), CancellationToken.None);
+        await loader.Load(WriteImage("1.1.2", seriesInstanceUid: "1.1"), CancellationToken.None);
+        await loader.Load(WriteImage("1.1.3", seriesInstanceUid: "1.1"), CancellationToken.None);
+        await loader.Load(WriteImage("1.2.1", seriesInstanceUid: "1.2"), CancellationToken.None);
+        loader.Complete();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            // Series already in the series list aren't looked up again
+            Assert.That(database.Series.Lookups, Is.EqualTo(new[] { new[] { "1.1" }, new[] { "1.2" } }));
+            Assert.That(database.Series.Inserted.ToDictionary(sm => sm.SeriesInstanceUID, sm => sm.ImagesInSeries),
+                Is.EquivalentTo(new Dictionary<string, int> { ["1.1"] = 3, ["1.2"] = 1 }));
+        });
+    }
+}
@@ -0,0 +1,28 @@
+using MongoDB.Bson;
+using NUnit.Framework;
+using SmiServices.Applications.DicomLoader;
+using System.Linq;
+
+namespace SmiServices.UnitTests.Applications.DicomLoader;
+
+internal class SeriesRecounterTests
+{
+    [Test]
+    public void BuildPipeline_MergesCountsIntoSeries()
+    {
+        // Arrange
+        var filter = IdRangePartitioner.RangeFilter(new BsonInt32(10), new BsonInt32(20));
+
+        // Act
+        var pipeline = SeriesRecounter.BuildPipeline(filter, "series");
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(pipeline.Select(s => s.GetElement(0).Name), Is.EqualTo(new[] { "$match", "$group", "$lookup", "$unwind", "$project", "$merge" }));
+            Assert.That(pipeline[0]["$match"], Is.EqualTo(filter));
+            Assert.That(pipeline[^1]["$merge"]["into"].AsString, Is.EqualTo("series"));
+            Assert.That(pipeline[^1]["$merge"]["whenNotMatched"].AsString, Is.EqualTo("discard"));
+        });
+    }
+}
@@ -0,0 +1,107 @@
+using FellowOakDicom;
+using NUnit.Framework;
+using SmiServices.Common;
+using System;
+using System.IO;
+using System.Linq;
+
+namespace SmiServices.UnitTests.Common;
+
+internal class DicomHeaderReaderTests
+{
+    private static MemoryStream CreateFile()
+    {
+        var ds = new DicomDataset
+        {
+            { DicomTag.SOPClassUID, DicomUID.SecondaryCaptureImageStorage },
+            { DicomTag.StudyInstanceUID, "1.2.3" },
+            { DicomTag.SeriesInstanceUID, "1.2.3.4" },
+            { DicomTag.SOPInstanceUID, "1.2.3.4.5" },
+            { DicomTag.PatientID, "0101010101" },
+            { DicomTag.Modality, "OT" },
+            { DicomTag.Rows, (ushort)1 },
+            { DicomTag.Columns, (ushort)1 },
+            { DicomTag.PixelData, new byte[] { 1, 2 } },
+        };
+        ds.Add(new DicomLongString(new DicomTag(0x0009, 0x0010), "TEST"));
+
+        var stream = new MemoryStream();
+        new DicomFile(ds).Save(stream);
+        stream.Position = 0;
+        return stream;
+    }
+
+    [Test]
+    public void Open_StopAtPixelData_SkipsPixelData()
+    {
+        // Arrange
+        using var stream = CreateFile();
+        var reader = new DicomHeaderReader(stopAtPixelData: true);
+
+        // Act
+        var ds = reader.Open(stream);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(ds.Contains(DicomTag.PixelData), Is.False);
+            Assert.That(ds.GetString(DicomTag.PatientID), Is.EqualTo("0101010101"));
+        });
+    }
+
+    [Test]
+    public void Open_NotStopAtPixelData_ReadsPixelData()
+    {
+        // Arrange
+        using var stream = CreateFile();
+        var reader = new DicomHeaderReader(stopAtPixelData: false);
+
+        // Act
+        var ds = reader.Open(stream, FileReadOption.ReadAll);
+
+        // Assert
+        Assert.That(ds.Contains(DicomTag.PixelData), Is.True);
+    }
+
+    [Test]
+    public void Filter_TagAllowList_KeepsAllowedTagsAndUids()
+    {
+        // Arrange
+        using var stream = CreateFile();
+        var reader = new DicomHeaderReader(tagAllowList: ["PatientID", "0009"]);
+
+        // Act
+        var ds = reader.Filter(reader.Open(stream));
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(ds.Contains(DicomTag.PatientID), Is.True);
+            Assert.That(ds.Contains(new DicomTag(0x0009, 0x0010)), Is.True);
+            Assert.That(ds.Contains(DicomTag.SOPInstanceUID), Is.True);
+            Assert.That(ds.Contains(DicomTag.Modality), Is.False);
+            Assert.That(ds.Contains(DicomTag.Rows), Is.False);
+        });
+    }
+
+    [Test]
+    public void Filter_NoAllowList_KeepsAllTags()
+    {
+        // Arrange
+        using var stream = CreateFile();
+        var reader = new DicomHeaderReader();
+        var ds = reader.Open(stream);
+
+        // Act
+        var filtered = reader.Filter(ds);
+
+        // Assert
+        Assert.That(filtered.Count(), Is.EqualTo(ds.Count()));
+    }
+
+    [Test]
+    public void Constructor_InvalidAllowListEntry_Throws()
+    {
+        Assert.Throws<ArgumentException>(() => _ = new DicomHeaderReader(tagAllowList: ["NotAKeyword"]));
+    }
+}
@@ -0,0 +1,85 @@
+using Newtonsoft.Json;
+using NUnit.Framework;
+using SmiServices.Common.Messages;
+using System.Text;
+using JsonConvert = SmiServices.Common.MessageSerialization.JsonConvert;
+
+namespace SmiServices.UnitTests.Common.MessageSerialization;
+
+internal class JsonConvertTests
+{
+    private static DicomFileMessage CreateMessage() => new()
+    {
+        DicomFilePath = "foo/bar.dcm",
+        DicomFileSize = 123,
+        StudyInstanceUID = "1.2.3",
+        SeriesInstanceUID = "1.2.3.4",
+        SOPInstanceUID = "1.2.3.4.5",
+        DicomDataset = "{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"Ü\\\\\"quoted\\\"\"]}}",
+    };
+
+    private static byte[] Utf8(object message) => Encoding.UTF8.GetBytes(Newtonsoft.Json.JsonConvert.SerializeObject(message));
+
+    [Test]
+    public void DeserializeLazy_DicomFileMessage_EqualsFullDeserialization()
+    {
+        // Arrange
+        var original = CreateMessage();
+
+        // Act
+        var lazy = JsonConvert.DeserializeLazy<DicomFileMessage>(Utf8(original));
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(lazy, Is.EqualTo(original));
+            Assert.That(lazy.DicomDataset, Is.EqualTo(original.DicomDataset));
+        });
+    }
+
+    [Test]
+    public void SerializeToUtf8Bytes_LazyDataset_IsCopiedUnchanged()
+    {
+        // Arrange
+        var original = CreateMessage();
+        var body = Utf8(original);
+        var lazy = JsonConvert.DeserializeLazy<DicomFileMessage>(body);
+        lazy.SOPInstanceUID = "9.8.7";
+
+        // Act
+        var serialized = JsonConvert.SerializeToUtf8Bytes(lazy);
+
+        // Assert
+        var token = Encoding.UTF8.GetBytes(Newtonsoft.Json.JsonConvert.ToString(original.DicomDataset));
+        var roundTripped = JsonConvert.DeserializeObject<DicomFileMessage>(serialized);
+        Assert.Multiple(() =>
+        {
+            Assert.That(Encoding.UTF8.GetString(serialized), Does.Contain(Encoding.UTF8.GetString(token)));
+            Assert.That(roundTripped.DicomDataset, Is.EqualTo(original.DicomDataset));
+            Assert.That(roundTripped.SOPInstanceUID, Is.EqualTo("9.8.7"));
+        });
+    }
+
+    [Test]
+    public void SerializeToUtf8Bytes_DatasetSet_UsesNewValue()
+    {
+        // Arrange
+        var lazy = JsonConvert.DeserializeLazy<DicomFileMessage>(Utf8(CreateMessage()));
+        lazy.DicomDataset = "{}";
+
+        // Act
+        var roundTripped = JsonConvert.DeserializeObject<DicomFileMessage>(JsonConvert.SerializeToUtf8Bytes(lazy));
+
+        // Assert
+        Assert.That(roundTripped.DicomDataset, Is.EqualTo("{}"));
+    }
+
+    [TestCase("{\"DicomFilePath\":\"a\",\"StudyInstanceUID\":\"b\",\"SeriesInstanceUID\":\"c\",\"SOPInstanceUID\":\"d\"}")]
+    [TestCase("{\"DicomFilePath\":\"a\",\"StudyInstanceUID\":\"b\",\"SeriesInstanceUID\":\"c\",\"SOPInstanceUID\":\"d\",\"DicomDataset\":null}")]
+    [TestCase("{\"DicomFilePath\":\"a\",\"StudyInstanceUID\":\"b\",\"SeriesInstanceUID\":\"c\",\"SOPInstanceUID\":\"d\",\"DicomDataset\":\"{}\",\"Foo\":1}")]
+    [TestCase("{\"DicomFilePath\":\"a\",")]
+    public void DeserializeLazy_InvalidMessage_Throws(string json)
+    {
+        Assert.Throws<JsonSerializationException>(() => JsonConvert.DeserializeLazy<DicomFileMessage>(Encoding.UTF8.GetBytes(json)));
+    }
+}
@@ -0,0 +1,81 @@
+using NUnit.Framework;
+using SmiServices.Common.MessageSerialization;
+using System.IO;
+using System.Text;
+
+namespace SmiServices.UnitTests.Common.MessageSerialization;
+
+internal class MessageBodyEncodingTests
+{
+    private static readonly string _largeJson = "{\"DicomDataset\":\"" + new string('x', 10_000) + "\"}";
+
+    [TestCase(MessageBodyCompression.GZip, MessageBodyEncoding.GZipContentEncoding)]
+    [TestCase(MessageBodyCompression.Brotli, MessageBodyEncoding.BrotliContentEncoding)]
+    public void Encode_OverThreshold_RoundTrips(MessageBodyCompression compression, string expectedContentEncoding)
+    {
+        // Act
+        var body = MessageBodyEncoding.Encode(_largeJson, compression, 1024, out var contentEncoding);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(contentEncoding, Is.EqualTo(expectedContentEncoding));
+            Assert.That(body, Has.Length.LessThan(_largeJson.Length));
+            Assert.That(MessageBodyEncoding.GetString(body, contentEncoding), Is.EqualTo(_largeJson));
+        });
+    }
+
+    [Test]
+    public void Encode_UnderThreshold_IsNotCompressed()
+    {
+        // Act
+        var body = MessageBodyEncoding.Encode("{}", MessageBodyCompression.Brotli, 1024, out var contentEncoding);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(contentEncoding, Is.EqualTo(MessageBodyEncoding.DefaultContentEncoding));
+            Assert.That(body, Is.EqualTo(Encoding.UTF8.GetBytes("{}")));
+        });
+    }
+
+    [TestCase(null)]
+    [TestCase("UTF-8")]
+    public void GetString_LegacyContentEncoding_IsTreatedAsCharset(string? contentEncoding)
+    {
+        var body = Encoding.UTF8.GetBytes(_largeJson);
+
+        Assert.That(MessageBodyEncoding.GetString(body, contentEncoding), Is.EqualTo(_largeJson));
+    }
+
+    [TestCase(MessageBodyCompression.None)]
+    [TestCase(MessageBodyCompression.GZip)]
+    [TestCase(MessageBodyCompression.Brotli)]
+    public void GetUtf8Bytes_RoundTrips(MessageBodyCompression compression)
+    {
+        // Arrange
+        var body = MessageBodyEncoding.Encode(_largeJson, compression, 1024, out var contentEncoding);
+
+        // Act
+        var utf8 = MessageBodyEncoding.GetUtf8Bytes(body, contentEncoding);
+
+        // Assert
+        Assert.That(utf8.ToArray(), Is.EqualTo(Encoding.UTF8.GetBytes(_largeJson)));
+    }
+
+    [TestCase(MessageBodyEncoding.GZipContentEncoding)]
+    [TestCase(MessageBodyEncoding.BrotliContentEncoding)]
+    public void GetString_CorruptCompressedBody_Throws(string contentEncoding)
+    {
+        // Arrange
+        var body = Encoding.UTF8.GetBytes("not compressed at all");
+
+        // Act
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.Throws<InvalidDataException>(() => MessageBodyEncoding.GetString(body, contentEncoding));
+            Assert.Throws<InvalidDataException>(() => MessageBodyEncoding.GetUtf8Bytes(body, contentEncoding));
+        });
+    }
+}
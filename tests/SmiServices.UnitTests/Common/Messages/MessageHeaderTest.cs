@@ -74,6 +74,44 @@ public class MessageHeaderTest
         Assert.That(h2.GetHashCode(), Is.EqualTo(h1.GetHashCode()));
     }
 
+    [Test]
+    public void Populate_BinaryGuids_RoundTrips()
+    {
+        var parent = new MessageHeader(new MessageHeader());
+        var header = new MessageHeader(parent);
+        var props = new Dictionary<string, object>();
+
+        header.Populate(props, binaryGuids: true);
+
+        // RabbitMQ delivers strings as byte arrays
+        props["ProducerExecutableName"] = Encoding.UTF8.GetBytes((string)props["ProducerExecutableName"]);
+
+        Assert.Multiple(() =>
+        {
+            Assert.That(props.ContainsKey("Parents"), Is.False);
+            Assert.That(MessageHeader.FromDict(props, Encoding.UTF8), Is.EqualTo(header));
+        });
+    }
+
+    [Test]
+    public void MessageHeader_CapParents_KeepsRootAndParent()
+    {
+        var root = new MessageHeader();
+        IMessageHeader parent = root;
+        for (var i = 0; i < 10; ++i)
+            parent = new MessageHeader(parent, capParents: true);
+
+        var header = new MessageHeader(parent, capParents: true);
+
+        Assert.Multiple(() =>
+        {
+            Assert.That(header.Parents, Has.Length.EqualTo(MessageHeader.CappedParentsLength));
+            Assert.That(header.Parents[0], Is.EqualTo(root.MessageGuid));
+            Assert.That(header.Parents[^1], Is.EqualTo(parent.MessageGuid));
+            Assert.That(header.IsDescendantOf(root), Is.True);
+        });
+    }
+
     [Test]
     public void CurrentProgramName_Unset_ThrowsException()
     {
@@ -0,0 +1,90 @@
+using NUnit.Framework;
+using SmiServices.Common.Messaging;
+using System;
+using System.Collections.Generic;
+
+namespace SmiServices.UnitTests.Common.Messaging;
+
+internal class AckCoalescerTests
+{
+    private static readonly TimeSpan _longDelay = TimeSpan.FromHours(1);
+
+    [Test]
+    public void Ack_AtBatchSize_SendsSingleMultipleAck()
+    {
+        // Arrange
+        var sent = new List<(ulong, bool)>();
+        using var coalescer = new AckCoalescer(3, _longDelay, (tag, multiple) => sent.Add((tag, multiple)));
+
+        // Act
+        foreach (ulong tag in new ulong[] { 1, 2, 3 })
+        {
+            coalescer.Delivered(tag);
+            coalescer.Ack(tag);
+        }
+
+        // Assert
+        Assert.That(sent, Is.EqualTo(new List<(ulong, bool)> { (3, true) }));
+    }
+
+    [Test]
+    public void Flush_MessageInFlight_AcksLaterMessagesIndividually()
+    {
+        // Arrange
+        var sent = new List<(ulong, bool)>();
+        using var coalescer = new AckCoalescer(10, _longDelay, (tag, multiple) => sent.Add((tag, multiple)));
+        for (ulong tag = 1; tag <= 5; ++tag)
+            coalescer.Delivered(tag);
+
+        // Act
+        coalescer.Ack(1);
+        coalescer.Ack(2);
+        coalescer.Ack(4);
+        coalescer.Ack(5);
+        coalescer.Flush();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(sent, Is.EqualTo(new List<(ulong, bool)> { (2, true), (4, false), (5, false) }));
+            Assert.That(coalescer.PendingCount, Is.EqualTo(0));
+        });
+    }
+
+    [Test]
+    public void Nack_SentImmediately_AndNotBlockingLaterAcks()
+    {
+        // Arrange
+        var sent = new List<string>();
+        using var coalescer = new AckCoalescer(10, _longDelay, (tag, multiple) => sent.Add($"ack {tag} {multiple}"));
+        for (ulong tag = 1; tag <= 3; ++tag)
+            coalescer.Delivered(tag);
+
+        // Act
+        coalescer.Ack(1);
+        coalescer.Nack(2, () => sent.Add("nack 2"));
+        coalescer.Ack(3);
+        coalescer.Flush();
+
+        // Assert
+        Assert.That(sent, Is.EqualTo(new List<string> { "nack 2", "ack 3 True" }));
+    }
+
+    [Test]
+    public void Dispose_SendsPendingAcks_ThenAcksImmediately()
+    {
+        // Arrange
+        var sent = new List<(ulong, bool)>();
+        var coalescer = new AckCoalescer(10, _longDelay, (tag, multiple) => sent.Add((tag, multiple)));
+        coalescer.Delivered(1);
+        coalescer.Delivered(2);
+        coalescer.Ack(1);
+
+        // Act
+        coalescer.Dispose();
+        coalescer.Ack(2);
+
+        // Assert
+        Assert.That(sent, Is.EqualTo(new List<(ulong, bool)> { (1, false), (2, false) }));
+    }
+}
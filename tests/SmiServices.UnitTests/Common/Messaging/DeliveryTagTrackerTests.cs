@@ -0,0 +1,52 @@
+using NUnit.Framework;
+using SmiServices.Common.Messaging;
+using System.Collections.Generic;
+
+namespace SmiServices.UnitTests.Common.Messaging;
+
+internal class DeliveryTagTrackerTests
+{
+    [Test]
+    public void Settle_OutOfOrder_SendsEachOnce()
+    {
+        // Arrange
+        var tracker = new DeliveryTagTracker();
+        for (ulong tag = 1; tag <= 3; ++tag)
+            tracker.Delivered(tag);
+
+        var sent = new List<ulong>();
+
+        // Act
+        tracker.Settle(3, multiple: false, () => sent.Add(3));
+        tracker.Settle(1, multiple: false, () => sent.Add(1));
+        tracker.Settle(3, multiple: false, () => sent.Add(3));
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(sent, Is.EqualTo(new List<ulong> { 3, 1 }));
+            Assert.That(tracker.UnsettledCount, Is.EqualTo(1));
+        });
+    }
+
+    [Test]
+    public void Settle_Multiple_SettlesAllUpToTag()
+    {
+        // Arrange
+        var tracker = new DeliveryTagTracker();
+        for (ulong tag = 1; tag <= 4; ++tag)
+            tracker.Delivered(tag);
+
+        // Act
+        var first = tracker.Settle(3, multiple: true, () => { });
+        var second = tracker.Settle(2, multiple: false, () => { });
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(first, Is.True);
+            Assert.That(second, Is.False);
+            Assert.That(tracker.UnsettledCount, Is.EqualTo(1));
+        });
+    }
+}
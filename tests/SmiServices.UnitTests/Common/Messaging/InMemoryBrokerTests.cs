@@ -0,0 +1,125 @@
+using NUnit.Framework;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Messaging;
+using SmiServices.Common.Options;
+using System;
+using System.Collections.Concurrent;
+
+namespace SmiServices.UnitTests.Common.Messaging;
+
+internal class InMemoryBrokerTests
+{
+    private class TestMessage : IMessage { }
+
+    private class TestConsumer : Consumer<TestMessage>
+    {
+        public readonly BlockingCollection<(IMessageHeader Header, TestMessage Message)> Received = [];
+
+        public bool AckMessages { get; init; } = true;
+
+        protected override void ProcessMessageImpl(IMessageHeader header, TestMessage message, ulong tag)
+        {
+            if (AckMessages)
+                Ack(header, tag);
+
+            Received.Add((header, message));
+        }
+    }
+
+    private static readonly TimeSpan _timeout = TimeSpan.FromSeconds(5);
+
+    private static InMemoryMessageBus CreateBus()
+    {
+        var bus = new InMemoryMessageBus();
+        bus.Declare(new InMemoryBrokerOptions
+        {
+            QueueCapacity = 10,
+            Bindings =
+            [
+                new InMemoryBindingOptions { ExchangeName = "TEST.Exchange", QueueName = "TEST.Queue" },
+                new InMemoryBindingOptions { ExchangeName = "TEST.TopicExchange", QueueName = "TEST.CtQueue", RoutingKey = "reprocessed.CT.*" },
+            ],
+        });
+        return bus;
+    }
+
+    [Test]
+    public void SendMessage_DeliversSameObjectToConsumer()
+    {
+        // Arrange
+        var broker = new InMemoryBroker(CreateBus(), "test");
+        var producer = broker.SetupProducer(new ProducerOptions { ExchangeName = "TEST.Exchange" });
+        var consumer = new TestConsumer();
+        broker.StartConsumer(new ConsumerOptions { QueueName = "TEST.Queue", QoSPrefetchCount = 1 }, consumer);
+        var message = new TestMessage();
+
+        // Act
+        var header = producer.SendMessage(message, null, null);
+
+        // Assert
+        Assert.That(consumer.Received.TryTake(out var received, _timeout), Is.True);
+        Assert.Multiple(() =>
+        {
+            Assert.That(received.Message, Is.SameAs(message));
+            Assert.That(received.Header.MessageGuid, Is.EqualTo(header.MessageGuid));
+            Assert.That(consumer.AckCount, Is.EqualTo(1));
+        });
+
+        broker.Shutdown(_timeout);
+    }
+
+    [Test]
+    public void StopConsumer_RequeuesUnackedMessages()
+    {
+        // Arrange
+        var bus = CreateBus();
+        var broker = new InMemoryBroker(bus, "test");
+        var producer = broker.SetupProducer(new ProducerOptions { ExchangeName = "TEST.Exchange" });
+        var consumer = new TestConsumer { AckMessages = false };
+        var taskId = broker.StartConsumer(new ConsumerOptions { QueueName = "TEST.Queue", QoSPrefetchCount = 1 }, consumer);
+
+        // Act
+        producer.SendMessage(new TestMessage(), null, null);
+        Assert.That(consumer.Received.TryTake(out _, _timeout), Is.True);
+        broker.StopConsumer(taskId, _timeout);
+
+        // Assert
+        Assert.That(bus.MessageCount("TEST.Queue"), Is.EqualTo(1));
+        broker.Shutdown(_timeout);
+    }
+
+    [Test]
+    public void StartConsumer_IsSolo_ThrowsIfQueueHasConsumer()
+    {
+        // Arrange
+        var broker = new InMemoryBroker(CreateBus(), "test");
+        var options = new ConsumerOptions { QueueName = "TEST.Queue", QoSPrefetchCount = 1 };
+        broker.StartConsumer(options, new TestConsumer());
+
+        // Act
+        // Assert
+        Assert.Throws<ApplicationException>(() => broker.StartConsumer(options, new TestConsumer(), isSolo: true));
+        broker.Shutdown(_timeout);
+    }
+
+    [Test]
+    public void SetupProducer_MissingExchange_Throws()
+    {
+        var broker = new InMemoryBroker(CreateBus(), "test");
+
+        Assert.Throws<ApplicationException>(() => broker.SetupProducer(new ProducerOptions { ExchangeName = "TEST.Missing" }));
+    }
+
+    [TestCase("reprocessed.CT.*", "reprocessed.CT.abc", true)]
+    [TestCase("reprocessed.CT.*", "reprocessed.CT", false)]
+    [TestCase("reprocessed.#", "reprocessed", true)]
+    [TestCase("reprocessed.#", "reprocessed.CT.abc", true)]
+    [TestCase("#.abc", "reprocessed.CT.abc", true)]
+    [TestCase("*", "", false)]
+    [TestCase("#", "", true)]
+    [TestCase("CT", "MR", false)]
+    public void TopicMatches(string pattern, string routingKey, bool expected)
+    {
+        Assert.That(InMemoryMessageBus.TopicMatches(pattern, routingKey), Is.EqualTo(expected));
+    }
+}
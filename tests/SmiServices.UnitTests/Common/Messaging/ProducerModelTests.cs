@@ -1,10 +1,15 @@
 using Moq;
 using NUnit.Framework;
 using RabbitMQ.Client;
+using RabbitMQ.Client.Events;
 using SmiServices.Common.Messages;
 using SmiServices.Common.Messaging;
+using SmiServices.Common.Metrics;
 using System;
 using System.Collections.Generic;
+using System.IO;
+using System.Threading;
+using System.Threading.Tasks;
 
 namespace SmiServices.UnitTests.Common.Messaging;
 
@@ -12,6 +17,13 @@ internal class ProducerModelTests
 {
     private class TestMessage : IMessage { }
 
+    private static string WriteMetrics()
+    {
+        using var writer = new StringWriter();
+        SmiMetrics.Registry.WriteTo(writer);
+        return writer.ToString();
+    }
+
     [OneTimeSetUp]
     public void OneTimeSetUp()
     {
@@ -96,7 +108,7 @@ internal class ProducerModelTests
     }
 
     [Test]
-    public void SendMessage_WithSenseQueue_OverLimit()
+    public void SendMessage_WithSenseQueue_SamplesEachInterval()
     {
         // Arrange
         bool timedOut = false;
@@ -105,9 +117,9 @@ internal class ProducerModelTests
         mockModel.Setup(x => x.WaitForConfirms(It.IsAny<TimeSpan>(), out timedOut)).Returns(true);
         mockModel.SetupSequence(x => x.MessageCount("ProbeQueue"))
             .Returns(123)           // Check in constructor
-            .Returns(123)           // First SendMessage call - first check
-            .Returns(0)             // First SendMessage call - second check
-            .Throws<Exception>();   // Throw if called again in second SendMessage call
+            .Returns(123)           // First SendMessage call
+            .Returns(0)             // Second SendMessage call
+            .Throws<Exception>();   // Throw if sampled more than once per call
 
         var mockBasicProperties = new Mock<IBasicProperties>();
         mockBasicProperties.Setup(x => x.Headers).Returns(() => new Dictionary<string, object>());
@@ -117,7 +129,7 @@ internal class ProducerModelTests
         mockBackoffProvider.Setup(x => x.Reset()).Verifiable();
 
         var maxRetryAttempts = 1;
-        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, maxRetryAttempts, mockBackoffProvider.Object, "ProbeQueue", 1, TimeSpan.Zero);
+        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, maxRetryAttempts, mockBackoffProvider.Object, "ProbeQueue", 1, TimeSpan.Zero, minPublishRate: 1000);
         var message = new TestMessage();
 
         // Act
@@ -126,4 +138,169 @@ internal class ProducerModelTests
         Assert.DoesNotThrow(() => producerModel.SendMessage(message, inResponseTo: null, routingKey: null));
         mockBackoffProvider.Verify();
     }
+
+    [Test]
+    public void SendMessage_WhileThrottled_DoesNotHoldSendLock()
+    {
+        // Arrange
+        bool timedOut = false;
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.Setup(x => x.BasicPublish("Exchange", "", true, It.IsAny<IBasicProperties>(), It.IsAny<ReadOnlyMemory<byte>>()));
+        mockModel.Setup(x => x.WaitForConfirms(It.IsAny<TimeSpan>(), out timedOut)).Returns(true);
+        mockModel.Setup(x => x.MessageCount("ProbeQueue")).Returns(0);
+
+        var mockBasicProperties = new Mock<IBasicProperties>();
+        mockBasicProperties.Setup(x => x.Headers).Returns(() => new Dictionary<string, object>());
+
+        // One message every 2 seconds, so the second send has to wait
+        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, probeQueueName: "ProbeQueue", probeQueueLimit: 1, probeInterval: TimeSpan.FromHours(1), minPublishRate: 0.5, maxPublishRate: 0.5);
+        using var fatalRaised = new ManualResetEventSlim();
+        producerModel.OnFatal += (_, _) => fatalRaised.Set();
+        var message = new TestMessage();
+        producerModel.SendMessage(message, inResponseTo: null, routingKey: null);
+
+        // Act
+        var throttled = Task.Run(() => producerModel.SendMessage(message, inResponseTo: null, routingKey: null));
+        Thread.Sleep(200);
+        mockModel.Raise(x => x.BasicReturn += null, new BasicReturnEventArgs());
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(fatalRaised.Wait(TimeSpan.FromSeconds(1)), Is.True);
+            Assert.That(throttled.IsCompleted, Is.False);
+        });
+        Assert.That(throttled.Wait(TimeSpan.FromSeconds(5)), Is.True);
+    }
+
+    [Test]
+    public void ModelShutdown_WithSenseQueue_StopsReportingPublishRate()
+    {
+        // Arrange
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.Setup(x => x.MessageCount("ProbeQueue")).Returns(0);
+        _ = new ProducerModel("RateExchange", mockModel.Object, new Mock<IBasicProperties>().Object, probeQueueName: "ProbeQueue", probeQueueLimit: 1);
+
+        const string sample = "smi_producer_publish_rate{exchange=\"RateExchange\"}";
+        Assert.That(WriteMetrics(), Does.Contain(sample));
+
+        // Act
+        mockModel.Raise(x => x.ModelShutdown += null, new ShutdownEventArgs(ShutdownInitiator.Application, 200, "Closed"));
+
+        // Assert
+        Assert.That(WriteMetrics(), Does.Not.Contain(sample));
+    }
+
+    [Test]
+    public void Constructor_WithSenseQueue_ZeroLimit_Throws()
+    {
+        // Arrange
+        var mockModel = new Mock<IModel>();
+        var mockBasicProperties = new Mock<IBasicProperties>();
+
+        // Act
+        // Assert
+        Assert.Throws<ArgumentException>(() => _ = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, probeQueueName: "ProbeQueue", probeQueueLimit: 0));
+    }
+
+    [Test]
+    public void SendMessageAsync_CompletesOnBasicAck()
+    {
+        // Arrange
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.Setup(x => x.BasicPublish("Exchange", "", true, It.IsAny<IBasicProperties>(), It.IsAny<ReadOnlyMemory<byte>>()));
+        mockModel.SetupSequence(x => x.NextPublishSeqNo).Returns(1).Returns(2);
+
+        var mockBasicProperties = new Mock<IBasicProperties>();
+        mockBasicProperties.Setup(x => x.Headers).Returns(() => new Dictionary<string, object>());
+
+        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, maxOutstandingConfirms: 2);
+        var message = new TestMessage();
+
+        // Act
+        var first = producerModel.SendMessageAsync(message);
+        var second = producerModel.SendMessageAsync(message);
+        mockModel.Raise(x => x.BasicAcks += null, new BasicAckEventArgs { DeliveryTag = 1, Multiple = false });
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(first.Wait(TimeSpan.FromSeconds(5)), Is.True);
+            Assert.That(second.IsCompleted, Is.False);
+        });
+
+        mockModel.Raise(x => x.BasicAcks += null, new BasicAckEventArgs { DeliveryTag = 2, Multiple = true });
+        Assert.That(second.Wait(TimeSpan.FromSeconds(5)), Is.True);
+    }
+
+    [Test]
+    public void SendMessageAsync_FaultsOnBasicNack()
+    {
+        // Arrange
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.Setup(x => x.BasicPublish("Exchange", "", true, It.IsAny<IBasicProperties>(), It.IsAny<ReadOnlyMemory<byte>>()));
+        mockModel.Setup(x => x.NextPublishSeqNo).Returns(1);
+
+        var mockBasicProperties = new Mock<IBasicProperties>();
+        mockBasicProperties.Setup(x => x.Headers).Returns(new Dictionary<string, object>());
+
+        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, maxOutstandingConfirms: 1);
+        var message = new TestMessage();
+
+        // Act
+        var sent = producerModel.SendMessageAsync(message);
+        mockModel.Raise(x => x.BasicNacks += null, new BasicNackEventArgs { DeliveryTag = 1, Multiple = false });
+
+        // Assert
+        var exc = Assert.Throws<AggregateException>(() => sent.Wait(TimeSpan.FromSeconds(5)));
+        Assert.That(exc?.InnerException?.Message, Is.EqualTo("RabbitMQ got a Nack"));
+    }
+
+    [Test]
+    public void SendMessageAsync_PublishThrows_FreesSlotOnce()
+    {
+        // Arrange
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.SetupSequence(x => x.BasicPublish("Exchange", "", true, It.IsAny<IBasicProperties>(), It.IsAny<ReadOnlyMemory<byte>>()))
+            .Throws(new InvalidOperationException("Publish failed"))
+            .Pass();
+        mockModel.SetupSequence(x => x.NextPublishSeqNo).Returns(1).Returns(2);
+
+        var mockBasicProperties = new Mock<IBasicProperties>();
+        mockBasicProperties.Setup(x => x.Headers).Returns(() => new Dictionary<string, object>());
+
+        var producerModel = new ProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object, maxOutstandingConfirms: 1);
+        var message = new TestMessage();
+
+        // Act
+        Assert.Throws<InvalidOperationException>(() => producerModel.SendMessageAsync(message));
+        var sent = producerModel.SendMessageAsync(message);
+
+        // Assert
+        Assert.DoesNotThrow(() => mockModel.Raise(x => x.BasicAcks += null, new BasicAckEventArgs { DeliveryTag = 2, Multiple = true }));
+        Assert.That(sent.Wait(TimeSpan.FromSeconds(5)), Is.True);
+    }
+
+    [Test]
+    public void SendMessageAsync_WithoutConfirmTracking_WaitsForConfirms()
+    {
+        // Arrange
+        bool timedOut = false;
+        var mockModel = new Mock<IModel>(MockBehavior.Strict);
+        mockModel.Setup(x => x.BasicPublish("Exchange", "", true, It.IsAny<IBasicProperties>(), It.IsAny<ReadOnlyMemory<byte>>()));
+        mockModel.Setup(x => x.WaitForConfirms(It.IsAny<TimeSpan>(), out timedOut)).Returns(true).Verifiable();
+
+        var mockBasicProperties = new Mock<IBasicProperties>();
+        mockBasicProperties.Setup(x => x.Headers).Returns(new Dictionary<string, object>());
+
+        var producerModel = new BatchProducerModel("Exchange", mockModel.Object, mockBasicProperties.Object);
+        var message = new TestMessage();
+
+        // Act
+        var sent = producerModel.SendMessageAsync(message);
+
+        // Assert
+        Assert.That(sent.IsCompletedSuccessfully, Is.True);
+        mockModel.Verify();
+    }
 }
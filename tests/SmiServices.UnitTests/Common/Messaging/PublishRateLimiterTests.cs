@@ -0,0 +1,100 @@
+using NUnit.Framework;
+using SmiServices.Common.Messaging;
+using System;
+
+namespace SmiServices.UnitTests.Common.Messaging;
+
+internal class PublishRateLimiterTests
+{
+    private class ManualTimeProvider : TimeProvider
+    {
+        public long Timestamp { get; set; }
+
+        public override long TimestampFrequency => TimeSpan.TicksPerSecond;
+
+        public override long GetTimestamp() => Timestamp;
+
+        public void Advance(TimeSpan by) => Timestamp += by.Ticks;
+    }
+
+    [Test]
+    public void Update_EmptyQueue_IncreasesRateUpToMax()
+    {
+        // Arrange
+        var limiter = new PublishRateLimiter(targetDepth: 100, minRate: 1, maxRate: 100, new ManualTimeProvider());
+        limiter.Update(200);
+        var throttled = limiter.Rate;
+
+        // Act
+        limiter.Update(0);
+        var increased = limiter.Rate;
+        for (var i = 0; i < 20; ++i)
+            limiter.Update(0);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(throttled, Is.EqualTo(50));
+            Assert.That(increased, Is.EqualTo(75));
+            Assert.That(limiter.Rate, Is.EqualTo(100));
+        });
+    }
+
+    [Test]
+    public void Update_OverTarget_DecreasesRateDownToMin()
+    {
+        // Arrange
+        var limiter = new PublishRateLimiter(targetDepth: 100, minRate: 1, maxRate: 100, new ManualTimeProvider());
+
+        // Act
+        limiter.Update(100);
+        var atTarget = limiter.Rate;
+        limiter.Update(150);
+        var overTarget = limiter.Rate;
+        for (var i = 0; i < 20; ++i)
+            limiter.Update(1_000_000);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(atTarget, Is.EqualTo(100));
+            Assert.That(overTarget, Is.EqualTo(75));
+            Assert.That(limiter.Rate, Is.EqualTo(1));
+        });
+    }
+
+    [Test]
+    public void Acquire_SpacesPublishesAtRate()
+    {
+        // Arrange
+        var time = new ManualTimeProvider();
+        var limiter = new PublishRateLimiter(targetDepth: 100, minRate: 10, maxRate: 10, time);
+
+        // Act
+        var first = limiter.Acquire();
+        var second = limiter.Acquire();
+        var third = limiter.Acquire();
+        time.Advance(TimeSpan.FromSeconds(1));
+        var afterWait = limiter.Acquire();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(first, Is.EqualTo(TimeSpan.Zero));
+            Assert.That(second, Is.EqualTo(TimeSpan.FromSeconds(0.1)));
+            Assert.That(third, Is.EqualTo(TimeSpan.FromSeconds(0.2)));
+            Assert.That(afterWait, Is.EqualTo(TimeSpan.Zero));
+        });
+    }
+
+    [Test]
+    public void Constructor_InvalidRates_Throws()
+    {
+        Assert.Multiple(() =>
+        {
+            Assert.Throws<ArgumentOutOfRangeException>(() => _ = new PublishRateLimiter(0, 1, 10));
+            Assert.Throws<ArgumentOutOfRangeException>(() => _ = new PublishRateLimiter(100, 0, 10));
+            Assert.Throws<ArgumentOutOfRangeException>(() => _ = new PublishRateLimiter(100, 10, 1));
+        });
+    }
+}
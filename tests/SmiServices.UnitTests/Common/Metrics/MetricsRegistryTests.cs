@@ -0,0 +1,86 @@
+using NUnit.Framework;
+using SmiServices.Common.Metrics;
+using System;
+using System.IO;
+
+namespace SmiServices.UnitTests.Common.Metrics;
+
+internal class MetricsRegistryTests
+{
+    private static string Write(MetricsRegistry registry)
+    {
+        using var writer = new StringWriter();
+        registry.WriteTo(writer);
+        return writer.ToString();
+    }
+
+    [Test]
+    public void Counter_WritesLabelledValue()
+    {
+        // Arrange
+        var registry = new MetricsRegistry();
+        var counter = registry.Counter("test_total", "A counter", "consumer");
+
+        // Act
+        counter.WithLabels("Foo").Inc();
+        counter.WithLabels("Foo").Inc(2);
+
+        // Assert
+        Assert.That(Write(registry), Is.EqualTo(
+            "# HELP test_total A counter\n" +
+            "# TYPE test_total counter\n" +
+            "test_total{consumer=\"Foo\"} 3\n"));
+    }
+
+    [Test]
+    public void Histogram_WritesCumulativeBuckets()
+    {
+        // Arrange
+        var registry = new MetricsRegistry();
+        var histogram = registry.Histogram("test_seconds", "A histogram", [1, 2]).WithLabels();
+
+        // Act
+        histogram.Observe(0.5);
+        histogram.Observe(1.5);
+        histogram.Observe(5);
+
+        // Assert
+        Assert.That(Write(registry), Is.EqualTo(
+            "# HELP test_seconds A histogram\n" +
+            "# TYPE test_seconds histogram\n" +
+            "test_seconds_bucket{le=\"1\"} 1\n" +
+            "test_seconds_bucket{le=\"2\"} 2\n" +
+            "test_seconds_bucket{le=\"+Inf\"} 3\n" +
+            "test_seconds_sum 7\n" +
+            "test_seconds_count 3\n"));
+    }
+
+    [Test]
+    public void Observed_DisposedSourceIsRemoved()
+    {
+        // Arrange
+        var registry = new MetricsRegistry();
+        var gauge = registry.Observed("test_messages", "A gauge", MetricType.Gauge, "queue");
+
+        // Act
+        var source = gauge.Observe(() => 42, "Queue");
+        var before = Write(registry);
+        source.Dispose();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(before, Does.Contain("test_messages{queue=\"Queue\"} 42\n"));
+            Assert.That(Write(registry), Does.Not.Contain("Queue"));
+        });
+    }
+
+    [Test]
+    public void Register_SameNameDifferentType_Throws()
+    {
+        var registry = new MetricsRegistry();
+        registry.Counter("test", "A counter");
+
+        Assert.Throws<ArgumentException>(() => registry.Histogram("test", "A histogram", null));
+    }
+}
@@ -0,0 +1,58 @@
+using NUnit.Framework;
+using SmiServices.Common.Metrics;
+using System;
+
+namespace SmiServices.UnitTests.Common.Metrics;
+
+internal class RunningStatisticsTests
+{
+    [Test]
+    public void Add_TracksCountMeanAndMax()
+    {
+        // Arrange
+        var stats = new RunningStatistics();
+
+        // Act
+        foreach (var value in new double[] { 1, 2, 3, 10 })
+            stats.Add(value);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(stats.Count, Is.EqualTo(4));
+            Assert.That(stats.Mean, Is.EqualTo(4).Within(1e-9));
+            Assert.That(stats.Max, Is.EqualTo(10));
+        });
+    }
+
+    [Test]
+    public void Percentile_IsWithinBucketError()
+    {
+        // Arrange
+        var stats = new RunningStatistics();
+
+        // Act
+        for (var i = 1; i <= 1000; ++i)
+            stats.Add(i);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(stats.Percentile(50), Is.EqualTo(500).Within(10).Percent);
+            Assert.That(stats.Percentile(99), Is.EqualTo(990).Within(10).Percent);
+            Assert.That(stats.Percentile(100), Is.EqualTo(1000));
+        });
+    }
+
+    [Test]
+    public void Percentile_NoValues_ReturnsZero()
+    {
+        Assert.That(new RunningStatistics().Percentile(50), Is.EqualTo(0));
+    }
+
+    [Test]
+    public void Add_Negative_Throws()
+    {
+        Assert.Throws<ArgumentOutOfRangeException>(() => new RunningStatistics().Add(-1));
+    }
+}
@@ -15,6 +15,7 @@ using System.IO.Abstractions;
 using System.IO.Abstractions.TestingHelpers;
 using System.Text.RegularExpressions;
 using System.Threading;
+using System.Threading.Tasks;
 
 namespace SmiServices.UnitTests.Microservices.CohortExtractor.Messaging;
 
@@ -123,9 +124,8 @@ public class ExtractionRequestQueueConsumerTest
 
         var mockFileInfoMessageProducerModel = new Mock<IProducerModel>(MockBehavior.Strict);
         mockFileInfoMessageProducerModel
-            .Setup(x => x.SendMessage(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), null))
-            .Returns(new MessageHeader());
-        mockFileInfoMessageProducerModel.Setup(x => x.WaitForConfirms());
+            .Setup(x => x.SendMessageAsync(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), null))
+            .Returns(Task.FromResult<IMessageHeader>(new MessageHeader()));
 
         var msg = new ExtractionRequestMessage
         {
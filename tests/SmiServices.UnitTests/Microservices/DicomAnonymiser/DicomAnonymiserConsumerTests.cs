@@ -14,6 +14,7 @@ using System.IO;
 using System.IO.Abstractions;
 using System.IO.Abstractions.TestingHelpers;
 using System.Linq.Expressions;
+using System.Threading.Tasks;
 
 namespace SmiServices.UnitTests.Microservices.DicomAnonymiser;
 
@@ -140,8 +141,8 @@ public class DicomAnonymiserConsumerTests
             .Setup(expectedAnonCall)
             .Returns(ExtractedFileStatus.Anonymised);
 
-        Expression<Func<IProducerModel, IMessageHeader>> expectedSendCall =
-            x => x.SendMessage(
+        Expression<Func<IProducerModel, Task<IMessageHeader>>> expectedSendCall =
+            x => x.SendMessageAsync(
                 It.Is<ExtractedFileStatusMessage>(x =>
                     x.Status == ExtractedFileStatus.Anonymised &&
                     x.StatusMessage == null &&
@@ -204,8 +205,8 @@ public class DicomAnonymiserConsumerTests
         _mockFs.File.SetAttributes(_sourceDcmPathAbs, _mockFs.File.GetAttributes(_sourceDcmPathAbs) & ~FileAttributes.ReadOnly);
         _mockFs.File.Delete(_sourceDcmPathAbs);
 
-        Expression<Func<IProducerModel, IMessageHeader>> expectedCall =
-            x => x.SendMessage(
+        Expression<Func<IProducerModel, Task<IMessageHeader>>> expectedCall =
+            x => x.SendMessageAsync(
                 It.Is<ExtractedFileStatusMessage>(x =>
                     x.Status == ExtractedFileStatus.FileMissing &&
                     x.StatusMessage == $"Could not find file to anonymise: '{_sourceDcmPathAbs}'" &&
@@ -238,8 +239,8 @@ public class DicomAnonymiserConsumerTests
 
         _mockFs.File.SetAttributes(_sourceDcmPathAbs, _mockFs.File.GetAttributes(_sourceDcmPathAbs) & ~FileAttributes.ReadOnly);
 
-        Expression<Func<IProducerModel, IMessageHeader>> expectedCall =
-            x => x.SendMessage(
+        Expression<Func<IProducerModel, Task<IMessageHeader>>> expectedCall =
+            x => x.SendMessageAsync(
                 It.Is<ExtractedFileStatusMessage>(x =>
                     x.Status == ExtractedFileStatus.ErrorWontRetry &&
                     x.StatusMessage == $"Source file was writeable and FailIfSourceWriteable is set: '{_sourceDcmPathAbs}'" &&
@@ -309,8 +310,8 @@ public class DicomAnonymiserConsumerTests
 
         var anonymiser = new FailingAnonymiser();
 
-        Expression<Func<IProducerModel, IMessageHeader>> expectedCall =
-            x => x.SendMessage(
+        Expression<Func<IProducerModel, Task<IMessageHeader>>> expectedCall =
+            x => x.SendMessageAsync(
                 It.Is<ExtractedFileStatusMessage>(x =>
                     x.Status == ExtractedFileStatus.ErrorWontRetry &&
                     x.StatusMessage!.StartsWith("oh no!") &&
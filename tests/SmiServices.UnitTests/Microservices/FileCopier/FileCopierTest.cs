@@ -7,6 +7,7 @@ using SmiServices.Common.Options;
 using SmiServices.Microservices.FileCopier;
 using System;
 using System.IO.Abstractions.TestingHelpers;
+using System.Threading.Tasks;
 
 namespace SmiServices.UnitTests.Microservices.FileCopier;
 
@@ -75,13 +76,13 @@ public class FileCopierTest
         ExtractedFileStatusMessage? sentStatusMessage = null;
         string? sentRoutingKey = null;
         mockProducerModel
-            .Setup(x => x.SendMessage(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
+            .Setup(x => x.SendMessageAsync(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
             .Callback((IMessage message, IMessageHeader header, string routingKey) =>
             {
                 sentStatusMessage = (ExtractedFileStatusMessage)message;
                 sentRoutingKey = routingKey;
             })
-            .Returns(() => null!);
+            .Returns(() => Task.FromResult<IMessageHeader>(null!));
 
         var requestHeader = new MessageHeader();
 
@@ -115,13 +116,13 @@ public class FileCopierTest
         ExtractedFileStatusMessage? sentStatusMessage = null;
         string? sentRoutingKey = null;
         mockProducerModel
-            .Setup(x => x.SendMessage(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
+            .Setup(x => x.SendMessageAsync(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
             .Callback((IMessage message, IMessageHeader header, string routingKey) =>
             {
                 sentStatusMessage = (ExtractedFileStatusMessage)message;
                 sentRoutingKey = routingKey;
             })
-            .Returns(() => null!);
+            .Returns(() => Task.FromResult<IMessageHeader>(null!));
 
         _requestMessage.DicomFilePath = "missing.dcm";
         var requestHeader = new MessageHeader();
@@ -150,13 +151,13 @@ public class FileCopierTest
         ExtractedFileStatusMessage? sentStatusMessage = null;
         string? sentRoutingKey = null;
         mockProducerModel
-            .Setup(x => x.SendMessage(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
+            .Setup(x => x.SendMessageAsync(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
             .Callback((IMessage message, IMessageHeader header, string routingKey) =>
             {
                 sentStatusMessage = (ExtractedFileStatusMessage)message;
                 sentRoutingKey = routingKey;
             })
-            .Returns(() => null!);
+            .Returns(() => Task.FromResult<IMessageHeader>(null!));
 
         var requestHeader = new MessageHeader();
         string expectedDest = _mockFileSystem.Path.Combine(ExtractRoot, _requestMessage.ExtractionDirectory, "out.dcm");
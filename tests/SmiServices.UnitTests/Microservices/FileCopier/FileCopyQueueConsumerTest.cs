@@ -5,6 +5,7 @@ using SmiServices.Common.Messages.Extraction;
 using SmiServices.Microservices.FileCopier;
 using SmiServices.UnitTests.TestCommon;
 using System;
+using System.Threading.Tasks;
 
 
 namespace SmiServices.UnitTests.Microservices.FileCopier;
@@ -43,7 +44,7 @@ public class FileCopyQueueConsumerTest
         };
 
         _mockFileCopier = new Mock<IFileCopier>(MockBehavior.Strict);
-        _mockFileCopier.Setup(x => x.ProcessMessage(It.IsAny<ExtractFileMessage>(), It.IsAny<IMessageHeader>()));
+        _mockFileCopier.Setup(x => x.ProcessMessage(It.IsAny<ExtractFileMessage>(), It.IsAny<IMessageHeader>())).Returns(Task.CompletedTask);
     }
 
     [TearDown]
@@ -63,6 +64,23 @@ public class FileCopyQueueConsumerTest
         TestTimelineAwaiter.Await(() => consumer.AckCount == 1 && consumer.NackCount == 0);
     }
 
+    [Test]
+    public void Test_FileCopyQueueConsumer_ValidMessage_IsAckedOnceStatusConfirmed()
+    {
+        var statusConfirmed = new TaskCompletionSource();
+        _mockFileCopier.Reset();
+        _mockFileCopier.Setup(x => x.ProcessMessage(It.IsAny<ExtractFileMessage>(), It.IsAny<IMessageHeader>())).Returns(statusConfirmed.Task);
+
+        var consumer = new FileCopyQueueConsumer(_mockFileCopier.Object);
+
+        consumer.ProcessMessage(new MessageHeader(), _message, 1);
+        Assert.That(consumer.AckCount, Is.EqualTo(0));
+
+        statusConfirmed.SetResult();
+
+        TestTimelineAwaiter.Await(() => consumer.AckCount == 1 && consumer.NackCount == 0);
+    }
+
     [Test]
     public void Test_FileCopyQueueConsumer_ApplicationException_IsNacked()
     {
@@ -0,0 +1,37 @@
+using NUnit.Framework;
+using SmiServices.Common.Messaging;
+using SmiServices.Common.Options;
+using SmiServices.Microservices.IdentifierMapper;
+
+namespace SmiServices.UnitTests.Microservices.IdentifierMapper;
+
+internal class IdentifierMapperHostTests
+{
+    [Test]
+    public void Constructor_InMemoryBroker_StartsAndStops()
+    {
+        // Arrange
+        var globals = new GlobalOptionsFactory().Load(nameof(Constructor_InMemoryBroker_StartsAndStops));
+        globals.MessageBrokerType = MessageBrokerType.InMemory;
+        globals.InMemoryBrokerOptions = new InMemoryBrokerOptions
+        {
+            Bindings =
+            [
+                new InMemoryBindingOptions { ExchangeName = "TEST.IdentifiableImageExchange", QueueName = globals.IdentifierMapperOptions!.QueueName },
+                new InMemoryBindingOptions { ExchangeName = globals.IdentifierMapperOptions.AnonImagesProducerOptions!.ExchangeName, QueueName = "TEST.AnonymousImageQueue" },
+            ],
+        };
+
+        IdentifierMapperHost? host = null;
+
+        // Act
+        // Assert
+        Assert.DoesNotThrow(() => host = new IdentifierMapperHost(globals, new SwapForFixedValueTester("fish")));
+        Assert.DoesNotThrow(() =>
+        {
+            host!.StartAuxConnections();
+            host.Start();
+            host.Stop("Test end");
+        });
+    }
+}
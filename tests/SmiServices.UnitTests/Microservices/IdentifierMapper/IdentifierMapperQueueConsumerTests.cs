@@ -0,0 +1,92 @@
+using Moq;
+using NUnit.Framework;
+using SmiServices.Common.Messages;
+using SmiServices.Common.Messaging;
+using SmiServices.Microservices.IdentifierMapper;
+using SmiServices.Microservices.IdentifierMapper.Swappers;
+using System;
+using System.Collections.Generic;
+using System.Linq;
+using System.Threading;
+
+namespace SmiServices.UnitTests.Microservices.IdentifierMapper;
+
+internal class IdentifierMapperQueueConsumerTests
+{
+    [Test]
+    public void BatchSwaps_SwapsBatchWithOneLookup()
+    {
+        // Arrange
+        var mockSwapper = new Mock<ISwapIdentifiers>();
+        mockSwapper
+            .Setup(x => x.GetSubstitutionsFor(It.IsAny<IReadOnlyCollection<string>>()))
+            .Returns((IReadOnlyCollection<string> ids) => ids.ToDictionary(id => id, id => id == "missing" ? null : $"anon-{id}"));
+
+        var mockProducer = new Mock<IProducerModel>(MockBehavior.Strict);
+        mockProducer
+            .Setup(x => x.SendMessage(It.IsAny<IMessage>(), It.IsAny<IMessageHeader>(), It.IsAny<string>()))
+            .Returns(new MessageHeader());
+        mockProducer.Setup(x => x.WaitForConfirms());
+
+        var consumer = new IdentifierMapperQueueConsumer(mockProducer.Object, mockSwapper.Object);
+        consumer.BatchSwaps(5, TimeSpan.FromHours(1));
+
+        var messages = new[] { "0101", "0202", "0101", "missing" }
+            .Select(id => new DicomFileMessage { DicomDataset = $"{{\"00100020\":{{\"vr\":\"LO\",\"Value\":[\"{id}\"]}}}}" })
+            .Append(new DicomFileMessage { DicomDataset = "{\"00100010\":{\"vr\":\"PN\"}}" })
+            .ToArray();
+
+        // Act
+        for (var i = 0; i < messages.Length; ++i)
+            consumer.ProcessMessage(new MessageHeader(), messages[i], (ulong)i + 1);
+        consumer.Shutdown();
+
+        // Assert
+        mockSwapper.Verify(
+            x => x.GetSubstitutionsFor(It.Is<IReadOnlyCollection<string>>(ids => ids.Count == 3)),
+            Times.Once);
+        Assert.Multiple(() =>
+        {
+            Assert.That(consumer.AckCount, Is.EqualTo(3));
+            Assert.That(consumer.NackCount, Is.EqualTo(2));
+            Assert.That(messages[0].DicomDataset, Is.EqualTo("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"anon-0101\"]}}"));
+            Assert.That(messages[1].DicomDataset, Is.EqualTo("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"anon-0202\"]}}"));
+            Assert.That(messages[3].DicomDataset, Is.EqualTo("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"missing\"]}}"));
+        });
+    }
+
+    [Test]
+    public void BatchSwaps_SwapperThrows_NacksWholeBatch()
+    {
+        // Arrange
+        var mockSwapper = new Mock<ISwapIdentifiers>();
+        mockSwapper
+            .Setup(x => x.GetSubstitutionsFor(It.IsAny<IReadOnlyCollection<string>>()))
+            .Throws(new InvalidOperationException("Mapping database unavailable"));
+
+        var mockProducer = new Mock<IProducerModel>(MockBehavior.Strict);
+
+        var consumer = new IdentifierMapperQueueConsumer(mockProducer.Object, mockSwapper.Object);
+        consumer.BatchSwaps(3, TimeSpan.FromHours(1));
+        using var fatalRaised = new ManualResetEventSlim();
+        consumer.OnFatal += (_, _) => fatalRaised.Set();
+
+        var messages = new[] { "0101", "0202" }
+            .Select(id => new DicomFileMessage { DicomDataset = $"{{\"00100020\":{{\"vr\":\"LO\",\"Value\":[\"{id}\"]}}}}" })
+            .Append(new DicomFileMessage { DicomDataset = "{\"00100010\":{\"vr\":\"PN\"}}" })
+            .ToArray();
+
+        // Act
+        for (var i = 0; i < messages.Length; ++i)
+            consumer.ProcessMessage(new MessageHeader(), messages[i], (ulong)i + 1);
+        consumer.Shutdown();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(fatalRaised.Wait(TimeSpan.FromSeconds(5)), Is.True);
+            Assert.That(consumer.AckCount, Is.EqualTo(0));
+            Assert.That(consumer.NackCount, Is.EqualTo(3));
+        });
+    }
+}
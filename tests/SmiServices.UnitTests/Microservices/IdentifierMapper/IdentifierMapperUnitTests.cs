@@ -31,4 +31,19 @@ public class IdentifierMapperUnitTests
 
         Assert.That(target.Logs.Single(), Does.StartWith("SwapForFixedValueTester: CacheRatio=1:0 SuccessRatio=1:0:0"));
     }
+
+    [Test]
+    public void Test_IdentifierMapper_GetSubstitutionsFor_LooksUpEachDistinctValue()
+    {
+        var mapper = new SwapForFixedValueTester("fish");
+
+        var answers = mapper.GetSubstitutionsFor(["a", "b", "a"]);
+
+        Assert.Multiple(() =>
+        {
+            Assert.That(answers.Keys, Is.EquivalentTo(new[] { "a", "b" }));
+            Assert.That(answers.Values, Is.All.EqualTo("fish"));
+            Assert.That(mapper.Success, Is.EqualTo(2));
+        });
+    }
 }
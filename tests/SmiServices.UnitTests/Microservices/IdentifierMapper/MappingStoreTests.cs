@@ -0,0 +1,101 @@
+using NUnit.Framework;
+using SmiServices.Microservices.IdentifierMapper.Swappers;
+using System;
+using System.Collections.Generic;
+
+namespace SmiServices.UnitTests.Microservices.IdentifierMapper;
+
+internal class MappingStoreTests
+{
+    [Test]
+    public void TryGetValue_FindsEachKind()
+    {
+        // Arrange
+        var builder = new MappingStore.Builder();
+        builder.Add("0101010101", "ECHI-1");
+        builder.Add("101010101", "ECHI-2");
+        builder.Add("0", "");
+        builder.Add("123456789012345678901", "long");
+        builder.Add("AB123", "Jöhn");
+
+        for (var i = 0; i < 5000; ++i)
+            builder.Add($"{i:D12}", $"v{i}");
+
+        // Act
+        var store = builder.Build();
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(store.Count, Is.EqualTo(5005));
+            Assert.That(store.TryGetValue("0101010101", out var value) ? value : null, Is.EqualTo("ECHI-1"));
+            Assert.That(store.TryGetValue("101010101", out value) ? value : null, Is.EqualTo("ECHI-2"));
+            Assert.That(store.TryGetValue("0", out value) ? value : null, Is.EqualTo(""));
+            Assert.That(store.TryGetValue("123456789012345678901", out value) ? value : null, Is.EqualTo("long"));
+            Assert.That(store.TryGetValue("AB123", out value) ? value : null, Is.EqualTo("Jöhn"));
+            Assert.That(store.TryGetValue("000000004321", out value) ? value : null, Is.EqualTo("v4321"));
+
+            Assert.That(store.TryGetValue("00101010101", out _), Is.False);
+            Assert.That(store.TryGetValue("", out _), Is.False);
+            Assert.That(store.TryGetValue("ab123", out _), Is.False);
+        });
+    }
+
+    [TestCase(10)]
+    [TestCase(10_000)]
+    public void With_AddsAndReplaces_WithoutChangingOriginal(int changeCount)
+    {
+        // Arrange
+        var builder = new MappingStore.Builder();
+        builder.Add("0101010101", "old");
+        builder.Add("AB123", "old");
+        builder.Add("0303030303", "kept");
+        var store = builder.Build();
+
+        var changes = new Dictionary<string, string>
+        {
+            { "0101010101", "new" },
+            { "AB123", "new" },
+        };
+        for (var i = 0; i < changeCount; ++i)
+            changes.Add($"{i:D12}", $"v{i}");
+
+        // Act
+        var changed = store.With(changes);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(changed.Count, Is.EqualTo(changeCount + 3));
+            Assert.That(changed.TryGetValue("0101010101", out var value) ? value : null, Is.EqualTo("new"));
+            Assert.That(changed.TryGetValue("AB123", out value) ? value : null, Is.EqualTo("new"));
+            Assert.That(changed.TryGetValue("0303030303", out value) ? value : null, Is.EqualTo("kept"));
+            Assert.That(changed.TryGetValue("000000000007", out value) ? value : null, Is.EqualTo("v7"));
+
+            Assert.That(store.Count, Is.EqualTo(3));
+            Assert.That(store.TryGetValue("0101010101", out value) ? value : null, Is.EqualTo("old"));
+            Assert.That(store.TryGetValue("000000000007", out _), Is.False);
+        });
+    }
+
+    [TestCase("0101010101")]
+    [TestCase("AB123")]
+    public void Build_DuplicateKey_Throws(string key)
+    {
+        // Arrange
+        var builder = new MappingStore.Builder();
+        builder.Add("0202020202", "a");
+
+        // Act
+        var act = () =>
+        {
+            builder.Add(key, "b");
+            builder.Add(key, "c");
+            builder.Build();
+        };
+
+        // Assert
+        var exc = Assert.Throws<ArgumentException>(() => act());
+        Assert.That(exc!.Message, Does.Contain($"'{key}'"));
+    }
+}
@@ -0,0 +1,109 @@
+using DicomTypeTranslation;
+using FellowOakDicom;
+using NUnit.Framework;
+using SmiServices.Microservices.IdentifierMapper;
+using System;
+
+namespace SmiServices.UnitTests.Microservices.IdentifierMapper;
+
+internal class PatientIdRewriterTests
+{
+    [Test]
+    public void Rewrite_OnlyReplacesTopLevelPatientID()
+    {
+        // Arrange
+        var ds = new DicomDataset
+        {
+            { DicomTag.PatientID, "0101010101" },
+            { DicomTag.AccessionNumber, "0101010101" },
+            { DicomTag.PatientName, "Smith^Jöhn" },
+        };
+        ds.Add(new DicomSequence(DicomTag.OtherPatientIDsSequence, new DicomDataset { { DicomTag.PatientID, "0101010101" } }));
+        var json = DicomTypeTranslater.SerializeDatasetToJson(ds);
+
+        // Act
+        var outcome = PatientIdRewriter.Rewrite(json, id => id == "0101010101" ? "0202020202" : null, out var rewritten);
+
+        // Assert
+        var newDs = DicomTypeTranslater.DeserializeJsonToDataset(rewritten!);
+        Assert.Multiple(() =>
+        {
+            Assert.That(outcome, Is.EqualTo(PatientIdRewriter.Outcome.Rewritten));
+            Assert.That(newDs.GetString(DicomTag.PatientID), Is.EqualTo("0202020202"));
+            Assert.That(newDs.GetString(DicomTag.AccessionNumber), Is.EqualTo("0101010101"));
+            Assert.That(newDs.GetString(DicomTag.PatientName), Is.EqualTo("Smith^Jöhn"));
+            Assert.That(newDs.GetSequence(DicomTag.OtherPatientIDsSequence).Items[0].GetString(DicomTag.PatientID), Is.EqualTo("0101010101"));
+        });
+    }
+
+    [TestCase("{\"00100010\":{\"vr\":\"PN\"}}", PatientIdRewriter.Outcome.Missing)]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\"}}", PatientIdRewriter.Outcome.Blank)]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\" \"]}}", PatientIdRewriter.Outcome.Blank)]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"123\"]}}", PatientIdRewriter.Outcome.NoSubstitution)]
+    public void Rewrite_NotRewritten(string json, PatientIdRewriter.Outcome expected)
+    {
+        // Act
+        var outcome = PatientIdRewriter.Rewrite(json, _ => null, out var rewritten);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(outcome, Is.EqualTo(expected));
+            Assert.That(rewritten, Is.Null);
+        });
+    }
+
+    [TestCase("[\"123\",\"123\"]")]
+    [TestCase("[\"123\",null]")]
+    [TestCase("[\"123\\\\\"]")]
+    public void Rewrite_RepeatedValues_AreAllowed(string values)
+    {
+        // Arrange
+        var json = $"{{\"00080050\":{{\"vr\":\"SH\"}},\"00100020\":{{\"vr\":\"LO\",\"Value\":{values}}},\"00100030\":{{\"vr\":\"DA\"}}}}";
+
+        // Act
+        var outcome = PatientIdRewriter.Rewrite(json, id => id == "123" ? "abc" : null, out var rewritten);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(outcome, Is.EqualTo(PatientIdRewriter.Outcome.Rewritten));
+            Assert.That(rewritten, Is.EqualTo("{\"00080050\":{\"vr\":\"SH\"},\"00100020\":{\"vr\":\"LO\",\"Value\":[\"abc\"]},\"00100030\":{\"vr\":\"DA\"}}"));
+        });
+    }
+
+    [TestCase("[\"123\"]", "[\"abc\"]")]
+    [TestCase("[{\"Alphabetic\":\"123\"}]", "[{\"Alphabetic\":\"abc\"}]")]
+    public void Rewrite_PersonNameVR_KeepsValueForm(string values, string expected)
+    {
+        // Arrange
+        var json = $"{{\"00100020\":{{\"vr\":\"PN\",\"Value\":{values}}}}}";
+
+        // Act
+        var outcome = PatientIdRewriter.Rewrite(json, id => id == "123" ? "abc" : null, out var rewritten);
+
+        // Assert
+        Assert.Multiple(() =>
+        {
+            Assert.That(outcome, Is.EqualTo(PatientIdRewriter.Outcome.Rewritten));
+            Assert.That(rewritten, Is.EqualTo($"{{\"00100020\":{{\"vr\":\"PN\",\"Value\":{expected}}}}}"));
+        });
+    }
+
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"123\",\"456\"]}}")]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[123]}}")]
+    [TestCase("{\"00100020\":{\"vr\":\"DA\",\"Value\":[\"20200101\"]}}")]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[{\"Alphabetic\":\"123\"}]}}")]
+    public void Rewrite_BadPatientID_Throws(string json)
+    {
+        Assert.Throws<BadPatientIDException>(() => PatientIdRewriter.Rewrite(json, _ => "abc", out _));
+    }
+
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"123\"]}")]
+    [TestCase("{\"00100020\":{\"Value\":[\"123\"]}}")]
+    [TestCase("{\"00100020\":{\"vr\":\"LO\",\"Value\":[\"123\"]},\"00100020\":{\"vr\":\"LO\",\"Value\":[\"456\"]}}")]
+    public void Rewrite_InvalidJson_Throws(string json)
+    {
+        Assert.Throws<ApplicationException>(() => PatientIdRewriter.Rewrite(json, _ => "abc", out _));
+    }
+}
@@ -14,6 +14,7 @@ using System.IO;
 using System.IO.Abstractions;
 using System.IO.Abstractions.TestingHelpers;
 using System.Linq.Expressions;
+using System.Threading.Tasks;
 
 namespace SmiServices.UnitTests.Microservices.IsIdentifiable;
 
@@ -27,7 +28,7 @@ public class IsIdentifiableQueueConsumerTests
     ExtractedFileStatusMessage _extractedFileStatusMessage = null!;
     FatalErrorEventArgs? _fatalArgs;
     Mock<IProducerModel> _mockProducerModel = null!;
-    Expression<Func<IProducerModel, IMessageHeader>> _expectedSendMessageCall = null!;
+    Expression<Func<IProducerModel, Task<IMessageHeader>>> _expectedSendMessageCall = null!;
     ExtractedFileVerificationMessage _response = null!;
 
     [OneTimeSetUp]
@@ -65,11 +66,11 @@ public class IsIdentifiableQueueConsumerTests
         _fatalArgs = null;
 
         _mockProducerModel = new Mock<IProducerModel>(MockBehavior.Strict);
-        _expectedSendMessageCall = x => x.SendMessage(It.IsAny<ExtractedFileVerificationMessage>(), It.IsAny<MessageHeader>(), null);
+        _expectedSendMessageCall = x => x.SendMessageAsync(It.IsAny<ExtractedFileVerificationMessage>(), It.IsAny<MessageHeader>(), null);
         _mockProducerModel
             .Setup(_expectedSendMessageCall)
             .Callback<IMessage, IMessageHeader, string>((x, _, _) => _response = (ExtractedFileVerificationMessage)x)
-            .Returns(new MessageHeader());
+            .Returns(Task.FromResult<IMessageHeader>(new MessageHeader()));
     }
 
     [TearDown]